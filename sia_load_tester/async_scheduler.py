@@ -0,0 +1,417 @@
+"""Schedules uploads on a single-threaded event loop.
+
+These are counterparts to renter_poller.Poller, sia_conditions.Waiter,
+progress.Monitor and dataset_uploader.DatasetUploader whose waits are
+coroutines instead of blocking calls, so renter polling, progress monitoring
+and upload submission all share one event_loop.EventLoop and one pool of
+non-blocking connections to Sia. The number of uploads in flight is bounded
+only by the concurrent upload limit, not by a number of worker threads.
+"""
+
+import logging
+
+import dataset_uploader
+import event_loop
+import progress
+import renter_poller
+import sia_client as sc
+import sia_conditions
+
+logger = logging.getLogger(__name__)
+
+# The Waiter wakes as soon as the Poller publishes a new snapshot, but also
+# re-checks at this interval in case a snapshot is slow to arrive.
+_WAIT_SECONDS = 1
+
+
+class Error(Exception):
+    pass
+
+
+def make_monitor(loop, poller, concurrency_controller, exit_event):
+    """Creates a Monitor instance using production defaults."""
+    return Monitor(loop, progress.Tracker(poller, loop.time),
+                   concurrency_controller, exit_event)
+
+
+def make_dataset_uploader(loop, upload_queue, poller, sia_client,
+                          concurrency_controller, upload_journal,
+                          latency_tracker, exit_event):
+    """Factory for creating a DatasetUploader using production settings."""
+    waiter = Waiter(loop, poller, concurrency_controller, _WAIT_SECONDS,
+                    exit_event)
+    return DatasetUploader(loop, upload_queue, sia_client, waiter,
+                           concurrency_controller, upload_journal,
+                           latency_tracker, exit_event)
+
+
+class Poller(object):
+    """Fetches Sia renter files periodically and publishes Snapshots."""
+
+    def __init__(self,
+                 loop,
+                 sia_client,
+                 exit_event,
+                 poll_interval_seconds,
+                 circuit_breaker=None,
+                 node_name=None):
+        """Creates a new Poller instance.
+
+        Args:
+            loop: The EventLoop on which to poll.
+            sia_client: An AsyncSiaClient.
+            exit_event: If this event is set, polling stops.
+            poll_interval_seconds: Number of seconds to wait between polls.
+            circuit_breaker: A CircuitBreaker whose open circuit skips
+                periodic polls once a Snapshot has been published, or None to
+                poll at every interval.
+            node_name: Name of the polled Sia node, under which to export its
+                metrics. Defaults to the node on localhost.
+        """
+        self._loop = loop
+        self._sia_client = sia_client
+        self._exit_event = exit_event
+        self._poll_interval_seconds = poll_interval_seconds
+        self._circuit_breaker = circuit_breaker
+        self._node_name = node_name or sc.default_node_name()
+        self._renter_state = renter_poller.RenterState(loop.time)
+        self._latest = None
+        self._subscribers = []
+        self._change_subscribers = []
+        # Completes when the next Snapshot is published.
+        self._next_snapshot = event_loop.Future()
+
+    @property
+    def node_name(self):
+        """Name of the polled Sia node."""
+        return self._node_name
+
+    def subscribe(self, callback):
+        """Registers a callback to receive each newly published Snapshot."""
+        self._subscribers.append(callback)
+
+    def subscribe_to_changes(self, callback):
+        """Registers a callback to receive the RenterChanges of each poll."""
+        self._change_subscribers.append(callback)
+
+    def latest(self):
+        """Returns the most recent Snapshot.
+
+        Raises:
+            Error if the Poller has not yet published a Snapshot.
+        """
+        if self._latest is None:
+            raise Error('Renter files have not been polled yet')
+        return self._latest
+
+    def poll(self):
+        """Fetches renter files from Sia and publishes a new Snapshot.
+
+        Returns:
+            A Future whose result is the newly published Snapshot.
+        """
+        return self._loop.spawn(self._poll())
+
+    def _poll(self):
+        self._renter_state.begin_update()
+        yield self._sia_client.stream_renter_files(self._renter_state.add_file)
+        changes = self._renter_state.end_update()
+        snapshot = self._renter_state.snapshot()
+        self._latest = snapshot
+        published, self._next_snapshot = (self._next_snapshot,
+                                          event_loop.Future())
+        published.set_result(snapshot)
+        renter_poller.log_changes(changes)
+        renter_poller.record_metrics(snapshot, self._node_name)
+        for callback in list(self._change_subscribers):
+            callback(changes)
+        for callback in list(self._subscribers):
+            callback(snapshot)
+        raise event_loop.Return(snapshot)
+
+    def wait_for_next_snapshot(self, timeout):
+        """Waits until the next Snapshot is published or the wait ends.
+
+        Args:
+            timeout: Maximum number of seconds to wait.
+
+        Returns:
+            A Future that completes once a new Snapshot is published or the
+            timeout elapses, whichever happens first.
+        """
+        return self._loop.with_timeout(self._next_snapshot, timeout)
+
+    def poll_until_exit(self):
+        """Coroutine that polls Sia at a regular interval until exit."""
+        while not self._exit_event.is_set():
+            try:
+                if not (self._latest is not None and
+                        renter_poller.sheds_poll(self._circuit_breaker)):
+                    yield self.poll()
+            except Exception as ex:
+                logger.error('Failed to poll Sia renter files: %s', ex.message)
+            yield self._loop.sleep(self._poll_interval_seconds)
+        logger.info('Exit event is set. Terminating renter file polling.')
+
+
+class Waiter(object):
+    """Waits for conditions in Sia node to become true without blocking."""
+
+    def __init__(self, loop, poller, concurrency_controller, wait_seconds,
+                 exit_event):
+        """Creates a new Waiter instance.
+
+        Args:
+            loop: The EventLoop on which to wait.
+            poller: The Poller that publishes renter file Snapshots.
+            concurrency_controller: Controller that determines the maximum
+                number of concurrent uploads.
+            wait_seconds: Maximum number of seconds to wait for a new Snapshot
+                between checks.
+            exit_event: An event that, when set, indicates Waiter should stop
+                waiting and raise an exception.
+        """
+        self._loop = loop
+        self._poller = poller
+        self._upload_slots = sia_conditions.UploadSlots(poller,
+                                                        concurrency_controller)
+        self._concurrency_controller = concurrency_controller
+        self._wait_seconds = wait_seconds
+        self._exit_event = exit_event
+        self._idle_seconds = 0.0
+
+    def record_upload_started(self, sia_path):
+        """Counts an upload as in progress until the renter reports it.
+
+        Args:
+            sia_path: Siapath of the upload that was just started.
+        """
+        self._upload_slots.record_started(sia_path)
+
+    def release_upload_slot(self):
+        """Frees a slot reserved for an upload that did not start."""
+        self._upload_slots.release()
+
+    def idle_seconds(self):
+        """Returns the total time spent waiting for upload slots."""
+        return self._idle_seconds
+
+    def wait_for_available_upload_slot(self):
+        """Waits until an upload slot is available, then reserves it.
+
+        Returns:
+            A Future that completes once a slot is reserved. The Future fails
+            with WaitInterruptedError if the exit event is set while waiting.
+        """
+        return self._loop.spawn(self._wait_for_available_upload_slot())
+
+    def _wait_for_available_upload_slot(self):
+        start_time = self._loop.time()
+        try:
+            sia_conditions.check_exit_event(self._exit_event)
+            reserved, upload_count = self._upload_slots.try_reserve()
+            logged_count = None
+            while not reserved:
+                # Waits wake at least once per second, so only log at INFO
+                # level when the upload count has changed since the last
+                # message.
+                log_fn = (logger.info
+                          if upload_count != logged_count else logger.debug)
+                logged_count = upload_count
+                log_fn('Too many uploads in progress: %d >= %d', upload_count,
+                       self._concurrency_controller.limit())
+                yield self._poller.wait_for_next_snapshot(self._wait_seconds)
+                sia_conditions.check_exit_event(self._exit_event)
+                reserved, upload_count = self._upload_slots.try_reserve()
+        finally:
+            self._idle_seconds += self._loop.time() - start_time
+
+    def wait_for_all_uploads_to_complete(self):
+        """Waits until all in-progress uploads are complete.
+
+        Returns:
+            A Future that completes once no uploads are in progress. The
+            Future fails with WaitInterruptedError if the exit event is set
+            while waiting.
+        """
+        return self._loop.spawn(self._wait_for_all_uploads_to_complete())
+
+    def _wait_for_all_uploads_to_complete(self):
+        sia_conditions.check_exit_event(self._exit_event)
+        upload_count = self._upload_slots.count_in_progress()
+        logged_count = None
+        while upload_count > 0:
+            log_fn = (logger.info
+                      if upload_count != logged_count else logger.debug)
+            logged_count = upload_count
+            log_fn(('Waiting for remaining uploads to complete.'
+                    ' %d uploads still in progress.'), upload_count)
+            yield self._poller.wait_for_next_snapshot(self._wait_seconds)
+            sia_conditions.check_exit_event(self._exit_event)
+            upload_count = self._upload_slots.count_in_progress()
+
+
+class Monitor(progress.Monitor):
+    """Monitor that checks upload progress from a coroutine."""
+
+    def __init__(self, loop, tracker, concurrency_controller, exit_event):
+        """Creates a new Monitor instance.
+
+        Args:
+            loop: The EventLoop on which to monitor progress.
+            tracker: A tracker for upload progress.
+            concurrency_controller: Controller for the upload concurrency limit
+                to feed with throughput measurements.
+            exit_event: If this event is set, monitoring stops. Monitor will set
+                this event if progress falls below minimum.
+        """
+        super(Monitor, self).__init__(tracker, concurrency_controller,
+                                      loop.sleep, exit_event)
+
+    def monitor(self):
+        """Coroutine that monitors progress until exit or progress stalls."""
+        while not self._exit_event.is_set():
+            if not self.check():
+                return
+            yield self._sleep_fn(progress.CHECK_FREQUENCY_IN_SECONDS)
+        logger.info('Exit event is set. Terminating progress monitoring.')
+
+
+class DatasetUploader(object):
+    """Uploads a full dataset of files to Sia from a single thread.
+
+    Rather than dedicating a thread to each in-flight upload request, the
+    uploader starts a coroutine for each upload as soon as it reserves a slot,
+    so every available upload slot can have a request in flight at once.
+    """
+
+    def __init__(self, loop, upload_queue, sia_client, sia_condition_waiter,
+                 concurrency_controller, upload_journal, latency_tracker,
+                 exit_event):
+        """Creates a new DatasetUploader instance.
+
+        Args:
+            loop: The EventLoop on which to upload.
+            upload_queue: The queue of upload jobs.
+            sia_client: An AsyncSiaClient.
+            sia_condition_waiter: A Waiter for upload slots.
+            concurrency_controller: Controller for the upload concurrency limit
+                to notify of upload errors.
+            upload_journal: Journal in which to record submitted and failed
+                uploads.
+            latency_tracker: Tracker with which to time submitted uploads.
+            exit_event: Event to set when DatasetUploader completes upload.
+        """
+        self._loop = loop
+        self._upload_queue = upload_queue
+        self._sia_client = sia_client
+        self._sia_condition_waiter = sia_condition_waiter
+        self._concurrency_controller = concurrency_controller
+        self._upload_journal = upload_journal
+        self._latency_tracker = latency_tracker
+        self._exit_event = exit_event
+        self._uploads_started = 0
+        self._upload_failures = 0
+        self._submissions_in_flight = 0
+        # Completes when an in-flight submission finishes.
+        self._submission_finished = None
+        # The first exception raised by a submission, if any.
+        self._submission_error = None
+
+    def upload(self):
+        """Uploads the dataset to Sia.
+
+        Returns:
+            A Future that completes once all files in the dataset are fully
+            uploaded to Sia. The Future fails with WaitInterruptedError if the
+            exit event is set during upload.
+        """
+        return self._loop.spawn(self._upload())
+
+    def stats(self):
+        """Returns dataset_uploader.UploadStats for the uploads so far."""
+        return dataset_uploader.UploadStats(
+            uploads_started=self._uploads_started,
+            upload_failures=self._upload_failures,
+            scheduler_idle_seconds=self._sia_condition_waiter.idle_seconds())
+
+    def _upload(self):
+        while True:
+            while not self._upload_queue.empty():
+                retry_seconds = self._upload_queue.seconds_until_ready()
+                if retry_seconds:
+                    # Wake early if a failed submission retries a job sooner.
+                    yield self._wait_for_submission(retry_seconds)
+                    self._raise_submission_error()
+                    continue
+                yield self._sia_condition_waiter.wait_for_available_upload_slot(
+                )
+                self._raise_submission_error()
+                self._start_submission(self._upload_queue.get())
+            if not self._submissions_in_flight:
+                break
+            # Failed submissions may requeue their jobs, so wait for them
+            # before deciding that the queue is done.
+            yield self._wait_for_submission()
+            self._raise_submission_error()
+        yield self._sia_condition_waiter.wait_for_all_uploads_to_complete()
+        self._exit_event.set()
+        stats = self.stats()
+        logger.info(('Started %d uploads (%d failed attempts), spent %.1f '
+                     'seconds waiting for upload slots'), stats.uploads_started,
+                    stats.upload_failures, stats.scheduler_idle_seconds)
+
+    def _wait_for_submission(self, timeout_seconds=None):
+        """Returns a Future that completes when a submission finishes.
+
+        Args:
+            timeout_seconds: If specified, the Future also completes after
+                this many seconds.
+        """
+        self._submission_finished = event_loop.Future()
+        if timeout_seconds is None:
+            return self._submission_finished
+        return self._loop.with_timeout(self._submission_finished,
+                                       timeout_seconds)
+
+    def _start_submission(self, job):
+        self._submissions_in_flight += 1
+        self._loop.spawn(self._submit(job)).add_done_callback(
+            self._on_submission_finished)
+
+    def _on_submission_finished(self, submission):
+        self._submissions_in_flight -= 1
+        if submission.exception() and not self._submission_error:
+            self._submission_error = submission.exception()
+        if self._submission_finished and not self._submission_finished.done():
+            self._submission_finished.set_result(None)
+
+    def _raise_submission_error(self):
+        if self._submission_error:
+            raise self._submission_error
+
+    def _submit(self, job):
+        logger.info('Uploading file to Sia: %s', job.local_path)
+        error = None
+        try:
+            uploaded = yield self._sia_client.upload_file_async(
+                job.local_path, job.sia_path)
+            if not uploaded:
+                error = dataset_uploader.ERROR_REJECTED
+        except Exception as ex:
+            logger.error('Upload failed: %s', ex.message)
+            error = dataset_uploader.error_type(ex)
+        if not error:
+            self._uploads_started += 1
+            dataset_uploader.UPLOADS_SUBMITTED.inc()
+            self._upload_journal.record_submitted(job)
+            self._latency_tracker.record_submitted(job)
+            self._sia_condition_waiter.record_upload_started(job.sia_path)
+            return
+        job.increment_failure_count()
+        self._upload_failures += 1
+        dataset_uploader.UPLOAD_ERRORS.inc(error=error)
+        self._upload_journal.record_failed(job)
+        self._concurrency_controller.record_upload_error()
+        self._sia_condition_waiter.release_upload_slot()
+        self._upload_queue.retry(job, error)
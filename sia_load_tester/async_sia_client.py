@@ -0,0 +1,758 @@
+"""Non-blocking client for the Sia API, driven by an event_loop.EventLoop.
+
+AsyncSiaClient offers the same methods as sia_client.SiaClient, but each
+method returns an event_loop.Future rather than blocking until Sia responds.
+Requests travel over a fixed pool of non-blocking keep-alive HTTP connections,
+so a single thread can keep thousands of requests in flight: requests beyond
+the pool size wait in the pool until a connection frees up.
+
+In place of iter_renter_files, which would block on the network as its
+iterator is consumed, stream_renter_files passes each file to a callback as
+the response arrives.
+"""
+
+import asyncore
+import collections
+import functools
+import json
+import logging
+import socket
+import sys
+import urllib
+
+import event_loop
+import json_stream
+import sia_client as sc
+
+logger = logging.getLogger(__name__)
+
+_MAX_REQUEST_ATTEMPTS = 5
+_HOST = 'localhost'
+_RECV_BUFFER_BYTES = 65536
+
+# ConnectionPools of every AsyncSiaClient the factory creates.
+_factory_pools = []
+
+
+class Error(Exception):
+    pass
+
+
+class ConnectionError(Error):
+    pass
+
+
+def make_async_sia_client(loop, port, pool_size):
+    """Factory for creating an AsyncSiaClient using production settings.
+
+    Args:
+        loop: The EventLoop on which to send requests.
+        port: Port on localhost on which the Sia node serves its API.
+        pool_size: Maximum number of keep-alive connections to Sia.
+
+    Returns:
+        An AsyncSiaClient for the Sia node on localhost.
+    """
+    connection_pool = ConnectionPool(loop, (_HOST, port), pool_size)
+    _factory_pools.append(connection_pool)
+    return AsyncSiaClient(loop, connection_pool, sc.shared_circuit_breaker())
+
+
+def connection_stats():
+    """Returns ConnectionStats across clients the factory created."""
+    opened = 0
+    reused = 0
+    for connection_pool in _factory_pools:
+        stats = connection_pool.stats()
+        opened += stats.opened
+        reused += stats.reused
+    return sc.ConnectionStats(opened=opened, reused=reused)
+
+
+def _coroutine_method(func):
+    """Decorator that runs a generator method as a coroutine on self._loop."""
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        return self._loop.spawn(func(self, *args, **kwargs))
+
+    return wrapper
+
+
+class AsyncSiaClient(object):
+    """Asynchronous client interface for Sia API functions.
+
+    Like SiaClient, retries requests that fail to reach Sia, waiting an
+    increasing amount of time between attempts, and waits while the circuit
+    breaker is open. Unlike SiaClient, waiting doesn't block other requests.
+    """
+
+    def __init__(self, loop, connection_pool, circuit_breaker=None):
+        """Creates a new AsyncSiaClient instance.
+
+        Args:
+            loop: The EventLoop on which to send requests.
+            connection_pool: ConnectionPool through which to send requests.
+            circuit_breaker: A CircuitBreaker that decides when requests may
+                go to Sia, or None to send every request right away.
+        """
+        self._loop = loop
+        self._connection_pool = connection_pool
+        self._circuit_breaker = circuit_breaker
+
+    @_coroutine_method
+    def is_blockchain_synced(self):
+        consensus = yield self._call('is_blockchain_synced', 'GET',
+                                     '/consensus')
+        raise event_loop.Return(consensus[u'synced'])
+
+    @_coroutine_method
+    def allowance_budget(self):
+        """Returns the amount budgeted for renter allowance (in hastings)."""
+        renter = yield self._call('allowance_budget', 'GET', '/renter')
+        raise event_loop.Return(
+            long(renter[u'settings'][u'allowance'][u'funds']))
+
+    @_coroutine_method
+    def set_allowance_budget(self, budget_hastings):
+        """Sets the allowance budget to the amount specified.
+
+        Args:
+            budget_hastings: The amount to set the allowance budget to (in
+                hastings).
+
+        Returns:
+            A Future whose result is True on success.
+        """
+        response = yield self._call('set_allowance_budget', 'POST', '/renter', {
+            'funds': budget_hastings,
+            'period': sc.ALLOWANCE_PERIOD
+        })
+        if response == True:
+            raise event_loop.Return(True)
+        logger.warning('Failed to set allowance to %d: %s', budget_hastings,
+                       _get_sia_error_from_response(response))
+        raise event_loop.Return(False)
+
+    @_coroutine_method
+    def contract_count(self):
+        contracts = yield self._call('contract_count', 'GET',
+                                     '/renter/contracts')
+        count = len(contracts[u'contracts'])
+        sc.CONTRACTS.set(count)
+        raise event_loop.Return(count)
+
+    @_coroutine_method
+    def is_wallet_locked(self):
+        wallet = yield self._call('is_wallet_locked', 'GET', '/wallet')
+        raise event_loop.Return(not wallet[u'unlocked'])
+
+    @_coroutine_method
+    def wallet_balance(self):
+        """Returns the wallet's confirmed Siacoin balance (in hastings)."""
+        wallet = yield self._call('wallet_balance', 'GET', '/wallet')
+        raise event_loop.Return(long(wallet[u'confirmedsiacoinbalance']))
+
+    @_coroutine_method
+    def renter_files(self):
+        """Returns a list of files known to the Sia renter."""
+        response = yield self._call('renter_files', 'GET', '/renter/files')
+        # Workaround for https://github.com/NebulousLabs/Sia/issues/2760
+        raise event_loop.Return(response[u'files'] or [])
+
+    def stream_renter_files(self, file_fn):
+        """Passes each file known to the Sia renter to a function.
+
+        The counterpart of SiaClient.iter_renter_files: files are decoded one
+        at a time as the response streams in, rather than holding the full
+        file list in memory. A coroutine can't block on an iterator, so the
+        files go to a callback instead.
+
+        Args:
+            file_fn: A function to call with each file dictionary.
+
+        Returns:
+            A Future that completes once every file has been passed to
+            file_fn.
+        """
+        return self._stream('stream_renter_files', '/renter/files', u'files',
+                            file_fn)
+
+    @_coroutine_method
+    def upload_file_async(self, local_path, sia_path):
+        """Starts an asynchronous upload of a file to Sia.
+
+        Args:
+            local_path: Path to file on the local filesystem (Sia node must
+                share a view of this filesystem and have access to this path).
+            sia_path: Name of the file within Sia.
+
+        Returns:
+            A Future whose result is True on success.
+        """
+        response = yield self._call(
+            'upload_file_async', 'POST',
+            '/renter/upload/%s' % urllib.quote(_utf8(sia_path)), {
+                'source': local_path
+            })
+        if response == True:
+            raise event_loop.Return(True)
+        logger.warning('Failed to upload file %s -> %s: %s', local_path,
+                       sia_path, _get_sia_error_from_response(response))
+        raise event_loop.Return(False)
+
+    def _call(self, method, verb, path, params=None, parse_fn=None):
+        """Sends a request to Sia, retrying if Sia can't be reached.
+
+        Args:
+            method: Name of the client method that sends the request, under
+                which to record the request's metrics.
+            verb: HTTP method of the request.
+            path: Path of the Sia API endpoint.
+            params: A dictionary of form parameters to send with the request.
+            parse_fn: A function that converts the HttpResponse into the
+                result. Defaults to decoding the JSON response body.
+
+        Returns:
+            A Future whose result is the parsed response. By default, this is
+            the decoded JSON response body, or whether the request succeeded
+            if the response has no JSON body.
+        """
+        return self._loop.spawn(
+            self._call_with_retries(method, verb, path, params, parse_fn or
+                                    _parse_response_body))
+
+    def _call_with_retries(self, method, verb, path, params, parse_fn):
+        request = _format_request(verb, path, params)
+        start_time = self._loop.time()
+        try:
+            for prior_attempts in range(_MAX_REQUEST_ATTEMPTS + 1):
+                try:
+                    response = yield self._send(method, request)
+                    sc.record_api_bytes_received(method, len(response.body))
+                    raise event_loop.Return(parse_fn(response))
+                except ConnectionError as e:
+                    if prior_attempts == _MAX_REQUEST_ATTEMPTS:
+                        raise sc.SiaServerNotAvailable(
+                            'Could not connect to Sia server: %s' % e.message,
+                            e)
+                    sleep_seconds = 5**prior_attempts
+                    logger.warning(('Request to Sia server failed: %s %s -> %s'
+                                    '  Retrying in %d seconds'), verb, path,
+                                   e.message, sleep_seconds)
+                    sc.record_api_retry(method, sleep_seconds)
+                    yield self._loop.sleep(sleep_seconds)
+        finally:
+            sc.record_api_call(method, self._loop.time() - start_time)
+
+    def _stream(self, method, path, key, item_fn):
+        """Sends a GET request to Sia and streams the array in its response.
+
+        Like _call, retries requests that fail to reach Sia. As in SiaClient,
+        a response that is cut off or garbled counts against the circuit
+        breaker, and is retried only if no items have been passed on yet, as a
+        retry would repeat them.
+
+        Args:
+            method: Name of the client method that sends the request, under
+                which to record the request's metrics.
+            path: Path of the Sia API endpoint.
+            key: Key in the response's top-level object of the array to
+                stream.
+            item_fn: A function to call with each element of the array,
+                decoded, as it arrives.
+
+        Returns:
+            A Future that completes once every element has been passed to
+            item_fn.
+        """
+        request = _format_request('GET', path, None)
+        return self._loop.spawn(
+            self._stream_with_retries(method, request, key, item_fn))
+
+    def _stream_with_retries(self, method, request, key, item_fn):
+        start_time = self._loop.time()
+        try:
+            for prior_attempts in range(_MAX_REQUEST_ATTEMPTS + 1):
+                items_read = False
+                body = _BodyStream()
+                response_future = self._send(method, request, body.write)
+                response_future.add_done_callback(body.end)
+                decoder = json_stream.ArrayItemDecoder(key)
+                try:
+                    while True:
+                        pieces = yield body.read()
+                        if not pieces:
+                            break
+                        for piece in pieces:
+                            sc.record_api_bytes_received(method, len(piece))
+                            for item in decoder.feed(piece):
+                                items_read = True
+                                item_fn(item)
+                    response = response_future.result()
+                    if not 200 <= response.status < 300:
+                        raise Error('%s failed with HTTP status %d: %s' %
+                                    (method, response.status,
+                                     _get_sia_error_from_response(
+                                         _parse_response_body(response))))
+                    decoder.close()
+                    return
+                except (ConnectionError, json_stream.Error) as e:
+                    # _send has already counted a ConnectionError.
+                    if (isinstance(e, json_stream.Error) and
+                            self._circuit_breaker is not None):
+                        self._circuit_breaker.record_failure()
+                    if items_read or prior_attempts == _MAX_REQUEST_ATTEMPTS:
+                        raise sc.SiaServerNotAvailable(
+                            'Lost connection to Sia server during %s: %s' %
+                            (method, e), e)
+                    sleep_seconds = 5**prior_attempts
+                    logger.warning(('Response from Sia server failed: %s -> %s'
+                                    '  Retrying in %d seconds'), method, e,
+                                   sleep_seconds)
+                    sc.record_api_retry(method, sleep_seconds)
+                    yield self._loop.sleep(sleep_seconds)
+                finally:
+                    body.close()
+        finally:
+            sc.record_api_call(method, self._loop.time() - start_time)
+
+    @_coroutine_method
+    def _send(self, method, request, body_fn=None):
+        """Sends a single request once the circuit breaker admits it."""
+        breaker = self._circuit_breaker
+        if breaker is None:
+            response = yield self._connection_pool.send(request, body_fn)
+            raise event_loop.Return(response)
+        while True:
+            wait_seconds = breaker.admit(method)
+            if not wait_seconds:
+                break
+            yield self._loop.sleep(wait_seconds)
+        start_time = self._loop.time()
+        try:
+            response = yield self._connection_pool.send(request, body_fn)
+        except ConnectionError:
+            breaker.record_failure()
+            raise
+        breaker.record_response(self._loop.time() - start_time)
+        raise event_loop.Return(response)
+
+
+def _utf8(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def _format_request(verb, path, params):
+    body = ''
+    if params:
+        query = urllib.urlencode(
+            [(name, _utf8(value)) for name, value in params.iteritems()])
+        if verb == 'GET':
+            path += '?' + query
+        else:
+            body = query
+    headers = [
+        '%s %s HTTP/1.1' % (verb, path),
+        'Host: %s' % _HOST,
+        'User-Agent: %s' % sc.SIA_USER_AGENT,
+        'Content-Length: %d' % len(body),
+    ]
+    if body:
+        headers.append('Content-Type: application/x-www-form-urlencoded')
+    return '\r\n'.join(headers) + '\r\n\r\n' + body
+
+
+def _parse_response_body(response):
+    try:
+        return json.loads(response.body)
+    except ValueError:
+        return 200 <= response.status < 400
+
+
+def _get_sia_error_from_response(response):
+    if isinstance(response, dict) and response.has_key(u'message'):
+        return response[u'message']
+    return 'unknown failure reason from Sia'
+
+
+class ConnectionPool(object):
+    """Dispatches HTTP requests over a bounded set of keep-alive connections.
+
+    Requests are queued when every connection is busy and sent, in order, as
+    connections become free.
+    """
+
+    def __init__(self, loop, address, pool_size):
+        """Creates a new ConnectionPool instance.
+
+        Args:
+            loop: The EventLoop that drives the connections.
+            address: A (host, port) tuple of the HTTP server.
+            pool_size: Maximum number of connections to hold open at once.
+        """
+        self._loop = loop
+        self._address = address
+        self._pool_size = pool_size
+        self._idle_connections = []
+        self._open_connections = 0
+        # Queue of (request, body_fn, Future) tuples waiting for a free
+        # connection.
+        self._pending_requests = collections.deque()
+        self._connections_opened = 0
+        self._requests_sent = 0
+
+    def send(self, request, body_fn=None):
+        """Sends a raw HTTP request.
+
+        Args:
+            request: The full HTTP request, as a string.
+            body_fn: A function to call with each piece of a successful
+                response's body as it arrives, or None to collect the body
+                into the HttpResponse.
+
+        Returns:
+            A Future whose result is the server's HttpResponse. The Future
+            fails with ConnectionError if the connection drops before the
+            response is complete.
+        """
+        future = event_loop.Future()
+        self._pending_requests.append((request, body_fn, future))
+        self._dispatch()
+        return future
+
+    def stats(self):
+        """Returns sia_client.ConnectionStats for the pool."""
+        return sc.ConnectionStats(
+            opened=self._connections_opened,
+            reused=self._requests_sent - self._connections_opened)
+
+    def _dispatch(self):
+        while self._pending_requests:
+            connection = self._take_idle_connection()
+            if connection is None:
+                if self._open_connections >= self._pool_size:
+                    return
+                connection = self._open_connection()
+            request, body_fn, future = self._pending_requests.popleft()
+            self._requests_sent += 1
+            connection.send_request(request, body_fn).add_done_callback(
+                functools.partial(self._on_response, connection, future))
+
+    def _take_idle_connection(self):
+        while self._idle_connections:
+            connection = self._idle_connections.pop()
+            if connection.is_open():
+                return connection
+        return None
+
+    def _open_connection(self):
+        self._open_connections += 1
+        self._connections_opened += 1
+        return _HttpConnection(self._loop.socket_map, self._address,
+                               self._on_connection_closed)
+
+    def _on_connection_closed(self):
+        self._open_connections -= 1
+        self._loop.call_soon(self._dispatch)
+
+    def _on_response(self, connection, future, response_future):
+        if connection.is_open():
+            self._idle_connections.append(connection)
+            self._loop.call_soon(self._dispatch)
+        exception = response_future.exception()
+        if exception:
+            future.set_exception(exception)
+        else:
+            future.set_result(response_future.result())
+
+
+class _BodyStream(object):
+    """Hands a response body from its connection to the coroutine reading it,
+    a piece at a time as it arrives."""
+
+    def __init__(self):
+        self._pieces = []
+        # Future of the pending read, if any.
+        self._reader = None
+        self._ended = False
+        self._closed = False
+
+    def write(self, piece):
+        """Adds the next piece of the body, unless the stream is closed."""
+        if self._closed:
+            return
+        self._pieces.append(piece)
+        self._wake_reader()
+
+    def end(self, response_future):
+        """Marks the end of the body, whether or not the response succeeded.
+
+        Args:
+            response_future: The Future of the response, which is done.
+        """
+        self._ended = True
+        self._wake_reader()
+
+    def read(self):
+        """Reads the pieces of the body that arrived since the last read.
+
+        Returns:
+            A Future whose result is a list of the pieces, in order, once any
+            have arrived, or an empty list once the body has ended.
+        """
+        reader = event_loop.Future()
+        self._reader = reader
+        self._wake_reader()
+        return reader
+
+    def close(self):
+        """Discards the unread body, along with any more that arrives."""
+        self._closed = True
+        self._pieces = []
+
+    def _wake_reader(self):
+        if self._reader is None or not (self._pieces or self._ended):
+            return
+        reader, self._reader = self._reader, None
+        pieces, self._pieces = self._pieces, []
+        reader.set_result(pieces)
+
+
+class _HttpConnection(asyncore.dispatcher):
+    """A non-blocking keep-alive HTTP connection that sends one request at a
+    time."""
+
+    def __init__(self, socket_map, address, on_closed):
+        """Creates a new _HttpConnection and starts connecting.
+
+        Args:
+            socket_map: The asyncore socket map of the event loop.
+            address: A (host, port) tuple of the HTTP server.
+            on_closed: Callback to call once the connection closes.
+        """
+        asyncore.dispatcher.__init__(self, map=socket_map)
+        self._on_closed = on_closed
+        self._is_open = True
+        self._outgoing = ''
+        self._parser = None
+        self._response_future = None
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            self.connect(address)
+        except socket.error:
+            self.handle_error()
+
+    def is_open(self):
+        return self._is_open
+
+    def send_request(self, request, body_fn=None):
+        """Sends a request over the connection.
+
+        Args:
+            request: The full HTTP request, as a string.
+            body_fn: A function to call with each piece of a successful
+                response's body as it arrives, or None to collect the body
+                into the HttpResponse.
+
+        Returns:
+            A Future whose result is the server's HttpResponse.
+        """
+        future = event_loop.Future()
+        if not self._is_open:
+            future.set_exception(ConnectionError('Connection is closed'))
+            return future
+        self._response_future = future
+        self._parser = _ResponseParser(body_fn)
+        self._outgoing = request
+        return future
+
+    def writable(self):
+        return bool(self._outgoing) or self.connecting
+
+    def handle_connect(self):
+        pass
+
+    def handle_write(self):
+        sent = self.send(self._outgoing)
+        self._outgoing = self._outgoing[sent:]
+
+    def handle_read(self):
+        data = self.recv(_RECV_BUFFER_BYTES)
+        if not data or not self._parser:
+            return
+        self._parser.feed(data)
+        if self._parser.is_complete():
+            self._finish_response()
+
+    def handle_close(self):
+        if self._parser and self._parser.finish_on_close():
+            self._finish_response()
+        self._shut_down(ConnectionError('Connection closed by server'))
+
+    def handle_error(self):
+        _, exception, _ = sys.exc_info()
+        self._shut_down(ConnectionError(str(exception)))
+
+    def _finish_response(self):
+        response = self._parser.response()
+        future = self._response_future
+        self._parser = None
+        self._response_future = None
+        if response.headers.get('connection', '').lower() == 'close':
+            self._shut_down(None)
+        future.set_result(response)
+
+    def _shut_down(self, exception):
+        if not self._is_open:
+            return
+        self._is_open = False
+        self.close()
+        future = self._response_future
+        self._response_future = None
+        self._parser = None
+        if future:
+            future.set_exception(exception)
+        self._on_closed()
+
+
+class _ResponseParser(object):
+    """Incrementally parses an HTTP/1.1 response from a byte stream.
+
+    Body data passes straight through to the body as it arrives, so only the
+    status line, headers and chunk framing are ever buffered.
+    """
+
+    def __init__(self, body_fn=None):
+        """Creates a new _ResponseParser instance.
+
+        Args:
+            body_fn: A function to call with each piece of the body of a
+                successful (2xx) response as it arrives, rather than
+                collecting the body into the HttpResponse. Bodies of other
+                responses are collected as usual, so callers can report them.
+        """
+        # Unparsed status line and headers, or a partial chunk framing line.
+        self._buffer = ''
+        self._status = None
+        self._headers = None
+        self._body_fn = body_fn
+        self._body_chunks = []
+        # Bytes left in the body or, if the body is chunked, in the current
+        # chunk.
+        self._remaining_bytes = None
+        self._chunked = False
+        # Whether the next chunk framing line is the one that ends a chunk's
+        # data, rather than a chunk size.
+        self._chunk_data_ended = False
+        self._reading_trailers = False
+        self._read_until_close = False
+        self._complete = False
+
+    def feed(self, data):
+        if self._headers is None:
+            self._buffer += data
+            end = self._buffer.find('\r\n\r\n')
+            if end < 0:
+                return
+            self._parse_headers(self._buffer[:end])
+            data = self._buffer[end + 4:]
+            self._buffer = ''
+        if not self._complete:
+            self._parse_body(data)
+
+    def is_complete(self):
+        return self._complete
+
+    def finish_on_close(self):
+        """Completes a response whose body ends when the connection closes.
+
+        Returns:
+            True if the response is complete.
+        """
+        if self._read_until_close:
+            self._complete = True
+        return self._complete
+
+    def response(self):
+        return HttpResponse(
+            status=self._status,
+            headers=self._headers,
+            body=''.join(self._body_chunks))
+
+    def _parse_headers(self, header_block):
+        lines = header_block.split('\r\n')
+        self._status = int(lines[0].split(' ', 2)[1])
+        self._headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            self._headers[name.strip().lower()] = value.strip()
+        if self._status in (204, 304) or 100 <= self._status < 200:
+            self._remaining_bytes = 0
+        elif self._headers.get('transfer-encoding', '').lower() == 'chunked':
+            self._chunked = True
+        elif 'content-length' in self._headers:
+            self._remaining_bytes = int(self._headers['content-length'])
+        else:
+            self._read_until_close = True
+
+    def _parse_body(self, data):
+        if self._chunked:
+            self._parse_chunks(data)
+        elif self._read_until_close:
+            self._add_body(data)
+        else:
+            body = data[:self._remaining_bytes]
+            self._add_body(body)
+            self._remaining_bytes -= len(body)
+            self._complete = self._remaining_bytes == 0
+
+    def _parse_chunks(self, data):
+        if self._buffer:
+            data = self._buffer + data
+            self._buffer = ''
+        position = 0
+        while position < len(data) and not self._complete:
+            if self._remaining_bytes:
+                end = min(len(data), position + self._remaining_bytes)
+                self._add_body(data[position:end])
+                self._remaining_bytes -= end - position
+                position = end
+                continue
+            line_end = data.find('\r\n', position)
+            if line_end < 0:
+                self._buffer = data[position:]
+                return
+            self._parse_chunk_line(data[position:line_end])
+            position = line_end + 2
+
+    def _parse_chunk_line(self, line):
+        if self._chunk_data_ended:
+            # The blank line that ends a chunk's data.
+            self._chunk_data_ended = False
+        elif self._reading_trailers:
+            # All chunks are read, so skip trailers up to the blank line that
+            # ends the response.
+            self._complete = not line
+        else:
+            self._remaining_bytes = int(line.split(';')[0], 16)
+            self._chunk_data_ended = self._remaining_bytes > 0
+            self._reading_trailers = self._remaining_bytes == 0
+
+    def _add_body(self, data):
+        if not data:
+            return
+        if self._body_fn is not None and 200 <= self._status < 300:
+            self._body_fn(data)
+        else:
+            self._body_chunks.append(data)
+
+
+# A complete HTTP response.
+#   status: The HTTP status code.
+#   headers: A dictionary of response headers, keyed by lowercase name.
+#   body: The response body, with any chunked transfer encoding removed.
+HttpResponse = collections.namedtuple('HttpResponse',
+                                      ['status', 'headers', 'body'])
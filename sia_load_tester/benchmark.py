@@ -0,0 +1,417 @@
+#!/usr/bin/python2
+"""Benchmarks the load tester's own overhead against a simulated Sia node.
+
+Runs the full load test (main.main) once for each combination of dataset shape
+and file count, against an in-process fake Sia node that uploads effectively
+instantly, so that the measurements reflect the cost of the load tester rather
+than of Sia. Results are written as JSON, and can be compared against the
+results from a previous commit to catch regressions:
+
+    python sia_load_tester/benchmark.py \\
+      --output_file after.json \\
+      --baseline_file before.json
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    # The resource module is not available on Windows.
+    resource = None
+
+import async_sia_client
+import concurrency
+import dataset_uploader
+import fake_siad
+import main as load_tester
+import sia_client as sc
+import sia_conditions
+
+logger = logging.getLogger(__name__)
+
+SHAPE_WORST = 'worst'
+SHAPE_OPTIMAL = 'optimal'
+SHAPE_MIXED = 'mixed'
+SHAPES = (SHAPE_WORST, SHAPE_OPTIMAL, SHAPE_MIXED)
+# File sizes (in bytes) for each dataset shape. Files cycle through the sizes
+# in order.
+_SHAPE_FILE_SIZES = {
+    SHAPE_WORST: (1,),
+    SHAPE_OPTIMAL: (40 * 2**20,),
+    SHAPE_MIXED: (1, 4 * 2**10, 2**20, 40 * 2**20),
+}
+
+DEFAULT_FILE_COUNTS = (1000, 10000)
+# File counts that --full_range benchmarks. Each upload slot frees up only
+# when a renter poll sees its upload complete, so a case takes roughly
+# file_count / concurrent uploads * poll interval seconds.
+FULL_RANGE_FILE_COUNTS = (1000, 10000, 100000, 1000000, 10000000)
+DEFAULT_RENTER_POLL_INTERVAL_SECONDS = 1.0
+# Relative increase in a metric over its baseline that counts as a regression.
+DEFAULT_REGRESSION_TOLERANCE = 0.1
+
+# Number of files to place in each directory of a generated dataset.
+_FILES_PER_DIRECTORY = 1000
+# Simulated upload bandwidth, high enough that Sia is never the bottleneck.
+_SIMULATED_UPLOAD_BANDWIDTH_MBPS = 10**7
+# Metrics to compare against a baseline, all of which are better when lower.
+_COMPARED_METRICS = ('wall_seconds', 'peak_rss_bytes', 'api_calls_per_file',
+                     'scheduler_idle_seconds')
+
+
+class Error(Exception):
+    pass
+
+
+class BenchmarkFailedError(Error):
+    pass
+
+
+def generate_dataset(dataset_dir, shape, file_count):
+    """Creates a dataset of files with the given shape.
+
+    Files are created sparse, so even large datasets take up little disk
+    space. A dataset that was already generated is reused as-is.
+
+    Args:
+        dataset_dir: Directory in which to create the dataset.
+        shape: Shape of the dataset (one of SHAPES).
+        file_count: Number of files to create.
+    """
+    # Mark completion outside of the dataset so the marker isn't part of it.
+    completion_marker = dataset_dir + '.complete'
+    if os.path.exists(completion_marker):
+        return
+    file_sizes = _SHAPE_FILE_SIZES[shape]
+    for i in xrange(file_count):
+        subdirectory = os.path.join(dataset_dir,
+                                    '%06d' % (i / _FILES_PER_DIRECTORY))
+        if i % _FILES_PER_DIRECTORY == 0 and not os.path.exists(subdirectory):
+            os.makedirs(subdirectory)
+        with open(os.path.join(subdirectory, '%09d.dat' % i), 'wb') as f:
+            f.truncate(file_sizes[i % len(file_sizes)])
+    open(completion_marker, 'w').close()
+
+
+def run_case(shape, file_count, work_dir, options):
+    """Benchmarks a single load test in a separate process.
+
+    Each case runs in its own process so that its peak memory usage is
+    measured in isolation and no state carries over between cases.
+
+    Args:
+        shape: Shape of the dataset (one of SHAPES).
+        file_count: Number of files in the dataset.
+        work_dir: Directory in which to store datasets and test output.
+        options: RunOptions for the load test.
+
+    Returns:
+        A BenchmarkResult for the case.
+
+    Raises:
+        BenchmarkFailedError if the load test fails.
+    """
+    dataset_dir = os.path.join(work_dir, 'dataset-%s-%d' % (shape, file_count))
+    logger.info('Generating %s dataset with %d files', shape, file_count)
+    generate_dataset(dataset_dir, shape, file_count)
+    output_dir = tempfile.mkdtemp(dir=work_dir)
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=_measure_load_test,
+        args=(dataset_dir, output_dir, options, results))
+    logger.info('Running load test on %s dataset with %d files', shape,
+                file_count)
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise BenchmarkFailedError(
+            'Load test failed with exit code %d. See logs in %s' %
+            (process.exitcode, output_dir))
+    measurement = results.get()
+    shutil.rmtree(output_dir)
+    return BenchmarkResult(shape=shape, file_count=file_count, **measurement)
+
+
+def _measure_load_test(dataset_dir, output_dir, options, results):
+    # Silence the load test's console output and the log handlers inherited
+    # from the benchmark process. The load test still logs to a file in its
+    # output directory.
+    logging.getLogger().handlers = []
+    sys.stderr = open(os.devnull, 'w')
+    server = fake_siad.make_server(
+        fake_siad.make_simulator(
+            fake_siad.Config(
+                upload_bandwidth_mbps=_SIMULATED_UPLOAD_BANDWIDTH_MBPS,
+                redundancy=fake_siad.DEFAULT_REDUNDANCY,
+                contract_count=fake_siad.DEFAULT_CONTRACT_COUNT,
+                contract_formation_seconds=0,
+                wallet_balance_hastings=(
+                    fake_siad.DEFAULT_WALLET_BALANCE_HASTINGS),
+                upload_error_rate=0.0,
+                connection_error_rate=0.0)), 0)
+    fake_siad.serve_async(server)
+    start_time = time.time()
+    upload_stats = load_tester.main(
+        _load_test_args(dataset_dir, output_dir, server.server_address[1],
+                        options))
+    wall_seconds = time.time() - start_time
+    api_calls = 0
+    for connection_stats in (sc.connection_stats(),
+                             async_sia_client.connection_stats()):
+        api_calls += connection_stats.opened + connection_stats.reused
+    results.put({
+        'wall_seconds':
+        wall_seconds,
+        'peak_rss_bytes':
+        _peak_rss_bytes(),
+        'api_calls':
+        api_calls,
+        'uploads_started':
+        upload_stats.uploads_started,
+        'api_calls_per_file': (float(api_calls) / upload_stats.uploads_started
+                               if upload_stats.uploads_started else None),
+        'scheduler_idle_seconds':
+        upload_stats.scheduler_idle_seconds,
+    })
+
+
+def _load_test_args(dataset_dir, output_dir, sia_api_port, options):
+    """Returns the load test's flags for a benchmark case.
+
+    Flags that the benchmark doesn't set keep the load tester's defaults.
+    """
+    args = load_tester.make_parser().parse_args(
+        ['--dataset_root', dataset_dir, '--output_dir', output_dir])
+    args.sia_api_port = sia_api_port
+    args.concurrency_policy = options.concurrency_policy
+    args.renter_poll_interval_seconds = options.renter_poll_interval_seconds
+    args.wait_mode = options.wait_mode
+    args.submission_workers = options.submission_workers
+    args.execution_mode = options.execution_mode
+    return args
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports peak RSS in bytes, other platforms in kilobytes.
+    if sys.platform == 'darwin':
+        return peak_rss
+    return peak_rss * 1024
+
+
+def compare_results(baseline_results, results, tolerance):
+    """Finds metrics that regressed relative to a baseline.
+
+    Args:
+        baseline_results: A list of BenchmarkResults from a previous run.
+        results: A list of BenchmarkResults from the current run.
+        tolerance: Relative increase in a metric over its baseline value
+            beyond which the metric counts as a regression.
+
+    Returns:
+        A list of Regressions. Cases or metrics missing from the baseline are
+        not compared.
+    """
+    baseline_by_case = {(r.shape, r.file_count): r for r in baseline_results}
+    regressions = []
+    for result in results:
+        baseline = baseline_by_case.get((result.shape, result.file_count))
+        if baseline is None:
+            continue
+        for metric in _COMPARED_METRICS:
+            baseline_value = getattr(baseline, metric)
+            value = getattr(result, metric)
+            if not baseline_value or value is None:
+                continue
+            if value > baseline_value * (1 + tolerance):
+                regressions.append(
+                    Regression(
+                        shape=result.shape,
+                        file_count=result.file_count,
+                        metric=metric,
+                        baseline_value=baseline_value,
+                        value=value))
+    return regressions
+
+
+def write_results(output_path, results):
+    """Writes BenchmarkResults to a JSON file, labeled with the commit."""
+    with open(output_path, 'w') as output_file:
+        json.dump(
+            {
+                'commit':
+                _current_commit(),
+                'timestamp':
+                datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'results': [r._asdict() for r in results],
+            },
+            output_file,
+            indent=2,
+            sort_keys=True)
+
+
+def load_results(input_path):
+    """Reads BenchmarkResults from a JSON file written by write_results."""
+    with open(input_path) as input_file:
+        return [BenchmarkResult(**r) for r in json.load(input_file)['results']]
+
+
+def _current_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Load test settings to use for each benchmark case.
+RunOptions = collections.namedtuple('RunOptions', [
+    'concurrency_policy', 'renter_poll_interval_seconds', 'wait_mode',
+    'submission_workers', 'execution_mode'
+])
+
+# Measurements of a single benchmark case.
+#   shape: Shape of the dataset (one of SHAPES).
+#   file_count: Number of files in the dataset.
+#   wall_seconds: Total duration of the load test.
+#   peak_rss_bytes: Peak resident memory of the load test process, or None if
+#       the platform does not report it.
+#   api_calls: Number of requests sent to the Sia API.
+#   uploads_started: Number of uploads Sia accepted.
+#   api_calls_per_file: Sia API requests per upload Sia accepted.
+#   scheduler_idle_seconds: Time the uploader spent waiting for an upload
+#       slot.
+BenchmarkResult = collections.namedtuple('BenchmarkResult', [
+    'shape', 'file_count', 'wall_seconds', 'peak_rss_bytes', 'api_calls',
+    'uploads_started', 'api_calls_per_file', 'scheduler_idle_seconds'
+])
+
+# A metric that got worse relative to a baseline benchmark.
+Regression = collections.namedtuple(
+    'Regression', ['shape', 'file_count', 'metric', 'baseline_value', 'value'])
+
+
+def main(args):
+    logging.basicConfig(
+        format='%(asctime)s %(name)-16s %(levelname)-4s %(message)s',
+        level=logging.INFO)
+    options = RunOptions(
+        concurrency_policy=args.concurrency_policy,
+        renter_poll_interval_seconds=args.renter_poll_interval_seconds,
+        wait_mode=args.wait_mode,
+        submission_workers=args.submission_workers,
+        execution_mode=args.execution_mode)
+    work_dir = args.work_dir or tempfile.mkdtemp()
+    if not os.path.exists(work_dir):
+        os.makedirs(work_dir)
+    try:
+        results = []
+        file_counts = (FULL_RANGE_FILE_COUNTS
+                       if args.full_range else args.file_counts)
+        for shape in args.shapes:
+            for file_count in file_counts:
+                result = run_case(shape, file_count, work_dir, options)
+                logger.info(
+                    ('%s dataset with %d files: %.1f seconds, %s bytes peak '
+                     'RSS, %.2f API calls per file, %.1f seconds idle'), shape,
+                    file_count, result.wall_seconds, result.peak_rss_bytes,
+                    result.api_calls_per_file or 0,
+                    result.scheduler_idle_seconds)
+                results.append(result)
+    finally:
+        # Keep datasets in a user-specified work directory for reuse.
+        if not args.work_dir:
+            shutil.rmtree(work_dir)
+    write_results(args.output_file, results)
+    logger.info('Wrote benchmark results to %s', args.output_file)
+    if not args.baseline_file:
+        return 0
+    regressions = compare_results(
+        load_results(args.baseline_file), results, args.regression_tolerance)
+    for regression in regressions:
+        logger.error('Regression in %s dataset with %d files: %s %s -> %s',
+                     regression.shape, regression.file_count, regression.metric,
+                     regression.baseline_value, regression.value)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='Sia Load Tester Benchmark',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '-o',
+        '--output_file',
+        required=True,
+        help='Path to JSON file in which to write benchmark results')
+    parser.add_argument(
+        '--baseline_file',
+        help='Path to JSON results of a previous run to compare against')
+    parser.add_argument(
+        '--regression_tolerance',
+        default=DEFAULT_REGRESSION_TOLERANCE,
+        type=float,
+        help='Relative increase in a metric that counts as a regression')
+    parser.add_argument(
+        '--shapes',
+        default=SHAPES,
+        nargs='+',
+        choices=SHAPES,
+        help='Dataset shapes to benchmark')
+    parser.add_argument(
+        '--file_counts',
+        default=DEFAULT_FILE_COUNTS,
+        nargs='+',
+        type=int,
+        help='Dataset file counts to benchmark')
+    parser.add_argument(
+        '--full_range',
+        action='store_true',
+        help=('Benchmark file counts from 1k to 10M instead of --file_counts. '
+              'The larger counts are limited by the renter poll interval and '
+              'take hours or more'))
+    parser.add_argument(
+        '--work_dir',
+        help=('Directory in which to keep generated datasets between runs. '
+              'Defaults to a temporary directory'))
+    parser.add_argument(
+        '--concurrency_policy',
+        default=concurrency.POLICY_FIXED,
+        choices=concurrency.POLICIES,
+        help='Concurrency policy for the load test')
+    parser.add_argument(
+        '--renter_poll_interval_seconds',
+        default=DEFAULT_RENTER_POLL_INTERVAL_SECONDS,
+        type=float,
+        help='Number of seconds between polls of the Sia renter file list')
+    parser.add_argument(
+        '--wait_mode',
+        default=sia_conditions.WAIT_MODE_EVENT,
+        choices=sia_conditions.WAIT_MODES,
+        help='How the load test waits for upload slots')
+    parser.add_argument(
+        '--submission_workers',
+        default=dataset_uploader.DEFAULT_SUBMISSION_WORKERS,
+        type=int,
+        help='Number of threads that submit uploads to Sia concurrently')
+    parser.add_argument(
+        '--execution_mode',
+        default=load_tester.EXECUTION_MODE_THREADS,
+        choices=load_tester.EXECUTION_MODES,
+        help='How the load test schedules its work')
+    sys.exit(main(parser.parse_args()))
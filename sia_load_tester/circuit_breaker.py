@@ -0,0 +1,188 @@
+"""Stops all Sia API clients from piling requests onto a struggling Sia node.
+
+Each client retries its own failed requests, so when Sia stops responding,
+every thread (and coroutine) keeps sending requests to it at once. The circuit
+breaker is shared by all clients: once Sia fails several requests in a row or
+answers too slowly, the circuit opens. While it is open, non-essential calls
+(e.g., state snapshots and periodic renter polls) are shed, and essential calls
+(e.g., upload submissions) wait. When the open period ends, a single probe
+request goes to Sia, and the circuit closes only if Sia answers it promptly.
+"""
+
+import logging
+import threading
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Number of consecutive failed or slow Sia API requests that open the circuit.
+DEFAULT_FAILURE_THRESHOLD = 5
+# Requests that take at least this many seconds count as failures.
+DEFAULT_SLOW_CALL_SECONDS = 30.0
+# Number of seconds the circuit stays open before probing Sia again.
+DEFAULT_OPEN_SECONDS = 30.0
+# Number of seconds essential calls wait before checking again whether the
+# probe request has closed the circuit.
+_PROBE_WAIT_SECONDS = 1.0
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+CIRCUIT_OPEN = metrics.gauge(
+    'api_circuit_open',
+    '1 while the Sia API circuit breaker is open or probing, otherwise 0.')
+CIRCUIT_TRIPS = metrics.counter(
+    'api_circuit_trips_total',
+    'Number of times the Sia API circuit breaker opened.')
+CALLS_SHED = metrics.counter(
+    'api_calls_shed_total',
+    'Number of non-essential Sia API calls skipped while the circuit breaker '
+    'was open, by client method.', ['method'])
+
+
+class Error(Exception):
+    pass
+
+
+class CallShedError(Error):
+    pass
+
+
+class CircuitBreaker(object):
+    """Circuit breaker shared by every client of one Sia node."""
+
+    def __init__(self,
+                 time_fn,
+                 failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 slow_call_seconds=DEFAULT_SLOW_CALL_SECONDS,
+                 open_seconds=DEFAULT_OPEN_SECONDS):
+        """Creates a new CircuitBreaker instance.
+
+        Args:
+            time_fn: A function that returns the current time in seconds.
+            failure_threshold: Number of consecutive failed or slow requests
+                that open the circuit.
+            slow_call_seconds: Requests that take at least this many seconds
+                count as failures.
+            open_seconds: Number of seconds the circuit stays open before a
+                probe request may go to Sia.
+        """
+        self._time_fn = time_fn
+        self._failure_threshold = failure_threshold
+        self._slow_call_seconds = slow_call_seconds
+        self._open_seconds = open_seconds
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._consecutive_failures = 0
+        self._opened_time = None
+        self._probe_in_flight = False
+
+    def state(self):
+        """Returns the circuit's state (one of the STATE_* constants)."""
+        with self._lock:
+            return self._state
+
+    def admit(self, method, essential=True):
+        """Decides whether a request to Sia may go ahead.
+
+        Once the open period ends, the first request to ask, essential or
+        not, becomes the probe request. Callers that get a wait must ask again
+        once it elapses, and callers that get through must report the outcome
+        of their request with record_response or record_failure.
+
+        Args:
+            method: Name of the client method making the request.
+            essential: False if the load test can do without the request.
+
+        Returns:
+            0 if the request may go to Sia now, otherwise the number of seconds
+            to wait before asking again.
+
+        Raises:
+            CallShedError if the request is not essential and the circuit is
+            open or already probing Sia.
+        """
+        with self._lock:
+            if self._state == STATE_CLOSED:
+                return 0
+            wait_seconds = self._wait_seconds_locked()
+            if wait_seconds:
+                if not essential:
+                    self._shed_locked(method)
+                return wait_seconds
+            logger.info('Probing Sia API with a call to %s', method)
+            self._state = STATE_HALF_OPEN
+            self._probe_in_flight = True
+            return 0
+
+    def check_shed(self, method):
+        """Sheds a non-essential task that would make requests to Sia.
+
+        Unlike admit, this does not make the caller the probe request, so
+        callers that go ahead must make their requests through a client that
+        calls admit.
+
+        Args:
+            method: Name of the task.
+
+        Raises:
+            CallShedError if the circuit is open or already probing Sia.
+        """
+        with self._lock:
+            if self._state != STATE_CLOSED and self._wait_seconds_locked():
+                self._shed_locked(method)
+
+    def _wait_seconds_locked(self):
+        """Returns how long a request must wait before it may probe Sia."""
+        if self._state == STATE_OPEN:
+            return max(0,
+                       self._opened_time + self._open_seconds - self._time_fn())
+        if self._probe_in_flight:
+            return _PROBE_WAIT_SECONDS
+        return 0
+
+    def _shed_locked(self, method):
+        CALLS_SHED.inc(method=method)
+        raise CallShedError('Sia API circuit is %s, skipping %s' % (self._state,
+                                                                    method))
+
+    def record_response(self, elapsed_seconds):
+        """Records a request that Sia answered.
+
+        Args:
+            elapsed_seconds: Time Sia took to answer the request.
+        """
+        if elapsed_seconds >= self._slow_call_seconds:
+            self.record_failure()
+            return
+        with self._lock:
+            self._consecutive_failures = 0
+            if self._state == STATE_HALF_OPEN:
+                logger.info('Sia API probe succeeded. Closing circuit.')
+                self._state = STATE_CLOSED
+                self._probe_in_flight = False
+                CIRCUIT_OPEN.set(0)
+
+    def record_failure(self):
+        """Records a request that failed to reach Sia or was too slow."""
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == STATE_HALF_OPEN:
+                logger.warning('Sia API probe failed. Reopening circuit.')
+                self._open()
+            elif (self._state == STATE_CLOSED and
+                  self._consecutive_failures >= self._failure_threshold):
+                logger.warning(
+                    ('Sia API failed %d requests in a row. Opening circuit for '
+                     '%.1f seconds.'), self._consecutive_failures,
+                    self._open_seconds)
+                CIRCUIT_TRIPS.inc()
+                self._open()
+
+    def _open(self):
+        self._state = STATE_OPEN
+        self._opened_time = self._time_fn()
+        self._probe_in_flight = False
+        CIRCUIT_OPEN.set(1)
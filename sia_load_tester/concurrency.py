@@ -0,0 +1,199 @@
+"""Controls how many uploads the load tester keeps in flight at once.
+
+A fixed limit either leaves bandwidth unused (for large files) or overloads
+Sia (for tiny files), so the limit can instead be tuned at runtime based on the
+upload throughput the load tester observes.
+"""
+
+import collections
+import csv
+import datetime
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENT_UPLOADS = 5
+
+POLICY_FIXED = 'fixed'
+POLICY_AIMD = 'aimd'
+POLICIES = (POLICY_FIXED, POLICY_AIMD)
+
+# Bounds on the in-flight upload limit under adaptive control.
+_MIN_CONCURRENT_UPLOADS = 1
+_MAX_CONCURRENT_UPLOADS = 200
+# Relative change in throughput between samples that counts as a real rise or
+# fall rather than noise.
+_THROUGHPUT_CHANGE_THRESHOLD = 0.05
+# Factor by which to shrink the limit when uploads fail.
+_ERROR_DECREASE_FACTOR = 0.5
+
+_METRICS_FILENAME = 'concurrency_metrics.csv'
+
+DECISION_INCREASE = 'increase'
+DECISION_DECREASE = 'decrease'
+DECISION_HOLD = 'hold'
+
+
+class Error(Exception):
+    pass
+
+
+class InvalidPolicyError(Error):
+    pass
+
+
+def make_controller(policy, output_dir):
+    """Factory for creating a concurrency controller.
+
+    Args:
+        policy: Name of the concurrency policy (one of POLICIES).
+        output_dir: Directory in which to write concurrency metrics.
+
+    Returns:
+        A concurrency controller implementing the given policy.
+    """
+    if policy == POLICY_FIXED:
+        return FixedController(DEFAULT_CONCURRENT_UPLOADS)
+    if policy == POLICY_AIMD:
+        return AimdController(DEFAULT_CONCURRENT_UPLOADS,
+                              MetricsWriter(
+                                  os.path.join(output_dir, _METRICS_FILENAME)),
+                              datetime.datetime.utcnow)
+    raise InvalidPolicyError('Unrecognized concurrency policy: %s' % policy)
+
+
+class FixedController(object):
+    """Concurrency controller that keeps a constant upload limit."""
+
+    def __init__(self, limit):
+        self._limit = limit
+
+    def limit(self):
+        return self._limit
+
+    def record_throughput(self, upload_mbps):
+        pass
+
+    def record_upload_error(self):
+        pass
+
+
+class AimdController(object):
+    """Adjusts the upload limit with additive-increase/multiplicative-decrease.
+
+    For each throughput sample, the controller:
+
+      * Halves the limit if any uploads failed since the previous sample.
+      * Raises the limit by one if throughput rose.
+      * Lowers the limit by one if throughput fell, or if it plateaued right
+        after an increase (the extra upload slot did not help).
+      * Otherwise, holds the limit steady.
+    """
+
+    def __init__(self, initial_limit, metrics_writer, time_fn):
+        """Creates a new AimdController instance.
+
+        Args:
+            initial_limit: The upload limit to start with.
+            metrics_writer: Callback that receives a Decision each time the
+                controller evaluates a throughput sample.
+            time_fn: A function that returns the current time.
+        """
+        self._limit = initial_limit
+        self._metrics_writer = metrics_writer
+        self._time_fn = time_fn
+        self._lock = threading.Lock()
+        self._previous_mbps = None
+        self._previous_action = DECISION_HOLD
+        self._errors_since_sample = 0
+
+    def limit(self):
+        with self._lock:
+            return self._limit
+
+    def record_upload_error(self):
+        with self._lock:
+            self._errors_since_sample += 1
+
+    def record_throughput(self, upload_mbps):
+        """Adjusts the upload limit based on the latest throughput sample.
+
+        Args:
+            upload_mbps: Upload throughput (in Mbps) since the previous sample.
+        """
+        with self._lock:
+            action, reason = self._decide(upload_mbps)
+            old_limit = self._limit
+            if action == DECISION_INCREASE:
+                self._limit = min(self._limit + 1, _MAX_CONCURRENT_UPLOADS)
+            elif action == DECISION_DECREASE and self._errors_since_sample:
+                self._limit = max(
+                    int(self._limit * _ERROR_DECREASE_FACTOR),
+                    _MIN_CONCURRENT_UPLOADS)
+            elif action == DECISION_DECREASE:
+                self._limit = max(self._limit - 1, _MIN_CONCURRENT_UPLOADS)
+            decision = Decision(
+                timestamp=self._time_fn(),
+                upload_mbps=upload_mbps,
+                upload_errors=self._errors_since_sample,
+                action=action,
+                reason=reason,
+                old_limit=old_limit,
+                new_limit=self._limit)
+            self._previous_mbps = upload_mbps
+            self._previous_action = action
+            self._errors_since_sample = 0
+        logger.info('Concurrency limit %d -> %d (%s: %s, %.2f Mbps)',
+                    decision.old_limit, decision.new_limit, decision.action,
+                    decision.reason, decision.upload_mbps)
+        self._metrics_writer(decision)
+
+    def _decide(self, upload_mbps):
+        if self._errors_since_sample:
+            return DECISION_DECREASE, '%d upload errors' % (
+                self._errors_since_sample)
+        if self._previous_mbps is None:
+            return DECISION_INCREASE, 'first sample'
+        change = _relative_change(self._previous_mbps, upload_mbps)
+        if change >= _THROUGHPUT_CHANGE_THRESHOLD:
+            return DECISION_INCREASE, 'throughput rising'
+        if change <= -_THROUGHPUT_CHANGE_THRESHOLD:
+            return DECISION_DECREASE, 'throughput falling'
+        if self._previous_action == DECISION_INCREASE:
+            return DECISION_DECREASE, 'throughput plateaued after increase'
+        return DECISION_HOLD, 'throughput steady'
+
+
+def _relative_change(old_value, new_value):
+    if old_value <= 0:
+        return 1.0 if new_value > 0 else 0.0
+    return (new_value - old_value) / float(old_value)
+
+
+class MetricsWriter(object):
+    """Appends concurrency Decisions to a CSV file."""
+
+    def __init__(self, output_path):
+        self._output_path = output_path
+
+    def __call__(self, decision):
+        write_header = not os.path.exists(self._output_path)
+        with open(self._output_path, 'ab') as output_file:
+            writer = csv.writer(output_file)
+            if write_header:
+                writer.writerow(Decision._fields)
+            writer.writerow([
+                decision.timestamp.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                '%.3f' % decision.upload_mbps, decision.upload_errors,
+                decision.action, decision.reason, decision.old_limit,
+                decision.new_limit
+            ])
+
+
+# A single evaluation by the concurrency controller and its outcome.
+Decision = collections.namedtuple('Decision', [
+    'timestamp', 'upload_mbps', 'upload_errors', 'action', 'reason',
+    'old_limit', 'new_limit'
+])
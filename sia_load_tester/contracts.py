@@ -24,10 +24,16 @@ class BuyAllowanceError(Error):
     pass
 
 
-def ensure_min_contracts():
-    initiator = Initiator(
-        Buyer(sc.make_sia_client()), Waiter(sc.make_sia_client(), time.sleep))
-    initiator.ensure_sia_has_enough_contracts()
+def ensure_min_contracts(node=None):
+    make_initiator(node).ensure_sia_has_enough_contracts()
+
+
+def make_initiator(node=None):
+    """Creates an Initiator for a Sia node (by default, on localhost)."""
+    node = node or sc.default_node()
+    return Initiator(
+        Buyer(node.make_sia_client()), Waiter(node.make_sia_client(),
+                                              time.sleep))
 
 
 class Initiator(object):
@@ -1,8 +1,24 @@
+import collections
 import logging
 import os
+import Queue
+import time
+from multiprocessing import pool
+
+try:
+    from os import scandir
+except ImportError:
+    from scandir import scandir
+
+import dataset_manifest
 
 logger = logging.getLogger(__name__)
 
+# Number of threads that list directories in parallel during a dataset scan.
+DEFAULT_SCAN_WORKERS = 8
+# Minimum number of seconds between scan progress log messages.
+_SCAN_PROGRESS_INTERVAL_SECONDS = 10
+
 
 class Error(Exception):
     pass
@@ -19,15 +35,18 @@ class Dataset(object):
     The test files must be located in the root of a single directory.
     """
 
-    def __init__(self, root_dir, paths):
+    def __init__(self, root_dir, paths, file_sizes=None):
         """Creates a new Dataset instance.
 
         Args:
             root_dir: Root directory in which dataset files are located.
             paths: Paths of the files in the dataset.
+            file_sizes: An optional dictionary of file sizes (in bytes), keyed
+                by path.
         """
         self._root_dir = root_dir
         self._paths = sorted(paths)
+        self._file_sizes = file_sizes or {}
 
     @property
     def root_dir(self):
@@ -37,24 +56,275 @@ class Dataset(object):
     def paths(self):
         return self._paths
 
+    @property
+    def files(self):
+        """Iterates over DatasetFile entries for each file in the dataset."""
+        for path in self._paths:
+            yield DatasetFile(path=path, size=self._file_sizes.get(path))
+
+
+class StreamingDataset(object):
+    """A Dataset whose files are discovered as the dataset is consumed.
+
+    Rather than waiting for a full scan of the dataset root before returning
+    any files, a StreamingDataset yields each file as soon as the scan finds
+    it, so that consumers can begin work while the scan continues. Files are
+    yielded in the order the scan finds them rather than in sorted order.
+    """
+
+    def __init__(self, root_dir, scanned_files):
+        """Creates a new StreamingDataset instance.
+
+        Args:
+            root_dir: Root directory in which dataset files are located.
+            scanned_files: An iterator of DatasetFile entries for the files in
+                the dataset, as a scan finds them.
+        """
+        self._root_dir = root_dir
+        self._scanned_files = scanned_files
+
+    @property
+    def root_dir(self):
+        return self._root_dir
+
+    @property
+    def paths(self):
+        for dataset_file in self.files:
+            yield dataset_file.path
+
+    @property
+    def files(self):
+        """Iterates over DatasetFile entries as the scan finds them.
+
+        The underlying scan can only be consumed once.
+        """
+        return self._scanned_files
+
 
 def load_from_path(input_path):
     """Creates a new dataset from an input path."""
+    _check_dataset_root(input_path)
+    file_sizes = {}
+    try:
+        for dataset_file in scan_files(input_path):
+            file_sizes[dataset_file.path] = dataset_file.size
+    except OSError:
+        raise InvalidPath('Unable to read dataset directory: %s' % input_path)
+    dataset = Dataset(input_path, file_sizes.keys(), file_sizes)
+    logger.info('Input dataset contains %d files', len(dataset.paths))
+    return dataset
+
+
+def stream_from_path(input_path, manifest_path=None):
+    """Creates a new StreamingDataset that scans an input path as it is read.
+
+    Args:
+        input_path: Root directory of the dataset.
+        manifest_path: Optional path to a dataset manifest from which to reuse
+            unchanged directory listings. The manifest is rewritten once the
+            scan completes.
+
+    Returns:
+        A StreamingDataset for the input path.
+
+    Raises:
+        InvalidPath if the input path does not exist or cannot be read. The
+        scan itself raises InvalidPath as it is read if listing the input
+        path fails.
+    """
+    _check_dataset_root(input_path)
+    if not (os.path.isdir(input_path) and
+            os.access(input_path, os.R_OK | os.X_OK)):
+        raise InvalidPath('Unable to read dataset directory: %s' % input_path)
+    return StreamingDataset(input_path,
+                            _scan_dataset_root(input_path, manifest_path))
+
+
+def _check_dataset_root(input_path):
     if not os.path.exists(input_path):
         raise InvalidPath(
             'Input dataset directory does not exist: %s' % input_path)
+
+
+def _scan_dataset_root(input_path, manifest_path):
+    # scan_files raises OSError only when the root itself cannot be listed, as
+    # it skips unreadable subdirectories.
     try:
-        dataset = Dataset(input_path, _find_files_recursively(input_path))
+        for dataset_file in scan_files(input_path, manifest_path=manifest_path):
+            yield dataset_file
     except OSError:
         raise InvalidPath('Unable to read dataset directory: %s' % input_path)
-    logger.info('Input dataset contains %d files', len(dataset.paths))
-    return dataset
 
 
-def _find_files_recursively(root_dir):
+def scan_files(root_dir, worker_count=DEFAULT_SCAN_WORKERS, manifest_path=None):
+    """Finds all files under a directory, listing subdirectories in parallel.
+
+    Lists directories with scandir, which reports each entry's type (and, on
+    Windows, its size) along with its name, so the scan needs at most one
+    stat call per file to learn its size. Subdirectories are listed
+    concurrently by a pool of worker threads, which hides filesystem latency
+    on network-mounted datasets. Symbolic links to directories are not
+    followed, matching os.walk's default behavior.
+
+    If a manifest path is given, directories that have not changed since the
+    manifest was written are read from the manifest instead of being listed
+    again, and the manifest is rewritten with the results of this scan once
+    the scan completes.
+
+    Args:
+        root_dir: Directory to scan recursively.
+        worker_count: Number of threads to use for listing directories.
+        manifest_path: Optional path to a dataset manifest.
+
+    Yields:
+        A DatasetFile for each file found, as soon as it is found.
+
+    Raises:
+        The error raised while listing the root directory (usually OSError)
+        if it cannot be read.
+    """
     logger.info('Searching for files in %s', root_dir)
-    paths = []
-    for root, _, filenames in os.walk(root_dir):
-        for filename in filenames:
-            paths.append(os.path.join(root, filename))
-    return paths
+    cached_listings = {}
+    manifest_writer = None
+    if manifest_path:
+        cached_listings = dataset_manifest.load(manifest_path)
+        manifest_writer = dataset_manifest.Writer(manifest_path)
+    worker_pool = pool.ThreadPool(worker_count)
+    listings = Queue.Queue()
+    progress = _ScanProgress(time.time)
+    try:
+        worker_pool.apply_async(
+            _list_directory, (root_dir, cached_listings), callback=listings.put)
+        pending_directories = 1
+        while pending_directories:
+            listing = listings.get()
+            pending_directories -= 1
+            if listing.error:
+                if listing.directory == root_dir:
+                    raise listing.error
+                logger.warning('Skipping unreadable directory %s: %s',
+                               listing.directory, listing.error)
+                continue
+            for subdirectory in listing.contents.subdirectories:
+                worker_pool.apply_async(
+                    _list_directory, (subdirectory, cached_listings),
+                    callback=listings.put)
+                pending_directories += 1
+            if manifest_writer:
+                manifest_writer.add_listing(listing.directory, listing.contents)
+            for listed_file in listing.contents.files:
+                yield DatasetFile(path=listed_file.path, size=listed_file.size)
+            progress.add_listing(listing)
+    except:
+        if manifest_writer:
+            manifest_writer.close()
+        raise
+    finally:
+        worker_pool.terminate()
+    if manifest_writer:
+        manifest_writer.finish()
+    progress.log_summary()
+
+
+def _list_directory(directory, cached_listings):
+    """Lists a single directory's files and subdirectories.
+
+    Args:
+        directory: Path to the directory to list.
+        cached_listings: A dictionary of dataset_manifest.Listing entries from
+            a previous scan, keyed by directory path.
+
+    Returns:
+        A DirectoryListing. Errors are returned in the listing rather than
+        raised, as the scan would otherwise wait forever for a listing that
+        the worker thread never delivers.
+    """
+    try:
+        directory_mtime = os.stat(directory).st_mtime
+        cached_listing = cached_listings.get(directory)
+        if cached_listing and dataset_manifest.is_fresh(cached_listing,
+                                                        directory_mtime):
+            return DirectoryListing(
+                directory=directory,
+                contents=cached_listing,
+                from_manifest=True,
+                error=None)
+        listed_at = time.time()
+        files = []
+        subdirectories = []
+        for entry in scandir(directory):
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    subdirectories.append(entry.path)
+                continue
+            try:
+                stat = entry.stat()
+                size, mtime = stat.st_size, stat.st_mtime
+            except OSError:
+                # Broken symlinks have no size to report.
+                size, mtime = None, None
+            files.append(
+                dataset_manifest.ListedFile(
+                    path=entry.path, size=size, mtime=mtime))
+    except Exception as e:
+        # Not just OSError: a name that cannot be decoded, for example, raises
+        # UnicodeDecodeError.
+        return DirectoryListing(
+            directory=directory, contents=None, from_manifest=False, error=e)
+    return DirectoryListing(
+        directory=directory,
+        contents=dataset_manifest.Listing(
+            mtime=directory_mtime,
+            listed_at=listed_at,
+            files=files,
+            subdirectories=subdirectories),
+        from_manifest=False,
+        error=None)
+
+
+class _ScanProgress(object):
+    """Periodically logs the rate at which a scan is finding files."""
+
+    def __init__(self, time_fn):
+        self._time_fn = time_fn
+        self._start_time = time_fn()
+        self._last_report_time = self._start_time
+        self._file_count = 0
+        self._directory_count = 0
+        self._manifest_directory_count = 0
+
+    def add_listing(self, listing):
+        self._file_count += len(listing.contents.files)
+        self._directory_count += 1
+        if listing.from_manifest:
+            self._manifest_directory_count += 1
+        now = self._time_fn()
+        if now - self._last_report_time >= _SCAN_PROGRESS_INTERVAL_SECONDS:
+            self._last_report_time = now
+            logger.info('Scanned %d files so far (%.1f files/sec)',
+                        self._file_count, self._files_per_second(now))
+
+    def log_summary(self):
+        logger.info(('Scan found %d files (%.1f files/sec), reusing %d of %d '
+                     'directory listings from manifest'), self._file_count,
+                    self._files_per_second(self._time_fn()),
+                    self._manifest_directory_count, self._directory_count)
+
+    def _files_per_second(self, now):
+        elapsed_seconds = now - self._start_time
+        if elapsed_seconds <= 0:
+            return 0
+        return self._file_count / elapsed_seconds
+
+
+# A file in the dataset and its size in bytes (None if the size is unknown).
+DatasetFile = collections.namedtuple('DatasetFile', ['path', 'size'])
+
+# The result of listing a single directory during a dataset scan.
+#   directory: Path of the directory.
+#   contents: A dataset_manifest.Listing of the directory's contents or None
+#       if the directory could not be read.
+#   from_manifest: True if contents were reused from a dataset manifest.
+#   error: The exception raised while listing the directory, if any.
+DirectoryListing = collections.namedtuple(
+    'DirectoryListing', ['directory', 'contents', 'from_manifest', 'error'])
@@ -0,0 +1,209 @@
+"""On-disk cache of dataset directory listings.
+
+Scanning a large dataset from scratch can take many minutes, so the load
+tester records each directory listing from a scan in a SQLite manifest. On the
+next run, a directory whose modification time has not changed since it was
+listed is read back from the manifest instead of being listed again.
+
+A directory's modification time changes when files are added to, removed from
+or renamed within it, but not when an existing file is modified in place, so
+file sizes in the manifest can go stale if dataset files are rewritten between
+runs.
+"""
+
+import collections
+import logging
+import os
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+# If a directory was modified this close (in seconds) to when it was listed,
+# the listing may have missed changes made in the same mtime tick, so it
+# shouldn't be trusted on a later run.
+_MTIME_GRANULARITY_SECONDS = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    listed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS subdirectories (
+    parent TEXT NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    directory TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER,
+    mtime REAL
+);
+CREATE INDEX IF NOT EXISTS subdirectories_parent ON subdirectories (parent);
+CREATE INDEX IF NOT EXISTS files_directory ON files (directory);
+"""
+
+
+def load(manifest_path):
+    """Reads the directory listings recorded in a manifest.
+
+    Args:
+        manifest_path: Path to the manifest file.
+
+    Returns:
+        A dictionary of Listing instances, keyed by directory path.
+        Empty if the manifest does not exist or cannot be read.
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        connection = _connect(manifest_path)
+        try:
+            return _read_listings(connection)
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        logger.warning('Ignoring unreadable dataset manifest %s: %s',
+                       manifest_path, e)
+        return {}
+
+
+def _read_listings(connection):
+    subdirectories = collections.defaultdict(list)
+    for parent, path in connection.execute(
+            'SELECT parent, path FROM subdirectories'):
+        subdirectories[parent].append(path)
+    files = collections.defaultdict(list)
+    for directory, path, size, mtime in connection.execute(
+            'SELECT directory, path, size, mtime FROM files'):
+        files[directory].append(ListedFile(path=path, size=size, mtime=mtime))
+    listings = {}
+    for path, mtime, listed_at in connection.execute(
+            'SELECT path, mtime, listed_at FROM directories'):
+        listings[path] = Listing(
+            mtime=mtime,
+            listed_at=listed_at,
+            files=files[path],
+            subdirectories=subdirectories[path])
+    logger.info('Loaded %d directory listings from dataset manifest',
+                len(listings))
+    return listings
+
+
+def is_fresh(listing, directory_mtime):
+    """Indicates whether a cached listing still reflects its directory.
+
+    Args:
+        listing: A Listing from a previous scan.
+        directory_mtime: The directory's current modification time.
+
+    Returns:
+        True if the directory has not changed since it was listed.
+    """
+    return ((listing.mtime == directory_mtime) and
+            (listing.listed_at - listing.mtime > _MTIME_GRANULARITY_SECONDS))
+
+
+class Writer(object):
+    """Records directory listings to a manifest as a scan reads them.
+
+    Each listing is committed as soon as it is recorded, so a scan that is
+    interrupted (e.g., because the load test was killed before it consumed
+    the whole dataset) still leaves behind the listings it read. Listings
+    from earlier scans stay in the manifest until they are replaced, and the
+    listings of directories that no longer exist are dropped when a scan
+    finishes.
+    """
+
+    def __init__(self, manifest_path):
+        self._manifest_path = manifest_path
+        self._connection = None
+        self._recorded_directories = set()
+
+    def add_listing(self, directory, listing):
+        """Records a single directory listing.
+
+        Args:
+            directory: Path of the listed directory.
+            listing: A Listing of the directory's contents.
+        """
+        if self._connection is None:
+            self._open()
+        with self._connection:
+            _delete_listing(self._connection, directory)
+            self._connection.execute(
+                'INSERT INTO directories (path, mtime, listed_at) '
+                'VALUES (?, ?, ?)',
+                (directory, listing.mtime, listing.listed_at))
+            self._connection.executemany(
+                'INSERT INTO subdirectories (parent, path) VALUES (?, ?)',
+                [(directory, path) for path in listing.subdirectories])
+            self._connection.executemany(
+                'INSERT INTO files (directory, path, size, mtime) '
+                'VALUES (?, ?, ?, ?)',
+                [(directory, f.path, f.size, f.mtime) for f in listing.files])
+        self._recorded_directories.add(directory)
+
+    def finish(self):
+        """Drops listings of directories the completed scan didn't find."""
+        if self._connection is None:
+            return
+        with self._connection:
+            stale_directories = [
+                path for path, in self._connection.execute(
+                    'SELECT path FROM directories')
+                if path not in self._recorded_directories
+            ]
+            for directory in stale_directories:
+                _delete_listing(self._connection, directory)
+        self.close()
+        logger.info('Saved dataset manifest to %s', self._manifest_path)
+
+    def close(self):
+        """Closes the manifest, keeping the listings recorded so far."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _open(self):
+        try:
+            self._connection = _connect(self._manifest_path)
+            self._connection.executescript(_SCHEMA)
+        except sqlite3.Error as e:
+            logger.warning('Replacing unreadable dataset manifest %s: %s',
+                           self._manifest_path, e)
+            if self._connection is not None:
+                self._connection.close()
+            os.remove(self._manifest_path)
+            self._connection = _connect(self._manifest_path)
+            self._connection.executescript(_SCHEMA)
+        # The manifest is only a cache, so losing recent listings to an
+        # operating system crash is acceptable, but waiting for the disk on
+        # every listing is not.
+        self._connection.execute('PRAGMA synchronous = OFF')
+
+
+def _delete_listing(connection, directory):
+    connection.execute('DELETE FROM directories WHERE path = ?', (directory,))
+    connection.execute('DELETE FROM subdirectories WHERE parent = ?',
+                       (directory,))
+    connection.execute('DELETE FROM files WHERE directory = ?', (directory,))
+
+
+def _connect(path):
+    connection = sqlite3.connect(path, check_same_thread=False)
+    # Return paths as byte strings, the same as the filesystem APIs do.
+    connection.text_factory = str
+    return connection
+
+
+# A file in a manifest listing, with its size in bytes and modification time.
+ListedFile = collections.namedtuple('ListedFile', ['path', 'size', 'mtime'])
+
+# The contents of a directory as of a previous scan.
+#   mtime: Modification time of the directory when it was listed.
+#   listed_at: Time at which the directory was listed.
+#   files: A list of ListedFile entries for files in the directory.
+#   subdirectories: A list of paths of subdirectories of the directory.
+Listing = collections.namedtuple(
+    'Listing', ['mtime', 'listed_at', 'files', 'subdirectories'])
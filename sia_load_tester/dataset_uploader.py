@@ -1,25 +1,62 @@
+import collections
 import logging
+import Queue
+import threading
 
+import metrics
 import sia_client as sc
 import sia_conditions
 
-_MAX_CONCURRENT_UPLOADS = 5
-_SLEEP_SECONDS = 15
-
 logger = logging.getLogger(__name__)
 
+# Number of threads that submit uploads to Sia concurrently.
+DEFAULT_SUBMISSION_WORKERS = 4
+
+# Error type for uploads that Sia received but refused to start.
+ERROR_REJECTED = 'rejected'
+
+UPLOADS_SUBMITTED = metrics.counter('uploads_submitted_total',
+                                    'Number of uploads that Sia accepted.')
+UPLOAD_ERRORS = metrics.counter(
+    'upload_errors_total',
+    'Number of failed upload submissions, by error type (the exception class, '
+    'or "%s" if Sia refused the upload).' % ERROR_REJECTED, ['error'])
+
+
+def make_dataset_uploader(upload_queue,
+                          renter_poller,
+                          concurrency_controller,
+                          upload_journal,
+                          latency_tracker,
+                          exit_event,
+                          wait_mode,
+                          submission_workers,
+                          node=None):
+    """Factory for creating a DatasetUploader using production settings.
 
-def make_dataset_uploader(upload_queue, exit_event):
-    """Factory for creating a DatasetUploader using production settings."""
-    return DatasetUploader(upload_queue, sc.make_sia_client(),
-                           sia_conditions.make_waiter(exit_event), exit_event)
+    Uploads to the given sia_client.Node, or by default to the node on
+    localhost.
+    """
+    node = node or sc.default_node()
+    waiter = sia_conditions.make_waiter(renter_poller, concurrency_controller,
+                                        exit_event, wait_mode)
+    return DatasetUploader(upload_queue, node.make_sia_client(), waiter,
+                           concurrency_controller, upload_journal,
+                           latency_tracker, submission_workers, exit_event)
 
 
 class DatasetUploader(object):
-    """Uploads a full dataset of files to Sia."""
+    """Uploads a full dataset of files to Sia.
+
+    Each upload request to Sia is a blocking HTTP round-trip, so uploads are
+    submitted by a pool of worker threads. Each worker reserves an upload slot
+    from the condition waiter before it takes a job from the queue, so the
+    workers together never exceed the concurrent upload limit.
+    """
 
     def __init__(self, upload_queue, sia_client, sia_condition_waiter,
-                 exit_event):
+                 concurrency_controller, upload_journal, latency_tracker,
+                 submission_workers, exit_event):
         """Creates a new DatasetUploader instance.
 
         Args:
@@ -27,28 +64,99 @@ class DatasetUploader(object):
             sia_client: An implementation of the Sia client API.
             sia_condition_waiter: An object that blocks the thread to wait for
                 particular Sia conditions to be true.
-            exit_event: Event to set when DatasetUploader completes upload.
+            concurrency_controller: Controller for the upload concurrency limit
+                to notify of upload errors.
+            upload_journal: Journal in which to record submitted and failed
+                uploads.
+            latency_tracker: Tracker with which to time submitted uploads.
+            submission_workers: Number of threads that submit uploads to Sia
+                concurrently.
+            exit_event: Event to set when DatasetUploader completes upload or
+                a submission worker fails.
         """
         self._upload_queue = upload_queue
         self._sia_client = sia_client
         self._sia_condition_waiter = sia_condition_waiter
+        self._concurrency_controller = concurrency_controller
+        self._upload_journal = upload_journal
+        self._latency_tracker = latency_tracker
+        self._submission_workers = submission_workers
         self._exit_event = exit_event
+        self._lock = threading.Lock()
+        self._uploads_started = 0
+        self._upload_failures = 0
+        # The first exception raised in a submission worker, if any.
+        self._worker_error = None
 
     def upload(self):
         """Uploads the dataset to Sia.
 
         Uploads and does not return until all files in the dataset are fully
         uploaded to Sia.
+
+        Raises:
+            The first exception raised by any submission worker (e.g.,
+            WaitInterruptedError if the exit event is set during upload).
         """
-        while not self._upload_queue.empty():
-            logger.info('%d files left to upload', self._upload_queue.qsize())
-            self._sia_condition_waiter.wait_for_available_upload_slot()
-            job = self._upload_queue.get()
-            if (not self._process_upload_job_async(job)) and (job.failure_count
-                                                              < 3):
-                self._upload_queue.put(job)
+        workers = [
+            threading.Thread(target=self._submit_jobs)
+            for _ in xrange(self._submission_workers)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        if self._worker_error:
+            raise self._worker_error
         self._sia_condition_waiter.wait_for_all_uploads_to_complete()
         self._exit_event.set()
+        stats = self.stats()
+        logger.info(('Started %d uploads (%d failed attempts), spent %.1f '
+                     'seconds waiting for upload slots'), stats.uploads_started,
+                    stats.upload_failures, stats.scheduler_idle_seconds)
+
+    def stats(self):
+        """Returns UploadStats for the uploads so far."""
+        with self._lock:
+            return UploadStats(
+                uploads_started=self._uploads_started,
+                upload_failures=self._upload_failures,
+                scheduler_idle_seconds=(
+                    self._sia_condition_waiter.idle_seconds()))
+
+    def _submit_jobs(self):
+        """Submits jobs from the queue until it is empty or a worker fails."""
+        try:
+            while (not self._worker_error) and (not self._upload_queue.empty()):
+                retry_seconds = self._upload_queue.seconds_until_ready()
+                if retry_seconds:
+                    self._wait_for_retry(retry_seconds)
+                    continue
+                self._sia_condition_waiter.wait_for_available_upload_slot()
+                try:
+                    job = self._upload_queue.get()
+                except Queue.Empty:
+                    # Another worker took the last job that was ready.
+                    self._sia_condition_waiter.release_upload_slot()
+                    continue
+                error = self._process_upload_job_async(job)
+                if error:
+                    self._sia_condition_waiter.release_upload_slot()
+                    self._upload_queue.retry(job, error)
+        except Exception as ex:
+            with self._lock:
+                if not self._worker_error:
+                    self._worker_error = ex
+            # Wake the other workers, which may be waiting for upload slots
+            # that Sia will never free.
+            self._exit_event.set()
+
+    def _wait_for_retry(self, retry_seconds):
+        logger.info('Waiting %.1f seconds to retry failed uploads',
+                    retry_seconds)
+        if self._exit_event.wait(retry_seconds):
+            raise sia_conditions.WaitInterruptedError(
+                'Exit event set while waiting to retry failed uploads')
 
     def _process_upload_job_async(self, job):
         """Starts a single file upload to Sia.
@@ -57,13 +165,45 @@ class DatasetUploader(object):
             job: Sia upload job to process.
 
         Returns:
-            True if upload job was sent to Sia successfully.
+            None if upload job was sent to Sia successfully, otherwise the type
+            of error that stopped it.
         """
         logger.info('Uploading file to Sia: %s', job.local_path)
         try:
-            return self._sia_client.upload_file_async(job.local_path,
-                                                      job.sia_path)
+            if not self._sia_client.upload_file_async(job.local_path,
+                                                      job.sia_path):
+                self._record_failure(job, ERROR_REJECTED)
+                return ERROR_REJECTED
         except Exception as ex:
             logger.error('Upload failed: %s', ex.message)
-            job.increment_failure_count()
-            return False
+            self._record_failure(job, error_type(ex))
+            return error_type(ex)
+        with self._lock:
+            self._uploads_started += 1
+        UPLOADS_SUBMITTED.inc()
+        self._upload_journal.record_submitted(job)
+        self._latency_tracker.record_submitted(job)
+        self._sia_condition_waiter.record_upload_started(job.sia_path)
+        return None
+
+    def _record_failure(self, job, error):
+        job.increment_failure_count()
+        with self._lock:
+            self._upload_failures += 1
+        UPLOAD_ERRORS.inc(error=error)
+        self._upload_journal.record_failed(job)
+        self._concurrency_controller.record_upload_error()
+
+
+def error_type(ex):
+    """Returns the error type under which to count an upload exception."""
+    return type(ex).__name__
+
+
+# Counts of the uploads a DatasetUploader has performed.
+#   uploads_started: Number of uploads that Sia accepted.
+#   upload_failures: Number of upload attempts that failed.
+#   scheduler_idle_seconds: Total time spent waiting for an upload slot.
+UploadStats = collections.namedtuple(
+    'UploadStats',
+    ['uploads_started', 'upload_failures', 'scheduler_idle_seconds'])
@@ -0,0 +1,244 @@
+"""A minimal single-threaded event loop for generator-based coroutines.
+
+Python 2.7 has no asyncio, so this module provides the small subset of it that
+the load tester needs, built on asyncore: non-blocking sockets, timers,
+Futures and coroutines.
+
+A coroutine is a generator that yields Futures. The loop resumes the generator
+with each Future's result once the Future completes, or raises the Future's
+exception inside the generator. A coroutine produces a result by raising
+Return, e.g.:
+
+    def fetch_count(sia_client):
+        files = yield sia_client.renter_files()
+        raise event_loop.Return(len(files))
+"""
+
+import asyncore
+import collections
+import heapq
+import itertools
+import time
+
+# Longest time to block waiting for socket activity, so that the loop notices
+# timers and callbacks scheduled from outside socket handlers.
+_MAX_POLL_SECONDS = 1.0
+
+
+class Error(Exception):
+    pass
+
+
+class Return(Exception):
+    """Raised inside a coroutine to finish it with a result."""
+
+    def __init__(self, value=None):
+        super(Return, self).__init__(value)
+        self.value = value
+
+
+class Future(object):
+    """The eventual result of an asynchronous operation."""
+
+    def __init__(self):
+        self._done = False
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def done(self):
+        return self._done
+
+    def result(self):
+        """Returns the Future's result.
+
+        Raises:
+            The Future's exception, if it completed with one, or Error if the
+            Future is not done.
+        """
+        if not self._done:
+            raise Error('Future is not done')
+        if self._exception:
+            raise self._exception
+        return self._result
+
+    def exception(self):
+        """Returns the Future's exception, or None if it has none."""
+        return self._exception
+
+    def set_result(self, result):
+        self._complete(result, None)
+
+    def set_exception(self, exception):
+        self._complete(None, exception)
+
+    def add_done_callback(self, callback):
+        """Calls callback with the Future once the Future is done."""
+        if self._done:
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def _complete(self, result, exception):
+        if self._done:
+            raise Error('Future is already done')
+        self._done = True
+        self._result = result
+        self._exception = exception
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+class EventLoop(object):
+    """Runs callbacks, timers, coroutines and asyncore socket handlers."""
+
+    def __init__(self, time_fn=time.time, sleep_fn=time.sleep):
+        """Creates a new EventLoop instance.
+
+        Args:
+            time_fn: A function that returns the current time in seconds.
+            sleep_fn: A callback function for putting the thread to sleep for
+                a given number of seconds when the loop has no sockets open.
+        """
+        self._time_fn = time_fn
+        self._sleep_fn = sleep_fn
+        # Map of open asyncore dispatchers, keyed by file descriptor.
+        self.socket_map = {}
+        self._ready = collections.deque()
+        # Heap of (deadline, sequence number, callback, args) tuples.
+        self._timers = []
+        self._timer_sequence = itertools.count()
+
+    def time(self):
+        return self._time_fn()
+
+    def call_soon(self, callback, *args):
+        """Schedules callback to run on the next iteration of the loop."""
+        self._ready.append((callback, args))
+
+    def call_later(self, delay, callback, *args):
+        """Schedules callback to run after delay seconds."""
+        heapq.heappush(self._timers,
+                       (self._time_fn() + delay, next(self._timer_sequence),
+                        callback, args))
+
+    def sleep(self, seconds):
+        """Returns a Future that completes after the given number of seconds."""
+        future = Future()
+        self.call_later(seconds, _set_result_if_pending, future, None)
+        return future
+
+    def with_timeout(self, future, seconds):
+        """Waits for a Future, but no longer than a given number of seconds.
+
+        Args:
+            future: The Future to wait for.
+            seconds: Maximum number of seconds to wait.
+
+        Returns:
+            A Future whose result is True if the given Future completed within
+            the timeout or False if the timeout elapsed first.
+        """
+        waiter = Future()
+        future.add_done_callback(lambda _: _set_result_if_pending(waiter, True))
+        self.call_later(seconds, _set_result_if_pending, waiter, False)
+        return waiter
+
+    def spawn(self, coroutine):
+        """Starts running a coroutine.
+
+        Args:
+            coroutine: A generator that yields Futures.
+
+        Returns:
+            A Future for the coroutine's result.
+        """
+        return _Task(self, coroutine)
+
+    def run_until_complete(self, future):
+        """Runs the loop until a Future completes.
+
+        Returns:
+            The Future's result.
+
+        Raises:
+            The Future's exception, if it completed with one, or Error if the
+            loop runs out of work before the Future completes.
+        """
+        while not future.done():
+            if not (self._ready or self._timers or self.socket_map):
+                raise Error(
+                    'Event loop has no work left, but future is pending')
+            self._run_once()
+        return future.result()
+
+    def _run_once(self):
+        timeout = 0
+        if not self._ready:
+            timeout = _MAX_POLL_SECONDS
+            if self._timers:
+                timeout = min(timeout,
+                              max(0, self._timers[0][0] - self._time_fn()))
+        if self.socket_map:
+            asyncore.loop(
+                timeout=timeout, use_poll=True, map=self.socket_map, count=1)
+        elif timeout > 0:
+            self._sleep_fn(timeout)
+
+        now = self._time_fn()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, callback, args = heapq.heappop(self._timers)
+            self._ready.append((callback, args))
+
+        # Run only the callbacks that are ready now, so that callbacks which
+        # schedule more callbacks can't starve socket handlers and timers.
+        for _ in xrange(len(self._ready)):
+            callback, args = self._ready.popleft()
+            callback(*args)
+
+
+def _set_result_if_pending(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+class _Task(Future):
+    """A Future that drives a coroutine to completion."""
+
+    def __init__(self, loop, coroutine):
+        super(_Task, self).__init__()
+        self._loop = loop
+        self._coroutine = coroutine
+        loop.call_soon(self._step, None, None)
+
+    def _step(self, value, exception):
+        try:
+            if exception:
+                yielded = self._coroutine.throw(exception)
+            else:
+                yielded = self._coroutine.send(value)
+        except Return as ret:
+            self.set_result(ret.value)
+            return
+        except StopIteration:
+            self.set_result(None)
+            return
+        except Exception as ex:
+            self.set_exception(ex)
+            return
+        if not isinstance(yielded, Future):
+            self._loop.call_soon(self._step, None,
+                                 Error('Coroutine yielded a non-Future: %r' %
+                                       (yielded,)))
+            return
+        yielded.add_done_callback(self._wake)
+
+    def _wake(self, future):
+        # Resume from the loop rather than from the completing Future's stack,
+        # so that long chains of coroutines don't exhaust the stack.
+        exception = future.exception()
+        if exception:
+            self._loop.call_soon(self._step, None, exception)
+        else:
+            self._loop.call_soon(self._step, future.result(), None)
@@ -0,0 +1,471 @@
+#!/usr/bin/python2
+"""Local stand-in for the Sia daemon, for running the load tester offline.
+
+Serves the subset of the siad HTTP API that the load tester uses, backed by a
+Simulator that models upload bandwidth, per-file upload progress, contract
+formation and injected failures. This makes it possible to benchmark the load
+tester itself, or reproduce a scheduling problem, without a synced blockchain
+or a funded wallet.
+
+The simulated node listens on siad's default API port, so the load tester can
+run against it unmodified:
+
+    python sia_load_tester/fake_siad.py --upload_bandwidth_mbps 500
+"""
+
+import argparse
+import BaseHTTPServer
+import collections
+import json
+import logging
+import os
+import random
+import SocketServer
+import threading
+import time
+import urllib
+import urlparse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 9980
+DEFAULT_UPLOAD_BANDWIDTH_MBPS = 100.0
+DEFAULT_REDUNDANCY = 3.0
+DEFAULT_CONTRACT_COUNT = 50
+DEFAULT_CONTRACT_FORMATION_SECONDS = 60.0
+DEFAULT_WALLET_BALANCE_HASTINGS = 1000 * 10**24  # 1000 SC
+
+# Sia rejects API requests that don't come from a Sia user agent.
+_SIA_USER_AGENT = 'Sia-Agent'
+_BLOCK_HEIGHT = 150000
+_UPLOAD_PATH_PREFIX = '/renter/upload/'
+
+
+class Error(Exception):
+    pass
+
+
+class ApiError(Error):
+    """Error that the fake Sia node reports to the client as a 400 response."""
+    pass
+
+
+def make_simulator(config):
+    """Creates a Simulator using production settings."""
+    return Simulator(config, time.time, random.random)
+
+
+def make_server(simulator, port):
+    """Creates an HTTP server that serves the Sia API from a Simulator.
+
+    Args:
+        simulator: The Simulator to serve.
+        port: Port on which to listen on localhost, or 0 to let the OS choose
+            a free port.
+
+    Returns:
+        An unstarted HTTP server.
+    """
+    return _ThreadingHTTPServer(('localhost', port), _make_handler(simulator))
+
+
+def serve_async(server):
+    """Serves requests from an HTTP server in a background thread."""
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    logger.info('Serving fake Sia API on port %d', server.server_address[1])
+    thread.start()
+
+
+class Simulator(object):
+    """Simulates the state of a Sia node's renter, wallet and consensus.
+
+    Upload progress advances lazily whenever the simulated state is read:
+    the bandwidth available since the previous read is split evenly between
+    all in-progress uploads. Like Sia, the simulator counts redundant copies of
+    each file towards its uploaded bytes, so a file must upload its size times
+    the redundancy factor to reach 100% progress.
+    """
+
+    def __init__(self, config, time_fn, random_fn):
+        """Creates a new Simulator instance.
+
+        Args:
+            config: A Config of simulation parameters.
+            time_fn: A function that returns the current time in seconds.
+            random_fn: A function that returns a random float in [0.0, 1.0),
+                used to decide when to inject errors.
+        """
+        self._config = config
+        self._time_fn = time_fn
+        self._random_fn = random_fn
+        self._lock = threading.Lock()
+        self._bytes_per_second = config.upload_bandwidth_mbps * 1000 * 1000 / 8
+        self._last_advance_time = time_fn()
+        self._allowance_funds = 0
+        self._allowance_period = 0
+        self._allowance_set_time = None
+        # Files in the order they were uploaded, keyed by siapath.
+        self._files = collections.OrderedDict()
+        self._uploading = []
+
+    def should_drop_connection(self):
+        """Indicates whether to simulate a dropped connection to Sia."""
+        return self._random_fn() < self._config.connection_error_rate
+
+    def consensus(self):
+        return {u'synced': True, u'height': _BLOCK_HEIGHT}
+
+    def wallet(self):
+        return {
+            u'encrypted': True,
+            u'unlocked': True,
+            u'confirmedsiacoinbalance':
+            str(self._config.wallet_balance_hastings),
+            u'unconfirmedincomingsiacoins': '0',
+            u'unconfirmedoutgoingsiacoins': '0',
+        }
+
+    def renter(self):
+        with self._lock:
+            return {
+                u'settings': {
+                    u'allowance': {
+                        u'funds': str(self._allowance_funds),
+                        u'hosts': self._config.contract_count,
+                        u'period': self._allowance_period,
+                        u'renewwindow': self._allowance_period / 2,
+                    }
+                }
+            }
+
+    def set_allowance(self, funds, period):
+        """Sets the renter allowance, which starts contract formation.
+
+        Args:
+            funds: Allowance budget (in hastings).
+            period: Allowance period (in blocks).
+
+        Raises:
+            ApiError if the allowance exceeds the wallet balance.
+        """
+        if funds > self._config.wallet_balance_hastings:
+            raise ApiError('insufficient balance')
+        with self._lock:
+            self._allowance_funds = funds
+            self._allowance_period = period
+            if self._allowance_set_time is None:
+                self._allowance_set_time = self._time_fn()
+
+    def renter_contracts(self):
+        contracts = []
+        for i in xrange(self._contracts_formed()):
+            contracts.append({
+                u'id':
+                u'%064x' % i,
+                u'netaddress':
+                u'host-%d.example.com:9982' % i,
+                u'endheight':
+                _BLOCK_HEIGHT + self._allowance_period,
+                u'renterfunds':
+                str(self._allowance_funds / self._config.contract_count),
+                u'size':
+                0,
+            })
+        return {u'contracts': contracts}
+
+    def _contracts_formed(self):
+        with self._lock:
+            if self._allowance_set_time is None:
+                return 0
+            formation_seconds = self._config.contract_formation_seconds
+            if formation_seconds <= 0:
+                return self._config.contract_count
+            elapsed = self._time_fn() - self._allowance_set_time
+            return min(
+                self._config.contract_count,
+                int(self._config.contract_count * elapsed / formation_seconds))
+
+    def renter_prices(self):
+        return {
+            u'downloadterabyte': u'%d' % (10 * 10**24),
+            u'formcontracts': u'%d' % (5 * 10**24),
+            u'storageterabytemonth': u'%d' % (20 * 10**24),
+            u'uploadterabyte': u'%d' % (10 * 10**24),
+        }
+
+    def renter_files(self):
+        with self._lock:
+            self._advance()
+            return {
+                u'files':
+                [self._file_status(f) for f in self._files.itervalues()]
+            }
+
+    def _file_status(self, fake_file):
+        uploaded_bytes = int(fake_file.uploaded_bytes)
+        if fake_file.total_bytes:
+            progress = 100.0 * uploaded_bytes / fake_file.total_bytes
+        else:
+            progress = 100.0
+        return {
+            u'siapath': fake_file.sia_path,
+            u'localpath': fake_file.local_path,
+            u'filesize': fake_file.size,
+            u'available': uploaded_bytes >= fake_file.size,
+            u'renewing': True,
+            u'redundancy': self._config.redundancy * progress / 100.0,
+            u'uploadedbytes': uploaded_bytes,
+            u'uploadprogress': min(progress, 100.0),
+            u'expiration': _BLOCK_HEIGHT + self._allowance_period,
+        }
+
+    def upload(self, sia_path, local_path):
+        """Starts a simulated upload of a local file.
+
+        Args:
+            sia_path: Name of the file within Sia.
+            local_path: Path to the file on the local filesystem.
+
+        Raises:
+            ApiError if Sia would reject the upload, or if an upload error is
+            injected.
+        """
+        if self._random_fn() < self._config.upload_error_rate:
+            raise ApiError('simulated upload failure')
+        try:
+            size = os.path.getsize(local_path)
+        except OSError as e:
+            raise ApiError('unable to open source file: %s' % e.strerror)
+        with self._lock:
+            self._advance()
+            if sia_path in self._files:
+                raise ApiError('a file already exists at that location')
+            fake_file = _FakeFile(sia_path, local_path, size,
+                                  int(size * self._config.redundancy))
+            self._files[sia_path] = fake_file
+            if fake_file.total_bytes:
+                self._uploading.append(fake_file)
+
+    def _advance(self):
+        """Distributes bandwidth since the last advance among uploads."""
+        now = self._time_fn()
+        budget = (now - self._last_advance_time) * self._bytes_per_second
+        self._last_advance_time = now
+        while budget > 0 and self._uploading:
+            share = budget / len(self._uploading)
+            still_uploading = []
+            for fake_file in self._uploading:
+                remaining = fake_file.remaining_bytes()
+                if share < remaining:
+                    fake_file.uploaded_bytes += share
+                    budget -= share
+                    still_uploading.append(fake_file)
+                else:
+                    fake_file.uploaded_bytes = fake_file.total_bytes
+                    budget -= remaining
+            # If every upload took its full share, the budget is spent.
+            # Otherwise, redistribute what completed uploads left over.
+            if len(still_uploading) == len(self._uploading):
+                break
+            self._uploading = still_uploading
+
+
+class _FakeFile(object):
+    """Upload state of a single file in the simulated renter."""
+
+    __slots__ = ('sia_path', 'local_path', 'size', 'total_bytes',
+                 'uploaded_bytes')
+
+    def __init__(self, sia_path, local_path, size, total_bytes):
+        self.sia_path = sia_path
+        self.local_path = local_path
+        self.size = size
+        self.total_bytes = total_bytes
+        self.uploaded_bytes = 0.0
+
+    def remaining_bytes(self):
+        return self.total_bytes - self.uploaded_bytes
+
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def _make_handler(simulator):
+    """Creates a request handler class bound to a Simulator."""
+
+    class Handler(_SiaRequestHandler):
+        pass
+
+    Handler.simulator = simulator
+    return Handler
+
+
+class _SiaRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Routes Sia API requests to a Simulator."""
+
+    # Support keep-alive so that clients can reuse connections, as with siad.
+    protocol_version = 'HTTP/1.1'
+    simulator = None
+
+    def do_GET(self):
+        routes = {
+            '/consensus': self.simulator.consensus,
+            '/renter': self.simulator.renter,
+            '/renter/contracts': self.simulator.renter_contracts,
+            '/renter/files': self.simulator.renter_files,
+            '/renter/prices': self.simulator.renter_prices,
+            '/wallet': self.simulator.wallet,
+        }
+        self._handle(routes.get(urlparse.urlparse(self.path).path))
+
+    def do_POST(self):
+        path = urlparse.urlparse(self.path).path
+        content_length = int(self.headers.getheader('Content-Length', 0))
+        form = urlparse.parse_qs(self.rfile.read(content_length))
+        if path == '/renter':
+            self._handle(lambda: self.simulator.set_allowance(
+                long(_form_value(form, 'funds')),
+                int(_form_value(form, 'period'))))
+        elif path.startswith(_UPLOAD_PATH_PREFIX):
+            sia_path = urllib.unquote(path[len(_UPLOAD_PATH_PREFIX):])
+            self._handle(lambda: self.simulator.upload(
+                sia_path, _form_value(form, 'source')))
+        else:
+            self._handle(None)
+
+    def _handle(self, route_fn):
+        """Responds to a request using the given route.
+
+        Args:
+            route_fn: A function that returns the response body, or None for
+                actions with no response body. None if no route matches the
+                request.
+        """
+        if self.simulator.should_drop_connection():
+            self.close_connection = 1
+            return
+        if self.headers.getheader('User-Agent') != _SIA_USER_AGENT:
+            self._send_error(400, 'Browser access disabled due to security '
+                             'vulnerability. Use Sia-UI or siac.')
+            return
+        if route_fn is None:
+            self._send_error(404, '404 page not found')
+            return
+        try:
+            response = route_fn()
+        except ApiError as e:
+            self._send_error(400, str(e))
+            return
+        if response is None:
+            # Like siad, successful actions return no content.
+            self.send_response(204)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            self._send_json(200, response)
+
+    def _send_error(self, status, message):
+        self._send_json(status, {u'message': message})
+
+    def _send_json(self, status, body):
+        encoded = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format_string, *args):
+        logger.debug(format_string, *args)
+
+
+def _form_value(form, key):
+    try:
+        return form[key][0]
+    except KeyError:
+        raise ApiError('missing required parameter: %s' % key)
+
+
+# Parameters of a simulated Sia node.
+#   upload_bandwidth_mbps: Total upload bandwidth shared by all uploads.
+#   redundancy: Ratio of bytes Sia uploads to the size of each file.
+#   contract_count: Number of contracts the renter forms.
+#   contract_formation_seconds: Time to form all contracts after the
+#       allowance is set. Contracts form at an even rate over this time.
+#   wallet_balance_hastings: Confirmed wallet balance.
+#   upload_error_rate: Fraction of upload requests to reject.
+#   connection_error_rate: Fraction of requests for which to drop the
+#       connection without a response.
+Config = collections.namedtuple('Config', [
+    'upload_bandwidth_mbps', 'redundancy', 'contract_count',
+    'contract_formation_seconds', 'wallet_balance_hastings',
+    'upload_error_rate', 'connection_error_rate'
+])
+
+
+def main(args):
+    logging.basicConfig(
+        format='%(asctime)s %(name)-16s %(levelname)-4s %(message)s',
+        level=logging.INFO)
+    server = make_server(
+        make_simulator(
+            Config(
+                upload_bandwidth_mbps=args.upload_bandwidth_mbps,
+                redundancy=args.redundancy,
+                contract_count=args.contract_count,
+                contract_formation_seconds=args.contract_formation_seconds,
+                wallet_balance_hastings=args.wallet_balance_hastings,
+                upload_error_rate=args.upload_error_rate,
+                connection_error_rate=args.connection_error_rate)), args.port)
+    logger.info('Serving fake Sia API on port %d', args.port)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='Fake Sia Node',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '--port',
+        default=DEFAULT_PORT,
+        type=int,
+        help='Port on which to serve the Sia API')
+    parser.add_argument(
+        '--upload_bandwidth_mbps',
+        default=DEFAULT_UPLOAD_BANDWIDTH_MBPS,
+        type=float,
+        help='Total upload bandwidth shared by all uploads')
+    parser.add_argument(
+        '--redundancy',
+        default=DEFAULT_REDUNDANCY,
+        type=float,
+        help='Ratio of bytes uploaded to the size of each file')
+    parser.add_argument(
+        '--contract_count',
+        default=DEFAULT_CONTRACT_COUNT,
+        type=int,
+        help='Number of contracts to form once the allowance is set')
+    parser.add_argument(
+        '--contract_formation_seconds',
+        default=DEFAULT_CONTRACT_FORMATION_SECONDS,
+        type=float,
+        help='Number of seconds to form all contracts')
+    parser.add_argument(
+        '--wallet_balance_hastings',
+        default=DEFAULT_WALLET_BALANCE_HASTINGS,
+        type=long,
+        help='Confirmed wallet balance')
+    parser.add_argument(
+        '--upload_error_rate',
+        default=0.0,
+        type=float,
+        help='Fraction of upload requests to reject')
+    parser.add_argument(
+        '--connection_error_rate',
+        default=0.0,
+        type=float,
+        help='Fraction of requests for which to drop the connection')
+    main(parser.parse_args())
@@ -0,0 +1,83 @@
+"""Log-bucketed histograms for recording latency distributions."""
+
+import array
+
+# Histograms split each power-of-two range of values into this many
+# equal-width buckets, so recorded values have a relative error of at most
+# 1 / _SUB_BUCKET_COUNT.
+_SUB_BUCKET_BITS = 5
+_SUB_BUCKET_COUNT = 2**_SUB_BUCKET_BITS
+
+
+class Histogram(object):
+    """Log-bucketed histogram of latencies, in the style of HdrHistogram.
+
+    Values are recorded in whole milliseconds. Values below
+    2 * _SUB_BUCKET_COUNT each get their own bucket, and every power-of-two
+    range above that is split into _SUB_BUCKET_COUNT equal-width buckets. This
+    bounds the relative error of every recorded value while memory grows only
+    with the logarithm of the largest value, and recording takes constant
+    time.
+    """
+
+    def __init__(self):
+        self._counts = array.array('L')
+        self._total_count = 0
+        self._max_ms = 0
+
+    def __len__(self):
+        return self._total_count
+
+    def record(self, seconds):
+        """Records a latency.
+
+        Args:
+            seconds: The latency to record, in seconds. Negative latencies are
+                recorded as zero.
+        """
+        value_ms = max(0, int(seconds * 1000))
+        index = _bucket_index(value_ms)
+        if index >= len(self._counts):
+            self._counts.extend([0] * (index + 1 - len(self._counts)))
+        self._counts[index] += 1
+        self._total_count += 1
+        self._max_ms = max(self._max_ms, value_ms)
+
+    def max(self):
+        """Returns the largest recorded latency in seconds or None if empty."""
+        if not self._total_count:
+            return None
+        return self._max_ms / 1000.0
+
+    def percentile(self, percentile):
+        """Returns the latency at a percentile of the recorded latencies.
+
+        Args:
+            percentile: The percentile to compute, between 0 and 100.
+
+        Returns:
+            The highest latency (in seconds) that falls in the same bucket as
+            the latency at the given percentile, or None if the histogram is
+            empty.
+        """
+        if not self._total_count:
+            return None
+        # Rank of the value at the percentile, rounded up, counting from one.
+        rank = max(1, -(-self._total_count * percentile // 100))
+        cumulative_count = 0
+        for index, count in enumerate(self._counts):
+            cumulative_count += count
+            if cumulative_count >= rank:
+                break
+        return min(_bucket_max_ms(index), self._max_ms) / 1000.0
+
+
+def _bucket_index(value_ms):
+    shift = max(0, value_ms.bit_length() - _SUB_BUCKET_BITS - 1)
+    return shift * _SUB_BUCKET_COUNT + (value_ms >> shift)
+
+
+def _bucket_max_ms(index):
+    shift = max(0, index // _SUB_BUCKET_COUNT - 1)
+    sub_bucket = index - shift * _SUB_BUCKET_COUNT
+    return ((sub_bucket + 1) << shift) - 1
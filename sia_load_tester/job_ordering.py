@@ -0,0 +1,285 @@
+"""Decides the order in which the upload queue hands out jobs.
+
+By default, jobs are uploaded in the order the dataset scan finds them, so
+the mix of file sizes plays no part in scheduling. Size-aware orderings
+instead hold a window of upcoming jobs and pick from it by file size, e.g.,
+to keep the upload slots full of bandwidth-heavy large files, or to
+interleave small and large files in a fixed proportion.
+"""
+
+import collections
+import heapq
+import os
+
+import upload_latency
+
+ORDERING_FIFO = 'fifo'
+ORDERING_LARGEST_FIRST = 'largest_first'
+ORDERING_SMALLEST_FIRST = 'smallest_first'
+ORDERING_ROUND_ROBIN = 'size_round_robin'
+ORDERING_TARGET_MIX = 'target_mix'
+ORDERINGS = (ORDERING_FIFO, ORDERING_LARGEST_FIRST, ORDERING_SMALLEST_FIRST,
+             ORDERING_ROUND_ROBIN, ORDERING_TARGET_MIX)
+
+# Number of upcoming jobs that size-aware orderings choose among. Larger
+# windows order the dataset more strictly, but delay the first upload until
+# the dataset scan has found this many files.
+DEFAULT_WINDOW_JOBS = 10000
+
+# Relative number of jobs of each size class that the target mix ordering
+# hands out, favoring large files, which use upload bandwidth most
+# efficiently.
+DEFAULT_TARGET_SIZE_MIX = {
+    upload_latency.SIZE_CLASS_SMALL: 1,
+    upload_latency.SIZE_CLASS_MEDIUM: 1,
+    upload_latency.SIZE_CLASS_LARGE: 2,
+}
+
+
+class Error(Exception):
+    pass
+
+
+class InvalidOrderingError(Error):
+    pass
+
+
+class InvalidSizeMixError(Error):
+    pass
+
+
+def make_ordering(ordering, target_size_mix=None):
+    """Factory for creating a job ordering.
+
+    Args:
+        ordering: Name of the ordering (one of ORDERINGS).
+        target_size_mix: For the target mix ordering, a dictionary of the
+            relative number of jobs to hand out for each size class. Defaults
+            to DEFAULT_TARGET_SIZE_MIX.
+
+    Returns:
+        A job ordering implementing the given policy.
+    """
+    if ordering == ORDERING_FIFO:
+        return FifoOrdering()
+    size_cache = StatCache()
+    if ordering == ORDERING_LARGEST_FIRST:
+        return SizeOrdering(size_cache, largest_first=True)
+    if ordering == ORDERING_SMALLEST_FIRST:
+        return SizeOrdering(size_cache, largest_first=False)
+    if ordering == ORDERING_ROUND_ROBIN:
+        return MixOrdering(size_cache,
+                           {c: 1
+                            for c in upload_latency.SIZE_CLASSES})
+    if ordering == ORDERING_TARGET_MIX:
+        return MixOrdering(size_cache, target_size_mix or
+                           DEFAULT_TARGET_SIZE_MIX)
+    raise InvalidOrderingError('Unrecognized job ordering: %s' % ordering)
+
+
+def parse_size_mix(size_mix):
+    """Parses a target size mix from a command-line flag.
+
+    Args:
+        size_mix: A comma-separated list of size_class=weight pairs, for
+            example 'small=1,medium=1,large=2'.
+
+    Returns:
+        A dictionary of weights, keyed by size class.
+
+    Raises:
+        InvalidSizeMixError if the size mix is malformed.
+    """
+    weights = {}
+    for pair in size_mix.split(','):
+        size_class, _, weight = pair.partition('=')
+        size_class = size_class.strip()
+        if size_class not in upload_latency.SIZE_CLASSES:
+            raise InvalidSizeMixError(
+                'Unrecognized size class: %s' % size_class)
+        try:
+            weights[size_class] = int(weight)
+        except ValueError:
+            raise InvalidSizeMixError(
+                'Weight for %s must be an integer, got: %s' % (size_class,
+                                                               weight))
+        if weights[size_class] < 0:
+            raise InvalidSizeMixError(
+                'Weight for %s must not be negative' % size_class)
+    if not any(weights.values()):
+        raise InvalidSizeMixError('Size mix needs at least one positive weight')
+    return weights
+
+
+def order_jobs(upload_jobs, ordering):
+    """Yields upload jobs in the order that a job ordering chooses.
+
+    Reads at most the ordering's window_jobs jobs ahead of the jobs it
+    yields, as the upload queue does.
+
+    Args:
+        upload_jobs: An iterable of upload jobs.
+        ordering: The job ordering in which to yield the jobs.
+    """
+    for job in upload_jobs:
+        ordering.push(job)
+        if len(ordering) >= ordering.window_jobs:
+            yield ordering.pop()
+    while ordering:
+        yield ordering.pop()
+
+
+class StatCache(object):
+    """Looks up the sizes of the files that upload jobs upload.
+
+    Jobs from a dataset scan already carry the size the scan read, so the
+    cache stats only files whose size is unknown, and at most once per file,
+    even when several jobs (e.g., dataset copies) upload the same file.
+    """
+
+    def __init__(self, stat_fn=os.stat):
+        self._stat_fn = stat_fn
+        # Maps local paths to file sizes (in bytes) or None if the file could
+        # not be read.
+        self._sizes = {}
+
+    def size(self, job):
+        """Returns the size (in bytes) of a job's file or None if unknown."""
+        if job.file_size is not None:
+            return job.file_size
+        local_path = job.local_path
+        if local_path not in self._sizes:
+            try:
+                self._sizes[local_path] = self._stat_fn(local_path).st_size
+            except OSError:
+                self._sizes[local_path] = None
+        return self._sizes[local_path]
+
+
+class FifoOrdering(object):
+    """Hands out jobs in the order they were added."""
+
+    # Holding jobs back gains nothing, so there is no need to read ahead of
+    # the next job.
+    window_jobs = 1
+
+    def __init__(self):
+        self._jobs = collections.deque()
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def push(self, job):
+        self._jobs.append(job)
+
+    def pop(self):
+        """Removes and returns the next job, or None if there are none."""
+        if not self._jobs:
+            return None
+        return self._jobs.popleft()
+
+
+class SizeOrdering(object):
+    """Hands out the largest (or smallest) job first.
+
+    Jobs of unknown size go last. Jobs of equal size go in the order they were
+    added.
+    """
+
+    window_jobs = DEFAULT_WINDOW_JOBS
+
+    def __init__(self, size_cache, largest_first):
+        """Creates a new SizeOrdering instance.
+
+        Args:
+            size_cache: A StatCache for looking up the sizes of job files.
+            largest_first: True to hand out the largest job first, False to
+                hand out the smallest job first.
+        """
+        self._size_cache = size_cache
+        self._largest_first = largest_first
+        # Heap of (unknown size, sort key, insertion order, job) tuples.
+        self._heap = []
+        self._jobs_pushed = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, job):
+        size = self._size_cache.size(job)
+        if size is None:
+            sort_key = 0
+        elif self._largest_first:
+            sort_key = -size
+        else:
+            sort_key = size
+        heapq.heappush(self._heap,
+                       (size is None, sort_key, self._jobs_pushed, job))
+        self._jobs_pushed += 1
+
+    def pop(self):
+        """Removes and returns the next job, or None if there are none."""
+        if not self._heap:
+            return None
+        return heapq.heappop(self._heap)[-1]
+
+
+class MixOrdering(object):
+    """Interleaves jobs of each size class in proportion to target weights.
+
+    Chooses among the size classes that have jobs waiting using smooth
+    weighted round-robin, so that classes are interleaved evenly rather than
+    handed out in bursts. Jobs within a size class go in the order they were
+    added. Size classes without a positive weight get jobs only when no
+    weighted class has any waiting.
+    """
+
+    window_jobs = DEFAULT_WINDOW_JOBS
+
+    def __init__(self, size_cache, weights):
+        """Creates a new MixOrdering instance.
+
+        Args:
+            size_cache: A StatCache for looking up the sizes of job files.
+            weights: A dictionary of the relative number of jobs to hand out
+                for each size class.
+        """
+        self._size_cache = size_cache
+        self._weights = weights
+        self._jobs = collections.OrderedDict(
+            (c, collections.deque()) for c in upload_latency.SIZE_CLASSES)
+        # Each size class's running credit in the weighted round-robin.
+        self._credits = dict.fromkeys(upload_latency.SIZE_CLASSES, 0)
+        self._job_count = 0
+
+    def __len__(self):
+        return self._job_count
+
+    def push(self, job):
+        size_class = upload_latency.size_class(self._size_cache.size(job))
+        self._jobs[size_class].append(job)
+        self._job_count += 1
+
+    def pop(self):
+        """Removes and returns the next job, or None if there are none."""
+        if not self._job_count:
+            return None
+        size_class = self._next_size_class()
+        self._job_count -= 1
+        return self._jobs[size_class].popleft()
+
+    def _next_size_class(self):
+        waiting = [
+            c for c, class_jobs in self._jobs.iteritems()
+            if class_jobs and self._weights.get(c, 0) > 0
+        ]
+        if not waiting:
+            return next(
+                c for c, class_jobs in self._jobs.iteritems() if class_jobs)
+        total_weight = 0
+        for size_class in waiting:
+            self._credits[size_class] += self._weights[size_class]
+            total_weight += self._weights[size_class]
+        chosen = max(waiting, key=lambda c: self._credits[c])
+        self._credits[chosen] -= total_weight
+        return chosen
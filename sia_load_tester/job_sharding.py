@@ -0,0 +1,202 @@
+"""Splits the upload job stream among several Sia nodes.
+
+A single renter node saturates long before the network does, so the load
+tester can drive several Sia nodes at once. Each node uploads its own share of
+the dataset: either the files whose siapaths hash to it on a consistent hash
+ring, so that every run sends each file to the same node, or whichever files
+are next when the node has a free upload slot, so that faster nodes take on
+more of the dataset.
+"""
+
+import bisect
+import collections
+import hashlib
+import logging
+import threading
+
+SHARDING_HASH = 'hash'
+SHARDING_LEAST_LOADED = 'least_loaded'
+SHARDINGS = (SHARDING_HASH, SHARDING_LEAST_LOADED)
+
+# Number of points each node owns on the hash ring. More points spread the
+# dataset more evenly among nodes.
+DEFAULT_RING_POINTS_PER_NODE = 100
+# Maximum number of jobs that may wait in memory for a node that has fallen
+# behind the others under hash sharding.
+DEFAULT_MAX_PENDING_JOBS_PER_NODE = 10000
+
+logger = logging.getLogger(__name__)
+
+
+class Error(Exception):
+    pass
+
+
+class InvalidShardingError(Error):
+    pass
+
+
+def make_sharder(sharding, upload_jobs, node_names):
+    """Factory for creating a job sharder.
+
+    Args:
+        sharding: Name of the sharding policy (one of SHARDINGS).
+        upload_jobs: An iterable of upload jobs to split among the nodes. It
+            is read only once, so it may be a stream of jobs.
+        node_names: Names of the nodes, in the order of their indexes.
+
+    Returns:
+        A sharder whose jobs_for method returns each node's share of the jobs.
+    """
+    if sharding == SHARDING_HASH:
+        return HashSharder(upload_jobs, HashRing(node_names))
+    if sharding == SHARDING_LEAST_LOADED:
+        return PullSharder(upload_jobs)
+    raise InvalidShardingError('Unrecognized job sharding: %s' % sharding)
+
+
+class HashRing(object):
+    """Consistent hash ring that assigns siapaths to nodes.
+
+    Adding or removing a node moves only the siapaths on that node's points of
+    the ring, so the other nodes keep the files they uploaded in earlier runs.
+    """
+
+    def __init__(self, node_names,
+                 points_per_node=DEFAULT_RING_POINTS_PER_NODE):
+        """Creates a new HashRing instance.
+
+        Args:
+            node_names: Names of the nodes on the ring. Each node's points on
+                the ring depend only on its name.
+            points_per_node: Number of points each node owns on the ring.
+        """
+        points = sorted((_hash('%s#%d' % (node_name, i)), node_index)
+                        for node_index, node_name in enumerate(node_names)
+                        for i in xrange(points_per_node))
+        self._hashes = [h for h, _ in points]
+        self._node_indexes = [node_index for _, node_index in points]
+
+    def node_index(self, sia_path):
+        """Returns the index of the node that owns a siapath."""
+        position = bisect.bisect(self._hashes, _hash(sia_path))
+        return self._node_indexes[position % len(self._node_indexes)]
+
+
+def _hash(key):
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return long(hashlib.md5(key).hexdigest()[:16], 16)
+
+
+class HashSharder(object):
+    """Hands each node the jobs whose siapaths it owns on a HashRing.
+
+    Reading a node's jobs may read past jobs that belong to other nodes.
+    Those jobs wait in memory until their nodes read them. Once a node that
+    has fallen behind has max_pending_jobs jobs waiting, reading stops until
+    that node catches up, so every job still goes to the node that owns it
+    and a slow node holds back a bounded number of jobs. Nodes that have
+    jobs waiting keep reading them meanwhile.
+
+    Close a node's iterator once the node reads no more jobs (e.g., because
+    its uploads failed), so that the other nodes don't wait for it.
+    """
+
+    def __init__(self,
+                 upload_jobs,
+                 hash_ring,
+                 max_pending_jobs=DEFAULT_MAX_PENDING_JOBS_PER_NODE):
+        """Creates a new HashSharder instance.
+
+        Args:
+            upload_jobs: An iterable of upload jobs to split among the nodes.
+            hash_ring: HashRing that assigns the jobs' siapaths to nodes.
+            max_pending_jobs: Maximum number of jobs to hold in memory for
+                each node.
+        """
+        self._upload_jobs = iter(upload_jobs)
+        self._hash_ring = hash_ring
+        self._max_pending_jobs = max_pending_jobs
+        self._lock = threading.Lock()
+        self._pending_jobs_read = threading.Condition(self._lock)
+        # Maps each node index to the jobs read for it by other nodes.
+        self._pending_jobs = collections.defaultdict(collections.deque)
+        # A job read for a node that already had max_pending_jobs jobs
+        # waiting, and the index of that node. Reading stops until the node
+        # has room for the job.
+        self._held_job = None
+        self._held_job_owner = None
+        # Indexes of the nodes that read no more jobs.
+        self._closed_nodes = set()
+
+    def jobs_for(self, node_index):
+        """Returns an iterator over the jobs of the node at an index."""
+        try:
+            while True:
+                job = self._next_job(node_index)
+                if job is None:
+                    return
+                yield job
+        finally:
+            self._close_node(node_index)
+
+    def _next_job(self, node_index):
+        with self._lock:
+            while True:
+                pending_jobs = self._pending_jobs[node_index]
+                if pending_jobs:
+                    if self._held_job_owner == node_index:
+                        self._pending_jobs_read.notify_all()
+                    return pending_jobs.popleft()
+                if self._held_job is None:
+                    job = next(self._upload_jobs, None)
+                    if job is None:
+                        return None
+                    owner_index = self._hash_ring.node_index(job.sia_path)
+                else:
+                    job, owner_index = self._held_job, self._held_job_owner
+                    self._held_job, self._held_job_owner = None, None
+                # Jobs of a closed node would never be read, so the node that
+                # reads them takes them instead.
+                if owner_index == node_index or owner_index in (
+                        self._closed_nodes):
+                    return job
+                owner_pending_jobs = self._pending_jobs[owner_index]
+                if len(owner_pending_jobs) < self._max_pending_jobs:
+                    owner_pending_jobs.append(job)
+                    continue
+                logger.debug('Waiting for node %d to catch up', owner_index)
+                self._held_job, self._held_job_owner = job, owner_index
+                self._pending_jobs_read.wait()
+
+    def _close_node(self, node_index):
+        with self._lock:
+            self._closed_nodes.add(node_index)
+            self._pending_jobs_read.notify_all()
+
+
+class PullSharder(object):
+    """Hands each job to whichever node asks for one next.
+
+    Nodes ask for a job only when they have a free upload slot, so the node
+    with the most spare capacity at any moment takes the next job.
+    """
+
+    def __init__(self, upload_jobs):
+        """Creates a new PullSharder instance.
+
+        Args:
+            upload_jobs: An iterable of upload jobs to split among the nodes.
+        """
+        self._upload_jobs = iter(upload_jobs)
+        self._lock = threading.Lock()
+
+    def jobs_for(self, node_index):
+        """Returns an iterator over the jobs of the node at an index."""
+        while True:
+            with self._lock:
+                job = next(self._upload_jobs, None)
+            if job is None:
+                return
+            yield job
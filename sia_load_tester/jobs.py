@@ -1,7 +1,10 @@
+import array
 import os
 
 # Limit to this many copies. Mainly for formatting siapaths cleanly.
 MAX_DATASET_COPIES = 100000000
+# Stop retrying a job once its upload has failed this many times.
+MAX_FAILURE_COUNT = 3
 
 
 class Error(Exception):
@@ -13,7 +16,10 @@ class InvalidCopyCountError(Error):
 
 
 def from_dataset(input_dataset, dataset_copies):
-    """Converts a Dataset to a list of Job instances.
+    """Converts a Dataset to a stream of Job instances.
+
+    Jobs are generated lazily from a compact JobStore, so memory use does not
+    grow with the number of dataset copies.
 
     Args:
         input_dataset: The Dataset of files to upload to Sia.
@@ -21,21 +27,13 @@ def from_dataset(input_dataset, dataset_copies):
             uploaded to Sia.
 
     Returns:
-        A list of upload jobs.
+        An iterator over upload jobs.
     """
-    jobs = []
     if dataset_copies < 1 or dataset_copies > MAX_DATASET_COPIES:
         raise InvalidCopyCountError(
             'dataset_copies must be an integer between 1 and %d. got: %d' %
             (MAX_DATASET_COPIES, dataset_copies))
-    for copy_index in xrange(dataset_copies):
-        for local_path in input_dataset.paths:
-            sia_path = _local_path_to_sia_path(local_path,
-                                               input_dataset.root_dir)
-            if dataset_copies != 1:
-                sia_path = _append_file_index(sia_path, copy_index)
-            jobs.append(Job(local_path, sia_path))
-    return jobs
+    return iter(JobStore(input_dataset, dataset_copies))
 
 
 def _local_path_to_sia_path(local_path, dataset_root_dir):
@@ -45,6 +43,25 @@ def _local_path_to_sia_path(local_path, dataset_root_dir):
     return sia_path.replace(path_separator, '/')
 
 
+def _sia_path_prefix(directory, dataset_root_dir):
+    """Returns the prefix of the Sia paths of the files in a local directory.
+
+    Args:
+        directory: Path of the local directory, including its trailing
+            separator, or empty for the working directory.
+        dataset_root_dir: Root directory of the dataset.
+
+    Returns:
+        The directory's path relative to the dataset root, with forward slash
+        separators and a trailing slash, or empty for the root itself.
+    """
+    sia_directory = _local_path_to_sia_path(directory or os.curdir,
+                                            dataset_root_dir).rstrip('/')
+    if sia_directory in ('', os.curdir):
+        return ''
+    return sia_directory + '/'
+
+
 def _append_file_index(sia_path, copy_index):
     """Appends a file index to a Sia path to represent which copy this is.
 
@@ -61,16 +78,126 @@ def _append_file_index(sia_path, copy_index):
     return '%s-%08d%s' % (base_path, copy_index, extension)
 
 
-class Job(object):
-    """A job upload task.
+class JobStore(object):
+    """A memory-compact, read-only sequence of the upload jobs for a dataset.
 
-    Represents the information needed to perform a single file upload from the
-    local system to the Sia network.
+    Rather than holding a Job object and two path strings per job, the store
+    keeps a single table of distinct directories, an array of directory
+    indices, an array of file sizes and a list of filenames, one entry per
+    dataset file. Jobs are addressed by index (all files for copy 0, then all
+    files for copy 1, and so on) and materialized as lightweight views on
+    access. Their Sia paths are derived on access from a Sia path prefix per
+    directory rather than stored.
+
+    The store reads the dataset's files lazily: iterating over the store
+    yields jobs for the first copy as soon as each file is read from the
+    dataset, so a streaming dataset can be consumed while it is still being
+    scanned.
     """
 
-    def __init__(self, local_path, sia_path):
-        self._local_path = local_path
-        self._sia_path = sia_path
+    def __init__(self, input_dataset, dataset_copies):
+        """Creates a new JobStore instance.
+
+        Args:
+            input_dataset: The Dataset of files to upload to Sia.
+            dataset_copies: The number of times each file in the dataset should
+                be uploaded to Sia.
+        """
+        self._root_dir = input_dataset.root_dir
+        self._dataset_copies = dataset_copies
+        self._unread_files = iter(input_dataset.files)
+        # Distinct directory prefixes (including trailing separator).
+        self._directories = []
+        # For each directory in self._directories, the prefix of its files'
+        # Sia paths, so that reads needn't recompute relative paths.
+        self._sia_directories = []
+        self._directory_table = {}
+        # For each file, the index of its directory in self._directories.
+        self._directory_indices = array.array('L')
+        # For each file, its size in bytes or -1 if the size is unknown.
+        self._file_sizes = array.array('d')
+        self._filenames = []
+
+    def __len__(self):
+        self._read_all_files()
+        return len(self._filenames) * self._dataset_copies
+
+    def __getitem__(self, index):
+        job_count = len(self)
+        if index < 0:
+            index += job_count
+        if not 0 <= index < job_count:
+            raise IndexError('job index out of range')
+        copy_index, file_index = divmod(index, len(self._filenames))
+        return _StoredJob(self, file_index, copy_index)
+
+    def __iter__(self):
+        file_index = 0
+        while file_index < len(self._filenames) or self._read_next_file():
+            yield _StoredJob(self, file_index, 0)
+            file_index += 1
+        for copy_index in xrange(1, self._dataset_copies):
+            for file_index in xrange(len(self._filenames)):
+                yield _StoredJob(self, file_index, copy_index)
+
+    def local_path(self, file_index):
+        return (self._directories[self._directory_indices[file_index]] +
+                self._filenames[file_index])
+
+    def sia_path(self, file_index, copy_index):
+        sia_path = (self._sia_directories[self._directory_indices[file_index]] +
+                    self._filenames[file_index])
+        if self._dataset_copies != 1:
+            sia_path = _append_file_index(sia_path, copy_index)
+        return sia_path
+
+    def file_size(self, file_index):
+        """Returns the size (in bytes) of a file or None if it is unknown."""
+        size = self._file_sizes[file_index]
+        if size < 0:
+            return None
+        return long(size)
+
+    def _read_all_files(self):
+        while self._read_next_file():
+            pass
+
+    def _read_next_file(self):
+        """Adds the next file from the dataset to the store.
+
+        Returns:
+            False if there are no more files to read from the dataset.
+        """
+        try:
+            dataset_file = next(self._unread_files)
+        except StopIteration:
+            return False
+        local_path = dataset_file.path
+        split_index = local_path.rfind(os.path.sep) + 1
+        directory = local_path[:split_index]
+        directory_index = self._directory_table.get(directory)
+        if directory_index is None:
+            directory_index = len(self._directories)
+            self._directory_table[directory] = directory_index
+            self._directories.append(directory)
+            self._sia_directories.append(
+                _sia_path_prefix(directory, self._root_dir))
+        self._directory_indices.append(directory_index)
+        self._file_sizes.append(-1 if dataset_file.size is None else
+                                dataset_file.size)
+        self._filenames.append(local_path[split_index:])
+        return True
+
+
+class _BaseJob(object):
+    """Behavior shared by all upload job representations.
+
+    Subclasses provide local_path, sia_path and file_size properties.
+    """
+
+    __slots__ = ('_failure_count',)
+
+    def __init__(self):
         self._failure_count = 0
 
     def __eq__(self, other):
@@ -82,12 +209,32 @@ class Job(object):
         return not self.__eq__(other)
 
     def __repr__(self):
-        return '%s(%s -> %s)' % (self.__class__.__name__, self._local_path,
-                                 self._sia_path)
+        return '%s(%s -> %s)' % (self.__class__.__name__, self.local_path,
+                                 self.sia_path)
 
     def increment_failure_count(self):
         self._failure_count += 1
 
+    @property
+    def failure_count(self):
+        return self._failure_count
+
+
+class Job(_BaseJob):
+    """A job upload task.
+
+    Represents the information needed to perform a single file upload from the
+    local system to the Sia network.
+    """
+
+    __slots__ = ('_local_path', '_sia_path', '_file_size')
+
+    def __init__(self, local_path, sia_path, file_size=None):
+        super(Job, self).__init__()
+        self._local_path = local_path
+        self._sia_path = sia_path
+        self._file_size = file_size
+
     @property
     def local_path(self):
         return self._local_path
@@ -97,5 +244,30 @@ class Job(object):
         return self._sia_path
 
     @property
-    def failure_count(self):
-        return self._failure_count
+    def file_size(self):
+        """Size (in bytes) of the file to upload or None if it is unknown."""
+        return self._file_size
+
+
+class _StoredJob(_BaseJob):
+    """A job upload task whose paths are derived from a JobStore."""
+
+    __slots__ = ('_store', '_file_index', '_copy_index')
+
+    def __init__(self, store, file_index, copy_index):
+        super(_StoredJob, self).__init__()
+        self._store = store
+        self._file_index = file_index
+        self._copy_index = copy_index
+
+    @property
+    def local_path(self):
+        return self._store.local_path(self._file_index)
+
+    @property
+    def sia_path(self):
+        return self._store.sia_path(self._file_index, self._copy_index)
+
+    @property
+    def file_size(self):
+        return self._store.file_size(self._file_index)
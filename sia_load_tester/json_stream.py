@@ -0,0 +1,255 @@
+"""Incremental decoding of large JSON documents.
+
+Decodes the elements of an array in a JSON object one at a time while reading
+the document a chunk at a time, so that memory use depends on the size of the
+largest element rather than on the size of the document.
+"""
+
+import json
+
+_WHITESPACE = ' \t\n\r'
+# Characters that may follow a complete value.
+_VALUE_DELIMITERS = _WHITESPACE + ',:]}'
+_DECODER = json.JSONDecoder()
+# Returned by ArrayItemDecoder._decode_value when the buffer holds only part
+# of the next value.
+_INCOMPLETE = object()
+
+# States of an ArrayItemDecoder, named for what it expects to read next.
+_OBJECT_START = 'object start'
+_FIRST_KEY = 'first key'
+_KEY = 'key'
+_COLON = 'colon'
+_VALUE = 'value'
+_MEMBER_END = 'member end'
+_ARRAY = 'array'
+_FIRST_ITEM = 'first item'
+_ITEM = 'item'
+_ITEM_END = 'item end'
+_DONE = 'done'
+
+
+class Error(Exception):
+    pass
+
+
+class MalformedJsonError(Error):
+    pass
+
+
+def iter_array_items(chunks, key):
+    """Iterates over the array stored under a key of a top-level JSON object.
+
+    Args:
+        chunks: An iterable of strings that together form a JSON object.
+        key: Key in the top-level object of the array to iterate.
+
+    Yields:
+        Each element of the array, decoded. Yields nothing if the key is
+        missing or its value is null.
+
+    Raises:
+        MalformedJsonError if the document is not valid JSON or the key's value
+        is not an array or null.
+    """
+    decoder = ArrayItemDecoder(key)
+    for chunk in chunks:
+        for item in decoder.feed(chunk):
+            yield item
+        if decoder.is_done():
+            # Ignore the rest of the document.
+            return
+    decoder.close()
+
+
+class ArrayItemDecoder(object):
+    """Decodes the array stored under a key of a top-level JSON object as
+    chunks of the object arrive.
+
+    The push counterpart of iter_array_items, for callers that are handed the
+    document a chunk at a time rather than able to ask for the next chunk,
+    such as event loop callbacks. Holds only the chunks that the value at the
+    current position spans.
+    """
+
+    def __init__(self, key):
+        """Creates a new ArrayItemDecoder instance.
+
+        Args:
+            key: Key in the top-level object of the array to decode.
+        """
+        self._key = key
+        self._buffer = ''
+        self._position = 0
+        self._state = _OBJECT_START
+        # Whether the most recently read key is the one to decode.
+        self._key_matched = False
+
+    def feed(self, chunk):
+        """Decodes the elements of the array that a chunk completes.
+
+        Args:
+            chunk: The next string of the document.
+
+        Returns:
+            A list of the elements completed by the chunk, decoded. Once the
+            decoder is done, further chunks are ignored.
+
+        Raises:
+            MalformedJsonError if the document is not valid JSON or the key's
+            value is not an array or null.
+        """
+        items = []
+        if self._state == _DONE:
+            return items
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        while self._state != _DONE and self._advance(items):
+            pass
+        return items
+
+    def is_done(self):
+        """Returns True once the array (or the object, if it has no such key)
+        has been read to its end."""
+        return self._state == _DONE
+
+    def close(self):
+        """Checks that the document did not end before the array.
+
+        Raises:
+            MalformedJsonError if the decoder is not done.
+        """
+        if self._state != _DONE:
+            raise MalformedJsonError('Unexpected end of JSON document')
+
+    def _advance(self, items):
+        """Reads the next token or value, if the buffer holds all of it.
+
+        Args:
+            items: List to which to append the array element read, if any.
+
+        Returns:
+            False if the buffer does not yet hold the next token or value.
+        """
+        if not self._skip_whitespace():
+            return False
+        token = self._buffer[self._position]
+        state = self._state
+        if state == _OBJECT_START:
+            self._expect('{')
+            self._state = _FIRST_KEY
+        elif state == _FIRST_KEY and token == '}':
+            self._position += 1
+            self._state = _DONE
+        elif state in (_FIRST_KEY, _KEY):
+            name = self._decode_value()
+            if name is _INCOMPLETE:
+                return False
+            self._key_matched = name == self._key
+            self._state = _COLON
+        elif state == _COLON:
+            self._expect(':')
+            self._state = _ARRAY if self._key_matched else _VALUE
+        elif state == _VALUE:
+            if self._decode_value() is _INCOMPLETE:
+                return False
+            self._state = _MEMBER_END
+        elif state == _MEMBER_END:
+            if token == '}':
+                self._position += 1
+                self._state = _DONE
+            else:
+                self._expect(',')
+                self._state = _KEY
+        elif state == _ARRAY and token == '[':
+            self._position += 1
+            self._state = _FIRST_ITEM
+        elif state == _ARRAY:
+            value = self._decode_value()
+            if value is _INCOMPLETE:
+                return False
+            if value is not None:
+                raise MalformedJsonError('Expected an array or null')
+            self._state = _DONE
+        else:
+            return self._read_items(items)
+        return True
+
+    def _read_items(self, items):
+        """Reads array elements and separators while the buffer holds them.
+
+        Array elements make up nearly all of a large document, so they get a
+        loop of their own.
+
+        Args:
+            items: List to which to append the array elements read.
+
+        Returns:
+            False if the buffer does not yet hold the next token or element.
+        """
+        while self._skip_whitespace():
+            token = self._buffer[self._position]
+            if self._state == _ITEM_END:
+                if token not in ',]':
+                    raise MalformedJsonError(
+                        'Expected \',\' or \']\', found %r' % token)
+                self._position += 1
+                if token == ']':
+                    self._state = _DONE
+                    return True
+                self._state = _ITEM
+            elif self._state == _FIRST_ITEM and token == ']':
+                self._position += 1
+                self._state = _DONE
+                return True
+            else:
+                item = self._decode_value()
+                if item is _INCOMPLETE:
+                    return False
+                items.append(item)
+                self._state = _ITEM_END
+        return False
+
+    def _skip_whitespace(self):
+        """Skips to the next non-whitespace character.
+
+        Returns:
+            False if the buffer holds no more non-whitespace characters.
+        """
+        # Sia's responses have no whitespace between tokens, so check for that
+        # case first.
+        if (self._position < len(self._buffer) and
+                self._buffer[self._position] not in _WHITESPACE):
+            return True
+        while (self._position < len(self._buffer) and
+               self._buffer[self._position] in _WHITESPACE):
+            self._position += 1
+        return self._position < len(self._buffer)
+
+    def _expect(self, token):
+        """Consumes the next character, which must be token."""
+        if self._buffer[self._position] != token:
+            raise MalformedJsonError('Expected %r, found %r' %
+                                     (token, self._buffer[self._position]))
+        self._position += 1
+
+    def _decode_value(self):
+        """Decodes and consumes the next JSON value.
+
+        Returns:
+            The decoded value, or _INCOMPLETE if the value may continue in the
+            next chunk.
+        """
+        try:
+            value, end = _DECODER.raw_decode(self._buffer, self._position)
+        except ValueError:
+            # The value may continue in the next chunk. If it doesn't, the
+            # document never completes, which close() reports.
+            return _INCOMPLETE
+        # A number that isn't followed by a delimiter may continue in the next
+        # chunk (e.g., "-1" followed by ".5").
+        if (end == len(self._buffer) or
+                self._buffer[end] not in _VALUE_DELIMITERS):
+            return _INCOMPLETE
+        self._position = end
+        return value
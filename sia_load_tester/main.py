@@ -1,22 +1,73 @@
 #!/usr/bin/python2
 
 import argparse
+import collections
+import functools
+import glob
 import os
 import logging
 import threading
 import time
 
+import async_scheduler
+import async_sia_client
+import circuit_breaker
+import concurrency
 import contracts
 import dataset
 import dataset_uploader
+import event_loop
+import job_ordering
+import job_sharding
 import jobs
+import metrics
+import node_throughput
 import preconditions
 import progress
+import renter_poller
+import retry_policy
+import sia_client as sc
+import sia_conditions
 import state
+import upload_journal
+import upload_latency
 import upload_queue
+import worker_pool
 
 logger = logging.getLogger(__name__)
 
+_MANIFEST_FILENAME = 'dataset_manifest.sqlite'
+# Prefix of the subdirectories of the output directory for each node's output
+# in a multi-node test.
+_NODE_OUTPUT_DIR_PREFIX = 'node-'
+# Prefix of the subdirectories of the output directory for each worker
+# process's output in a process-pool test.
+_WORKER_OUTPUT_DIR_PREFIX = 'worker-'
+
+# Submit uploads from a pool of worker threads, each blocking on its requests.
+EXECUTION_MODE_THREADS = 'threads'
+# Poll, monitor and submit uploads from coroutines on a single event loop.
+EXECUTION_MODE_EVENT_LOOP = 'event_loop'
+EXECUTION_MODES = (EXECUTION_MODE_THREADS, EXECUTION_MODE_EVENT_LOOP)
+
+# Uploads to one node of a multi-node test.
+#   node: The sia_client.Node to which to upload.
+#   output_dir: Directory for the node's output files.
+#   exit_event: Event that stops the node's polling, monitoring and uploads.
+#   uploader: DatasetUploader for the node's share of the dataset.
+#   latency_tracker: upload_latency.Tracker of the node's uploads.
+#   throughput_recorder: node_throughput.Recorder of the node's uploads.
+_NodeUpload = collections.namedtuple('_NodeUpload', [
+    'node', 'output_dir', 'exit_event', 'uploader', 'latency_tracker',
+    'throughput_recorder'
+])
+
+# Outcome of the uploads to one node of a multi-node test.
+#   upload_stats: The node's dataset_uploader.UploadStats.
+#   throughput: The node's node_throughput.NodeThroughput.
+_NodeResult = collections.namedtuple('_NodeResult',
+                                     ['upload_stats', 'throughput'])
+
 
 def configure_logging(output_dir):
     root_logger = logging.getLogger()
@@ -35,29 +86,515 @@ def configure_logging(output_dir):
 
 
 def main(args):
+    """Runs a load test.
+
+    Returns:
+        The dataset uploader's UploadStats for the test.
+    """
     _ensure_directory_exists(args.output_dir)
     configure_logging(args.output_dir)
     logger.info('Started runnning')
 
-    preconditions.check()
+    sc.configure_api_port(args.sia_api_port)
+    sc.configure_connection_pool(args.connection_pool_size)
+    sc.configure_circuit_breaker(args.circuit_failure_threshold,
+                                 args.circuit_slow_call_seconds,
+                                 args.circuit_open_seconds)
+
+    if args.sia_api_endpoints:
+        sia_nodes = [
+            sc.make_node(endpoint, args.connection_pool_size,
+                         args.circuit_failure_threshold,
+                         args.circuit_slow_call_seconds,
+                         args.circuit_open_seconds)
+            for endpoint in args.sia_api_endpoints
+        ]
+        node_output_dirs = [
+            _node_output_dir(args.output_dir, node) for node in sia_nodes
+        ]
+    else:
+        sia_nodes = [sc.default_node()]
+        node_output_dirs = [args.output_dir]
+
+    for node in sia_nodes:
+        preconditions.check(node)
 
-    snapshotter = state.make_snapshotter(args.output_dir)
-    snapshotter.snapshot()
+    snapshotters = []
+    for node, node_output_dir in zip(sia_nodes, node_output_dirs):
+        _ensure_directory_exists(node_output_dir)
+        snapshotters.append(state.make_snapshotter(node_output_dir, node))
+    for snapshotter in snapshotters:
+        snapshotter.snapshot()
 
-    contracts.ensure_min_contracts()
+    _ensure_min_contracts(sia_nodes)
 
-    input_dataset = dataset.load_from_path(args.dataset_root)
-    upload_jobs = jobs.from_dataset(input_dataset, args.dataset_copies)
-    queue = upload_queue.from_upload_jobs(upload_jobs)
+    # Stream the dataset scan straight into the job pipeline so that uploads
+    # can begin before the scan finishes.
+    upload_jobs = jobs.from_dataset(
+        dataset.stream_from_path(
+            args.dataset_root,
+            manifest_path=os.path.join(args.output_dir, _MANIFEST_FILENAME)),
+        args.dataset_copies)
 
+    coordinator = None
+    if args.worker_processes:
+        coordinator = _start_upload_workers(args, sia_nodes)
     exit_event = threading.Event()
-    progress.start_monitor_async(exit_event)
+    metrics_exporter_thread = _start_metrics_exporters(args, sia_nodes,
+                                                       exit_event)
 
-    uploader = dataset_uploader.make_dataset_uploader(queue, exit_event)
-    uploader.upload()
+    try:
+        if coordinator:
+            upload_stats = _upload_from_workers(args, coordinator, upload_jobs)
+        else:
+            upload_stats = _upload_in_process(args, sia_nodes, node_output_dirs,
+                                              upload_jobs, exit_event)
+    finally:
+        _report_api_call_stats(args.output_dir)
+        if metrics_exporter_thread:
+            # Let the exporter write the final metrics.
+            exit_event.set()
+            metrics_exporter_thread.join()
 
-    snapshotter.snapshot()
+    for snapshotter in snapshotters:
+        snapshotter.snapshot()
+    _log_connection_stats(sia_nodes)
     logger.info('Test completed successfully')
+    return upload_stats
+
+
+def _upload_in_process(args, sia_nodes, node_output_dirs, upload_jobs,
+                       exit_event):
+    """Uploads the dataset from the load tester's own process.
+
+    Returns:
+        The UploadStats of all nodes combined.
+    """
+    job_records = upload_journal.replay(
+        upload_journal.journal_path(args.output_dir))
+    # Open the journal last, so that nothing can fail between opening it and
+    # the try block that closes it.
+    dead_letter_file = retry_policy.make_dead_letter_file(args.output_dir)
+    journal = upload_journal.make_journal(args.output_dir, job_records)
+    try:
+        if args.sia_api_endpoints:
+            sharder = job_sharding.make_sharder(
+                args.job_sharding, _order_jobs_for_sharding(args, upload_jobs),
+                [node.name for node in sia_nodes])
+            node_results = _upload_to_nodes(
+                args, sia_nodes, node_output_dirs,
+                [sharder.jobs_for(i) for i in xrange(len(sia_nodes))],
+                job_records, journal, dead_letter_file,
+                node_throughput.record_sample)
+            return _report_node_results(args.output_dir, node_results)
+        concurrency_controller = concurrency.make_controller(
+            args.concurrency_policy, args.output_dir)
+        if args.execution_mode == EXECUTION_MODE_EVENT_LOOP:
+            upload_stats, latency_tracker = _upload_on_event_loop(
+                args, upload_jobs, job_records, journal, dead_letter_file,
+                concurrency_controller, exit_event)
+        else:
+            upload_stats, latency_tracker = _upload_on_threads(
+                args, upload_jobs, job_records, journal, dead_letter_file,
+                concurrency_controller, exit_event)
+        _write_latency_summaries(args.output_dir, latency_tracker)
+        return upload_stats
+    finally:
+        journal.close()
+        dead_letter_file.close()
+
+
+def _start_upload_workers(args, sia_nodes):
+    """Starts a worker process for each group of nodes.
+
+    Each worker resumes from the journals of all workers of earlier runs,
+    since an earlier run may have split the nodes among its workers
+    differently.
+
+    Returns:
+        A started worker_pool.Coordinator.
+    """
+    job_records = upload_journal.replay_all(
+        upload_journal.journal_path(worker_output_dir)
+        for worker_output_dir in sorted(
+            glob.glob(
+                os.path.join(args.output_dir,
+                             _WORKER_OUTPUT_DIR_PREFIX + '*'))))
+    coordinator = worker_pool.Coordinator(
+        functools.partial(_run_upload_worker, args, job_records),
+        worker_pool.group_nodes(len(sia_nodes), args.worker_processes),
+        [node.name for node in sia_nodes], args.job_sharding,
+        node_throughput.record_sample)
+    # Fork the workers before this process starts any other threads.
+    coordinator.start()
+    return coordinator
+
+
+def _upload_from_workers(args, coordinator, upload_jobs):
+    """Hands out the dataset's upload jobs to the worker processes.
+
+    Returns:
+        The UploadStats of all nodes combined.
+    """
+    worker_results = coordinator.run(
+        _order_jobs_for_sharding(args, upload_jobs))
+    return _report_node_results(
+        args.output_dir,
+        [node_result for results in worker_results for node_result in results])
+
+
+def _run_upload_worker(args, job_records, worker_index, node_indexes, node_jobs,
+                       sample_fn):
+    """Uploads to a group of nodes from a worker process.
+
+    The worker logs to, and keeps its journal, dead-letter file and Sia API
+    call statistics in, its own subdirectory of the output directory.
+
+    Returns:
+        A list of _NodeResults for the worker's nodes.
+    """
+    worker_output_dir = os.path.join(args.output_dir, '%s%d' %
+                                     (_WORKER_OUTPUT_DIR_PREFIX, worker_index))
+    _ensure_directory_exists(worker_output_dir)
+    logging.getLogger().handlers = []
+    configure_logging(worker_output_dir)
+    logger.info('Upload worker %d started', worker_index)
+
+    # Connections opened by the coordinator before it forked this process
+    # belong to the coordinator, so connect to the nodes anew.
+    sia_nodes = [
+        sc.make_node(args.sia_api_endpoints[i], args.connection_pool_size,
+                     args.circuit_failure_threshold,
+                     args.circuit_slow_call_seconds, args.circuit_open_seconds)
+        for i in node_indexes
+    ]
+    dead_letter_file = retry_policy.make_dead_letter_file(worker_output_dir)
+    journal = upload_journal.make_journal(worker_output_dir, job_records)
+    try:
+        return _upload_to_nodes(
+            args, sia_nodes,
+            [_node_output_dir(args.output_dir, node) for node in sia_nodes],
+            node_jobs, job_records, journal, dead_letter_file, sample_fn)
+    finally:
+        journal.close()
+        dead_letter_file.close()
+        _report_api_call_stats(worker_output_dir)
+        _log_connection_stats(sia_nodes)
+
+
+def _upload_on_threads(args, upload_jobs, job_records, journal,
+                       dead_letter_file, concurrency_controller, exit_event):
+    """Uploads the dataset from a pool of worker threads.
+
+    Returns:
+        A (UploadStats, upload_latency.Tracker) pair for the uploads.
+    """
+    poller = renter_poller.make_poller(exit_event,
+                                       args.renter_poll_interval_seconds)
+    poller.subscribe(journal.record_completed_uploads)
+    latency_tracker = upload_latency.Tracker(
+        time.time, upload_latency.DEFAULT_REPORT_INTERVAL_SECONDS)
+    poller.subscribe_to_changes(latency_tracker.record_changes)
+    queue = _make_upload_queue(upload_jobs, poller, job_records, journal,
+                               retry_policy.make_retry_policy(
+                                   args.retry_base_delay_seconds,
+                                   args.retry_max_delay_seconds,
+                                   dead_letter_file, time.time),
+                               _make_job_ordering(args), args)
+
+    renter_poller.start_poller_async(poller)
+    progress.start_monitor_async(poller, concurrency_controller, exit_event)
+
+    uploader = dataset_uploader.make_dataset_uploader(
+        queue, poller, concurrency_controller, journal, latency_tracker,
+        exit_event, args.wait_mode, args.submission_workers)
+    uploader.upload()
+    return uploader.stats(), latency_tracker
+
+
+def _upload_on_event_loop(args, upload_jobs, job_records, journal,
+                          dead_letter_file, concurrency_controller, exit_event):
+    """Uploads the dataset from coroutines on a single event loop.
+
+    Returns:
+        A (UploadStats, upload_latency.Tracker) pair for the uploads.
+    """
+    loop = event_loop.EventLoop()
+    sia_client = async_sia_client.make_async_sia_client(
+        loop, args.sia_api_port, args.connection_pool_size)
+    poller = async_scheduler.Poller(loop, sia_client, exit_event,
+                                    args.renter_poll_interval_seconds,
+                                    sc.shared_circuit_breaker())
+    poller.subscribe(journal.record_completed_uploads)
+    latency_tracker = upload_latency.Tracker(
+        loop.time, upload_latency.DEFAULT_REPORT_INTERVAL_SECONDS)
+    poller.subscribe_to_changes(latency_tracker.record_changes)
+    # The upload queue and the Waiter read the latest renter snapshot without
+    # waiting, so publish one before they start.
+    loop.run_until_complete(poller.poll())
+    queue = _make_upload_queue(upload_jobs, poller, job_records, journal,
+                               retry_policy.make_retry_policy(
+                                   args.retry_base_delay_seconds,
+                                   args.retry_max_delay_seconds,
+                                   dead_letter_file, loop.time),
+                               _make_job_ordering(args), args)
+
+    loop.spawn(poller.poll_until_exit())
+    loop.spawn(
+        async_scheduler.make_monitor(loop, poller, concurrency_controller,
+                                     exit_event).monitor())
+
+    uploader = async_scheduler.make_dataset_uploader(
+        loop, queue, poller, sia_client, concurrency_controller, journal,
+        latency_tracker, exit_event)
+    loop.run_until_complete(uploader.upload())
+    return uploader.stats(), latency_tracker
+
+
+def _upload_to_nodes(args, sia_nodes, node_output_dirs, node_jobs, job_records,
+                     journal, dead_letter_file, sample_fn):
+    """Uploads to several Sia nodes in parallel.
+
+    Gives each node its own renter poller, Waiter, latency Tracker,
+    concurrency controller and progress monitor. If uploads to any node fail,
+    uploads to the other nodes stop too.
+
+    Writes each node's upload latencies to its output directory.
+
+    Args:
+        node_jobs: An iterator of upload jobs for each node, as returned by a
+            sharder's jobs_for method.
+        sample_fn: A function to call with each node_throughput.ThroughputSample
+            of the nodes' progress.
+
+    Returns:
+        A list of _NodeResults, one for each node.
+    """
+    node_uploads = [
+        _start_node_upload(args, node, node_output_dir, jobs_for_node,
+                           job_records, journal, dead_letter_file, sample_fn)
+        for node, node_output_dir, jobs_for_node in zip(
+            sia_nodes, node_output_dirs, node_jobs)
+    ]
+    errors = []
+
+    def upload(index):
+        node_upload = node_uploads[index]
+        try:
+            node_upload.uploader.upload()
+        except Exception as ex:
+            logger.error('Uploads to %s failed: %s', node_upload.node.name,
+                         ex.message)
+            errors.append(ex)
+            for other_upload in node_uploads:
+                other_upload.exit_event.set()
+        finally:
+            # The node reads no more jobs, so the sharder must not hold back
+            # other nodes' jobs until it catches up.
+            node_jobs[index].close()
+
+    threads = [
+        threading.Thread(target=upload, args=(i,))
+        for i in xrange(len(node_uploads))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    node_results = []
+    for node_upload in node_uploads:
+        _write_latency_summaries(node_upload.output_dir,
+                                 node_upload.latency_tracker)
+        upload_stats = node_upload.uploader.stats()
+        node_results.append(
+            _NodeResult(
+                upload_stats=upload_stats,
+                throughput=node_upload.throughput_recorder.throughput(
+                    upload_stats)))
+    return node_results
+
+
+def _report_node_results(output_dir, node_results):
+    """Logs and writes the upload throughput of each node and of all nodes.
+
+    Returns:
+        The UploadStats of all nodes combined.
+    """
+    throughputs = [node_result.throughput for node_result in node_results]
+    throughputs.append(node_throughput.aggregate(throughputs))
+    node_throughput.log_throughputs(throughputs)
+    node_throughput.write_throughputs(
+        os.path.join(output_dir, node_throughput.SUMMARY_FILENAME), throughputs)
+    all_stats = [node_result.upload_stats for node_result in node_results]
+    return dataset_uploader.UploadStats(
+        uploads_started=sum(s.uploads_started for s in all_stats),
+        upload_failures=sum(s.upload_failures for s in all_stats),
+        scheduler_idle_seconds=sum(s.scheduler_idle_seconds for s in all_stats))
+
+
+def _start_node_upload(args, node, output_dir, node_jobs, job_records, journal,
+                       dead_letter_file, sample_fn):
+    """Starts polling and progress monitoring for one node of several.
+
+    Returns:
+        A _NodeUpload whose uploader uploads the node's jobs.
+    """
+    exit_event = threading.Event()
+    poller = renter_poller.make_poller(exit_event,
+                                       args.renter_poll_interval_seconds, node)
+    poller.subscribe(journal.record_completed_uploads)
+    latency_tracker = upload_latency.Tracker(
+        time.time, upload_latency.DEFAULT_REPORT_INTERVAL_SECONDS)
+    poller.subscribe_to_changes(latency_tracker.record_changes)
+    throughput_recorder = node_throughput.Recorder(node.name, time.time,
+                                                   sample_fn)
+    poller.subscribe(throughput_recorder.record_snapshot)
+    poller.subscribe_to_changes(throughput_recorder.record_changes)
+    queue = _make_upload_queue(node_jobs, poller, job_records, journal,
+                               retry_policy.make_retry_policy(
+                                   args.retry_base_delay_seconds,
+                                   args.retry_max_delay_seconds,
+                                   dead_letter_file, time.time),
+                               _node_job_ordering(args), args)
+    concurrency_controller = concurrency.make_controller(
+        args.concurrency_policy, output_dir)
+
+    renter_poller.start_poller_async(poller)
+    progress.start_monitor_async(poller, concurrency_controller, exit_event)
+
+    uploader = dataset_uploader.make_dataset_uploader(
+        queue, poller, concurrency_controller, journal, latency_tracker,
+        exit_event, args.wait_mode, args.submission_workers, node)
+    return _NodeUpload(
+        node=node,
+        output_dir=output_dir,
+        exit_event=exit_event,
+        uploader=uploader,
+        latency_tracker=latency_tracker,
+        throughput_recorder=throughput_recorder)
+
+
+def _node_output_dir(output_dir, node):
+    return os.path.join(output_dir,
+                        '%s%s-%d' % (_NODE_OUTPUT_DIR_PREFIX,
+                                     node.endpoint.host, node.endpoint.port))
+
+
+def _ensure_min_contracts(sia_nodes):
+    """Ensures that every node has enough contracts.
+
+    Buys contracts on every node before waiting for any of them, so that the
+    nodes form their contracts in parallel.
+    """
+    initiators = [contracts.make_initiator(node) for node in sia_nodes]
+    for initiator in initiators:
+        initiator.buyer.buy_contracts_if_needed()
+    for initiator in initiators:
+        initiator.waiter.wait_until_min_contracts_formed()
+
+
+def _write_latency_summaries(output_dir, latency_tracker):
+    upload_latency.write_summaries(
+        os.path.join(output_dir, upload_latency.SUMMARY_FILENAME),
+        latency_tracker.report())
+
+
+def _make_job_ordering(args):
+    return job_ordering.make_ordering(args.job_ordering, args.target_size_mix)
+
+
+def _order_jobs_for_sharding(args, upload_jobs):
+    """Orders the upload jobs before they are split among the nodes.
+
+    A least-loaded sharder hands out one job per free upload slot, so it must
+    hand out jobs that are already in order. Ordering them in each node's
+    upload queue instead would make every node read a window of jobs ahead,
+    taking them from the other nodes in large blocks.
+    """
+    if args.job_sharding != job_sharding.SHARDING_LEAST_LOADED:
+        return upload_jobs
+    return job_ordering.order_jobs(upload_jobs, _make_job_ordering(args))
+
+
+def _node_job_ordering(args):
+    """Returns the job ordering for the upload queue of one of several nodes."""
+    if args.job_sharding == job_sharding.SHARDING_LEAST_LOADED:
+        # The jobs are ordered before they are split among the nodes (see
+        # _order_jobs_for_sharding), so the node must not read ahead.
+        return job_ordering.FifoOrdering()
+    return _make_job_ordering(args)
+
+
+def _make_upload_queue(upload_jobs, poller, job_records, journal,
+                       job_retry_policy, ordering, args):
+    if job_records is None:
+        # Without a journal to resume from, the renter's file list is the only
+        # record of which files Sia already has.
+        return upload_queue.from_upload_jobs(upload_jobs, poller, journal,
+                                             ordering, job_retry_policy)
+    renter_snapshot = None
+    if args.reconcile_with_renter:
+        renter_snapshot = poller.latest()
+    return upload_queue.from_upload_jobs_and_journal(upload_jobs, job_records,
+                                                     journal, renter_snapshot,
+                                                     ordering, job_retry_policy)
+
+
+def _start_metrics_exporters(args, sia_nodes, exit_event):
+    """Starts the metrics exporters that the command-line flags enable.
+
+    Returns:
+        The textfile exporter's thread, or None if the textfile exporter is
+        disabled.
+    """
+    if args.metrics_port is None and not args.metrics_textfile:
+        return None
+    # Read the contract count on demand rather than polling Sia for it, and
+    # skip the read while the circuit breaker is open. The contract count
+    # isn't broken down by node, so it's exported only for a single node.
+    if len(sia_nodes) == 1:
+        metrics_sia_client = sia_nodes[0].make_sia_client(essential=False)
+        metrics.default_registry().register_collector(
+            metrics_sia_client.contract_count)
+    if args.metrics_port is not None:
+        metrics.start_http_server_async(args.metrics_port)
+    if args.metrics_textfile:
+        return metrics.start_textfile_exporter_async(
+            args.metrics_textfile, args.metrics_textfile_interval_seconds,
+            exit_event)
+    return None
+
+
+def _report_api_call_stats(output_dir):
+    stats = sc.api_call_stats()
+    sc.log_api_call_stats(stats)
+    sc.write_api_call_stats(
+        os.path.join(output_dir, sc.API_CALL_STATS_FILENAME), stats)
+
+
+def _log_connection_stats(sia_nodes):
+    all_stats = [node.connection_stats() for node in sia_nodes]
+    all_stats.append(async_sia_client.connection_stats())
+    logger.info('Sia API connections: %d opened, %d reused',
+                sum(s.opened for s in all_stats),
+                sum(s.reused for s in all_stats))
+
+
+def _parse_endpoint_flag(endpoint):
+    try:
+        return sc.parse_endpoint(endpoint)
+    except sc.InvalidEndpointError as ex:
+        raise argparse.ArgumentTypeError(str(ex))
+
+
+def _parse_size_mix_flag(size_mix):
+    try:
+        return job_ordering.parse_size_mix(size_mix)
+    except job_ordering.InvalidSizeMixError as ex:
+        raise argparse.ArgumentTypeError(str(ex))
 
 
 def _ensure_directory_exists(output_dir):
@@ -65,7 +602,8 @@ def _ensure_directory_exists(output_dir):
         os.makedirs(output_dir)
 
 
-if __name__ == '__main__':
+def make_parser():
+    """Returns the parser for the load tester's command-line flags."""
     parser = argparse.ArgumentParser(
         prog='Sia Load Tester',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -85,4 +623,137 @@ if __name__ == '__main__':
         '--output_dir',
         required=True,
         help='Path to directory for test output files')
-    main(parser.parse_args())
+    parser.add_argument(
+        '--sia_api_port',
+        default=sc.DEFAULT_API_PORT,
+        type=int,
+        help='Port on localhost on which Sia serves its API')
+    parser.add_argument(
+        '--sia_api_endpoints',
+        nargs='+',
+        type=_parse_endpoint_flag,
+        help=('If specified, upload to each of these Sia nodes in parallel '
+              'instead of to the node on --sia_api_port. Each endpoint is a '
+              'host:port pair (e.g., sia-node-1:9980) or a port on localhost'))
+    parser.add_argument(
+        '--job_sharding',
+        default=job_sharding.SHARDING_HASH,
+        choices=job_sharding.SHARDINGS,
+        help=('How to split files among the nodes of --sia_api_endpoints: by '
+              'consistent hash of each file\'s siapath (hash), or to '
+              'whichever node has a free upload slot (least_loaded)'))
+    parser.add_argument(
+        '--worker_processes',
+        default=0,
+        type=int,
+        help=('If greater than 0, upload to the nodes of --sia_api_endpoints '
+              'from this many worker processes, each uploading to its own '
+              'group of nodes, instead of from a single process'))
+    parser.add_argument(
+        '--connection_pool_size',
+        default=sc.DEFAULT_CONNECTION_POOL_SIZE,
+        type=int,
+        help='Maximum number of keep-alive connections to hold open to Sia')
+    parser.add_argument(
+        '--circuit_failure_threshold',
+        default=circuit_breaker.DEFAULT_FAILURE_THRESHOLD,
+        type=int,
+        help=('Number of consecutive failed or slow Sia API requests after '
+              'which to stop sending non-essential requests to Sia'))
+    parser.add_argument(
+        '--circuit_slow_call_seconds',
+        default=circuit_breaker.DEFAULT_SLOW_CALL_SECONDS,
+        type=float,
+        help='Sia API requests that take this long count as failures')
+    parser.add_argument(
+        '--circuit_open_seconds',
+        default=circuit_breaker.DEFAULT_OPEN_SECONDS,
+        type=float,
+        help=('Number of seconds to hold back requests after too many '
+              'failures before probing Sia again'))
+    parser.add_argument(
+        '--concurrency_policy',
+        default=concurrency.POLICY_FIXED,
+        choices=concurrency.POLICIES,
+        help=('How to limit concurrent uploads: a fixed limit of %d or an '
+              'adaptive (AIMD) limit tuned to upload throughput' %
+              concurrency.DEFAULT_CONCURRENT_UPLOADS))
+    parser.add_argument(
+        '--job_ordering',
+        default=job_ordering.ORDERING_FIFO,
+        choices=job_ordering.ORDERINGS,
+        help=('Order in which to upload files: as the dataset scan finds '
+              'them (fifo), by file size, or interleaved by file size class'))
+    parser.add_argument(
+        '--target_size_mix',
+        type=_parse_size_mix_flag,
+        help=('Relative number of small (<4 MiB), medium (<=40 MiB) and large '
+              'files to upload under the target_mix job ordering, e.g., '
+              'small=1,medium=1,large=2'))
+    parser.add_argument(
+        '--retry_base_delay_seconds',
+        default=retry_policy.DEFAULT_BASE_DELAY_SECONDS,
+        type=float,
+        help=('Delay before retrying a failed upload. The delay doubles with '
+              'each further failure of the same file, with random jitter'))
+    parser.add_argument(
+        '--retry_max_delay_seconds',
+        default=retry_policy.DEFAULT_MAX_DELAY_SECONDS,
+        type=float,
+        help='Maximum delay before retrying a failed upload')
+    parser.add_argument(
+        '--renter_poll_interval_seconds',
+        default=renter_poller.DEFAULT_POLL_INTERVAL_SECONDS,
+        type=float,
+        help='Number of seconds between polls of the Sia renter file list')
+    parser.add_argument(
+        '--submission_workers',
+        default=dataset_uploader.DEFAULT_SUBMISSION_WORKERS,
+        type=int,
+        help=('Number of threads that submit uploads to Sia concurrently '
+              '(threads execution mode only)'))
+    parser.add_argument(
+        '--execution_mode',
+        default=EXECUTION_MODE_THREADS,
+        choices=EXECUTION_MODES,
+        help=('How to schedule work: blocking worker threads (threads) or '
+              'coroutines sharing a single event loop (event_loop)'))
+    parser.add_argument(
+        '--reconcile_with_renter',
+        action='store_true',
+        help=('When resuming from the upload journal, skip files based on '
+              'the Sia renter\'s full file list instead of the journal'))
+    parser.add_argument(
+        '--metrics_port',
+        type=int,
+        help=('If specified, serve live metrics in the Prometheus text format '
+              'over HTTP on this port'))
+    parser.add_argument(
+        '--metrics_textfile',
+        help=('If specified, periodically write live metrics in the '
+              'Prometheus text format to this file (e.g., for the '
+              'node_exporter textfile collector)'))
+    parser.add_argument(
+        '--metrics_textfile_interval_seconds',
+        default=metrics.DEFAULT_TEXTFILE_INTERVAL_SECONDS,
+        type=float,
+        help='Number of seconds between writes of the metrics textfile')
+    parser.add_argument(
+        '--wait_mode',
+        default=sia_conditions.WAIT_MODE_EVENT,
+        choices=sia_conditions.WAIT_MODES,
+        help=('How to wait for upload slots: wake on each new renter poll '
+              '(event) or sleep a fixed interval between checks (sleep)'))
+    return parser
+
+
+if __name__ == '__main__':
+    parser = make_parser()
+    parsed_args = parser.parse_args()
+    if (parsed_args.sia_api_endpoints and
+            parsed_args.execution_mode != EXECUTION_MODE_THREADS):
+        parser.error('--sia_api_endpoints requires --execution_mode %s' %
+                     EXECUTION_MODE_THREADS)
+    if parsed_args.worker_processes and not parsed_args.sia_api_endpoints:
+        parser.error('--worker_processes requires --sia_api_endpoints')
+    main(parsed_args)
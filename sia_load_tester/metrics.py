@@ -0,0 +1,331 @@
+"""Exports live load test metrics in the Prometheus text exposition format.
+
+Each module defines the metrics it records at module level, in the default
+Registry. While a test runs, the registry can be scraped over HTTP, written
+periodically to a textfile (e.g., for the node_exporter textfile collector),
+or both, so that dashboards can follow a test for its full duration.
+"""
+
+import BaseHTTPServer
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Prefix for the names of all load tester metrics.
+NAMESPACE = 'sia_load_tester'
+
+DEFAULT_TEXTFILE_INTERVAL_SECONDS = 15
+
+_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Error(Exception):
+    pass
+
+
+class DuplicateMetricError(Error):
+    pass
+
+
+class InvalidLabelsError(Error):
+    pass
+
+
+class Registry(object):
+    """A collection of metrics that renders them together."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+        self._metric_names = set()
+        self._collectors = []
+
+    def register(self, metric):
+        """Adds a metric to the registry.
+
+        Raises:
+            DuplicateMetricError if the registry already has a metric with the
+            same name.
+        """
+        with self._lock:
+            if metric.name in self._metric_names:
+                raise DuplicateMetricError(
+                    'Metric is already registered: %s' % metric.name)
+            self._metric_names.add(metric.name)
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """Registers a function to call before each render.
+
+        Collectors update metrics whose values are cheaper to read on demand
+        than to keep current (e.g., values that require a Sia API call).
+        Errors from a collector are logged and do not stop the render.
+
+        Args:
+            collector: A function that takes no arguments.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as ex:
+                logger.warning('Failed to collect metrics: %s', ex)
+        return ''.join(metric.render() for metric in metrics)
+
+
+_default_registry = Registry()
+
+
+def default_registry():
+    """Returns the Registry in which modules define their metrics."""
+    return _default_registry
+
+
+def counter(name, documentation, label_names=()):
+    """Creates a Counter in the default registry."""
+    return _default_registry.register(Counter(name, documentation, label_names))
+
+
+def gauge(name, documentation, label_names=()):
+    """Creates a Gauge in the default registry."""
+    return _default_registry.register(Gauge(name, documentation, label_names))
+
+
+def summary(name, documentation, label_names=()):
+    """Creates a Summary in the default registry."""
+    return _default_registry.register(Summary(name, documentation, label_names))
+
+
+class _Metric(object):
+    """A named metric with a value for each combination of label values."""
+
+    _TYPE = None
+    # Value of the metric before anything is recorded.
+    _INITIAL_VALUE = 0
+
+    def __init__(self, name, documentation, label_names):
+        """Creates a new metric.
+
+        Args:
+            name: Name of the metric, without the NAMESPACE prefix.
+            documentation: One-line description of the metric.
+            label_names: Names of the labels that distinguish the metric's
+                values.
+        """
+        self.name = '%s_%s' % (NAMESPACE, name)
+        self._documentation = documentation
+        self._label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        # Maps each tuple of label values to the metric's value.
+        self._values = {}
+        # Without labels, there is exactly one value, so report it from the
+        # start.
+        if not self._label_names:
+            self._values[()] = self._INITIAL_VALUE
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [
+            '# HELP %s %s\n' % (self.name, self._documentation),
+            '# TYPE %s %s\n' % (self.name, self._TYPE)
+        ]
+        for label_values, value in values:
+            lines.extend(self._render_value(label_values, value))
+        return ''.join(lines)
+
+    def _render_value(self, label_values, value):
+        return [
+            _render_sample(self.name, self._label_names, label_values, value)
+        ]
+
+    def _label_values(self, labels):
+        if set(labels) != set(self._label_names):
+            raise InvalidLabelsError('%s expects labels %s, got %s' %
+                                     (self.name, self._label_names,
+                                      tuple(sorted(labels))))
+        return tuple(labels[label_name] for label_name in self._label_names)
+
+
+class Counter(_Metric):
+    """A metric whose values only increase."""
+
+    _TYPE = 'counter'
+
+    def inc(self, amount=1, **labels):
+        label_values = self._label_values(labels)
+        with self._lock:
+            self._values[label_values] = (
+                self._values.get(label_values, 0) + amount)
+
+    def value(self, **labels):
+        label_values = self._label_values(labels)
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+
+class Gauge(_Metric):
+    """A metric whose values can go up and down."""
+
+    _TYPE = 'gauge'
+
+    def set(self, value, **labels):
+        label_values = self._label_values(labels)
+        with self._lock:
+            self._values[label_values] = value
+
+    def value(self, **labels):
+        label_values = self._label_values(labels)
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+
+class Summary(_Metric):
+    """A metric that tracks the count and sum of observed values."""
+
+    _TYPE = 'summary'
+    _INITIAL_VALUE = (0, 0.0)
+
+    def observe(self, value, **labels):
+        label_values = self._label_values(labels)
+        with self._lock:
+            count, total = self._values.get(label_values, self._INITIAL_VALUE)
+            self._values[label_values] = (count + 1, total + value)
+
+    def _render_value(self, label_values, value):
+        count, total = value
+        return [
+            _render_sample(self.name + '_count', self._label_names,
+                           label_values, count),
+            _render_sample(self.name + '_sum', self._label_names, label_values,
+                           total)
+        ]
+
+
+def _render_sample(name, label_names, label_values, value):
+    if label_names:
+        name += '{%s}' % ','.join(
+            '%s="%s"' % (label_name, _escape_label_value(label_value))
+            for label_name, label_value in zip(label_names, label_values))
+    return '%s %s\n' % (name, _format_value(value))
+
+
+def _escape_label_value(label_value):
+    return unicode(label_value).encode('utf-8').replace('\\', '\\\\').replace(
+        '"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def start_http_server_async(port, registry=None):
+    """Serves metrics over HTTP from a background thread.
+
+    Args:
+        port: Port on which to serve metrics, on all interfaces.
+        registry: The Registry to serve. Defaults to the default registry.
+
+    Returns:
+        The running HTTP server.
+    """
+    server = BaseHTTPServer.HTTPServer(('', port),
+                                       _make_request_handler(
+                                           registry or _default_registry))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    logger.info('Serving metrics on port %d', server.server_address[1])
+    thread.start()
+    return server
+
+
+def _make_request_handler(registry):
+
+    class MetricsRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+        """Serves the registry's metrics in response to any GET request."""
+
+        def do_GET(self):
+            body = registry.render()
+            self.send_response(200)
+            self.send_header('Content-Type', _CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format_string, *args):
+            # Scrapes are frequent, so keep them out of the test log.
+            pass
+
+    return MetricsRequestHandler
+
+
+def start_textfile_exporter_async(output_path, interval_seconds, exit_event):
+    """Writes metrics to a textfile periodically from a background thread.
+
+    Args:
+        output_path: Path of the file to which to write metrics.
+        interval_seconds: Number of seconds between writes.
+        exit_event: If this event is set, the exporter writes the metrics a
+            final time and stops.
+
+    Returns:
+        The background thread.
+    """
+    exporter = TextfileExporter(output_path, _default_registry)
+    thread = threading.Thread(
+        target=exporter.export_until_exit, args=(interval_seconds, exit_event))
+    thread.daemon = True
+    logger.info('Writing metrics to %s every %d seconds', output_path,
+                interval_seconds)
+    thread.start()
+    return thread
+
+
+class TextfileExporter(object):
+    """Writes a Registry's metrics to a file."""
+
+    def __init__(self, output_path, registry):
+        self._output_path = output_path
+        self._registry = registry
+
+    def write(self):
+        """Replaces the file with the current metrics.
+
+        The metrics are written to a temporary file first, so that readers
+        never see a partially written file.
+        """
+        temp_path = self._output_path + '.tmp'
+        with open(temp_path, 'wb') as output_file:
+            output_file.write(self._registry.render())
+        try:
+            os.rename(temp_path, self._output_path)
+        except OSError:
+            # On Windows, rename fails if the destination already exists.
+            os.remove(self._output_path)
+            os.rename(temp_path, self._output_path)
+
+    def export_until_exit(self, interval_seconds, exit_event):
+        """Writes metrics at a regular interval until the exit event is set."""
+        while not exit_event.is_set():
+            self._write_logging_errors()
+            exit_event.wait(interval_seconds)
+        self._write_logging_errors()
+
+    def _write_logging_errors(self):
+        try:
+            self.write()
+        except (IOError, OSError) as ex:
+            logger.error('Failed to write metrics to %s: %s', self._output_path,
+                         ex)
@@ -0,0 +1,147 @@
+"""Measures upload throughput of each Sia node in a multi-node load test.
+
+Each node's renter poller reports the bytes the node uploaded since its last
+poll. A Recorder adds these up for one node, and the node's throughput, along
+with the aggregate throughput of all nodes, is logged and written to a CSV file
+in the output directory when the test ends.
+
+When worker processes upload to the nodes, each Recorder sends its node's live
+progress to the coordinator process as ThroughputSamples.
+"""
+
+import collections
+import csv
+import logging
+import threading
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FILENAME = 'node_throughput.csv'
+# Name under which to report the aggregate throughput of all nodes.
+ALL_NODES = 'all'
+
+NODE_UPLOADED_BYTES = metrics.gauge(
+    'node_uploaded_bytes',
+    'Total bytes uploaded across all renter files, by Sia node.', ['node'])
+
+
+def record_sample(sample):
+    """Updates a node's live metrics from a ThroughputSample."""
+    NODE_UPLOADED_BYTES.set(sample.uploaded_bytes, node=sample.node)
+
+
+class Recorder(object):
+    """Adds up the bytes one Sia node uploads during the test."""
+
+    def __init__(self, node_name, time_fn, sample_fn=record_sample):
+        """Creates a new Recorder instance.
+
+        Args:
+            node_name: Name of the node whose throughput to record.
+            time_fn: A function that returns the current time in seconds.
+            sample_fn: A function to call with a ThroughputSample of the
+                node's progress after each renter poll.
+        """
+        self._node_name = node_name
+        self._time_fn = time_fn
+        self._sample_fn = sample_fn
+        self._start_time = time_fn()
+        self._lock = threading.Lock()
+        self._bytes_uploaded = 0
+
+    def record_snapshot(self, snapshot):
+        """Samples the node's progress from a renter Snapshot."""
+        self._sample_fn(
+            ThroughputSample(
+                node=self._node_name, uploaded_bytes=snapshot.uploaded_bytes))
+
+    def record_changes(self, changes):
+        """Adds the bytes uploaded in a renter poll's RenterChanges."""
+        with self._lock:
+            self._bytes_uploaded += changes.bytes_uploaded
+
+    def throughput(self, upload_stats):
+        """Returns the node's NodeThroughput so far.
+
+        Args:
+            upload_stats: The node's dataset_uploader.UploadStats.
+        """
+        with self._lock:
+            bytes_uploaded = self._bytes_uploaded
+        return _make_throughput(self._node_name, upload_stats.uploads_started,
+                                upload_stats.upload_failures, bytes_uploaded,
+                                self._time_fn() - self._start_time)
+
+
+def aggregate(throughputs):
+    """Returns the combined NodeThroughput of several nodes.
+
+    The nodes upload in parallel, so their aggregate upload speed is their
+    total bytes uploaded over the longest time any node spent uploading.
+    """
+    return _make_throughput(ALL_NODES,
+                            sum(t.uploads_started for t in throughputs),
+                            sum(t.upload_failures for t in throughputs),
+                            sum(t.bytes_uploaded for t in throughputs),
+                            max([t.elapsed_seconds for t in throughputs] or
+                                [0.0]))
+
+
+def _make_throughput(node, uploads_started, upload_failures, bytes_uploaded,
+                     elapsed_seconds):
+    upload_mbps = 0.0
+    if elapsed_seconds > 0:
+        upload_mbps = bytes_uploaded * 8 / 1000000.0 / elapsed_seconds
+    return NodeThroughput(
+        node=node,
+        uploads_started=uploads_started,
+        upload_failures=upload_failures,
+        bytes_uploaded=bytes_uploaded,
+        elapsed_seconds=elapsed_seconds,
+        upload_mbps=upload_mbps)
+
+
+def log_throughputs(throughputs):
+    """Logs a line for each NodeThroughput."""
+    for throughput in throughputs:
+        logger.info(('Upload throughput of %s: %.2f Mbps (%d bytes in %.1f '
+                     'seconds), %d uploads started, %d failed attempts'),
+                    throughput.node, throughput.upload_mbps,
+                    throughput.bytes_uploaded, throughput.elapsed_seconds,
+                    throughput.uploads_started, throughput.upload_failures)
+
+
+def write_throughputs(output_path, throughputs):
+    """Writes NodeThroughputs to a CSV file, replacing any existing file."""
+    with open(output_path, 'wb') as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(NodeThroughput._fields)
+        for throughput in throughputs:
+            writer.writerow([
+                throughput.node, throughput.uploads_started,
+                throughput.upload_failures, throughput.bytes_uploaded,
+                '%.3f' % throughput.elapsed_seconds,
+                '%.3f' % throughput.upload_mbps
+            ])
+
+
+# Upload throughput of one Sia node (or, for ALL_NODES, of all nodes).
+#   node: Name of the node, or ALL_NODES.
+#   uploads_started: Number of uploads that the node accepted.
+#   upload_failures: Number of upload attempts to the node that failed.
+#   bytes_uploaded: Bytes the node uploaded during the test.
+#   elapsed_seconds: Time (in seconds) from the start of the node's uploads
+#       until they completed.
+#   upload_mbps: Average upload speed (in Mbps) over elapsed_seconds.
+NodeThroughput = collections.namedtuple('NodeThroughput', [
+    'node', 'uploads_started', 'upload_failures', 'bytes_uploaded',
+    'elapsed_seconds', 'upload_mbps'
+])
+
+# Live progress of one Sia node.
+#   node: Name of the node.
+#   uploaded_bytes: Total bytes uploaded across all of the node's renter files.
+ThroughputSample = collections.namedtuple('ThroughputSample',
+                                          ['node', 'uploaded_bytes'])
@@ -21,8 +21,10 @@ class WalletLockedError(Error):
     pass
 
 
-def check():
-    PreconditionChecker(sc.make_sia_client()).check_preconditions()
+def check(node=None):
+    """Checks the preconditions on a Sia node (by default, on localhost)."""
+    node = node or sc.default_node()
+    PreconditionChecker(node.make_sia_client()).check_preconditions()
 
 
 class PreconditionChecker(object):
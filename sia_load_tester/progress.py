@@ -4,53 +4,65 @@ This offers a collection of classes meant to monitor Sia's upload progress to
 ensure progress has not stalled.
 """
 
+import array
 import collections
-import datetime
 import logging
 import threading
 import time
 
-import sia_client as sc
+import metrics
 
 logger = logging.getLogger(__name__)
 
 # Sia must average at least 3 Mbps upload speed in the past hour window.
 TIME_WINDOW_MINUTES = 60
+TIME_WINDOW_SECONDS = TIME_WINDOW_MINUTES * 60
 MINIMUM_PROGRESS_THRESHOLD = 1350000000  # ~1.26 GiB
 
-_CHECK_FREQUENCY_IN_SECONDS = 60
+CHECK_FREQUENCY_IN_SECONDS = 60
+# Maximum number of progress checks the Tracker retains. Sized so that a full
+# time window fits even when checking every second.
+_MAX_HISTORY_ENTRIES = TIME_WINDOW_SECONDS + 1
 
+WINDOW_UPLOAD_MBPS = metrics.gauge(
+    'window_upload_mbps',
+    'Average upload speed (in Mbps) over the progress time window, by Sia '
+    'node.', ['node'])
 
-def start_monitor_async(exit_event):
+
+def start_monitor_async(renter_poller, concurrency_controller, exit_event):
     """Creates a Monitor instance and starts monitoring."""
-    monitor = make_monitor(exit_event)
+    monitor = make_monitor(renter_poller, concurrency_controller, exit_event)
     thread = threading.Thread(target=monitor.monitor)
     thread.daemon = True
     logger.info('Starting background thread to monitor upload progress.')
     thread.start()
 
 
-def make_monitor(exit_event):
+def make_monitor(renter_poller, concurrency_controller, exit_event):
     """Creates a Monitor instance using production defaults."""
     return Monitor(
-        Tracker(sc.make_sia_client(), datetime.datetime.utcnow), time.sleep,
+        Tracker(renter_poller, time.time), concurrency_controller, time.sleep,
         exit_event)
 
 
 class Monitor(object):
     """Monitor that tracks upload progress and fires an event when it slows."""
 
-    def __init__(self, tracker, sleep_fn, exit_event):
+    def __init__(self, tracker, concurrency_controller, sleep_fn, exit_event):
         """Creates a new Monitor instance.
 
         Args:
             tracker: A tracker for upload progress.
+            concurrency_controller: Controller for the upload concurrency limit
+                to feed with throughput measurements.
             sleep_fn: A callback function for putting the thread to sleep for
                 a given number of seconds.
             exit_event: If this event is set, monitoring stops. Monitor will set
                 this event if progress falls below minimum.
         """
         self._tracker = tracker
+        self._concurrency_controller = concurrency_controller
         self._sleep_fn = sleep_fn
         self._exit_event = exit_event
 
@@ -63,13 +75,30 @@ class Monitor(object):
         gracefully.
         """
         while not self._exit_event.is_set():
-            if self._progress_is_below_minimum():
-                logger.critical('Signaling for load test to end')
-                self._exit_event.set()
+            if not self.check():
                 return
-            self._sleep_fn(_CHECK_FREQUENCY_IN_SECONDS)
+            self._sleep_fn(CHECK_FREQUENCY_IN_SECONDS)
         logger.info('Exit event is set. Terminating progress monitoring.')
 
+    def check(self):
+        """Checks upload progress once.
+
+        Returns:
+            False if progress fell below the minimum and the exit event is now
+            set, True otherwise.
+        """
+        if self._progress_is_below_minimum():
+            logger.critical('Signaling for load test to end')
+            self._exit_event.set()
+            return False
+        self._report_throughput()
+        return True
+
+    def _report_throughput(self):
+        upload_mbps = self._tracker.recent_upload_mbps()
+        if upload_mbps is not None:
+            self._concurrency_controller.record_throughput(upload_mbps)
+
     def _progress_is_below_minimum(self):
         bytes_uploaded = self._tracker.bytes_uploaded_in_window()
         if not bytes_uploaded:
@@ -86,11 +115,17 @@ class Monitor(object):
 class Tracker(object):
     """Keeps track of changes in Sia aggregate upload progress over time."""
 
-    def __init__(self, sia_client, time_fn):
-        self._sia_client = sia_client
+    def __init__(self, renter_poller, time_fn):
+        """Creates a new Tracker instance.
+
+        Args:
+            renter_poller: A source of renter file Snapshots, with the
+                node_name of the node it polls.
+            time_fn: A function that returns the current time in seconds.
+        """
+        self._renter_poller = renter_poller
         self._time_fn = time_fn
-        # A list of history entries, with the oldest at position 0.
-        self._progress_history = []
+        self._progress_history = HistoryBuffer(_MAX_HISTORY_ENTRIES)
 
     def bytes_uploaded_in_window(self):
         """Returns number of bytes uploaded in current time window.
@@ -99,7 +134,7 @@ class Tracker(object):
         function returns the delta of upload progress within the window. In
         other words:
 
-            bytes_uploaded_in_window = (bytes uploaded now) - 
+            bytes_uploaded_in_window = (bytes uploaded now) -
                                        (bytes uploaded at window start)
 
         Bytes uploaded data is based on Sia API information, so if files are
@@ -112,50 +147,56 @@ class Tracker(object):
         self._record_latest()
         self._prune_history()
         bytes_uploaded = self._window_bytes()
+        upload_mbps = self._get_upload_mbps_in_time_window()
+        WINDOW_UPLOAD_MBPS.set(upload_mbps, node=self._renter_poller.node_name)
         if self._has_complete_time_window():
             logger.info(
                 '%d bytes uploaded in time window (averaging %.2f Mbps)',
-                bytes_uploaded, self._get_upload_mbps_in_time_window())
+                bytes_uploaded, upload_mbps)
             return bytes_uploaded
         else:
             logger.info(
                 '%d bytes uploaded since tracking began (averaging %.2f Mbps)',
-                bytes_uploaded, self._get_upload_mbps_in_time_window())
+                bytes_uploaded, upload_mbps)
+            return None
+
+    def recent_upload_mbps(self):
+        """Returns upload speed (in Mbps) between the two latest checks.
+
+        Returns:
+            Upload speed between the two most recent calls to
+            bytes_uploaded_in_window or None if there have been fewer than two
+            calls.
+        """
+        if len(self._progress_history) < 2:
             return None
+        previous = self._progress_history[-2]
+        latest = self._progress_history[-1]
+        return _bytes_to_mbps(latest.uploaded_bytes - previous.uploaded_bytes,
+                              latest.timestamp - previous.timestamp)
 
     def _get_upload_mbps_in_time_window(self):
         if len(self._progress_history) < 2:
             return 0
-        bytes_uploaded = self._window_bytes()
-        time_window_seconds = (self._window_end_timestamp() -
-                               self._window_start_timestamp()).total_seconds()
-        megabits_uploaded = (bytes_uploaded * 8.0) / pow(10, 6)
-        return megabits_uploaded / time_window_seconds
+        return _bytes_to_mbps(
+            self._window_bytes(),
+            self._window_end_timestamp() - self._window_start_timestamp())
 
     def _record_latest(self):
         self._progress_history.append(
-            HistoryEntry(
-                timestamp=self._time_fn(),
-                uploaded_bytes=self._count_uploaded_bytes()))
-
-    def _count_uploaded_bytes(self):
-        uploaded_bytes = 0
-        for f in self._sia_client.renter_files():
-            uploaded_bytes += f[u'uploadedbytes']
-        return uploaded_bytes
+            self._time_fn(),
+            self._renter_poller.latest().uploaded_bytes)
 
     def _prune_history(self):
-        """Removeis all history entries before start of time window."""
-        # Walk backwards until we find a record >= TIME_WINDOW_MINUTES earlier
-        # than the latest record.
-        for i in range(len(self._progress_history) - 1, 0, -1):
-            entry = self._progress_history[i]
-            if ((self._window_end_timestamp() - entry.timestamp) >=
-                    datetime.timedelta(minutes=TIME_WINDOW_MINUTES)):
-                # Trim all entries prior to the current entry. Make this entry
-                # the oldest.
-                self._progress_history = self._progress_history[i:]
-                return
+        """Removes all history entries before start of time window."""
+        # Evict from the front for as long as the next-oldest entry is still
+        # >= TIME_WINDOW_SECONDS earlier than the latest entry, so the oldest
+        # remaining entry marks the start of the window.
+        while (
+            (len(self._progress_history) > 1) and
+            (self._window_end_timestamp() - self._progress_history[1].timestamp)
+                >= TIME_WINDOW_SECONDS):
+            self._progress_history.pop_oldest()
 
     def _window_bytes(self):
         return self._window_end_bytes() - self._window_start_bytes()
@@ -173,8 +214,72 @@ class Tracker(object):
         return self._progress_history[-1].timestamp
 
     def _has_complete_time_window(self):
-        return (self._window_end_timestamp() - self._window_start_timestamp()
-               ) >= datetime.timedelta(minutes=TIME_WINDOW_MINUTES)
+        return (self._window_end_timestamp() -
+                self._window_start_timestamp()) >= TIME_WINDOW_SECONDS
+
+
+class HistoryBuffer(object):
+    """Fixed-capacity ring buffer of upload progress history entries.
+
+    Stores timestamps and byte counts in flat arrays of doubles (exact for
+    byte counts up to 2^53) so that appending, evicting and reading entries
+    at either end of the buffer all take constant time and memory use never
+    grows past the buffer's capacity. When the buffer is full, appending a new
+    entry evicts the oldest one.
+    """
+
+    def __init__(self, capacity):
+        self._timestamps = array.array('d', [0.0]) * capacity
+        self._uploaded_bytes = array.array('d', [0.0]) * capacity
+        self._capacity = capacity
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        """Returns the HistoryEntry at an index, where 0 is the oldest entry.
+
+        Args:
+            index: Position of the entry in the buffer. Negative indices count
+                back from the newest entry.
+
+        Returns:
+            A HistoryEntry for the entry at the given index.
+
+        Raises:
+            IndexError if the index is outside the buffer.
+        """
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError('history index out of range')
+        position = (self._start + index) % self._capacity
+        return HistoryEntry(
+            timestamp=self._timestamps[position],
+            uploaded_bytes=long(self._uploaded_bytes[position]))
+
+    def append(self, timestamp, uploaded_bytes):
+        if self._size == self._capacity:
+            self.pop_oldest()
+        position = (self._start + self._size) % self._capacity
+        self._timestamps[position] = timestamp
+        self._uploaded_bytes[position] = uploaded_bytes
+        self._size += 1
+
+    def pop_oldest(self):
+        if not self._size:
+            raise IndexError('pop from empty history')
+        self._start = (self._start + 1) % self._capacity
+        self._size -= 1
+
+
+def _bytes_to_mbps(bytes_uploaded, elapsed_seconds):
+    if elapsed_seconds <= 0:
+        return 0
+    megabits_uploaded = (bytes_uploaded * 8.0) / pow(10, 6)
+    return megabits_uploaded / elapsed_seconds
 
 
 HistoryEntry = collections.namedtuple('HistoryEntry',
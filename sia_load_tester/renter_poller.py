@@ -0,0 +1,461 @@
+"""Polls the Sia renter's file list on behalf of all consumers.
+
+Fetching /renter/files is expensive when the renter knows about many files, so
+rather than having each component query Sia independently, a single Poller
+fetches the file list once per interval and publishes an immutable Snapshot
+with the aggregates that consumers need.
+
+A RenterState carries each file's state from one poll to the next, so each poll
+updates the aggregates only from the files that changed and reports the
+changes (new files, each upload milestone reached, bytes uploaded) to
+subscribers.
+"""
+
+import collections
+import logging
+import threading
+import time
+
+import circuit_breaker
+import metrics
+import sia_client as sc
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL_SECONDS = 15
+
+UPLOADED_BYTES = metrics.gauge(
+    'uploaded_bytes', 'Total bytes uploaded across all renter files, by Sia '
+    'node.', ['node'])
+UPLOADS_IN_PROGRESS = metrics.gauge(
+    'uploads_in_progress', 'Number of renter files with upload progress below '
+    '100%, by Sia node.', ['node'])
+
+# Redundancy at which a file is fully uploaded under Sia's default erasure
+# coding (10 data pieces of 30 total).
+TARGET_REDUNDANCY = 3.0
+
+
+def make_poller(exit_event, poll_interval_seconds, node=None):
+    """Factory for creating a Poller using production settings.
+
+    Args:
+        exit_event: If this event is set, polling stops.
+        poll_interval_seconds: Number of seconds to wait between polls.
+        node: The sia_client.Node to poll. Defaults to the node on localhost.
+    """
+    node = node or sc.default_node()
+    # Sleep by waiting on the exit event so that polling stops (and waiting
+    # consumers are released) as soon as the exit event is set.
+    return Poller(node.make_sia_client(), exit_event.wait, time.time,
+                  exit_event, poll_interval_seconds, node.circuit_breaker,
+                  node.name)
+
+
+def start_poller_async(poller):
+    """Starts a Poller's polling loop in a background thread."""
+    thread = threading.Thread(target=poller.poll_until_exit)
+    thread.daemon = True
+    logger.info('Starting background thread to poll Sia renter files.')
+    thread.start()
+
+
+def snapshot_from_renter_files(renter_files):
+    """Summarizes a list of renter files into a Snapshot.
+
+    Args:
+        renter_files: An iterable of file dictionaries, as returned by the Sia
+            /renter/files API. The files are read only once, so this may be
+            a stream of files.
+
+    Returns:
+        A Snapshot of the aggregates over the given files.
+    """
+    renter_state = RenterState(time.time)
+    renter_state.update(renter_files)
+    return renter_state.snapshot()
+
+
+class _FileState(object):
+    """Mutable state of a single renter file between polls."""
+
+    __slots__ = ('uploaded_bytes', 'uploading', 'redundant', 'first_seen_time',
+                 'last_seen_poll')
+
+    def __init__(self, first_seen_time, last_seen_poll):
+        # A newly seen file counts as an upload that has not yet started, so
+        # that it reports every milestone it has already reached.
+        self.uploaded_bytes = 0
+        self.uploading = True
+        self.redundant = False
+        self.first_seen_time = first_seen_time
+        self.last_seen_poll = last_seen_poll
+
+
+class _PendingUpdate(object):
+    """What an update has found so far, from the files added to it."""
+
+    __slots__ = ('poll_time', 'new_sia_paths', 'started_uploads',
+                 'completed_uploads', 'redundant_uploads', 'bytes_uploaded',
+                 'uploading_changed', 'seen_count')
+
+    def __init__(self, poll_time):
+        self.poll_time = poll_time
+        self.new_sia_paths = []
+        self.started_uploads = []
+        self.completed_uploads = []
+        self.redundant_uploads = []
+        self.bytes_uploaded = 0
+        self.uploading_changed = False
+        # Number of previously known files that appear in this poll.
+        self.seen_count = 0
+
+
+class RenterState(object):
+    """Tracks the state of each renter file across polls.
+
+    Rather than recomputing aggregates from the full file list on every poll,
+    RenterState compares each file against its state from the previous poll
+    and adjusts the aggregates only by what changed. The Snapshot's frozensets
+    are rebuilt only when their membership changes.
+
+    Not thread-safe; callers must serialize updates.
+    """
+
+    def __init__(self, time_fn):
+        """Creates a new RenterState instance.
+
+        Args:
+            time_fn: A function that returns the current time in seconds, used
+                to timestamp changes.
+        """
+        self._time_fn = time_fn
+        # Maps each siapath to its _FileState.
+        self._files = {}
+        self._uploading_sia_paths = set()
+        self._uploaded_bytes = 0
+        self._poll_count = 0
+        # The _PendingUpdate begun by begin_update(), if any.
+        self._pending_update = None
+        self._snapshot = Snapshot(
+            uploads_in_progress=0,
+            uploaded_bytes=0,
+            sia_paths=frozenset(),
+            uploading_sia_paths=frozenset())
+
+    def snapshot(self):
+        """Returns a Snapshot of the state as of the most recent update."""
+        return self._snapshot
+
+    def update(self, renter_files):
+        """Applies the renter's current file list to the state.
+
+        Args:
+            renter_files: An iterable of file dictionaries, as returned by the
+                Sia /renter/files API. The files are read only once, so this
+                may be a stream of files.
+
+        Returns:
+            A RenterChanges describing how the renter's files changed since
+            the previous update.
+        """
+        self.begin_update()
+        for f in renter_files:
+            self.add_file(f)
+        return self.end_update()
+
+    def begin_update(self):
+        """Starts applying the renter's current file list a file at a time.
+
+        For callers that are handed the files one at a time rather than able
+        to iterate over them. Pass each file to add_file(), then call
+        end_update().
+        """
+        self._poll_count += 1
+        self._pending_update = _PendingUpdate(self._time_fn())
+
+    def add_file(self, f):
+        """Applies one file of the update begun by begin_update().
+
+        Args:
+            f: A file dictionary, as returned by the Sia /renter/files API.
+        """
+        update = self._pending_update
+        sia_path = f[u'siapath']
+        uploaded_bytes = f[u'uploadedbytes']
+        uploading = f[u'uploadprogress'] < 100
+        state = self._files.get(sia_path)
+        if state is None:
+            state = _FileState(update.poll_time, self._poll_count)
+            self._files[sia_path] = state
+            self._uploading_sia_paths.add(sia_path)
+            update.uploading_changed = True
+            update.new_sia_paths.append(sia_path)
+        else:
+            state.last_seen_poll = self._poll_count
+            update.seen_count += 1
+        if uploaded_bytes != state.uploaded_bytes:
+            if not state.uploaded_bytes:
+                update.started_uploads.append(sia_path)
+            update.bytes_uploaded += uploaded_bytes - state.uploaded_bytes
+            state.uploaded_bytes = uploaded_bytes
+        if not state.redundant and f[u'redundancy'] >= TARGET_REDUNDANCY:
+            state.redundant = True
+            update.redundant_uploads.append(sia_path)
+        if uploading == state.uploading:
+            return
+        state.uploading = uploading
+        update.uploading_changed = True
+        if uploading:
+            self._uploading_sia_paths.add(sia_path)
+        else:
+            self._uploading_sia_paths.discard(sia_path)
+            update.completed_uploads.append(
+                UploadCompletion(
+                    sia_path=sia_path,
+                    first_seen_time=state.first_seen_time,
+                    completed_time=update.poll_time))
+
+    def end_update(self):
+        """Finishes the update begun by begin_update().
+
+        Returns:
+            A RenterChanges describing how the renter's files changed since
+            the previous update.
+        """
+        update, self._pending_update = self._pending_update, None
+        bytes_uploaded = update.bytes_uploaded
+        uploading_changed = update.uploading_changed
+        removed_sia_paths = []
+        # Files are almost never removed, so only scan for them when some
+        # previously known file was missing from this poll.
+        if len(self._files) - len(update.new_sia_paths) > update.seen_count:
+            removed_sia_paths = self._remove_unseen_files()
+        for sia_path, state in removed_sia_paths:
+            bytes_uploaded -= state.uploaded_bytes
+            if state.uploading:
+                self._uploading_sia_paths.discard(sia_path)
+                uploading_changed = True
+        self._uploaded_bytes += bytes_uploaded
+
+        sia_paths = self._snapshot.sia_paths
+        if update.new_sia_paths or removed_sia_paths:
+            sia_paths = frozenset(self._files)
+        uploading_sia_paths = self._snapshot.uploading_sia_paths
+        if uploading_changed:
+            uploading_sia_paths = frozenset(self._uploading_sia_paths)
+        self._snapshot = Snapshot(
+            uploads_in_progress=len(uploading_sia_paths),
+            uploaded_bytes=self._uploaded_bytes,
+            sia_paths=sia_paths,
+            uploading_sia_paths=uploading_sia_paths)
+        return RenterChanges(
+            poll_time=update.poll_time,
+            new_sia_paths=update.new_sia_paths,
+            started_uploads=update.started_uploads,
+            completed_uploads=update.completed_uploads,
+            redundant_uploads=update.redundant_uploads,
+            removed_sia_paths=[sia_path for sia_path, _ in removed_sia_paths],
+            bytes_uploaded=bytes_uploaded)
+
+    def _remove_unseen_files(self):
+        """Forgets files that were absent from the latest poll.
+
+        Returns:
+            A list of (siapath, _FileState) pairs for the removed files.
+        """
+        removed = [(sia_path, state)
+                   for sia_path, state in self._files.iteritems()
+                   if state.last_seen_poll != self._poll_count]
+        for sia_path, _ in removed:
+            del self._files[sia_path]
+        return removed
+
+
+class Poller(object):
+    """Fetches Sia renter files periodically and publishes Snapshots."""
+
+    def __init__(self,
+                 sia_client,
+                 sleep_fn,
+                 time_fn,
+                 exit_event,
+                 poll_interval_seconds,
+                 circuit_breaker=None,
+                 node_name=None):
+        """Creates a new Poller instance.
+
+        Args:
+            sia_client: An implementation of the Sia client API.
+            sleep_fn: A callback function for putting the thread to sleep for
+                a given number of seconds.
+            time_fn: A function that returns the current time in seconds.
+            exit_event: If this event is set, polling stops.
+            poll_interval_seconds: Number of seconds to wait between polls.
+            circuit_breaker: A CircuitBreaker whose open circuit skips
+                periodic polls once a Snapshot has been published, or None to
+                poll at every interval.
+            node_name: Name of the polled Sia node, under which to export its
+                metrics. Defaults to the node on localhost.
+        """
+        self._sia_client = sia_client
+        self._sleep_fn = sleep_fn
+        self._exit_event = exit_event
+        self._poll_interval_seconds = poll_interval_seconds
+        self._circuit_breaker = circuit_breaker
+        self._node_name = node_name or sc.default_node_name()
+        self._renter_state = RenterState(time_fn)
+        # Serializes polls so that renter state is updated in poll order.
+        self._poll_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._snapshot_published = threading.Condition(self._lock)
+        self._latest = None
+        self._subscribers = []
+        self._change_subscribers = []
+
+    @property
+    def node_name(self):
+        """Name of the polled Sia node."""
+        return self._node_name
+
+    def subscribe(self, callback):
+        """Registers a callback to receive each newly published Snapshot."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def subscribe_to_changes(self, callback):
+        """Registers a callback to receive the RenterChanges of each poll."""
+        with self._lock:
+            self._change_subscribers.append(callback)
+
+    def latest(self):
+        """Returns the most recent Snapshot, polling if there is none yet."""
+        with self._lock:
+            latest = self._latest
+        if latest is None:
+            latest = self.poll()
+        return latest
+
+    def poll(self):
+        """Fetches renter files from Sia and publishes a new Snapshot.
+
+        Returns:
+            The newly published Snapshot.
+        """
+        with self._poll_lock:
+            changes = self._renter_state.update(
+                self._sia_client.iter_renter_files())
+            snapshot = self._renter_state.snapshot()
+            with self._lock:
+                self._latest = snapshot
+                subscribers = list(self._subscribers)
+                change_subscribers = list(self._change_subscribers)
+                self._snapshot_published.notify_all()
+        log_changes(changes)
+        record_metrics(snapshot, self._node_name)
+        for callback in change_subscribers:
+            callback(changes)
+        for callback in subscribers:
+            callback(snapshot)
+        return snapshot
+
+    def wait_for_next_snapshot(self, timeout):
+        """Blocks until the next Snapshot is published or the wait ends.
+
+        Args:
+            timeout: Maximum number of seconds to wait.
+
+        Returns once a new Snapshot is published, the exit event is set and
+        polling stops, or the timeout elapses, whichever happens first.
+        """
+        with self._snapshot_published:
+            if not self._exit_event.is_set():
+                self._snapshot_published.wait(timeout)
+
+    def poll_until_exit(self):
+        """Polls Sia at a regular interval until the exit event is set."""
+        while not self._exit_event.is_set():
+            with self._lock:
+                has_snapshot = self._latest is not None
+            try:
+                if not (has_snapshot and sheds_poll(self._circuit_breaker)):
+                    self.poll()
+            except Exception as ex:
+                logger.error('Failed to poll Sia renter files: %s', ex.message)
+            self._sleep_fn(self._poll_interval_seconds)
+        logger.info('Exit event is set. Terminating renter file polling.')
+        with self._snapshot_published:
+            self._snapshot_published.notify_all()
+
+
+def sheds_poll(breaker):
+    """Returns True if a circuit breaker sheds a periodic renter poll.
+
+    Consumers can carry on with the last Snapshot for a while, so periodic
+    polls are not essential once a Snapshot has been published.
+
+    Args:
+        breaker: A CircuitBreaker or None.
+    """
+    if breaker is None:
+        return False
+    try:
+        breaker.check_shed('iter_renter_files')
+    except circuit_breaker.CallShedError as ex:
+        logger.warning('Skipping renter poll: %s', ex.message)
+        return True
+    return False
+
+
+def log_changes(changes):
+    """Logs a summary of the changes found by a renter poll."""
+    logger.info('Renter poll found %d new files, %d started uploads, '
+                '%d completed uploads, %d redundant uploads, %d removed files, '
+                '%d bytes uploaded', len(changes.new_sia_paths),
+                len(changes.started_uploads), len(changes.completed_uploads),
+                len(changes.redundant_uploads), len(changes.removed_sia_paths),
+                changes.bytes_uploaded)
+
+
+def record_metrics(snapshot, node_name):
+    """Updates a node's renter file metrics from a newly published Snapshot."""
+    UPLOADED_BYTES.set(snapshot.uploaded_bytes, node=node_name)
+    UPLOADS_IN_PROGRESS.set(snapshot.uploads_in_progress, node=node_name)
+
+
+# Immutable summary of the Sia renter's files at a point in time.
+#   uploads_in_progress: Number of files with upload progress below 100%.
+#   uploaded_bytes: Total bytes uploaded across all renter files.
+#   sia_paths: A frozenset of the siapaths of all renter files.
+#   uploading_sia_paths: A frozenset of the siapaths of files with upload
+#       progress below 100%.
+Snapshot = collections.namedtuple('Snapshot', [
+    'uploads_in_progress', 'uploaded_bytes', 'sia_paths', 'uploading_sia_paths'
+])
+
+# Changes to the Sia renter's files between two polls.
+#   poll_time: Time of the poll, in seconds since the epoch.
+#   new_sia_paths: A list of siapaths of files that were not in the previous
+#       poll.
+#   started_uploads: A list of siapaths of files that first reported uploaded
+#       bytes in this poll.
+#   completed_uploads: A list of UploadCompletions for files whose upload
+#       progress reached 100% in this poll.
+#   redundant_uploads: A list of siapaths of files whose redundancy first
+#       reached TARGET_REDUNDANCY in this poll.
+#   removed_sia_paths: A list of siapaths of files that were in the previous
+#       poll but are no longer known to the renter.
+#   bytes_uploaded: Change in total uploaded bytes since the previous poll.
+RenterChanges = collections.namedtuple('RenterChanges', [
+    'poll_time', 'new_sia_paths', 'started_uploads', 'completed_uploads',
+    'redundant_uploads', 'removed_sia_paths', 'bytes_uploaded'
+])
+
+# A file whose upload reached 100%.
+#   sia_path: The file's siapath.
+#   first_seen_time: Time of the first poll in which the file appeared.
+#   completed_time: Time of the first poll in which the file's upload progress
+#       was 100%. Equal to first_seen_time if the file was already complete
+#       when first seen.
+UploadCompletion = collections.namedtuple(
+    'UploadCompletion', ['sia_path', 'first_seen_time', 'completed_time'])
@@ -0,0 +1,138 @@
+"""Caches Sia API responses that many components read close together.
+
+Several components (e.g., precondition checks, contract formation and the
+metrics exporters) read the same slowly-changing Sia state. The cache serves
+repeated reads from memory for a short time, and callers that ask for the same
+value while a request for it is already in flight wait for that request
+rather than sending their own.
+"""
+
+import threading
+
+import circuit_breaker
+import metrics
+
+CACHE_HITS = metrics.counter(
+    'api_cache_hits_total',
+    'Number of Sia API reads served from the response cache, by client method.',
+    ['method'])
+CACHE_MISSES = metrics.counter(
+    'api_cache_misses_total',
+    'Number of Sia API reads the response cache sent to Sia, by client method.',
+    ['method'])
+
+
+class ResponseCache(object):
+    """Read-through cache of Sia API responses, keyed by client method."""
+
+    def __init__(self, time_fn):
+        """Creates a new ResponseCache instance.
+
+        Args:
+            time_fn: A function that returns the current time in seconds.
+        """
+        self._time_fn = time_fn
+        self._lock = threading.Lock()
+        # Maps each method to a (value, expiration time) pair.
+        self._entries = {}
+        # Maps each method to the _Fetch in flight for it.
+        self._fetches = {}
+        # Maps each method to the number of times it has been invalidated, so
+        # that fetches that overlap an invalidation don't cache stale values.
+        self._generations = {}
+
+    def get(self, method, ttl_seconds, fetch_fn):
+        """Returns a method's cached value, fetching it if it is not fresh.
+
+        Args:
+            method: Name of the client method whose value to return.
+            ttl_seconds: Number of seconds for which a fetched value is fresh.
+            fetch_fn: A function that takes no arguments and fetches the value
+                from Sia.
+
+        Returns:
+            The cached value if it is fresh, otherwise the result of fetch_fn.
+            If another thread is already fetching the value, waits for and
+            returns that thread's result. If the circuit breaker shed that
+            thread's call, which may be less essential than this one, fetches
+            the value with fetch_fn instead.
+
+        Raises:
+            Any error that fetch_fn raises.
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(method)
+                if entry is not None and self._time_fn() < entry[1]:
+                    CACHE_HITS.inc(method=method)
+                    return entry[0]
+                fetch = self._fetches.get(method)
+                if fetch is None:
+                    fetch = _Fetch()
+                    self._fetches[method] = fetch
+                    generation = self._generations.get(method, 0)
+                    break
+            try:
+                value = fetch.wait()
+            except circuit_breaker.CallShedError:
+                continue
+            CACHE_HITS.inc(method=method)
+            return value
+
+        CACHE_MISSES.inc(method=method)
+        try:
+            value = fetch_fn()
+        except Exception as ex:
+            self._finish_fetch(method, fetch)
+            fetch.fail(ex)
+            raise
+        with self._lock:
+            if self._generations.get(method, 0) == generation:
+                self._entries[method] = (value, self._time_fn() + ttl_seconds)
+        self._finish_fetch(method, fetch)
+        fetch.succeed(value)
+        return value
+
+    def invalidate(self, methods):
+        """Discards the cached values of methods after a write to Sia.
+
+        Fetches that are already in flight still return their results to
+        their callers, but later reads fetch the value again.
+
+        Args:
+            methods: Names of the client methods whose values to discard.
+        """
+        with self._lock:
+            for method in methods:
+                self._entries.pop(method, None)
+                self._fetches.pop(method, None)
+                self._generations[method] = (
+                    self._generations.get(method, 0) + 1)
+
+    def _finish_fetch(self, method, fetch):
+        with self._lock:
+            if self._fetches.get(method) is fetch:
+                del self._fetches[method]
+
+
+class _Fetch(object):
+    """A fetch from Sia that other callers can wait on."""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._value = None
+        self._error = None
+
+    def succeed(self, value):
+        self._value = value
+        self._done.set()
+
+    def fail(self, error):
+        self._error = error
+        self._done.set()
+
+    def wait(self):
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._value
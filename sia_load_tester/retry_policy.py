@@ -0,0 +1,132 @@
+"""Decides when to retry failed uploads and records the ones that run out.
+
+Retrying a failed upload immediately makes little sense when Sia is rejecting
+uploads: every retry fails the same way and adds load to the Sia API. The
+retry policy instead delays each retry with exponential backoff and random
+jitter, so that retries of jobs that failed together spread out over time.
+Jobs that fail jobs.MAX_FAILURE_COUNT times are listed in a dead-letter file
+in the output directory.
+"""
+
+import csv
+import logging
+import os
+import random
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_DELAY_SECONDS = 30.0
+DEFAULT_MAX_DELAY_SECONDS = 600.0
+
+DEAD_LETTER_FILENAME = 'dead_letter_jobs.csv'
+_DEAD_LETTER_FIELDS = ('sia_path', 'local_path', 'failure_count', 'last_error')
+
+
+def make_dead_letter_file(output_dir):
+    """Creates a DeadLetterFile in an output directory."""
+    return DeadLetterFile(os.path.join(output_dir, DEAD_LETTER_FILENAME))
+
+
+def make_retry_policy(base_delay_seconds, max_delay_seconds, dead_letter_file,
+                      time_fn):
+    """Creates a RetryPolicy with random jitter."""
+    return RetryPolicy(base_delay_seconds, max_delay_seconds, dead_letter_file,
+                       time_fn, random.random)
+
+
+class RetryPolicy(object):
+    """Delays retries of failed jobs with exponential backoff and jitter."""
+
+    def __init__(self, base_delay_seconds, max_delay_seconds, dead_letter_file,
+                 time_fn, random_fn):
+        """Creates a new RetryPolicy instance.
+
+        Args:
+            base_delay_seconds: Delay before the first retry of a job. The
+                delay doubles with each further failure of the job.
+            max_delay_seconds: Maximum delay before any retry.
+            dead_letter_file: DeadLetterFile in which to record jobs that ran
+                out of retries.
+            time_fn: A function that returns the current time in seconds.
+            random_fn: A function that returns a random float in [0.0, 1.0).
+        """
+        self._base_delay_seconds = base_delay_seconds
+        self._max_delay_seconds = max_delay_seconds
+        self._dead_letter_file = dead_letter_file
+        self._time_fn = time_fn
+        self._random_fn = random_fn
+
+    def time(self):
+        return self._time_fn()
+
+    def retry_delay(self, job):
+        """Returns the number of seconds to wait before retrying a job.
+
+        The backoff doubles with each failure of the job, up to the maximum,
+        and the delay is chosen at random between half the backoff and the
+        full backoff.
+        """
+        backoff = min(
+            self._max_delay_seconds,
+            self._base_delay_seconds * 2**max(0, job.failure_count - 1))
+        return backoff / 2.0 + self._random_fn() * backoff / 2.0
+
+    def give_up(self, job, error):
+        """Records a job that will not be retried.
+
+        Args:
+            job: The upload job that ran out of retries.
+            error: Type of the error from the job's last failed attempt.
+        """
+        logger.warning('Giving up on upload after %d failed attempts: %s',
+                       job.failure_count, job.local_path)
+        self._dead_letter_file.record(job, error)
+
+
+class DeadLetterFile(object):
+    """CSV file listing the upload jobs that ran out of retries."""
+
+    def __init__(self, output_path):
+        """Creates a new DeadLetterFile instance.
+
+        The file is opened only once the first job runs out of retries, so
+        tests without failures leave no file behind. Jobs are appended to any
+        existing file, so that a resumed test keeps the jobs from earlier
+        runs.
+
+        Args:
+            output_path: Path of the file to which to write jobs.
+        """
+        self._output_path = output_path
+        self._output_file = None
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def record(self, job, error):
+        with self._lock:
+            if self._writer is None:
+                self._open()
+            self._writer.writerow([
+                _utf8(job.sia_path),
+                _utf8(job.local_path), job.failure_count, error
+            ])
+            self._output_file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._output_file:
+                self._output_file.close()
+
+    def _open(self):
+        is_new_file = not os.path.exists(self._output_path)
+        self._output_file = open(self._output_path, 'ab')
+        self._writer = csv.writer(self._output_file)
+        if is_new_file:
+            self._writer.writerow(_DEAD_LETTER_FIELDS)
+
+
+def _utf8(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
@@ -1,18 +1,82 @@
+import collections
+import csv
 import functools
 import inspect
 import logging
+import threading
 import time
 
 import pysia
 import requests
 
+import circuit_breaker
+import histogram
+import json_stream
+import metrics
+import response_cache
+
 logger = logging.getLogger(__name__)
 
 _MAX_REQUEST_ATTEMPTS = 5
 # Use a 3 month allowance period. This mirrors Sia-UI's behavior for allowance
 # period:
 # https://github.com/NebulousLabs/Sia-UI/blob/8c4b271fd29066c4beccade1274715ef32c4cb6d/plugins/Files/js/sagas/helpers.js#L7-L9
-_ALLOWANCE_PERIOD = 4320 * 3
+ALLOWANCE_PERIOD = 4320 * 3
+# Host and port on which the Sia node serves its API by default.
+DEFAULT_API_HOST = 'localhost'
+DEFAULT_API_PORT = 9980
+# Default number of keep-alive connections to hold open to the Sia node.
+DEFAULT_CONNECTION_POOL_SIZE = 10
+# Size of the chunks in which to read streamed responses.
+_STREAM_CHUNK_BYTES = 65536
+# Errors that mean a streamed response was cut off or garbled on its way in.
+_STREAM_ERRORS = (requests.exceptions.ConnectionError,
+                  requests.exceptions.ChunkedEncodingError, json_stream.Error)
+# Sia rejects API requests that don't come from a Sia user agent.
+SIA_USER_AGENT = 'Sia-Agent'
+# Name of the file to which the load tester writes API call statistics.
+API_CALL_STATS_FILENAME = 'api_call_stats.csv'
+
+# Number of seconds for which cached responses from each Sia API endpoint stay
+# fresh. Reads of the renter's file list expire soonest, as uploads change it
+# continually.
+_WALLET_CACHE_TTL_SECONDS = 5
+_RENTER_CACHE_TTL_SECONDS = 5
+_CONTRACTS_CACHE_TTL_SECONDS = 10
+_RENTER_FILES_CACHE_TTL_SECONDS = 2
+
+# requests.Session shared by every SiaClient the factory creates, so that all
+# clients draw from the same pool of keep-alive connections.
+_shared_session = None
+_shared_session_lock = threading.Lock()
+_api_port = DEFAULT_API_PORT
+# ResponseCache shared by every SiaClient the factory creates, so that reads
+# from different components share responses.
+_shared_response_cache = response_cache.ResponseCache(time.time)
+# CircuitBreaker shared by every Sia API client, so that all clients back off
+# together when the Sia node struggles.
+_shared_circuit_breaker = circuit_breaker.CircuitBreaker(time.time)
+
+API_CALLS = metrics.counter('api_calls_total',
+                            'Number of calls to the Sia API, by client method.',
+                            ['method'])
+API_CALL_SECONDS = metrics.summary(
+    'api_call_seconds',
+    'Time spent in calls to the Sia API (including retries), by client method.',
+    ['method'])
+API_RETRIES = metrics.counter(
+    'api_retries_total',
+    'Number of Sia API requests retried after failing to reach Sia.',
+    ['method'])
+API_RECEIVED_BYTES = metrics.counter(
+    'api_received_bytes_total',
+    'Bytes of Sia API response bodies received, by client method.', ['method'])
+API_BACKOFF_SECONDS = metrics.counter(
+    'api_backoff_seconds_total',
+    'Time spent waiting to retry Sia API requests, by client method.',
+    ['method'])
+CONTRACTS = metrics.gauge('contracts',
+                          'Number of renter contracts, as of the last check.')
 
 
 class Error(Exception):
@@ -23,9 +87,514 @@ class SiaServerNotAvailable(Error):
     pass
 
 
-def make_sia_client():
-    """Creates a SiaClient instance using production settings."""
-    return SiaClient(pysia.Sia(), time.sleep)
+class InvalidEndpointError(Error):
+    pass
+
+
+def make_sia_client(essential=True):
+    """Creates a SiaClient instance using production settings.
+
+    Args:
+        essential: False if the load test can do without the client's calls,
+            so that they are shed while the circuit breaker is open.
+    """
+    return default_node().make_sia_client(essential)
+
+
+def make_sia_api():
+    """Creates a pysia implementation that uses the shared connection pool."""
+    return default_node().make_sia_api()
+
+
+def default_node_name():
+    """Returns the name of the Node for the Sia node on localhost."""
+    return _node_name(Endpoint(host=DEFAULT_API_HOST, port=_api_port))
+
+
+def default_node():
+    """Returns the Node for the Sia node on localhost.
+
+    The Node shares the connection pool, response cache and circuit breaker
+    that the configure_* functions set up, so clients created through it
+    share them with clients created by make_sia_client.
+    """
+    return Node(
+        Endpoint(host=DEFAULT_API_HOST, port=_api_port), _get_shared_session(),
+        _shared_response_cache, _shared_circuit_breaker)
+
+
+def make_node(endpoint, pool_size, failure_threshold, slow_call_seconds,
+              open_seconds):
+    """Creates a Node for a Sia node with its own connections and state.
+
+    Args:
+        endpoint: Endpoint on which the Sia node serves its API.
+        pool_size: Maximum number of keep-alive connections to the node.
+        failure_threshold: Number of consecutive failed or slow requests that
+            open the node's circuit.
+        slow_call_seconds: Requests that take at least this many seconds
+            count as failures.
+        open_seconds: Number of seconds the node's circuit stays open before
+            a probe request may go to the node.
+
+    Returns:
+        A Node whose clients share a connection pool, response cache and
+        circuit breaker with each other, but not with clients of other nodes.
+    """
+    return Node(endpoint, _make_session(pool_size),
+                response_cache.ResponseCache(time.time),
+                circuit_breaker.CircuitBreaker(time.time, failure_threshold,
+                                               slow_call_seconds, open_seconds))
+
+
+def parse_endpoint(endpoint):
+    """Parses a Sia API endpoint from a command-line flag.
+
+    Args:
+        endpoint: A host and port separated by a colon (e.g.,
+            'sia-node-1:9980'), or a port on localhost (e.g., '9980').
+
+    Returns:
+        The Endpoint.
+
+    Raises:
+        InvalidEndpointError if the endpoint is malformed.
+    """
+    host, _, port = endpoint.rpartition(':')
+    try:
+        port = int(port)
+    except ValueError:
+        raise InvalidEndpointError(
+            'Sia API endpoint must end in a port number, got: %s' % endpoint)
+    return Endpoint(host=host or DEFAULT_API_HOST, port=port)
+
+
+def configure_api_port(port):
+    """Sets the port of the Sia API for clients the factory creates.
+
+    Args:
+        port: Port on localhost on which the Sia node serves its API.
+    """
+    global _api_port
+    _api_port = port
+
+
+def configure_connection_pool(pool_size):
+    """Sets the size of the connection pool shared by all SiaClients.
+
+    Must be called before the factory creates any clients, as clients hold on
+    to the session that was current when they were created.
+
+    Args:
+        pool_size: Maximum number of keep-alive connections to Sia.
+    """
+    global _shared_session
+    with _shared_session_lock:
+        _shared_session = _make_session(pool_size)
+
+
+def configure_circuit_breaker(failure_threshold, slow_call_seconds,
+                              open_seconds):
+    """Sets the thresholds of the circuit breaker shared by all clients.
+
+    Must be called before the factory creates any clients, as clients hold on
+    to the circuit breaker that was current when they were created.
+
+    Args:
+        failure_threshold: Number of consecutive failed or slow requests that
+            open the circuit.
+        slow_call_seconds: Requests that take at least this many seconds
+            count as failures.
+        open_seconds: Number of seconds the circuit stays open before a probe
+            request may go to Sia.
+    """
+    global _shared_circuit_breaker
+    _shared_circuit_breaker = circuit_breaker.CircuitBreaker(
+        time.time, failure_threshold, slow_call_seconds, open_seconds)
+
+
+def shared_circuit_breaker():
+    """Returns the CircuitBreaker shared by all Sia API clients."""
+    return _shared_circuit_breaker
+
+
+def connection_stats():
+    """Returns ConnectionStats for the shared connection pool."""
+    with _shared_session_lock:
+        session = _shared_session
+    if session is None:
+        return ConnectionStats(opened=0, reused=0)
+    return _session_connection_stats(session)
+
+
+def _get_shared_session():
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = _make_session(DEFAULT_CONNECTION_POOL_SIZE)
+        return _shared_session
+
+
+def _make_session(pool_size):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'User-agent': SIA_USER_AGENT})
+    return session
+
+
+def _session_connection_stats(session):
+    opened = 0
+    requests_sent = 0
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            requests_sent += pool.num_requests
+    return ConnectionStats(opened=opened, reused=requests_sent - opened)
+
+
+class Node(object):
+    """A Sia node, and the state shared by every client that talks to it."""
+
+    def __init__(self, endpoint, session, response_cache, circuit_breaker):
+        """Creates a new Node instance.
+
+        Args:
+            endpoint: Endpoint on which the Sia node serves its API.
+            session: The requests.Session through which clients send
+                requests to the node.
+            response_cache: ResponseCache from which clients serve repeated
+                reads.
+            circuit_breaker: CircuitBreaker that decides when clients may send
+                requests to the node.
+        """
+        self.endpoint = endpoint
+        self.circuit_breaker = circuit_breaker
+        self._session = session
+        self._response_cache = response_cache
+
+    @property
+    def name(self):
+        return _node_name(self.endpoint)
+
+    def make_sia_client(self, essential=True):
+        """Creates a SiaClient for the node.
+
+        Args:
+            essential: False if the load test can do without the client's
+                calls, so that they are shed while the circuit is open.
+        """
+        return SiaClient(self.make_sia_api(), time.sleep, self._response_cache,
+                         self.circuit_breaker, essential)
+
+    def make_sia_api(self):
+        """Creates a pysia implementation for the node."""
+        return PooledSia(
+            self._session,
+            host='http://%s' % self.endpoint.host,
+            port=self.endpoint.port)
+
+    def connection_stats(self):
+        """Returns ConnectionStats for the node's connection pool."""
+        return _session_connection_stats(self._session)
+
+
+def _node_name(endpoint):
+    return '%s:%d' % endpoint
+
+
+class PooledSia(pysia.Sia):
+    """pysia implementation that sends requests over a requests.Session.
+
+    pysia.Sia issues every call through the module-level requests functions,
+    which open a fresh connection per request. This sends the same calls
+    through a Session so that connections to Sia are kept alive and reused.
+    """
+
+    def __init__(self, session, *args, **kwargs):
+        """Creates a new PooledSia instance.
+
+        Args:
+            session: The requests.Session through which to send requests.
+            *args: Positional arguments to pass through to pysia.Sia.
+            **kwargs: Keyword arguments to pass through to pysia.Sia.
+        """
+        super(PooledSia, self).__init__(*args, **kwargs)
+        self._session = session
+
+    def __call__(self, verb, url, data=None):
+        full_url = self._url_base + url
+        if verb == pysia.client.GET:
+            response = self._session.get(full_url, params=data)
+        else:
+            response = self._session.post(full_url, data=data)
+        method = _current_method()
+        if method is not None:
+            record_api_bytes_received(method, len(response.content))
+        try:
+            return response.json()
+        except ValueError:
+            return response.ok
+
+    def iter_renter_files(self):
+        """Returns an iterator over the files in the renter's file list.
+
+        Unlike get_renter_files, decodes the response one file at a time as
+        it streams in, rather than holding the full file list in memory.
+        """
+        response = self._session.get(
+            self._url_base + '/renter/files', stream=True)
+        response.raise_for_status()
+        chunks = response.iter_content(_STREAM_CHUNK_BYTES)
+        # The response streams in after the client method returns, so capture
+        # the method to which to attribute its bytes now.
+        method = _current_method()
+        if method is not None:
+            chunks = _count_received_bytes(method, chunks)
+        return _iter_and_close(response,
+                               json_stream.iter_array_items(chunks, u'files'))
+
+
+def record_api_call(method, elapsed_seconds):
+    """Records the metrics of a completed call to the Sia API.
+
+    Args:
+        method: Name of the client method that called the API.
+        elapsed_seconds: Duration of the call, including any retries.
+    """
+    API_CALLS.inc(method=method)
+    API_CALL_SECONDS.observe(elapsed_seconds, method=method)
+    _api_call_recorder.record_call(method, elapsed_seconds)
+
+
+def record_api_bytes_received(method, byte_count):
+    """Records bytes of a Sia API response body.
+
+    Args:
+        method: Name of the client method that called the API.
+        byte_count: Number of bytes received.
+    """
+    API_RECEIVED_BYTES.inc(byte_count, method=method)
+    _api_call_recorder.record_bytes_received(method, byte_count)
+
+
+def record_api_retry(method, backoff_seconds):
+    """Records a retry of a Sia API request that failed to reach Sia.
+
+    Args:
+        method: Name of the client method that called the API.
+        backoff_seconds: Time to wait before retrying the request.
+    """
+    API_RETRIES.inc(method=method)
+    API_BACKOFF_SECONDS.inc(backoff_seconds, method=method)
+    _api_call_recorder.record_retry(method, backoff_seconds)
+
+
+def api_call_stats():
+    """Returns ApiCallStats for each client method that called the Sia API.
+
+    Covers calls from every SiaClient and AsyncSiaClient since the process
+    started, sorted by method name.
+    """
+    return _api_call_recorder.stats()
+
+
+def log_api_call_stats(stats):
+    """Logs a line of ApiCallStats for each client method."""
+    for method_stats in stats:
+        logger.info(('Sia API calls to %s: count=%d, p50=%.3fs, p90=%.3fs, '
+                     'p99=%.3fs, max=%.3fs, received=%d bytes, retries=%d '
+                     '(%.1fs backoff)'), method_stats.method,
+                    method_stats.calls, method_stats.p50_seconds,
+                    method_stats.p90_seconds, method_stats.p99_seconds,
+                    method_stats.max_seconds, method_stats.bytes_received,
+                    method_stats.retries, method_stats.backoff_seconds)
+
+
+def write_api_call_stats(output_path, stats):
+    """Writes ApiCallStats to a CSV file, replacing any existing file."""
+    with open(output_path, 'wb') as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(ApiCallStats._fields)
+        for method_stats in stats:
+            writer.writerow(
+                [method_stats.method, method_stats.calls] +
+                ['%.3f' % s for s in method_stats[2:6]] + [
+                    method_stats.bytes_received, method_stats.retries,
+                    '%.3f' % method_stats.backoff_seconds
+                ])
+
+
+class _MethodStats(object):
+    """Running totals of the calls from one client method."""
+
+    __slots__ = ('latencies', 'bytes_received', 'retries', 'backoff_seconds')
+
+    def __init__(self):
+        self.latencies = histogram.Histogram()
+        self.bytes_received = 0
+        self.retries = 0
+        self.backoff_seconds = 0
+
+
+class _ApiCallRecorder(object):
+    """Accumulates statistics of Sia API calls for each client method."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Maps each client method name to its _MethodStats.
+        self._methods = collections.defaultdict(_MethodStats)
+
+    def record_call(self, method, elapsed_seconds):
+        with self._lock:
+            self._methods[method].latencies.record(elapsed_seconds)
+
+    def record_bytes_received(self, method, byte_count):
+        with self._lock:
+            self._methods[method].bytes_received += byte_count
+
+    def record_retry(self, method, backoff_seconds):
+        with self._lock:
+            method_stats = self._methods[method]
+            method_stats.retries += 1
+            method_stats.backoff_seconds += backoff_seconds
+
+    def stats(self):
+        with self._lock:
+            return [
+                _summarize_method(method, self._methods[method])
+                for method in sorted(self._methods)
+            ]
+
+
+def _summarize_method(method, method_stats):
+    latencies = method_stats.latencies
+    p50, p90, p99 = [latencies.percentile(p) for p in (50, 90, 99)]
+    return ApiCallStats(
+        method=method,
+        calls=len(latencies),
+        p50_seconds=p50 or 0.0,
+        p90_seconds=p90 or 0.0,
+        p99_seconds=p99 or 0.0,
+        max_seconds=latencies.max() or 0.0,
+        bytes_received=method_stats.bytes_received,
+        retries=method_stats.retries,
+        backoff_seconds=method_stats.backoff_seconds)
+
+
+_api_call_recorder = _ApiCallRecorder()
+
+# Name of the SiaClient method that each thread is running, so that PooledSia
+# can attribute the bytes it receives to the method that requested them.
+_call_context = threading.local()
+
+
+def _current_method():
+    return getattr(_call_context, 'method', None)
+
+
+def _count_received_bytes(method, chunks):
+    for chunk in chunks:
+        record_api_bytes_received(method, len(chunk))
+        yield chunk
+
+
+def _iter_and_close(response, items):
+    try:
+        for item in items:
+            yield item
+    finally:
+        response.close()
+
+
+def _cached(ttl_seconds):
+    """Decorator for SiaClient reads that the client's cache may serve.
+
+    Args:
+        ttl_seconds: Number of seconds for which a response stays fresh.
+    """
+
+    def decorator(func):
+        func.cache_ttl_seconds = ttl_seconds
+        return func
+
+    return decorator
+
+
+def _invalidates(*methods):
+    """Decorator for SiaClient writes that change the result of cached reads.
+
+    Args:
+        *methods: Names of the cached methods whose results the write changes.
+    """
+
+    def decorator(func):
+        func.invalidated_methods = methods
+        return func
+
+    return decorator
+
+
+def _streamed(func):
+    """Decorator for SiaClient reads whose responses stream in as they're read.
+
+    The call isn't complete until the caller has read the whole stream, so its
+    latency is recorded only once the stream ends.
+    """
+    func.streamed = True
+    return func
+
+
+def _iter_streamed_call(method, request, sia_client, *a, **kw):
+    """Yields the items of a streamed response, recording the call's stats.
+
+    If the connection drops or the response turns out to be malformed while
+    it streams in, the failure counts against the client's CircuitBreaker
+    (if it has one). The request is retried like any other, unless the caller
+    has already read items from the stream, as a retry would repeat them.
+
+    Args:
+        method: Name of the client method that called the API.
+        request: Function that sends the request and returns an iterator over
+            the response's items.
+        sia_client: The calling SiaClient.
+        *a: Positional arguments to pass through to request.
+        **kw: Keyword arguments to pass through to request.
+
+    Raises:
+        SiaServerNotAvailable if the stream fails after the caller has read
+        items from it, or on every attempt.
+    """
+    start_time = time.time()
+    try:
+        for prior_attempts in range(_MAX_REQUEST_ATTEMPTS + 1):
+            items_read = False
+            try:
+                for item in request(sia_client, *a, **kw):
+                    items_read = True
+                    yield item
+                return
+            except _STREAM_ERRORS as e:
+                if sia_client._circuit_breaker is not None:
+                    sia_client._circuit_breaker.record_failure()
+                if items_read or prior_attempts == _MAX_REQUEST_ATTEMPTS:
+                    raise SiaServerNotAvailable(
+                        'Lost connection to Sia server during %s: %s' % (method,
+                                                                         e), e)
+                sleep_seconds = 5**prior_attempts
+                logger.warning(('Response from Sia server failed: %s -> %s'
+                                '  Retrying in %d seconds'), method, e,
+                               sleep_seconds)
+                record_api_retry(method, sleep_seconds)
+                sia_client._sleep_fn(sleep_seconds)
+    finally:
+        record_api_call(method, time.time() - start_time)
 
 
 def _NetworkErrorChecking(func):
@@ -34,32 +603,118 @@ def _NetworkErrorChecking(func):
     Function decorator that wraps the function in a handler for network errors.
     Every time there's an error, it calls the calling SiaClient instance's
     _sleep_fn method to wait an increasing amount of time until the next call,
-    for a maximum of _MAX_REQUEST_ATTEMPTS calls.
+    for a maximum of _MAX_REQUEST_ATTEMPTS calls. Records the number, latency
+    and response bytes of calls and the number of retries and time spent
+    backing off, both as metrics and in the statistics that api_call_stats
+    returns.
+
+    Reads marked with _streamed return an iterator, and the call lasts until
+    the iterator is exhausted or closed.
+
+    Reads marked with _cached are served from the calling SiaClient's
+    ResponseCache (if it has one), so only cache misses call the API. Writes
+    marked with _invalidates discard the cached reads that they change.
+
+    Each request goes through the calling SiaClient's CircuitBreaker (if it has
+    one), which may make the request wait or, for clients that aren't
+    essential, raise circuit_breaker.CallShedError.
     """
 
+    # Only public methods call the Sia API. Helpers (and the constructor)
+    # still get retries, but no metrics.
+    if func.__name__.startswith('_'):
+        return functools.wraps(func)(
+            lambda *a, **kw: _call_with_retries(func, *a, **kw))
+
+    guarded_func = _guard_with_circuit_breaker(func)
+
+    def request(*a, **kw):
+        previous_method = _current_method()
+        _call_context.method = func.__name__
+        try:
+            return _call_with_retries(guarded_func, *a, **kw)
+        finally:
+            _call_context.method = previous_method
+
+    def call_api(*a, **kw):
+        if getattr(func, 'streamed', False):
+            return _iter_streamed_call(func.__name__, request, *a, **kw)
+        start_time = time.time()
+        try:
+            return request(*a, **kw)
+        finally:
+            record_api_call(func.__name__, time.time() - start_time)
+
+    ttl_seconds = getattr(func, 'cache_ttl_seconds', None)
+    invalidated_methods = getattr(func, 'invalidated_methods', ())
+
     @functools.wraps(func)
-    def wrapper(*a, **kw):
-        sia_client = a[0]
-        for prior_attempts in range(_MAX_REQUEST_ATTEMPTS):
-            try:
-                return func(*a, **kw)
-            except requests.exceptions.ConnectionError as e:
-                sleep_seconds = 5**prior_attempts
-                logger.warning(('Request to Sia server failed: %s(%s) -> %s'
-                                '  Retrying in %d seconds'), func.__name__, kw,
-                               e.message, sleep_seconds)
-                sia_client._sleep_fn(sleep_seconds)
-                continue
-        # Make one last try. If it fails, raise a custom error.
+    def wrapper(sia_client, *a, **kw):
+        cache = sia_client._response_cache
+        if cache is None:
+            return call_api(sia_client, *a, **kw)
+        if ttl_seconds is not None:
+            return cache.get(func.__name__, ttl_seconds,
+                             lambda: call_api(sia_client, *a, **kw))
         try:
-            return func(*a, **kw)
-        except requests.exceptions.ConnectionError as e:
-            raise SiaServerNotAvailable(
-                'Could not connect to Sia server: %s' % e.message, e)
+            return call_api(sia_client, *a, **kw)
+        finally:
+            if invalidated_methods:
+                cache.invalidate(invalidated_methods)
+
+    return wrapper
+
+
+def _guard_with_circuit_breaker(func):
+    """Wraps a single request to Sia in the calling SiaClient's CircuitBreaker.
+    """
+
+    @functools.wraps(func)
+    def wrapper(sia_client, *a, **kw):
+        breaker = sia_client._circuit_breaker
+        if breaker is None:
+            return func(sia_client, *a, **kw)
+        while True:
+            wait_seconds = breaker.admit(func.__name__, sia_client._essential)
+            if not wait_seconds:
+                break
+            sia_client._sleep_fn(wait_seconds)
+        start_time = time.time()
+        try:
+            result = func(sia_client, *a, **kw)
+        except requests.exceptions.ConnectionError:
+            breaker.record_failure()
+            raise
+        except Exception:
+            breaker.record_response(time.time() - start_time)
+            raise
+        breaker.record_response(time.time() - start_time)
+        return result
 
     return wrapper
 
 
+def _call_with_retries(func, *a, **kw):
+    sia_client = a[0]
+    for prior_attempts in range(_MAX_REQUEST_ATTEMPTS):
+        try:
+            return func(*a, **kw)
+        except requests.exceptions.ConnectionError as e:
+            sleep_seconds = 5**prior_attempts
+            logger.warning(('Request to Sia server failed: %s(%s) -> %s'
+                            '  Retrying in %d seconds'), func.__name__, kw,
+                           e.message, sleep_seconds)
+            record_api_retry(func.__name__, sleep_seconds)
+            sia_client._sleep_fn(sleep_seconds)
+            continue
+    # Make one last try. If it fails, raise a custom error.
+    try:
+        return func(*a, **kw)
+    except requests.exceptions.ConnectionError as e:
+        raise SiaServerNotAvailable(
+            'Could not connect to Sia server: %s' % e.message, e)
+
+
 def _decorate_all_methods(decorator):
     """Class decorator which adds a function decorator to a class's methods.
 
@@ -82,25 +737,41 @@ class SiaClient(object):
     This class is a thin wrapper around pysia.
     """
 
-    def __init__(self, api_impl, sleep_fn):
+    def __init__(self,
+                 api_impl,
+                 sleep_fn,
+                 response_cache=None,
+                 circuit_breaker=None,
+                 essential=True):
         """Creates a new SiaClient instance.
 
         Args:
             api_impl: Implementation of pysia interface.
             sleep_fn: A callback function for putting the thread to sleep for
                 a given number of seconds.
+            response_cache: A ResponseCache from which to serve repeated
+                reads, or None to send every read to Sia.
+            circuit_breaker: A CircuitBreaker that decides when requests may
+                go to Sia, or None to send every request right away.
+            essential: False if the client's calls should be shed, rather than
+                wait, while the circuit breaker is open.
         """
         self._api_impl = api_impl
         self._sleep_fn = sleep_fn
+        self._response_cache = response_cache
+        self._circuit_breaker = circuit_breaker
+        self._essential = essential
 
     def is_blockchain_synced(self):
         return self._api_impl.get_consensus()[u'synced']
 
+    @_cached(_RENTER_CACHE_TTL_SECONDS)
     def allowance_budget(self):
         """Returns the amount budgeted for renter allowance (in hastings)."""
         return long(
             self._api_impl.get_renter()[u'settings'][u'allowance'][u'funds'])
 
+    @_invalidates('allowance_budget', 'wallet_balance', 'contract_count')
     def set_allowance_budget(self, budget_hastings):
         """Sets the allowance budget to the amount specified
 
@@ -112,7 +783,7 @@ class SiaClient(object):
             True on success.
         """
         response = self._api_impl.set_renter(
-            funds=budget_hastings, period=_ALLOWANCE_PERIOD)
+            funds=budget_hastings, period=ALLOWANCE_PERIOD)
         if response == True:
             return True
         sia_error = self._get_sia_error_from_response(response)
@@ -120,16 +791,22 @@ class SiaClient(object):
                        sia_error)
         return False
 
+    @_cached(_CONTRACTS_CACHE_TTL_SECONDS)
     def contract_count(self):
-        return len(self._api_impl.get_renter_contracts()[u'contracts'])
+        count = len(self._api_impl.get_renter_contracts()[u'contracts'])
+        CONTRACTS.set(count)
+        return count
 
+    @_cached(_WALLET_CACHE_TTL_SECONDS)
     def is_wallet_locked(self):
         return not self._api_impl.get_wallet()[u'unlocked']
 
+    @_cached(_WALLET_CACHE_TTL_SECONDS)
     def wallet_balance(self):
         """Returns the wallet's confirmed Siacoin balance (in hastings)."""
         return long(self._api_impl.get_wallet()[u'confirmedsiacoinbalance'])
 
+    @_cached(_RENTER_FILES_CACHE_TTL_SECONDS)
     def renter_files(self):
         """Returns a list of files known to the Sia renter."""
         files = self._api_impl.get_renter_files()[u'files']
@@ -138,6 +815,17 @@ class SiaClient(object):
             return []
         return files
 
+    @_streamed
+    def iter_renter_files(self):
+        """Returns an iterator over the files known to the Sia renter.
+
+        Streams the renter's file list, so consumers that need only
+        aggregates over the files (e.g., a count) use constant memory no
+        matter how many files the renter has.
+        """
+        return self._api_impl.iter_renter_files()
+
+    @_invalidates('renter_files')
     def upload_file_async(self, local_path, sia_path):
         """Starts an asynchronous upload of a file to Sia
 
@@ -161,3 +849,26 @@ class SiaClient(object):
             return response[u'message']
         else:
             return 'unknown failure reason from Sia'
+
+
+# Host and port on which a Sia node serves its API.
+Endpoint = collections.namedtuple('Endpoint', ['host', 'port'])
+
+# Counts of connections to Sia that the shared pool opened and requests that
+# reused an already-open connection.
+ConnectionStats = collections.namedtuple('ConnectionStats',
+                                         ['opened', 'reused'])
+
+# Statistics of the Sia API calls from one client method.
+#   method: Name of the SiaClient or AsyncSiaClient method.
+#   calls: Number of calls the method made.
+#   p50_seconds, p90_seconds, p99_seconds: Call latency (in seconds, including
+#       retries) at the 50th, 90th and 99th percentiles.
+#   max_seconds: Largest call latency (in seconds).
+#   bytes_received: Total bytes of the response bodies the calls received.
+#   retries: Number of requests retried after failing to reach Sia.
+#   backoff_seconds: Total time (in seconds) spent waiting between retries.
+ApiCallStats = collections.namedtuple('ApiCallStats', [
+    'method', 'calls', 'p50_seconds', 'p90_seconds', 'p99_seconds',
+    'max_seconds', 'bytes_received', 'retries', 'backoff_seconds'
+])
@@ -1,10 +1,19 @@
 import logging
+import random
+import threading
 import time
 
-import sia_client as sc
+WAIT_MODE_EVENT = 'event'
+WAIT_MODE_SLEEP = 'sleep'
+WAIT_MODES = (WAIT_MODE_EVENT, WAIT_MODE_SLEEP)
 
-_MAX_CONCURRENT_UPLOADS = 5
 _SLEEP_SECONDS = 15
+# In event mode, the Waiter wakes as soon as the renter poller publishes a new
+# snapshot, but also re-checks at this interval in case it missed an update.
+_EVENT_FALLBACK_SECONDS = 1
+# Maximum fraction by which to randomly vary the fallback interval, so that
+# multiple waiting threads don't wake in lockstep.
+_EVENT_FALLBACK_JITTER = 0.5
 
 logger = logging.getLogger(__name__)
 
@@ -17,42 +26,206 @@ class WaitInterruptedError(Error):
     pass
 
 
-def make_waiter(exit_event):
-    """Factory for creating a Waiter using production settings."""
-    return Waiter(sc.make_sia_client(), time.sleep, exit_event)
+def make_waiter(renter_poller,
+                concurrency_controller,
+                exit_event,
+                wait_mode=WAIT_MODE_EVENT):
+    """Factory for creating a Waiter using production settings.
+
+    Args:
+        renter_poller: A source of renter file Snapshots.
+        concurrency_controller: Controller that determines the maximum number
+            of concurrent uploads.
+        exit_event: An event that, when set, indicates Waiter should stop
+            waiting.
+        wait_mode: WAIT_MODE_EVENT to wake up whenever the renter poller
+            publishes a new snapshot or WAIT_MODE_SLEEP to sleep a fixed
+            interval between checks.
+
+    Returns:
+        A Waiter that waits in the given mode.
+    """
+    if wait_mode == WAIT_MODE_EVENT:
+        return Waiter(renter_poller, concurrency_controller,
+                      _make_snapshot_wait_fn(renter_poller),
+                      _EVENT_FALLBACK_SECONDS, time.time, exit_event)
+    return Waiter(renter_poller, concurrency_controller, time.sleep,
+                  _SLEEP_SECONDS, time.time, exit_event)
+
+
+def _make_snapshot_wait_fn(renter_poller):
+    """Makes a sleep function that returns early on a new renter snapshot."""
+
+    def wait_fn(seconds):
+        jitter = random.uniform(-_EVENT_FALLBACK_JITTER, _EVENT_FALLBACK_JITTER)
+        renter_poller.wait_for_next_snapshot(seconds * (1 + jitter))
+
+    return wait_fn
+
+
+class UploadSlots(object):
+    """Counts in-progress uploads against the concurrent upload limit.
+
+    Renter snapshots are shared and may predate the most recent uploads, so
+    UploadSlots counts newly started uploads itself until they appear in a
+    snapshot, along with slots reserved for uploads that are about to start.
+    """
+
+    def __init__(self, renter_poller, concurrency_controller):
+        """Creates a new UploadSlots instance.
+
+        Args:
+            renter_poller: A source of renter file Snapshots.
+            concurrency_controller: Controller that determines the maximum
+                number of concurrent uploads.
+        """
+        self._renter_poller = renter_poller
+        self._concurrency_controller = concurrency_controller
+        self._lock = threading.Lock()
+        # Siapaths of uploads started since the latest renter snapshot.
+        self._unconfirmed_sia_paths = set()
+        # Number of upload slots reserved for uploads that haven't started yet.
+        self._reserved_slots = 0
+        # Latest snapshot against which the unconfirmed uploads were checked.
+        self._checked_snapshot = None
+
+    def try_reserve(self):
+        """Reserves an upload slot if one is available.
+
+        Returns:
+            A (reserved, upload_count) tuple, where reserved is True if a slot
+            was reserved and upload_count is the number of uploads in progress
+            before the attempt.
+        """
+        snapshot = self._renter_poller.latest()
+        limit = self._concurrency_controller.limit()
+        with self._lock:
+            upload_count = self._count_in_progress_locked(snapshot)
+            if upload_count >= limit:
+                return False, upload_count
+            self._reserved_slots += 1
+            return True, upload_count
+
+    def record_started(self, sia_path):
+        """Counts an upload as in progress until the renter reports it.
+
+        The upload takes over the slot reserved for it, if any.
+
+        Args:
+            sia_path: Siapath of the upload that was just started.
+        """
+        with self._lock:
+            if self._reserved_slots:
+                self._reserved_slots -= 1
+            self._unconfirmed_sia_paths.add(sia_path)
+            # The upload may already appear in the latest snapshot (e.g., if
+            # the renter still lists an earlier upload of the same file).
+            self._checked_snapshot = None
+
+    def release(self):
+        """Frees a slot reserved for an upload that did not start."""
+        with self._lock:
+            self._reserved_slots -= 1
+
+    def count_in_progress(self):
+        """Returns the number of uploads in progress or about to start."""
+        snapshot = self._renter_poller.latest()
+        with self._lock:
+            return self._count_in_progress_locked(snapshot)
+
+    def _count_in_progress_locked(self, snapshot):
+        # Every submission thread checks for slots under the same lock, so
+        # check the unconfirmed uploads only once per new snapshot. Look up
+        # each unconfirmed path in the snapshot rather than subtracting the
+        # snapshot's paths, which would visit every file on the renter.
+        if snapshot is not self._checked_snapshot:
+            self._unconfirmed_sia_paths = set(
+                sia_path for sia_path in self._unconfirmed_sia_paths
+                if sia_path not in snapshot.sia_paths)
+            self._checked_snapshot = snapshot
+        return (snapshot.uploads_in_progress +
+                len(self._unconfirmed_sia_paths) + self._reserved_slots)
 
 
 class Waiter(object):
     """Waits for conditions in Sia node to become true."""
 
-    def __init__(self, sia_client, sleep_fn, exit_event):
+    def __init__(self, renter_poller, concurrency_controller, sleep_fn,
+                 sleep_seconds, time_fn, exit_event):
         """Creates a new Waiter instance.
 
         Args:
-            sia_client: An implementation of the Sia client API.
+            renter_poller: A source of renter file Snapshots.
+            concurrency_controller: Controller that determines the maximum
+                number of concurrent uploads.
             sleep_fn: A callback function for putting the thread to sleep for
                 a given number of seconds.
+            sleep_seconds: Number of seconds to sleep between checks.
+            time_fn: A function that returns the current time in seconds.
             exit_event: An event that, when set, indicates Waiter should stop
                 waiting and raise an exception.
         """
-        self._sia_client = sia_client
+        self._upload_slots = UploadSlots(renter_poller, concurrency_controller)
+        self._concurrency_controller = concurrency_controller
         self._sleep_fn = sleep_fn
+        self._sleep_seconds = sleep_seconds
+        self._time_fn = time_fn
         self._exit_event = exit_event
+        self._idle_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record_upload_started(self, sia_path):
+        """Counts an upload as in progress until the renter reports it.
+
+        Args:
+            sia_path: Siapath of the upload that was just started.
+        """
+        self._upload_slots.record_started(sia_path)
+
+    def release_upload_slot(self):
+        """Frees a slot reserved for an upload that did not start."""
+        self._upload_slots.release()
+
+    def idle_seconds(self):
+        """Returns the total time spent waiting for upload slots.
+
+        When multiple threads wait at once, each thread's wait counts
+        separately.
+        """
+        with self._lock:
+            return self._idle_seconds
 
     def wait_for_available_upload_slot(self):
-        """Waits until the number of concurrent uploads is below the maximum.
+        """Waits until an upload slot is available, then reserves it.
+
+        The reserved slot counts as an in-progress upload until the caller
+        either records the upload as started or releases the slot, so that
+        concurrent callers can't claim the same slot.
 
         Raises:
             WaitInterruptedError if the exit event is set during function
                 execution.
         """
-        upload_count = self._count_uploads_in_progress()
-        while self._too_many_uploads_in_progress(upload_count):
-            logger.info(('Too many uploads in progress: %d >= %d.'
-                         ' Sleeping for %d seconds'), upload_count,
-                        _MAX_CONCURRENT_UPLOADS, _SLEEP_SECONDS)
-            self._sleep_fn(_SLEEP_SECONDS)
-            upload_count = self._count_uploads_in_progress()
+        start_time = self._time_fn()
+        try:
+            reserved, upload_count = self._try_reserve_upload_slot()
+            logged_count = None
+            while not reserved:
+                # Waits can wake every second, so only log at INFO level when
+                # the upload count has changed since the last message.
+                log_fn = (logger.info
+                          if upload_count != logged_count else logger.debug)
+                logged_count = upload_count
+                log_fn(('Too many uploads in progress: %d >= %d.'
+                        ' Sleeping for %d seconds'), upload_count,
+                       self._concurrency_controller.limit(),
+                       self._sleep_seconds)
+                self._sleep_fn(self._sleep_seconds)
+                reserved, upload_count = self._try_reserve_upload_slot()
+        finally:
+            idle_seconds = self._time_fn() - start_time
+            with self._lock:
+                self._idle_seconds += idle_seconds
 
     def wait_for_all_uploads_to_complete(self):
         """Waits until all in-progress uploads are complete.
@@ -62,27 +235,28 @@ class Waiter(object):
                 execution.
         """
         upload_count = self._count_uploads_in_progress()
+        logged_count = None
         while upload_count > 0:
-            logger.info(
-                ('Waiting for remaining uploads to complete.'
-                 ' %d uploads still in progress. Sleeping for %d seconds'),
-                upload_count, _SLEEP_SECONDS)
-            self._sleep_fn(_SLEEP_SECONDS)
+            log_fn = (logger.info
+                      if upload_count != logged_count else logger.debug)
+            logged_count = upload_count
+            log_fn(('Waiting for remaining uploads to complete.'
+                    ' %d uploads still in progress. Sleeping for %d seconds'),
+                   upload_count, self._sleep_seconds)
+            self._sleep_fn(self._sleep_seconds)
             upload_count = self._count_uploads_in_progress()
 
+    def _try_reserve_upload_slot(self):
+        check_exit_event(self._exit_event)
+        return self._upload_slots.try_reserve()
+
     def _count_uploads_in_progress(self):
-        self._check_exit_event()
-        n = 0
-        for sia_file in self._sia_client.renter_files():
-            if sia_file[u'uploadprogress'] < 100:
-                n += 1
-        return n
-
-    def _too_many_uploads_in_progress(self, concurrent_uploads):
-        return concurrent_uploads >= _MAX_CONCURRENT_UPLOADS
-
-    def _check_exit_event(self):
-        if self._exit_event.is_set():
-            logger.critical('Exit event is set. Stopping wait.')
-            raise WaitInterruptedError(
-                'Sia condition wait has been interrupted')
+        check_exit_event(self._exit_event)
+        return self._upload_slots.count_in_progress()
+
+
+def check_exit_event(exit_event):
+    """Raises WaitInterruptedError if the exit event is set."""
+    if exit_event.is_set():
+        logger.critical('Exit event is set. Stopping wait.')
+        raise WaitInterruptedError('Sia condition wait has been interrupted')
@@ -3,23 +3,35 @@ import json
 import logging
 import os
 
-import pysia
+import circuit_breaker
+import sia_client as sc
 
 logger = logging.getLogger(__name__)
 
 
-def make_snapshotter(output_dir):
-    return Snapshotter(output_dir, pysia.Sia(), datetime.datetime.utcnow)
+def make_snapshotter(output_dir, node=None):
+    node = node or sc.default_node()
+    return Snapshotter(output_dir, node.make_sia_api(),
+                       datetime.datetime.utcnow, node.circuit_breaker)
 
 
 class Snapshotter(object):
 
-    def __init__(self, output_dir, sia_api, time_fn):
+    def __init__(self, output_dir, sia_api, time_fn, circuit_breaker=None):
         self._output_dir = output_dir
         self._sia_api = sia_api
         self._time_fn = time_fn
+        # Snapshots are not essential to the load test, so they are skipped
+        # while the circuit breaker is open.
+        self._circuit_breaker = circuit_breaker
 
     def snapshot(self):
+        if self._circuit_breaker is not None:
+            try:
+                self._circuit_breaker.check_shed('snapshot')
+            except circuit_breaker.CallShedError as ex:
+                logger.warning('Skipping snapshot of Sia state: %s', ex.message)
+                return
         _ensure_directory_exists(self._output_dir)
         snapshot_fns = [
             self._snapshot_renter, self._snapshot_contract,
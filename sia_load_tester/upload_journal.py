@@ -0,0 +1,233 @@
+"""Append-only journal of upload job state, for resuming after a restart.
+
+The load tester records each change in an upload job's state to a journal in
+the output directory: when the job enters the upload queue, when Sia accepts
+the upload, when the renter reports the upload complete, and each time an
+upload attempt fails. On restart, replaying the journal tells the load tester
+which jobs still need work without fetching the renter's full file list.
+
+To keep journaling cheap, records are flushed to disk in batches, at least
+every few seconds, so a crash can lose the last few records. A lost record only
+causes the load tester to repeat some work on restart (e.g., retry an upload
+that Sia already accepted, which Sia rejects as a duplicate).
+"""
+
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_JOURNAL_FILENAME = 'upload_journal.jsonl'
+# Flush journal records to disk after this many records have accumulated or
+# this many seconds have passed since the last flush, whichever comes first.
+_SYNC_INTERVAL_RECORDS = 1000
+_SYNC_INTERVAL_SECONDS = 5
+
+EVENT_QUEUED = 'queued'
+EVENT_SUBMITTED = 'submitted'
+EVENT_COMPLETED = 'completed'
+EVENT_FAILED = 'failed'
+
+STATE_QUEUED = 'queued'
+STATE_SUBMITTED = 'submitted'
+STATE_COMPLETED = 'completed'
+
+# Orders the states from least to most progress toward a completed upload.
+_STATE_PROGRESS = {STATE_QUEUED: 0, STATE_SUBMITTED: 1, STATE_COMPLETED: 2}
+
+
+def journal_path(output_dir):
+    """Returns the path of the upload journal in an output directory."""
+    return os.path.join(output_dir, _JOURNAL_FILENAME)
+
+
+def make_journal(output_dir, job_records):
+    """Opens the upload journal in an output directory for appending.
+
+    Args:
+        output_dir: Directory that holds the journal.
+        job_records: JobRecords replayed from the existing journal, or None if
+            there is no existing journal.
+
+    Returns:
+        A Journal that appends to the journal in the output directory.
+    """
+    submitted_sia_paths = []
+    if job_records:
+        submitted_sia_paths = [
+            sia_path for sia_path, record in job_records.iteritems()
+            if record.state == STATE_SUBMITTED
+        ]
+    return Journal(
+        open(journal_path(output_dir), 'ab'), time.time, submitted_sia_paths)
+
+
+def replay(input_path):
+    """Reconstructs the last known state of each job from a journal.
+
+    Args:
+        input_path: Path to the journal file.
+
+    Returns:
+        A dictionary of JobRecords, keyed by siapath, or None if the journal
+        does not exist.
+    """
+    if not os.path.exists(input_path):
+        return None
+    job_records = {}
+    with open(input_path, 'rb') as journal_file:
+        for line in journal_file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A crash can leave a partially written record at the end of
+                # the journal.
+                logger.warning('Skipping malformed upload journal record: %r',
+                               line)
+                continue
+            sia_path = entry[u'sia_path']
+            record = job_records.get(sia_path,
+                                     JobRecord(
+                                         state=STATE_QUEUED, failure_count=0))
+            event = entry[u'event']
+            if event == EVENT_QUEUED:
+                record = record._replace(state=STATE_QUEUED)
+            elif event == EVENT_SUBMITTED:
+                record = record._replace(state=STATE_SUBMITTED)
+            elif event == EVENT_COMPLETED:
+                record = record._replace(state=STATE_COMPLETED)
+            elif event == EVENT_FAILED:
+                record = record._replace(
+                    state=STATE_QUEUED, failure_count=entry[u'failure_count'])
+            job_records[sia_path] = record
+    logger.info('Replayed upload journal with %d jobs', len(job_records))
+    return job_records
+
+
+def replay_all(input_paths):
+    """Reconstructs the last known state of each job from several journals.
+
+    A job may appear in more than one journal, e.g., if worker processes of
+    earlier runs each attempted it. Its record comes from the journal in which
+    it got furthest.
+
+    Args:
+        input_paths: Paths to the journal files.
+
+    Returns:
+        A dictionary of JobRecords, keyed by siapath, or None if none of the
+        journals exist.
+    """
+    job_records = None
+    for input_path in input_paths:
+        journal_records = replay(input_path)
+        if journal_records is None:
+            continue
+        if job_records is None:
+            job_records = {}
+        for sia_path, record in journal_records.iteritems():
+            existing = job_records.get(sia_path)
+            if existing is None or _progress(record) > _progress(existing):
+                job_records[sia_path] = record
+    return job_records
+
+
+def _progress(record):
+    return (_STATE_PROGRESS[record.state], record.failure_count)
+
+
+class Journal(object):
+    """Appends job state changes to a journal file."""
+
+    def __init__(self, journal_file, time_fn, submitted_sia_paths):
+        """Creates a new Journal instance.
+
+        Args:
+            journal_file: File object to which to append records.
+            time_fn: A function that returns the current time in seconds.
+            submitted_sia_paths: Siapaths of jobs that Sia accepted but has not
+                yet finished uploading, according to a previous journal.
+        """
+        self._journal_file = journal_file
+        self._time_fn = time_fn
+        self._lock = threading.Lock()
+        self._unsynced_records = 0
+        self._last_sync_time = time_fn()
+        # Siapaths of jobs whose completion the journal hasn't yet recorded.
+        self._submitted_sia_paths = set(submitted_sia_paths)
+
+    def record_queued(self, job):
+        self._append({'event': EVENT_QUEUED, 'sia_path': job.sia_path})
+
+    def record_submitted(self, job):
+        with self._lock:
+            self._submitted_sia_paths.add(job.sia_path)
+        self._append({'event': EVENT_SUBMITTED, 'sia_path': job.sia_path})
+
+    def record_failed(self, job):
+        self._append({
+            'event': EVENT_FAILED,
+            'sia_path': job.sia_path,
+            'failure_count': job.failure_count
+        })
+
+    def record_completed_uploads(self, renter_snapshot):
+        """Records submitted uploads that a renter Snapshot shows complete.
+
+        Args:
+            renter_snapshot: The latest Snapshot of the renter's files.
+        """
+        with self._lock:
+            completed = [
+                sia_path for sia_path in self._submitted_sia_paths
+                if (sia_path in renter_snapshot.sia_paths) and
+                (sia_path not in renter_snapshot.uploading_sia_paths)
+            ]
+            self._submitted_sia_paths.difference_update(completed)
+        for sia_path in completed:
+            self._append({'event': EVENT_COMPLETED, 'sia_path': sia_path})
+        # The renter poller calls this on every poll, so records flush on
+        # time even when no new records arrive to trigger a sync.
+        self.sync_if_due()
+
+    def sync_if_due(self):
+        """Flushes records to disk if they have waited the sync interval."""
+        with self._lock:
+            if self._unsynced_records and self._sync_interval_passed_locked():
+                self._sync()
+
+    def close(self):
+        """Flushes all records to disk and closes the journal."""
+        with self._lock:
+            try:
+                self._sync()
+            finally:
+                self._journal_file.close()
+
+    def _append(self, entry):
+        with self._lock:
+            self._journal_file.write(json.dumps(entry) + '\n')
+            self._unsynced_records += 1
+            if ((self._unsynced_records >= _SYNC_INTERVAL_RECORDS) or
+                    self._sync_interval_passed_locked()):
+                self._sync()
+
+    def _sync_interval_passed_locked(self):
+        return (self._time_fn() - self._last_sync_time >=
+                _SYNC_INTERVAL_SECONDS)
+
+    def _sync(self):
+        self._journal_file.flush()
+        os.fsync(self._journal_file.fileno())
+        self._unsynced_records = 0
+        self._last_sync_time = self._time_fn()
+
+
+# The last known state of an upload job, according to the journal.
+#   state: One of STATE_QUEUED, STATE_SUBMITTED or STATE_COMPLETED.
+#   failure_count: Number of failed upload attempts for the job.
+JobRecord = collections.namedtuple('JobRecord', ['state', 'failure_count'])
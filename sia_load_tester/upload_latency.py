@@ -0,0 +1,210 @@
+"""Measures how long individual uploads take to reach each milestone.
+
+Aggregate upload throughput can't distinguish a few slow uploads from fewer
+concurrent ones, so the load tester also times each upload it submits, from
+submission to each milestone that the renter polls report:
+
+  * first progress: the renter first reports uploaded bytes for the file.
+  * uploaded: the file's upload progress reaches 100%.
+  * redundant: the file's redundancy reaches renter_poller.TARGET_REDUNDANCY.
+
+Latencies are kept in log-bucketed histograms, one per milestone and file-size
+class, and their percentiles are logged periodically and at the end of the
+test.
+"""
+
+import collections
+import csv
+import logging
+import threading
+
+import histogram
+
+logger = logging.getLogger(__name__)
+
+STAGE_FIRST_PROGRESS = 'first_progress'
+STAGE_UPLOADED = 'uploaded'
+STAGE_REDUNDANT = 'redundant'
+STAGES = (STAGE_FIRST_PROGRESS, STAGE_UPLOADED, STAGE_REDUNDANT)
+
+# Files smaller than a single 4 MiB sector, which Sia pads to a full sector.
+SIZE_CLASS_SMALL = 'small'
+# Files that fit within a single 40 MiB Sia chunk.
+SIZE_CLASS_MEDIUM = 'medium'
+# Files that span multiple Sia chunks.
+SIZE_CLASS_LARGE = 'large'
+SIZE_CLASS_UNKNOWN = 'unknown'
+SIZE_CLASSES = (SIZE_CLASS_SMALL, SIZE_CLASS_MEDIUM, SIZE_CLASS_LARGE,
+                SIZE_CLASS_UNKNOWN)
+_SMALL_FILE_MAX_BYTES = 4 * 2**20
+_MEDIUM_FILE_MAX_BYTES = 40 * 2**20
+
+PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+DEFAULT_REPORT_INTERVAL_SECONDS = 300
+
+SUMMARY_FILENAME = 'upload_latency.csv'
+
+
+def size_class(file_size):
+    """Returns the size class (one of SIZE_CLASSES) of a file size in bytes."""
+    if file_size is None:
+        return SIZE_CLASS_UNKNOWN
+    if file_size < _SMALL_FILE_MAX_BYTES:
+        return SIZE_CLASS_SMALL
+    if file_size <= _MEDIUM_FILE_MAX_BYTES:
+        return SIZE_CLASS_MEDIUM
+    return SIZE_CLASS_LARGE
+
+
+class _PendingUpload(object):
+    """An upload that has not yet reached all of its milestones."""
+
+    __slots__ = ('submit_time', 'size_class', 'remaining_stages')
+
+    def __init__(self, submit_time, file_size_class):
+        self.submit_time = submit_time
+        self.size_class = file_size_class
+        self.remaining_stages = set(STAGES)
+
+
+class Tracker(object):
+    """Times each submitted upload to each milestone reported by renter polls.
+
+    Subscribe record_changes to a renter Poller's changes so that the Tracker
+    sees each poll.
+    """
+
+    def __init__(self, time_fn, report_interval_seconds):
+        """Creates a new Tracker instance.
+
+        Args:
+            time_fn: A function that returns the current time in seconds. Must
+                use the same clock as the renter Poller.
+            report_interval_seconds: Number of seconds between latency reports
+                while the test is running.
+        """
+        self._time_fn = time_fn
+        self._report_interval_seconds = report_interval_seconds
+        self._lock = threading.Lock()
+        # Maps each siapath to its _PendingUpload.
+        self._pending = {}
+        # Maps each (stage, size class) pair to its Histogram.
+        self._histograms = collections.defaultdict(histogram.Histogram)
+        self._last_report_time = time_fn()
+
+    def record_submitted(self, job):
+        """Starts timing an upload that Sia just accepted.
+
+        Args:
+            job: The upload job that Sia accepted.
+        """
+        pending = _PendingUpload(self._time_fn(), size_class(job.file_size))
+        with self._lock:
+            self._pending[job.sia_path] = pending
+
+    def record_changes(self, changes):
+        """Records the milestones that submitted uploads reached in a poll.
+
+        Logs a latency report if a report interval has passed since the last
+        one.
+
+        Args:
+            changes: The RenterChanges of a renter poll.
+        """
+        with self._lock:
+            for sia_path in changes.started_uploads:
+                self._record_stage(sia_path, STAGE_FIRST_PROGRESS,
+                                   changes.poll_time)
+            for completion in changes.completed_uploads:
+                self._record_stage(completion.sia_path, STAGE_UPLOADED,
+                                   changes.poll_time)
+            for sia_path in changes.redundant_uploads:
+                self._record_stage(sia_path, STAGE_REDUNDANT, changes.poll_time)
+            for sia_path in changes.removed_sia_paths:
+                self._pending.pop(sia_path, None)
+            report_due = (changes.poll_time - self._last_report_time >=
+                          self._report_interval_seconds)
+        if report_due:
+            self.report()
+
+    def summaries(self):
+        """Returns a LatencySummary for each stage and size class with data."""
+        with self._lock:
+            return [
+                _summarize(stage, file_size_class,
+                           self._histograms[(stage, file_size_class)])
+                for stage in STAGES
+                for file_size_class in SIZE_CLASSES
+                if (stage, file_size_class) in self._histograms
+            ]
+
+    def report(self):
+        """Logs the latency percentiles of each stage and size class.
+
+        Returns:
+            The reported LatencySummaries.
+        """
+        summaries = self.summaries()
+        with self._lock:
+            self._last_report_time = self._time_fn()
+            pending_count = len(self._pending)
+        logger.info('Upload latency report (%d uploads in progress)',
+                    pending_count)
+        for summary in summaries:
+            logger.info(('Upload latency to %s for %s files: count=%d, '
+                         'p50=%.1fs, p90=%.1fs, p99=%.1fs, p99.9=%.1fs, '
+                         'max=%.1fs'), summary.stage, summary.size_class,
+                        summary.count, summary.p50_seconds, summary.p90_seconds,
+                        summary.p99_seconds, summary.p999_seconds,
+                        summary.max_seconds)
+        return summaries
+
+    def _record_stage(self, sia_path, stage, poll_time):
+        pending = self._pending.get(sia_path)
+        # Skip uploads that were not submitted during this test, as well as
+        # milestones that an upload reaches a second time (e.g., if Sia
+        # re-uploads a file after losing hosts).
+        if pending is None or stage not in pending.remaining_stages:
+            return
+        self._histograms[(
+            stage, pending.size_class)].record(poll_time - pending.submit_time)
+        pending.remaining_stages.remove(stage)
+        if not pending.remaining_stages:
+            del self._pending[sia_path]
+
+
+def _summarize(stage, file_size_class, latency_histogram):
+    p50, p90, p99, p999 = [latency_histogram.percentile(p) for p in PERCENTILES]
+    return LatencySummary(
+        stage=stage,
+        size_class=file_size_class,
+        count=len(latency_histogram),
+        p50_seconds=p50,
+        p90_seconds=p90,
+        p99_seconds=p99,
+        p999_seconds=p999,
+        max_seconds=latency_histogram.max())
+
+
+def write_summaries(output_path, summaries):
+    """Writes LatencySummaries to a CSV file, replacing any existing file."""
+    with open(output_path, 'wb') as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(LatencySummary._fields)
+        for summary in summaries:
+            writer.writerow([summary.stage, summary.size_class, summary.count] +
+                            ['%.3f' % s for s in summary[3:]])
+
+
+# Latency percentiles for uploads of one size class to one milestone.
+#   stage: The milestone (one of STAGES).
+#   size_class: The file-size class (one of SIZE_CLASSES).
+#   count: Number of uploads that reached the milestone.
+#   p50_seconds, p90_seconds, p99_seconds, p999_seconds: Latency (in seconds)
+#       at the 50th, 90th, 99th and 99.9th percentiles.
+#   max_seconds: Largest latency (in seconds).
+LatencySummary = collections.namedtuple('LatencySummary', [
+    'stage', 'size_class', 'count', 'p50_seconds', 'p90_seconds', 'p99_seconds',
+    'p999_seconds', 'max_seconds'
+])
@@ -1,12 +1,33 @@
+import heapq
+import itertools
 import logging
 import Queue
+import threading
 
-import sia_client as sc
+import job_ordering
+import jobs
+import metrics
+import upload_journal
 
 logger = logging.getLogger(__name__)
 
+JOBS_DEQUEUED = metrics.counter(
+    'queue_jobs_dequeued_total',
+    'Number of jobs taken from the upload queue, including retries.')
+RETRY_QUEUE_DEPTH = metrics.gauge(
+    'queue_retry_jobs', 'Number of failed jobs waiting in the upload queue '
+    'until they are due to be retried.')
+JOBS_ABANDONED = metrics.counter(
+    'queue_jobs_abandoned_total',
+    'Number of jobs dropped from the upload queue after running out of '
+    'retries.')
 
-def from_upload_jobs(upload_jobs):
+
+def from_upload_jobs(upload_jobs,
+                     renter_poller,
+                     journal=None,
+                     ordering=None,
+                     retry_policy=None):
     """Creates a new upload queue from a list of upload jobs.
 
     Creates a new queue of files to upload by starting with the full input
@@ -15,39 +36,244 @@ def from_upload_jobs(upload_jobs):
 
     Args:
         upload_jobs: The unfiltered set of upload jobs.
+        renter_poller: A source of renter file Snapshots.
+        journal: An optional upload Journal in which to record each job as it
+            enters the queue.
+        ordering: An optional job ordering that decides the order in which
+            the queue hands out jobs. Defaults to the order of upload_jobs.
+        retry_policy: An optional RetryPolicy that decides when the queue
+            hands out failed jobs again. Defaults to retrying immediately.
 
     Returns:
-        A Queue of upload jobs, filtered to remove jobs that are already
+        A JobQueue of upload jobs, filtered to remove jobs that are already
         complete (the paths already exist on Sia).
     """
-    return from_upload_jobs_and_sia_client(upload_jobs, sc.make_sia_client())
+    return from_upload_jobs_and_snapshot(upload_jobs, renter_poller.latest(),
+                                         journal, ordering, retry_policy)
 
 
-def from_upload_jobs_and_sia_client(upload_jobs, sia_client):
+def from_upload_jobs_and_snapshot(upload_jobs,
+                                  renter_snapshot,
+                                  journal=None,
+                                  ordering=None,
+                                  retry_policy=None):
     """Creates a new upload queue from a dataset.
 
     Creates a new queue of files to upload by starting with the full input
     dataset and removing any files that are uploaded (partially or fully) to
-    Sia.
+    Sia. Jobs are filtered lazily as the queue is consumed, so upload_jobs
+    may be a generator of arbitrary length.
 
     Args:
         upload_jobs: The unfiltered set of upload jobs.
-        sia_client: An implementation of the Sia client interface.
+        renter_snapshot: A Snapshot of the files on the Sia renter.
+        journal: An optional upload Journal in which to record each job as it
+            enters the queue.
+        ordering: An optional job ordering that decides the order in which
+            the queue hands out jobs. Defaults to the order of upload_jobs.
+        retry_policy: An optional RetryPolicy that decides when the queue
+            hands out failed jobs again. Defaults to retrying immediately.
 
     Returns:
-        A Queue of upload jobs, filtered to remove jobs that are already
+        A JobQueue of upload jobs, filtered to remove jobs that are already
         complete (the paths already exist on Sia).
     """
-    sia_paths = _get_sia_paths(sia_client)
+    sia_paths = renter_snapshot.sia_paths
+    logger.info('%d files already uploaded to Sia, skipping them',
+                len(sia_paths))
     # Filter jobs for files that have already been uploaded to Sia.
-    upload_jobs = [j for j in upload_jobs if j.sia_path not in sia_paths]
-    logger.info('%d files already uploaded to Sia, need to upload %d more',
-                len(sia_paths), len(upload_jobs))
-    upload_queue = Queue.Queue()
-    for upload_job in upload_jobs:
-        upload_queue.put(upload_job)
-    return upload_queue
+    return JobQueue(
+        _record_queued_jobs(
+            (j for j in upload_jobs if j.sia_path not in sia_paths), journal),
+        ordering, retry_policy)
+
+
+def from_upload_jobs_and_journal(upload_jobs,
+                                 job_records,
+                                 journal,
+                                 renter_snapshot=None,
+                                 ordering=None,
+                                 retry_policy=None):
+    """Creates a new upload queue that resumes from an upload journal.
+
+    Removes jobs that the journal shows Sia already accepted, as well as jobs
+    that have failed too many times, and restores the failure counts of the
+    remaining jobs. Checking each job against the journal takes constant
+    time, so the queue is rebuilt without fetching the renter's file list.
+
+    Args:
+        upload_jobs: The unfiltered set of upload jobs.
+        job_records: JobRecords replayed from the upload journal, keyed by
+            siapath.
+        journal: The upload Journal in which to record each job as it enters
+            the queue.
+        renter_snapshot: An optional Snapshot of the files on the Sia renter.
+            If specified, the renter's files take precedence over the journal
+            in deciding which jobs Sia already accepted.
+        ordering: An optional job ordering that decides the order in which
+            the queue hands out jobs. Defaults to the order of upload_jobs.
+        retry_policy: An optional RetryPolicy that decides when the queue
+            hands out failed jobs again. Defaults to retrying immediately.
+
+    Returns:
+        A JobQueue of the upload jobs that still need to be uploaded.
+    """
+    logger.info('Resuming uploads for %d jobs recorded in upload journal',
+                len(job_records))
+    return JobQueue(
+        _record_queued_jobs(
+            _resume_jobs(upload_jobs, job_records, renter_snapshot), journal,
+            job_records), ordering, retry_policy)
+
+
+def _resume_jobs(upload_jobs, job_records, renter_snapshot):
+    for job in upload_jobs:
+        record = job_records.get(job.sia_path)
+        if renter_snapshot:
+            if job.sia_path in renter_snapshot.sia_paths:
+                continue
+        elif record and record.state != upload_journal.STATE_QUEUED:
+            continue
+        if record:
+            if record.failure_count >= jobs.MAX_FAILURE_COUNT:
+                continue
+            for _ in xrange(record.failure_count):
+                job.increment_failure_count()
+        yield job
+
+
+def _record_queued_jobs(upload_jobs, journal, job_records=None):
+    for job in upload_jobs:
+        if journal and not _is_recorded_queued(job, job_records):
+            journal.record_queued(job)
+        yield job
+
+
+def _is_recorded_queued(job, job_records):
+    # Jobs that the journal already shows as queued need no new record, or
+    # each restart would append another record for every remaining job.
+    if not job_records:
+        return False
+    record = job_records.get(job.sia_path)
+    return record is not None and record.state == upload_journal.STATE_QUEUED
+
+
+class JobQueue(object):
+    """A thread-safe queue of upload jobs that draws lazily from a source.
+
+    Jobs are pulled from the source iterable only as consumers ask for them.
+    The queue holds at most a window of the job ordering's window_jobs jobs
+    from the source, and hands them out in the order that the job ordering
+    chooses. Failed jobs wait in a separate heap, ordered by the time they are
+    due to be retried, and rejoin the job ordering once they are due.
+    """
+
+    def __init__(self, source_jobs, ordering=None, retry_policy=None):
+        """Creates a new JobQueue instance.
+
+        Args:
+            source_jobs: An iterable of upload jobs.
+            ordering: A job ordering that decides the order in which to hand
+                out jobs from the source. Defaults to a FifoOrdering.
+            retry_policy: A RetryPolicy that decides when to retry failed
+                jobs. If None, failed jobs are retried immediately.
+        """
+        self._source_jobs = iter(source_jobs)
+        self._source_exhausted = False
+        # Jobs read ahead from the source, waiting to be handed out.
+        if ordering is None:
+            ordering = job_ordering.FifoOrdering()
+        self._ordering = ordering
+        self._retry_policy = retry_policy
+        # Heap of (due time, sequence number, job) tuples for jobs waiting to
+        # be retried.
+        self._delayed_jobs = []
+        self._delayed_job_sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def empty(self):
+        """Returns True if the queue has no more jobs, including retries."""
+        with self._lock:
+            self._fill_window()
+            return not self._ordering and not self._delayed_jobs
+
+    def seconds_until_ready(self):
+        """Returns the time until get() can return a job.
+
+        Returns:
+            Zero if a job is ready now, the number of seconds until the next
+            failed job is due to be retried if only delayed jobs remain, or
+            None if the queue has no more jobs.
+        """
+        with self._lock:
+            self._fill_window()
+            self._release_due_jobs()
+            if self._ordering:
+                return 0
+            if self._delayed_jobs:
+                return max(0, self._delayed_jobs[0][0] - self._now())
+            return None
+
+    def get(self):
+        """Removes and returns the next job that is ready.
+
+        Raises:
+            Queue.Empty if no job is ready (the queue may still hold failed
+            jobs that are not yet due to be retried).
+        """
+        with self._lock:
+            self._fill_window()
+            self._release_due_jobs()
+            job = self._ordering.pop()
+        if job is None:
+            raise Queue.Empty('No jobs are ready in the upload queue')
+        JOBS_DEQUEUED.inc()
+        return job
+
+    def put(self, job):
+        """Adds a job to the queue to be handed out again right away."""
+        self._put_delayed(job, self._now())
+
+    def retry(self, job, error):
+        """Schedules a failed job to be retried, unless it is out of retries.
+
+        Args:
+            job: The upload job whose latest attempt failed.
+            error: Type of the error from the failed attempt.
+        """
+        if job.failure_count >= jobs.MAX_FAILURE_COUNT:
+            JOBS_ABANDONED.inc()
+            if self._retry_policy:
+                self._retry_policy.give_up(job, error)
+            return
+        due_time = self._now()
+        if self._retry_policy:
+            due_time += self._retry_policy.retry_delay(job)
+        self._put_delayed(job, due_time)
+
+    def _now(self):
+        if self._retry_policy:
+            return self._retry_policy.time()
+        return 0
+
+    def _put_delayed(self, job, due_time):
+        with self._lock:
+            heapq.heappush(self._delayed_jobs,
+                           (due_time, next(self._delayed_job_sequence), job))
+            RETRY_QUEUE_DEPTH.set(len(self._delayed_jobs))
 
+    def _release_due_jobs(self):
+        if not self._delayed_jobs:
+            return
+        now = self._now()
+        while self._delayed_jobs and self._delayed_jobs[0][0] <= now:
+            self._ordering.push(heapq.heappop(self._delayed_jobs)[-1])
+        RETRY_QUEUE_DEPTH.set(len(self._delayed_jobs))
 
-def _get_sia_paths(sia_client):
-    return set([f[u'siapath'] for f in sia_client.renter_files()])
+    def _fill_window(self):
+        while (not self._source_exhausted and
+               len(self._ordering) < self._ordering.window_jobs):
+            try:
+                self._ordering.push(next(self._source_jobs))
+            except StopIteration:
+                self._source_exhausted = True
@@ -0,0 +1,258 @@
+"""Spreads the uploads of a multi-node load test across worker processes.
+
+Python threads in one process take turns on a single core, so with enough Sia
+nodes, the load tester itself becomes the bottleneck. In a process-pool test,
+a coordinator process scans the dataset and hands out batches of upload jobs
+to worker processes, each of which uploads to its own group of Sia nodes. As
+they upload, the workers send samples of each node's progress back to the
+coordinator, and when they finish, they send the results of their uploads.
+"""
+
+import logging
+import multiprocessing
+import Queue
+import threading
+
+import job_sharding
+import jobs
+
+logger = logging.getLogger(__name__)
+
+# Number of upload jobs the coordinator sends to a worker at a time.
+JOB_BATCH_SIZE = 100
+# Maximum number of job batches waiting to be read by each worker. A worker
+# that falls this far behind holds up job batches for the other workers.
+_MAX_QUEUED_BATCHES = 100
+# Number of seconds to wait for a message from the workers before checking
+# whether any of them has died.
+_LIVENESS_CHECK_SECONDS = 1.0
+
+_MESSAGE_SAMPLE = 'sample'
+_MESSAGE_DONE = 'done'
+_MESSAGE_FAILED = 'failed'
+
+
+class Error(Exception):
+    pass
+
+
+class WorkerFailedError(Error):
+    pass
+
+
+def group_nodes(node_count, worker_count):
+    """Splits the indexes of the nodes into one group per worker process.
+
+    Nodes are dealt out in turn, so group sizes differ by at most one. There
+    are never more groups than nodes.
+
+    Args:
+        node_count: Number of Sia nodes.
+        worker_count: Number of worker processes to use.
+
+    Returns:
+        A list of lists of node indexes.
+    """
+    worker_count = min(worker_count, node_count)
+    return [range(i, node_count, worker_count) for i in xrange(worker_count)]
+
+
+class Coordinator(object):
+    """Starts the worker processes, feeds them jobs and collects results."""
+
+    def __init__(self,
+                 worker_fn,
+                 node_groups,
+                 node_names,
+                 sharding,
+                 sample_fn,
+                 process_factory=multiprocessing.Process,
+                 queue_factory=multiprocessing.Queue):
+        """Creates a new Coordinator instance.
+
+        Args:
+            worker_fn: Function that each worker process calls to upload to
+                its nodes, as worker_fn(worker_index, node_indexes, node_jobs,
+                sample_fn). node_jobs holds an iterable of upload jobs for
+                each node in node_indexes, and sample_fn sends a
+                node_throughput.ThroughputSample to the coordinator. Returns
+                the worker's results, which must be picklable.
+            node_groups: Indexes of the nodes of each worker, as returned by
+                group_nodes.
+            node_names: Names of all nodes, in the order of their indexes.
+            sharding: Name of the sharding policy that splits the jobs among
+                the nodes (one of job_sharding.SHARDINGS).
+            sample_fn: A function to call in the coordinator with each
+                ThroughputSample the workers send.
+            process_factory: Factory for creating worker processes.
+            queue_factory: Factory for creating queues between processes.
+        """
+        self._worker_fn = worker_fn
+        self._node_groups = node_groups
+        self._node_names = node_names
+        self._sharding = sharding
+        self._sample_fn = sample_fn
+        self._process_factory = process_factory
+        self._queue_factory = queue_factory
+        self._processes = []
+        self._job_queues = []
+        self._results_queue = None
+        self._feed_error = None
+
+    def start(self):
+        """Starts the worker processes.
+
+        Workers are forked from the coordinator, so start them before the
+        coordinator starts any other threads, or a worker may inherit a lock
+        that one of those threads held.
+        """
+        if self._sharding == job_sharding.SHARDING_LEAST_LOADED:
+            # Workers take turns reading the same queue, so each batch goes to
+            # whichever worker asks for one first.
+            shared_queue = self._queue_factory(_MAX_QUEUED_BATCHES)
+            self._job_queues = [shared_queue] * len(self._node_groups)
+        else:
+            self._job_queues = [
+                self._queue_factory(_MAX_QUEUED_BATCHES)
+                for _ in self._node_groups
+            ]
+        self._results_queue = self._queue_factory()
+        for worker_index, node_indexes in enumerate(self._node_groups):
+            process = self._process_factory(
+                target=_run_worker,
+                args=(self._worker_fn, worker_index, node_indexes,
+                      self._job_queues[worker_index], self._results_queue,
+                      self._sharding, self._node_names))
+            process.daemon = True
+            process.start()
+            self._processes.append(process)
+        logger.info('Started %d upload worker processes', len(self._processes))
+
+    def run(self, upload_jobs):
+        """Hands out upload jobs to the workers until all of them finish.
+
+        Args:
+            upload_jobs: An iterable of upload jobs to split among the nodes.
+
+        Returns:
+            A list of each worker's results, in worker order.
+
+        Raises:
+            WorkerFailedError if any worker fails, after stopping the others.
+        """
+        feeder = threading.Thread(target=self._feed_jobs, args=(upload_jobs,))
+        feeder.daemon = True
+        feeder.start()
+        try:
+            results = self._collect_results()
+        except Exception:
+            for process in self._processes:
+                process.terminate()
+            # The feeder may be blocked on a queue that no worker reads
+            # anymore, so don't wait for its batches to reach the workers.
+            for job_queue in self._job_queues:
+                job_queue.cancel_join_thread()
+            raise
+        finally:
+            for process in self._processes:
+                process.join()
+        feeder.join()
+        if self._feed_error:
+            raise self._feed_error
+        return results
+
+    def _feed_jobs(self, upload_jobs):
+        worker_of_job = self._make_job_router()
+        batches = [[] for _ in self._job_queues]
+        try:
+            for job in upload_jobs:
+                worker_index = worker_of_job(job)
+                batch = batches[worker_index]
+                batch.append((job.local_path, job.sia_path, job.file_size))
+                if len(batch) >= JOB_BATCH_SIZE:
+                    self._job_queues[worker_index].put(batch)
+                    batches[worker_index] = []
+        except Exception as ex:
+            logger.error('Failed to read upload jobs: %s', ex.message)
+            self._feed_error = ex
+        for job_queue, batch in zip(self._job_queues, batches):
+            if batch:
+                job_queue.put(batch)
+        # A worker stops reading jobs when it reads None. With a shared
+        # queue, each worker reads one of the Nones.
+        for job_queue in self._job_queues:
+            job_queue.put(None)
+
+    def _make_job_router(self):
+        """Returns a function that returns the index of a job's worker."""
+        if self._sharding == job_sharding.SHARDING_LEAST_LOADED:
+            return lambda job: 0
+        hash_ring = job_sharding.HashRing(self._node_names)
+        worker_of_node = {}
+        for worker_index, node_indexes in enumerate(self._node_groups):
+            for node_index in node_indexes:
+                worker_of_node[node_index] = worker_index
+        return lambda job: worker_of_node[hash_ring.node_index(job.sia_path)]
+
+    def _collect_results(self):
+        results = [None] * len(self._processes)
+        running_workers = set(xrange(len(self._processes)))
+        while running_workers:
+            try:
+                message_type, worker_index, payload = self._results_queue.get(
+                    timeout=_LIVENESS_CHECK_SECONDS)
+            except Queue.Empty:
+                self._check_workers_alive(running_workers)
+                continue
+            if message_type == _MESSAGE_SAMPLE:
+                self._sample_fn(payload)
+            elif message_type == _MESSAGE_DONE:
+                results[worker_index] = payload
+                running_workers.discard(worker_index)
+            else:
+                raise WorkerFailedError('Upload worker %d failed: %s' %
+                                        (worker_index, payload))
+        return results
+
+    def _check_workers_alive(self, running_workers):
+        # A worker that exits cleanly has already sent its results, which may
+        # still be on their way, so only an abnormal exit means it failed.
+        for worker_index in running_workers:
+            exit_code = self._processes[worker_index].exitcode
+            if exit_code:
+                raise WorkerFailedError('Upload worker %d exited with code %d' %
+                                        (worker_index, exit_code))
+
+
+def _run_worker(worker_fn, worker_index, node_indexes, job_queue, results_queue,
+                sharding, node_names):
+    """Uploads a worker's share of the jobs and sends its results."""
+
+    def send_sample(sample):
+        results_queue.put((_MESSAGE_SAMPLE, worker_index, sample))
+
+    # Split the worker's jobs by the same sharding as the coordinator. Under
+    # hash sharding, jobs reach only the worker of the node that owns them, so
+    # each node reads exactly the jobs that hash to it.
+    sharder = job_sharding.make_sharder(sharding, _read_jobs(job_queue),
+                                        node_names)
+    try:
+        results = worker_fn(
+            worker_index, node_indexes,
+            [sharder.jobs_for(node_index) for node_index in node_indexes],
+            send_sample)
+    except Exception as ex:
+        logger.exception('Upload worker %d failed', worker_index)
+        results_queue.put((_MESSAGE_FAILED, worker_index, str(ex)))
+        return
+    results_queue.put((_MESSAGE_DONE, worker_index, results))
+
+
+def _read_jobs(job_queue):
+    """Yields the upload jobs from a worker's job queue until it reads None."""
+    while True:
+        batch = job_queue.get()
+        if batch is None:
+            return
+        for local_path, sia_path, file_size in batch:
+            yield jobs.Job(local_path, sia_path, file_size)
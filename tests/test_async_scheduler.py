@@ -0,0 +1,186 @@
+import threading
+import unittest
+
+import mock
+
+from sia_load_tester import async_scheduler
+from sia_load_tester import concurrency
+from sia_load_tester import event_loop
+from sia_load_tester import jobs
+from sia_load_tester import progress
+from sia_load_tester import renter_poller
+from sia_load_tester import sia_conditions
+from sia_load_tester import upload_queue
+
+
+def completed_future(result):
+    future = event_loop.Future()
+    future.set_result(result)
+    return future
+
+
+def failed_future(exception):
+    future = event_loop.Future()
+    future.set_exception(exception)
+    return future
+
+
+class AsyncSchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.loop = event_loop.EventLoop(lambda: self.now, self.advance_time)
+        # Files the fake renter knows about, keyed by siapath, with their
+        # upload progress.
+        self.renter_files = {}
+        self.mock_sia_client = mock.Mock()
+        self.mock_sia_client.stream_renter_files.side_effect = self.stream_renter_files
+        self.exit_event = threading.Event()
+        self.poller = async_scheduler.Poller(self.loop, self.mock_sia_client,
+                                             self.exit_event, 5)
+
+    def advance_time(self, seconds):
+        self.now += seconds
+
+    def stream_renter_files(self, file_fn):
+        for sia_path, upload_progress in self.renter_files.items():
+            file_fn({
+                u'siapath': sia_path,
+                u'uploadprogress': upload_progress,
+                u'uploadedbytes': 0,
+                u'redundancy': 0.0
+            })
+        return completed_future(None)
+
+    def run_loop(self, future):
+        return self.loop.run_until_complete(future)
+
+
+class PollerTest(AsyncSchedulerTestCase):
+
+    def test_latest_raises_error_before_first_poll(self):
+        with self.assertRaises(async_scheduler.Error):
+            self.poller.latest()
+
+    def test_poll_publishes_snapshot_to_subscribers(self):
+        self.renter_files = {u'a.txt': 50}
+        mock_callback = mock.Mock()
+        self.poller.subscribe(mock_callback)
+
+        snapshot = self.run_loop(self.poller.poll())
+
+        self.assertEqual(
+            renter_poller.Snapshot(
+                uploads_in_progress=1,
+                uploaded_bytes=0,
+                sia_paths=frozenset([u'a.txt']),
+                uploading_sia_paths=frozenset([u'a.txt'])), snapshot)
+        self.assertEqual(snapshot, self.poller.latest())
+        mock_callback.assert_called_once_with(snapshot)
+
+    def test_wait_for_next_snapshot_wakes_when_poll_publishes(self):
+        self.loop.spawn(self.poller.poll_until_exit())
+
+        self.assertTrue(self.run_loop(self.poller.wait_for_next_snapshot(1)))
+        self.assertTrue(self.run_loop(self.poller.wait_for_next_snapshot(10)))
+        self.assertEqual(5.0, self.now)
+
+
+class DatasetUploaderTest(AsyncSchedulerTestCase):
+
+    def setUp(self):
+        super(DatasetUploaderTest, self).setUp()
+        self.mock_upload_journal = mock.Mock()
+        self.mock_latency_tracker = mock.Mock()
+        self.mock_concurrency_controller = mock.Mock()
+        self.mock_concurrency_controller.limit.return_value = 2
+
+    def make_uploader(self, upload_jobs):
+        self.run_loop(self.poller.poll())
+        self.loop.spawn(self.poller.poll_until_exit())
+        queue = upload_queue.from_upload_jobs_and_snapshot(
+            upload_jobs, self.poller.latest())
+        return async_scheduler.make_dataset_uploader(
+            self.loop, queue, self.poller, self.mock_sia_client,
+            self.mock_concurrency_controller, self.mock_upload_journal,
+            self.mock_latency_tracker, self.exit_event)
+
+    def accept_upload(self, _, sia_path):
+        self.renter_files[sia_path] = 100
+        return completed_future(True)
+
+    def test_uploads_all_jobs_and_waits_for_completion(self):
+        self.mock_sia_client.upload_file_async.side_effect = self.accept_upload
+        uploader = self.make_uploader([
+            jobs.Job(
+                local_path='/dummy-path/%d.txt' % i, sia_path='%d.txt' % i)
+            for i in xrange(5)
+        ])
+
+        self.run_loop(uploader.upload())
+
+        self.assertEqual(5, self.mock_sia_client.upload_file_async.call_count)
+        self.assertEqual(5,
+                         self.mock_upload_journal.record_submitted.call_count)
+        self.assertEqual(5, uploader.stats().uploads_started)
+        self.assertTrue(self.exit_event.is_set())
+
+    def test_waits_for_snapshot_when_upload_slots_are_full(self):
+        self.mock_sia_client.upload_file_async.side_effect = self.accept_upload
+        self.renter_files = {u'a.txt': 50, u'b.txt': 50}
+        uploader = self.make_uploader(
+            [jobs.Job(local_path='/dummy-path/c.txt', sia_path='c.txt')])
+        self.loop.call_later(12, self.renter_files.update, {
+            u'a.txt': 100,
+            u'b.txt': 100
+        })
+
+        self.run_loop(uploader.upload())
+
+        self.assertEqual([mock.call('/dummy-path/c.txt', 'c.txt')],
+                         self.mock_sia_client.upload_file_async.call_args_list)
+        self.assertEqual(15.0, uploader.stats().scheduler_idle_seconds)
+
+    def test_retries_failed_uploads_up_to_max_failure_count(self):
+        self.mock_sia_client.upload_file_async.return_value = failed_future(
+            ValueError('dummy upload error'))
+        uploader = self.make_uploader(
+            [jobs.Job(local_path='/dummy-path/a.txt', sia_path='a.txt')])
+
+        self.run_loop(uploader.upload())
+
+        self.assertEqual(jobs.MAX_FAILURE_COUNT,
+                         self.mock_sia_client.upload_file_async.call_count)
+        self.assertEqual(jobs.MAX_FAILURE_COUNT,
+                         uploader.stats().upload_failures)
+        self.assertEqual(
+            jobs.MAX_FAILURE_COUNT,
+            self.mock_concurrency_controller.record_upload_error.call_count)
+
+    def test_raises_error_when_exit_event_is_set(self):
+        self.renter_files = {u'a.txt': 50, u'b.txt': 50}
+        uploader = self.make_uploader(
+            [jobs.Job(local_path='/dummy-path/c.txt', sia_path='c.txt')])
+        self.loop.call_later(3, self.exit_event.set)
+
+        with self.assertRaises(sia_conditions.WaitInterruptedError):
+            self.run_loop(uploader.upload())
+        self.assertFalse(self.mock_sia_client.upload_file_async.called)
+
+
+class MonitorTest(AsyncSchedulerTestCase):
+
+    def test_monitor_checks_progress_until_exit_event(self):
+        self.run_loop(self.poller.poll())
+        mock_tracker = mock.Mock()
+        mock_tracker.bytes_uploaded_in_window.return_value = None
+        mock_tracker.recent_upload_mbps.return_value = 10.0
+        concurrency_controller = concurrency.FixedController(5)
+        monitor = async_scheduler.Monitor(
+            self.loop, mock_tracker, concurrency_controller, self.exit_event)
+        self.loop.call_later(progress.CHECK_FREQUENCY_IN_SECONDS * 2.5,
+                             self.exit_event.set)
+
+        self.run_loop(self.loop.spawn(monitor.monitor()))
+
+        self.assertEqual(3, mock_tracker.bytes_uploaded_in_window.call_count)
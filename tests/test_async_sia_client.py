@@ -0,0 +1,287 @@
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+import mock
+
+from sia_load_tester import async_sia_client
+from sia_load_tester import circuit_breaker
+from sia_load_tester import event_loop
+from sia_load_tester import fake_siad
+from sia_load_tester import sia_client as sc
+
+
+class AsyncSiaClientTest(unittest.TestCase):
+    """Exercises AsyncSiaClient end-to-end against the fake Sia API."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.simulator = fake_siad.Simulator(
+            fake_siad.Config(
+                upload_bandwidth_mbps=8.0,
+                redundancy=1.0,
+                contract_count=50,
+                contract_formation_seconds=0,
+                wallet_balance_hastings=1000L,
+                upload_error_rate=0.0,
+                connection_error_rate=0.0),
+            mock.Mock(return_value=0.0),
+            mock.Mock(return_value=0.5))
+        self.server = fake_siad.make_server(self.simulator, 0)
+        fake_siad.serve_async(self.server)
+        self.loop = event_loop.EventLoop()
+        self.connection_pool = async_sia_client.ConnectionPool(
+            self.loop, ('localhost', self.server.server_address[1]), 2)
+        self.sia_client = async_sia_client.AsyncSiaClient(
+            self.loop, self.connection_pool)
+
+    def tearDown(self):
+        for dispatcher in self.loop.socket_map.values():
+            dispatcher.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.test_dir)
+
+    def run_loop(self, future):
+        return self.loop.run_until_complete(future)
+
+    def make_file(self, filename):
+        local_path = os.path.join(self.test_dir, filename)
+        open(local_path, 'w').close()
+        return local_path
+
+    def test_client_reads_node_state(self):
+        self.assertTrue(self.run_loop(self.sia_client.is_blockchain_synced()))
+        self.assertFalse(self.run_loop(self.sia_client.is_wallet_locked()))
+        self.assertEqual(1000L, self.run_loop(self.sia_client.wallet_balance()))
+        self.assertEqual(0L, self.run_loop(self.sia_client.allowance_budget()))
+        self.assertEqual(0, self.run_loop(self.sia_client.contract_count()))
+
+    def test_client_sets_allowance(self):
+        self.assertTrue(
+            self.run_loop(self.sia_client.set_allowance_budget(1000L)))
+        self.assertFalse(
+            self.run_loop(self.sia_client.set_allowance_budget(1001L)))
+
+        self.assertEqual(1000L,
+                         self.run_loop(self.sia_client.allowance_budget()))
+
+    def test_client_uploads_file(self):
+        local_path = self.make_file('a.txt')
+
+        self.assertTrue(
+            self.run_loop(
+                self.sia_client.upload_file_async(local_path, u'foo/\xe9.txt')))
+        self.assertFalse(
+            self.run_loop(
+                self.sia_client.upload_file_async(local_path, u'foo/\xe9.txt')))
+        self.assertEqual([u'foo/\xe9.txt'], [
+            f[u'siapath'] for f in self.run_loop(self.sia_client.renter_files())
+        ])
+
+    def test_client_streams_renter_files(self):
+        local_path = self.make_file('a.txt')
+        for sia_path in ('a.txt', 'b.txt'):
+            self.run_loop(
+                self.sia_client.upload_file_async(local_path, sia_path))
+        sia_paths = []
+
+        self.run_loop(
+            self.sia_client.stream_renter_files(
+                lambda f: sia_paths.append(f[u'siapath'])))
+
+        self.assertEqual([u'a.txt', u'b.txt'], sia_paths)
+
+    def test_concurrent_requests_share_connection_pool(self):
+        local_path = self.make_file('a.txt')
+        uploads = [
+            self.sia_client.upload_file_async(local_path, '%d.txt' % i)
+            for i in xrange(20)
+        ]
+
+        for upload in uploads:
+            self.assertTrue(self.run_loop(upload))
+        self.assertEqual(20, len(self.run_loop(self.sia_client.renter_files())))
+        self.assertEqual(
+            sc.ConnectionStats(opened=2, reused=19),
+            self.connection_pool.stats())
+
+
+class AsyncSiaClientUnavailableTest(unittest.TestCase):
+
+    def setUp(self):
+        # Reserve a free port, then close it so that connections are refused.
+        listener = socket.socket()
+        listener.bind(('localhost', 0))
+        self.port = listener.getsockname()[1]
+        listener.close()
+        self.now = 0.0
+        self.loop = event_loop.EventLoop(lambda: self.now, self.advance_time)
+
+    def advance_time(self, seconds):
+        self.now += seconds
+
+    def test_raises_error_after_retries_when_server_is_unavailable(self):
+        sia_client = async_sia_client.AsyncSiaClient(
+            self.loop,
+            async_sia_client.ConnectionPool(self.loop, ('localhost', self.port),
+                                            1))
+
+        with self.assertRaises(sc.SiaServerNotAvailable):
+            self.loop.run_until_complete(sia_client.is_blockchain_synced())
+        # Waits 1 + 5 + 25 + 125 + 625 seconds between attempts.
+        self.assertGreaterEqual(self.now, 781.0)
+
+    def test_waits_for_circuit_breaker_between_attempts(self):
+        breaker = circuit_breaker.CircuitBreaker(
+            lambda: self.now, failure_threshold=2, open_seconds=1000.0)
+        sia_client = async_sia_client.AsyncSiaClient(
+            self.loop,
+            async_sia_client.ConnectionPool(self.loop, ('localhost', self.port),
+                                            1), breaker)
+
+        with self.assertRaises(sc.SiaServerNotAvailable):
+            self.loop.run_until_complete(sia_client.is_blockchain_synced())
+        # The circuit opens after the second attempt, and each later attempt
+        # is a probe that waits out the open period and reopens the circuit.
+        self.assertGreaterEqual(self.now, 4001.0)
+        self.assertEqual(circuit_breaker.STATE_OPEN, breaker.state())
+
+
+def streamed_response(pieces, exception=None):
+    """Returns a fake ConnectionPool.send that streams a response body."""
+
+    def send(request, body_fn):
+        for piece in pieces:
+            body_fn(piece)
+        future = event_loop.Future()
+        if exception:
+            future.set_exception(exception)
+        else:
+            future.set_result(
+                async_sia_client.HttpResponse(status=200, headers={}, body=''))
+        return future
+
+    return send
+
+
+class AsyncSiaClientStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.loop = event_loop.EventLoop(lambda: self.now, self.advance_time)
+        self.mock_connection_pool = mock.Mock()
+        self.mock_breaker = mock.Mock()
+        self.mock_breaker.admit.return_value = 0
+        self.sia_client = async_sia_client.AsyncSiaClient(
+            self.loop, self.mock_connection_pool, self.mock_breaker)
+        self.files = []
+
+    def advance_time(self, seconds):
+        self.now += seconds
+
+    def respond_with(self, *sends):
+        sends = list(sends)
+        self.mock_connection_pool.send.side_effect = (
+            lambda request, body_fn: sends.pop(0)(request, body_fn))
+
+    def stream_renter_files(self):
+        self.loop.run_until_complete(
+            self.sia_client.stream_renter_files(self.files.append))
+
+    def test_retries_response_that_fails_before_any_files(self):
+        self.respond_with(
+            streamed_response(['{"files": [{"a"'],
+                              async_sia_client.ConnectionError('Reset')),
+            streamed_response(['{"files": [{"a"', ': 1}, {"b": 2}]}']),
+        )
+
+        self.stream_renter_files()
+
+        self.assertEqual([{u'a': 1}, {u'b': 2}], self.files)
+        self.assertEqual(2, self.mock_connection_pool.send.call_count)
+
+    def test_retries_garbled_response_and_counts_it_as_failure(self):
+        self.respond_with(
+            streamed_response(['{"files": [{"a"', '}]}']),
+            streamed_response(['{"files": [{"a": 1}]}']),
+        )
+
+        self.stream_renter_files()
+
+        self.assertEqual([{u'a': 1}], self.files)
+        self.assertEqual(1, self.mock_breaker.record_failure.call_count)
+
+    def test_raises_error_when_response_fails_after_passing_on_files(self):
+        self.respond_with(
+            streamed_response(['{"files": [{"a": 1}, {"b"'],
+                              async_sia_client.ConnectionError('Reset')))
+
+        with self.assertRaises(sc.SiaServerNotAvailable):
+            self.stream_renter_files()
+        self.assertEqual([{u'a': 1}], self.files)
+        self.assertEqual(1, self.mock_connection_pool.send.call_count)
+
+
+class ResponseParserTest(unittest.TestCase):
+
+    def test_parses_response_with_content_length(self):
+        parser = async_sia_client._ResponseParser()
+        parser.feed('HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nab')
+        self.assertFalse(parser.is_complete())
+        parser.feed('cde')
+
+        self.assertTrue(parser.is_complete())
+        self.assertEqual(
+            async_sia_client.HttpResponse(
+                status=200, headers={'content-length': '5'}, body='abcde'),
+            parser.response())
+
+    def test_parses_chunked_response_fed_byte_by_byte(self):
+        parser = async_sia_client._ResponseParser()
+        raw_response = ('HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                        '3\r\nabc\r\na;ext=1\r\n0123456789\r\n0\r\n\r\n')
+        for c in raw_response:
+            self.assertFalse(parser.is_complete())
+            parser.feed(c)
+
+        self.assertTrue(parser.is_complete())
+        self.assertEqual('abc0123456789', parser.response().body)
+
+    def test_no_content_response_is_complete_after_headers(self):
+        parser = async_sia_client._ResponseParser()
+        parser.feed('HTTP/1.1 204 No Content\r\n\r\n')
+
+        self.assertTrue(parser.is_complete())
+        self.assertEqual('', parser.response().body)
+
+    def test_response_without_length_ends_when_connection_closes(self):
+        parser = async_sia_client._ResponseParser()
+        parser.feed('HTTP/1.1 200 OK\r\n\r\nabc')
+        self.assertFalse(parser.is_complete())
+
+        self.assertTrue(parser.finish_on_close())
+        self.assertEqual('abc', parser.response().body)
+
+    def test_passes_successful_body_to_body_fn_as_it_arrives(self):
+        pieces = []
+        parser = async_sia_client._ResponseParser(pieces.append)
+        parser.feed('HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                    '3\r\nabc\r\n5\r\n01')
+        self.assertEqual(['abc', '01'], pieces)
+        parser.feed('234\r\n0\r\n\r\n')
+
+        self.assertTrue(parser.is_complete())
+        self.assertEqual(['abc', '01', '234'], pieces)
+        self.assertEqual('', parser.response().body)
+
+    def test_collects_error_body_rather_than_passing_it_to_body_fn(self):
+        pieces = []
+        parser = async_sia_client._ResponseParser(pieces.append)
+        parser.feed('HTTP/1.1 500 Internal Server Error\r\n'
+                    'Content-Length: 4\r\n\r\noops')
+
+        self.assertEqual([], pieces)
+        self.assertEqual('oops', parser.response().body)
@@ -0,0 +1,141 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from sia_load_tester import benchmark
+
+
+def make_result(shape='worst', file_count=1000, **overrides):
+    result = benchmark.BenchmarkResult(
+        shape=shape,
+        file_count=file_count,
+        wall_seconds=10.0,
+        peak_rss_bytes=1000000,
+        api_calls=1500,
+        uploads_started=1000,
+        api_calls_per_file=1.5,
+        scheduler_idle_seconds=5.0)
+    return result._replace(**overrides)
+
+
+class GenerateDatasetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.dataset_dir = os.path.join(self.test_dir, 'dataset')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def dataset_file_sizes(self):
+        file_sizes = []
+        for root, _, filenames in os.walk(self.dataset_dir):
+            for filename in sorted(filenames):
+                file_sizes.append(os.path.getsize(os.path.join(root, filename)))
+        return file_sizes
+
+    def test_generates_files_of_shape_sizes(self):
+        benchmark.generate_dataset(self.dataset_dir, benchmark.SHAPE_MIXED, 5)
+
+        self.assertEqual([1, 4096, 1048576, 41943040, 1],
+                         self.dataset_file_sizes())
+
+    def test_splits_large_datasets_across_directories(self):
+        benchmark.generate_dataset(self.dataset_dir, benchmark.SHAPE_WORST,
+                                   1001)
+
+        self.assertEqual(['000000', '000001'],
+                         sorted(os.listdir(self.dataset_dir)))
+        self.assertEqual(1001, len(self.dataset_file_sizes()))
+
+    def test_reuses_previously_generated_dataset(self):
+        benchmark.generate_dataset(self.dataset_dir, benchmark.SHAPE_WORST, 2)
+        benchmark.generate_dataset(self.dataset_dir, benchmark.SHAPE_WORST, 5)
+
+        self.assertEqual(2, len(self.dataset_file_sizes()))
+
+
+class CompareResultsTest(unittest.TestCase):
+
+    def test_reports_metrics_that_grew_beyond_tolerance(self):
+        self.assertEqual([
+            benchmark.Regression(
+                shape='worst',
+                file_count=1000,
+                metric='wall_seconds',
+                baseline_value=10.0,
+                value=12.0)
+        ],
+                         benchmark.compare_results(
+                             [make_result()], [make_result(wall_seconds=12.0)],
+                             tolerance=0.1))
+
+    def test_ignores_changes_within_tolerance_and_improvements(self):
+        self.assertEqual([],
+                         benchmark.compare_results(
+                             [make_result()], [
+                                 make_result(
+                                     wall_seconds=10.5,
+                                     peak_rss_bytes=500000,
+                                     scheduler_idle_seconds=0.0)
+                             ],
+                             tolerance=0.1))
+
+    def test_ignores_cases_missing_from_baseline(self):
+        self.assertEqual([],
+                         benchmark.compare_results(
+                             [make_result(file_count=1000)],
+                             [make_result(file_count=10000, wall_seconds=99)],
+                             tolerance=0.1))
+
+    def test_ignores_metrics_that_were_not_measured(self):
+        self.assertEqual([],
+                         benchmark.compare_results(
+                             [make_result(peak_rss_bytes=None)],
+                             [make_result(peak_rss_bytes=2000000)],
+                             tolerance=0.1))
+
+
+class ResultsFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_load_results_reads_results_from_write_results(self):
+        results_path = os.path.join(self.test_dir, 'results.json')
+        results = [make_result(), make_result(shape='mixed')]
+
+        benchmark.write_results(results_path, results)
+
+        self.assertEqual(results, benchmark.load_results(results_path))
+        with open(results_path) as results_file:
+            self.assertIn('commit', json.load(results_file))
+
+
+class LoadTestArgsTest(unittest.TestCase):
+
+    def test_sets_benchmark_flags_and_keeps_load_tester_defaults(self):
+        args = benchmark._load_test_args('/dataset', '/output', 9999,
+                                         benchmark.RunOptions(
+                                             concurrency_policy='aimd',
+                                             renter_poll_interval_seconds=0.5,
+                                             wait_mode='sleep',
+                                             submission_workers=3,
+                                             execution_mode='event_loop'))
+
+        self.assertEqual('/dataset', args.dataset_root)
+        self.assertEqual('/output', args.output_dir)
+        self.assertEqual(9999, args.sia_api_port)
+        self.assertEqual('aimd', args.concurrency_policy)
+        self.assertEqual(0.5, args.renter_poll_interval_seconds)
+        self.assertEqual('sleep', args.wait_mode)
+        self.assertEqual(3, args.submission_workers)
+        self.assertEqual('event_loop', args.execution_mode)
+        self.assertEqual(1, args.dataset_copies)
+        self.assertIsNone(args.sia_api_endpoints)
+        self.assertFalse(args.reconcile_with_renter)
@@ -0,0 +1,126 @@
+import unittest
+
+import mock
+
+from sia_load_tester import circuit_breaker
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_time_fn = mock.Mock(return_value=100.0)
+        self.breaker = circuit_breaker.CircuitBreaker(
+            self.mock_time_fn,
+            failure_threshold=3,
+            slow_call_seconds=10.0,
+            open_seconds=30.0)
+
+    def trip(self):
+        for _ in xrange(3):
+            self.breaker.record_failure()
+
+    def test_admits_all_calls_while_closed(self):
+        self.assertEqual(0, self.breaker.admit('renter_files'))
+        self.assertEqual(0, self.breaker.admit('contract_count', False))
+        self.assertEqual(circuit_breaker.STATE_CLOSED, self.breaker.state())
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertEqual(circuit_breaker.STATE_CLOSED, self.breaker.state())
+
+        self.breaker.record_failure()
+        self.assertEqual(circuit_breaker.STATE_OPEN, self.breaker.state())
+
+    def test_responses_reset_failure_count(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_response(1.0)
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+
+        self.assertEqual(circuit_breaker.STATE_CLOSED, self.breaker.state())
+
+    def test_slow_responses_count_as_failures(self):
+        for _ in xrange(3):
+            self.breaker.record_response(10.0)
+
+        self.assertEqual(circuit_breaker.STATE_OPEN, self.breaker.state())
+
+    def test_sheds_non_essential_calls_while_open(self):
+        self.trip()
+
+        with self.assertRaises(circuit_breaker.CallShedError):
+            self.breaker.admit('contract_count', essential=False)
+
+    def test_essential_calls_wait_until_open_period_ends(self):
+        self.trip()
+        self.mock_time_fn.return_value = 120.0
+
+        self.assertEqual(10.0, self.breaker.admit('upload_file_async'))
+
+    def test_admits_single_probe_after_open_period(self):
+        self.trip()
+        self.mock_time_fn.return_value = 130.0
+
+        self.assertEqual(0, self.breaker.admit('upload_file_async'))
+        self.assertEqual(circuit_breaker.STATE_HALF_OPEN, self.breaker.state())
+        self.assertGreater(self.breaker.admit('upload_file_async'), 0)
+        with self.assertRaises(circuit_breaker.CallShedError):
+            self.breaker.admit('contract_count', essential=False)
+
+    def test_closes_when_probe_succeeds(self):
+        self.trip()
+        self.mock_time_fn.return_value = 130.0
+        self.breaker.admit('upload_file_async')
+
+        self.breaker.record_response(1.0)
+
+        self.assertEqual(circuit_breaker.STATE_CLOSED, self.breaker.state())
+        self.assertEqual(0, self.breaker.admit('upload_file_async'))
+
+    def test_reopens_when_probe_fails(self):
+        self.trip()
+        self.mock_time_fn.return_value = 130.0
+        self.breaker.admit('upload_file_async')
+
+        self.breaker.record_failure()
+
+        self.assertEqual(circuit_breaker.STATE_OPEN, self.breaker.state())
+        self.assertEqual(30.0, self.breaker.admit('upload_file_async'))
+
+    def test_reopens_when_probe_is_slow(self):
+        self.trip()
+        self.mock_time_fn.return_value = 130.0
+        self.breaker.admit('upload_file_async')
+
+        self.breaker.record_response(15.0)
+
+        self.assertEqual(circuit_breaker.STATE_OPEN, self.breaker.state())
+
+    def test_recovers_with_only_non_essential_calls(self):
+        self.trip()
+
+        with self.assertRaises(circuit_breaker.CallShedError):
+            self.breaker.admit('contract_count', essential=False)
+        self.mock_time_fn.return_value = 130.0
+        self.assertEqual(0, self.breaker.admit('contract_count', False))
+        self.assertEqual(circuit_breaker.STATE_HALF_OPEN, self.breaker.state())
+        with self.assertRaises(circuit_breaker.CallShedError):
+            self.breaker.admit('contract_count', essential=False)
+        self.breaker.record_response(1.0)
+
+        self.assertEqual(circuit_breaker.STATE_CLOSED, self.breaker.state())
+        self.assertEqual(0, self.breaker.admit('contract_count', False))
+
+    def test_check_shed_sheds_tasks_until_open_period_ends(self):
+        self.trip()
+
+        with self.assertRaises(circuit_breaker.CallShedError):
+            self.breaker.check_shed('iter_renter_files')
+        self.mock_time_fn.return_value = 130.0
+        self.breaker.check_shed('iter_renter_files')
+
+        # The check leaves the probe to the task's own request.
+        self.assertEqual(0, self.breaker.admit('iter_renter_files'))
+        self.assertEqual(circuit_breaker.STATE_HALF_OPEN, self.breaker.state())
@@ -0,0 +1,147 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from sia_load_tester import concurrency
+
+
+class AimdControllerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_metrics_writer = mock.Mock()
+        self.mock_time = datetime.datetime(2018, 2, 13, 0, 0, 0)
+        self.controller = concurrency.AimdController(
+            5, self.mock_metrics_writer, lambda: self.mock_time)
+
+    def test_starts_at_initial_limit(self):
+        self.assertEqual(5, self.controller.limit())
+
+    def test_increases_limit_while_throughput_rises(self):
+        self.controller.record_throughput(10.0)
+        self.controller.record_throughput(12.0)
+        self.controller.record_throughput(15.0)
+
+        self.assertEqual(8, self.controller.limit())
+
+    def test_backs_off_when_throughput_plateaus_after_increase(self):
+        self.controller.record_throughput(10.0)
+        self.controller.record_throughput(12.0)
+        self.controller.record_throughput(12.1)
+
+        self.assertEqual(6, self.controller.limit())
+
+    def test_holds_limit_while_throughput_is_steady(self):
+        self.controller.record_throughput(10.0)
+        self.controller.record_throughput(10.1)
+        self.controller.record_throughput(10.0)
+        self.controller.record_throughput(10.2)
+
+        self.assertEqual(5, self.controller.limit())
+
+    def test_decreases_limit_when_throughput_falls(self):
+        self.controller.record_throughput(10.0)
+        self.controller.record_throughput(5.0)
+
+        self.assertEqual(5, self.controller.limit())
+
+    def test_halves_limit_when_uploads_fail(self):
+        self.controller.record_throughput(10.0)
+        self.controller.record_throughput(15.0)
+        self.controller.record_throughput(20.0)
+        self.controller.record_upload_error()
+        self.controller.record_upload_error()
+        self.controller.record_throughput(30.0)
+
+        self.assertEqual(4, self.controller.limit())
+
+    def test_never_decreases_limit_below_one(self):
+        for _ in range(5):
+            self.controller.record_upload_error()
+            self.controller.record_throughput(1.0)
+
+        self.assertEqual(1, self.controller.limit())
+
+    def test_writes_each_decision_to_metrics(self):
+        self.controller.record_throughput(10.0)
+        self.controller.record_upload_error()
+        self.controller.record_throughput(12.0)
+
+        self.mock_metrics_writer.assert_has_calls([
+            mock.call(
+                concurrency.Decision(
+                    timestamp=self.mock_time,
+                    upload_mbps=10.0,
+                    upload_errors=0,
+                    action=concurrency.DECISION_INCREASE,
+                    reason='first sample',
+                    old_limit=5,
+                    new_limit=6)),
+            mock.call(
+                concurrency.Decision(
+                    timestamp=self.mock_time,
+                    upload_mbps=12.0,
+                    upload_errors=1,
+                    action=concurrency.DECISION_DECREASE,
+                    reason='1 upload errors',
+                    old_limit=6,
+                    new_limit=3)),
+        ])
+
+
+class MetricsWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.output_path = os.path.join(self.test_dir, 'metrics.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_writes_header_and_decisions_as_csv(self):
+        writer = concurrency.MetricsWriter(self.output_path)
+        writer(
+            concurrency.Decision(
+                timestamp=datetime.datetime(2018, 2, 13, 0, 0, 0),
+                upload_mbps=10.0,
+                upload_errors=0,
+                action=concurrency.DECISION_INCREASE,
+                reason='first sample',
+                old_limit=5,
+                new_limit=6))
+        writer(
+            concurrency.Decision(
+                timestamp=datetime.datetime(2018, 2, 13, 0, 1, 0),
+                upload_mbps=10.1,
+                upload_errors=0,
+                action=concurrency.DECISION_HOLD,
+                reason='throughput steady',
+                old_limit=6,
+                new_limit=6))
+
+        with open(self.output_path) as metrics_file:
+            self.assertEqual([
+                ('timestamp,upload_mbps,upload_errors,action,reason,old_limit,'
+                 'new_limit\r\n'),
+                '2018-02-13T00:00:00Z,10.000,0,increase,first sample,5,6\r\n',
+                '2018-02-13T00:01:00Z,10.100,0,hold,throughput steady,6,6\r\n',
+            ], metrics_file.readlines())
+
+
+class MakeControllerTest(unittest.TestCase):
+
+    def test_fixed_policy_keeps_default_limit(self):
+        controller = concurrency.make_controller(concurrency.POLICY_FIXED,
+                                                 '/dummy-output')
+        controller.record_throughput(10.0)
+        controller.record_throughput(20.0)
+
+        self.assertEqual(concurrency.DEFAULT_CONCURRENT_UPLOADS,
+                         controller.limit())
+
+    def test_raises_on_unrecognized_policy(self):
+        with self.assertRaises(concurrency.InvalidPolicyError):
+            concurrency.make_controller('dummy-policy', '/dummy-output')
@@ -3,7 +3,10 @@ import shutil
 import tempfile
 import unittest
 
+import mock
+
 from sia_load_tester import dataset
+from sia_load_tester import dataset_manifest
 
 
 class DatasetTest(unittest.TestCase):
@@ -63,3 +66,165 @@ class DatasetTest(unittest.TestCase):
         with self.assertRaises(dataset.InvalidPath):
             dataset.load_from_path(
                 os.path.join(self.test_dir, 'dummy-subdirectory'))
+
+    def test_load_from_path_records_file_sizes(self):
+        with open(os.path.join(self.test_dir, 'a.txt'), 'w') as f:
+            f.write('12345')
+        os.makedirs(os.path.join(self.test_dir, 'foo'))
+        open(os.path.join(self.test_dir, 'foo', 'b.txt'), 'w').close()
+
+        d = dataset.load_from_path(self.test_dir)
+
+        self.assertItemsEqual([
+            dataset.DatasetFile(
+                path=os.path.join(self.test_dir, 'a.txt'), size=5),
+            dataset.DatasetFile(
+                path=os.path.join(self.test_dir, 'foo', 'b.txt'), size=0),
+        ], d.files)
+
+    def test_stream_from_path_yields_all_files_with_sizes(self):
+        for subdirectory in ['a', 'b', 'c']:
+            os.makedirs(os.path.join(self.test_dir, subdirectory, 'nested'))
+            with open(
+                    os.path.join(self.test_dir, subdirectory, 'nested',
+                                 'file.txt'), 'w') as f:
+                f.write(subdirectory * 3)
+
+        d = dataset.stream_from_path(self.test_dir)
+
+        self.assertEqual(self.test_dir, d.root_dir)
+        self.assertItemsEqual([
+            dataset.DatasetFile(
+                path=os.path.join(self.test_dir, 'a', 'nested', 'file.txt'),
+                size=3),
+            dataset.DatasetFile(
+                path=os.path.join(self.test_dir, 'b', 'nested', 'file.txt'),
+                size=3),
+            dataset.DatasetFile(
+                path=os.path.join(self.test_dir, 'c', 'nested', 'file.txt'),
+                size=3),
+        ], d.files)
+
+    def test_stream_from_path_nonexistent_directory_raises_exception(self):
+        with self.assertRaises(dataset.InvalidPath):
+            dataset.stream_from_path(
+                os.path.join(self.test_dir, 'dummy-subdirectory'))
+
+    def test_stream_from_path_file_raises_exception(self):
+        file_path = os.path.join(self.test_dir, 'a.txt')
+        open(file_path, 'w').close()
+
+        with self.assertRaises(dataset.InvalidPath):
+            dataset.stream_from_path(file_path)
+
+    def test_stream_from_path_raises_exception_when_root_cannot_be_listed(self):
+        d = dataset.stream_from_path(self.test_dir)
+
+        with mock.patch.object(
+                dataset, 'scandir', side_effect=OSError('dummy error')):
+            with self.assertRaises(dataset.InvalidPath):
+                list(d.files)
+
+    def test_scan_files_skips_directories_that_fail_with_non_OSError(self):
+        os.makedirs(os.path.join(self.test_dir, 'bad'))
+        open(os.path.join(self.test_dir, 'a.txt'), 'w').close()
+        real_scandir = dataset.scandir
+
+        def mock_scandir(directory):
+            if directory.endswith('bad'):
+                raise UnicodeDecodeError('utf-8', 'dummy', 0, 1, 'dummy error')
+            return real_scandir(directory)
+
+        with mock.patch.object(dataset, 'scandir', side_effect=mock_scandir):
+            self.assertEqual(
+                [os.path.join(self.test_dir, 'a.txt')],
+                [f.path for f in dataset.scan_files(self.test_dir)])
+
+    @unittest.skipUnless(
+        hasattr(os, 'symlink'), 'Platform does not support symlinks')
+    def test_scan_files_does_not_follow_directory_symlinks(self):
+        os.makedirs(os.path.join(self.test_dir, 'real'))
+        open(os.path.join(self.test_dir, 'real', 'a.txt'), 'w').close()
+        os.symlink(
+            os.path.join(self.test_dir, 'real'),
+            os.path.join(self.test_dir, 'link'))
+
+        self.assertEqual([os.path.join(self.test_dir, 'real', 'a.txt')],
+                         [f.path for f in dataset.scan_files(self.test_dir)])
+
+    def test_scan_files_raises_OSError_when_root_is_not_a_directory(self):
+        file_path = os.path.join(self.test_dir, 'a.txt')
+        open(file_path, 'w').close()
+
+        with self.assertRaises(OSError):
+            list(dataset.scan_files(file_path))
+
+    def _make_old_directory(self, path):
+        # Backdate the directory so that its listing is trusted by the
+        # manifest.
+        if not os.path.exists(path):
+            os.makedirs(path)
+        os.utime(path, (1000000000, 1000000000))
+
+    def test_scan_files_reuses_unchanged_directories_from_manifest(self):
+        root_dir = os.path.join(self.test_dir, 'dataset')
+        manifest_path = os.path.join(self.test_dir, 'manifest.sqlite')
+        file_path = os.path.join(root_dir, 'a.txt')
+        os.makedirs(root_dir)
+        with open(file_path, 'w') as f:
+            f.write('a')
+        self._make_old_directory(root_dir)
+        list(dataset.scan_files(root_dir, manifest_path=manifest_path))
+
+        # Rewriting a file in place does not change its directory's mtime, so
+        # the scan reuses the stale size from the manifest.
+        with open(file_path, 'w') as f:
+            f.write('aaa')
+
+        self.assertEqual([dataset.DatasetFile(path=file_path, size=1)],
+                         list(
+                             dataset.scan_files(
+                                 root_dir, manifest_path=manifest_path)))
+
+    def test_scan_files_rescans_changed_directories(self):
+        root_dir = os.path.join(self.test_dir, 'dataset')
+        manifest_path = os.path.join(self.test_dir, 'manifest.sqlite')
+        self._make_old_directory(os.path.join(root_dir, 'a'))
+        open(os.path.join(root_dir, 'a', 'a.txt'), 'w').close()
+        self._make_old_directory(os.path.join(root_dir, 'a'))
+        self._make_old_directory(root_dir)
+        list(dataset.scan_files(root_dir, manifest_path=manifest_path))
+
+        open(os.path.join(root_dir, 'a', 'b.txt'), 'w').close()
+
+        self.assertItemsEqual([
+            os.path.join(root_dir, 'a', 'a.txt'),
+            os.path.join(root_dir, 'a', 'b.txt'),
+        ], [
+            f.path
+            for f in dataset.scan_files(root_dir, manifest_path=manifest_path)
+        ])
+
+    def test_scan_files_saves_listings_read_before_scan_is_interrupted(self):
+        root_dir = os.path.join(self.test_dir, 'dataset')
+        manifest_path = os.path.join(self.test_dir, 'manifest.sqlite')
+        os.makedirs(os.path.join(root_dir, 'a'))
+        open(os.path.join(root_dir, 'a.txt'), 'w').close()
+        open(os.path.join(root_dir, 'a', 'b.txt'), 'w').close()
+
+        scanned_files = dataset.scan_files(
+            root_dir, manifest_path=manifest_path)
+        next(scanned_files)
+
+        self.assertEqual([root_dir],
+                         dataset_manifest.load(manifest_path).keys())
+        scanned_files.close()
+
+    def test_scan_files_does_not_write_manifest_when_scan_fails(self):
+        file_path = os.path.join(self.test_dir, 'a.txt')
+        manifest_path = os.path.join(self.test_dir, 'manifest.sqlite')
+        open(file_path, 'w').close()
+
+        with self.assertRaises(OSError):
+            list(dataset.scan_files(file_path, manifest_path=manifest_path))
+        self.assertEqual(['a.txt'], os.listdir(self.test_dir))
@@ -0,0 +1,143 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import mock
+
+from sia_load_tester import dataset_manifest
+
+
+class DatasetManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.manifest_path = os.path.join(self.test_dir, 'manifest.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_load_returns_listings_saved_by_writer(self):
+        listing = dataset_manifest.Listing(
+            mtime=100.0,
+            listed_at=200.0,
+            files=[
+                dataset_manifest.ListedFile(
+                    path='/dataset/a.txt', size=5, mtime=90.0),
+                dataset_manifest.ListedFile(
+                    path='/dataset/broken-link', size=None, mtime=None),
+            ],
+            subdirectories=['/dataset/foo'])
+        empty_listing = dataset_manifest.Listing(
+            mtime=110.0, listed_at=200.0, files=[], subdirectories=[])
+        writer = dataset_manifest.Writer(self.manifest_path)
+        writer.add_listing('/dataset', listing)
+        writer.add_listing('/dataset/foo', empty_listing)
+        writer.finish()
+
+        self.assertEqual({
+            '/dataset': listing,
+            '/dataset/foo': empty_listing,
+        }, dataset_manifest.load(self.manifest_path))
+
+    def test_load_returns_empty_dict_when_manifest_does_not_exist(self):
+        self.assertEqual({}, dataset_manifest.load(self.manifest_path))
+
+    def test_load_returns_empty_dict_when_manifest_is_corrupt(self):
+        with open(self.manifest_path, 'w') as manifest_file:
+            manifest_file.write('not a database')
+
+        self.assertEqual({}, dataset_manifest.load(self.manifest_path))
+
+    def test_interrupted_writer_keeps_listings_recorded_so_far(self):
+        listing = dataset_manifest.Listing(
+            mtime=100.0, listed_at=200.0, files=[], subdirectories=[])
+        writer = dataset_manifest.Writer(self.manifest_path)
+        writer.add_listing('/dataset', listing)
+        writer.finish()
+
+        writer = dataset_manifest.Writer(self.manifest_path)
+        writer.add_listing('/other-dataset', listing)
+
+        self.assertEqual({
+            '/dataset': listing,
+            '/other-dataset': listing,
+        }, dataset_manifest.load(self.manifest_path))
+        writer.close()
+
+    def test_finish_drops_listings_the_scan_did_not_find(self):
+        listing = dataset_manifest.Listing(
+            mtime=100.0, listed_at=200.0, files=[], subdirectories=[])
+        new_listing = dataset_manifest.Listing(
+            mtime=150.0,
+            listed_at=200.0,
+            files=[
+                dataset_manifest.ListedFile(
+                    path='/dataset/a.txt', size=5, mtime=90.0)
+            ],
+            subdirectories=[])
+        writer = dataset_manifest.Writer(self.manifest_path)
+        writer.add_listing('/dataset', listing)
+        writer.add_listing('/dataset/removed', listing)
+        writer.finish()
+
+        writer = dataset_manifest.Writer(self.manifest_path)
+        writer.add_listing('/dataset', new_listing)
+        writer.finish()
+
+        self.assertEqual({
+            '/dataset': new_listing
+        }, dataset_manifest.load(self.manifest_path))
+
+    def test_writer_replaces_corrupt_manifest(self):
+        with open(self.manifest_path, 'w') as manifest_file:
+            manifest_file.write('not a database')
+        listing = dataset_manifest.Listing(
+            mtime=100.0, listed_at=200.0, files=[], subdirectories=[])
+
+        writer = dataset_manifest.Writer(self.manifest_path)
+        writer.add_listing('/dataset', listing)
+        writer.finish()
+
+        self.assertEqual({
+            '/dataset': listing
+        }, dataset_manifest.load(self.manifest_path))
+
+    def test_writer_replaces_manifest_it_cannot_connect_to(self):
+        with open(self.manifest_path, 'w') as manifest_file:
+            manifest_file.write('not a database')
+        listing = dataset_manifest.Listing(
+            mtime=100.0, listed_at=200.0, files=[], subdirectories=[])
+        connect = dataset_manifest._connect
+        errors = [sqlite3.OperationalError('unable to open database file')]
+
+        def connect_after_error(path):
+            if errors:
+                raise errors.pop()
+            return connect(path)
+
+        with mock.patch.object(dataset_manifest, '_connect',
+                               connect_after_error):
+            writer = dataset_manifest.Writer(self.manifest_path)
+            writer.add_listing('/dataset', listing)
+            writer.finish()
+
+        self.assertEqual({
+            '/dataset': listing
+        }, dataset_manifest.load(self.manifest_path))
+
+    def test_is_fresh_when_directory_unchanged_since_listing(self):
+        listing = dataset_manifest.Listing(
+            mtime=100.0, listed_at=200.0, files=[], subdirectories=[])
+        self.assertTrue(dataset_manifest.is_fresh(listing, 100.0))
+
+    def test_is_not_fresh_when_directory_mtime_changed(self):
+        listing = dataset_manifest.Listing(
+            mtime=100.0, listed_at=200.0, files=[], subdirectories=[])
+        self.assertFalse(dataset_manifest.is_fresh(listing, 150.0))
+
+    def test_is_not_fresh_when_listed_too_soon_after_modification(self):
+        listing = dataset_manifest.Listing(
+            mtime=100.0, listed_at=101.0, files=[], subdirectories=[])
+        self.assertFalse(dataset_manifest.is_fresh(listing, 100.0))
@@ -5,7 +5,9 @@ import mock
 
 from sia_load_tester import jobs
 from sia_load_tester import dataset_uploader
+from sia_load_tester import renter_poller
 from sia_load_tester import sia_client as sc
+from sia_load_tester import sia_conditions
 from sia_load_tester import upload_queue
 
 
@@ -17,6 +19,10 @@ class DatasetUploaderTest(unittest.TestCase):
         self.mock_sia_client = sc.SiaClient(self.mock_sia_api_impl,
                                             mock_sleep_fn)
         self.mock_condition_waiter = mock.Mock()
+        self.mock_condition_waiter.idle_seconds.return_value = 0.0
+        self.mock_concurrency_controller = mock.Mock()
+        self.mock_upload_journal = mock.Mock()
+        self.mock_latency_tracker = mock.Mock()
         self.exit_event = threading.Event()
 
     def test_blocks_until_all_uploads_complete(self):
@@ -25,30 +31,17 @@ class DatasetUploaderTest(unittest.TestCase):
             jobs.Job(local_path='/dummy-path/2.txt', sia_path='2.txt'),
             jobs.Job(local_path='/dummy-path/3.txt', sia_path='3.txt'),
         ]
-        self.mock_sia_api_impl.get_renter_files.return_value = {
-            u'files': [
-                {
-                    u'siapath': u'1.txt',
-                    u'localpath': u'/dummy-path/1.txt',
-                    u'uploadprogress': 15,
-                },
-                {
-                    u'siapath': u'2.txt',
-                    u'localpath': u'/dummy-path/2.txt',
-                    u'uploadprogress': 18,
-                },
-                {
-                    u'siapath': u'3.txt',
-                    u'localpath': u'/dummy-path/3.txt',
-                    u'uploadprogress': 19,
-                },
-            ]
-        }
-        queue = upload_queue.from_upload_jobs_and_sia_client(
-            upload_jobs, self.mock_sia_client)
-        uploader = dataset_uploader.DatasetUploader(queue, self.mock_sia_client,
-                                                    self.mock_condition_waiter,
-                                                    self.exit_event)
+        renter_snapshot = renter_poller.Snapshot(
+            uploads_in_progress=3,
+            uploaded_bytes=0,
+            sia_paths=frozenset([u'1.txt', u'2.txt', u'3.txt']),
+            uploading_sia_paths=frozenset([u'1.txt', u'2.txt', u'3.txt']))
+        queue = upload_queue.from_upload_jobs_and_snapshot(
+            upload_jobs, renter_snapshot)
+        uploader = dataset_uploader.DatasetUploader(
+            queue, self.mock_sia_client, self.mock_condition_waiter,
+            self.mock_concurrency_controller, self.mock_upload_journal,
+            self.mock_latency_tracker, 1, self.exit_event)
 
         uploader.upload()
 
@@ -68,41 +61,20 @@ class DatasetUploaderTest(unittest.TestCase):
             jobs.Job(local_path='/dummy-path/6.txt', sia_path='6.txt'),
             jobs.Job(local_path='/dummy-path/7.txt', sia_path='7.txt'),
         ]
-        self.mock_sia_api_impl.get_renter_files.return_value = {
-            u'files': [
-                {
-                    u'siapath': u'1.txt',
-                    u'localpath': u'/dummy-path/1.txt',
-                    u'uploadprogress': 15,
-                },
-                {
-                    u'siapath': u'2.txt',
-                    u'localpath': u'/dummy-path/2.txt',
-                    u'uploadprogress': 18,
-                },
-                {
-                    u'siapath': u'3.txt',
-                    u'localpath': u'/dummy-path/3.txt',
-                    u'uploadprogress': 19,
-                },
-                {
-                    u'siapath': u'4.txt',
-                    u'localpath': u'/dummy-path/4.txt',
-                    u'uploadprogress': 16,
-                },
-                {
-                    u'siapath': u'5.txt',
-                    u'localpath': u'/dummy-path/5.txt',
-                    u'uploadprogress': 5,
-                },
-            ]
-        }
+        renter_snapshot = renter_poller.Snapshot(
+            uploads_in_progress=5,
+            uploaded_bytes=0,
+            sia_paths=frozenset(
+                [u'1.txt', u'2.txt', u'3.txt', u'4.txt', u'5.txt']),
+            uploading_sia_paths=frozenset(
+                [u'1.txt', u'2.txt', u'3.txt', u'4.txt', u'5.txt']))
         self.mock_sia_api_impl.set_renter_upload.return_value = True
-        queue = upload_queue.from_upload_jobs_and_sia_client(
-            upload_jobs, self.mock_sia_client)
-        uploader = dataset_uploader.DatasetUploader(queue, self.mock_sia_client,
-                                                    self.mock_condition_waiter,
-                                                    self.exit_event)
+        queue = upload_queue.from_upload_jobs_and_snapshot(
+            upload_jobs, renter_snapshot)
+        uploader = dataset_uploader.DatasetUploader(
+            queue, self.mock_sia_client, self.mock_condition_waiter,
+            self.mock_concurrency_controller, self.mock_upload_journal,
+            self.mock_latency_tracker, 1, self.exit_event)
 
         uploader.upload()
 
@@ -123,18 +95,27 @@ class DatasetUploaderTest(unittest.TestCase):
             jobs.Job(local_path='/dummy-path/a.txt', sia_path='a.txt'),
             jobs.Job(local_path='/dummy-path/b.txt', sia_path='b.txt'),
         ]
-        self.mock_sia_api_impl.get_renter_files.return_value = {u'files': None}
+        renter_snapshot = renter_poller.Snapshot(
+            uploads_in_progress=0,
+            uploaded_bytes=0,
+            sia_paths=frozenset(),
+            uploading_sia_paths=frozenset())
         self.mock_sia_api_impl.set_renter_upload.side_effect = [
             ValueError('dummy upload error'), True
         ]
-        queue = upload_queue.from_upload_jobs_and_sia_client(
-            upload_jobs, self.mock_sia_client)
-        uploader = dataset_uploader.DatasetUploader(queue, self.mock_sia_client,
-                                                    self.mock_condition_waiter,
-                                                    self.exit_event)
+        queue = upload_queue.from_upload_jobs_and_snapshot(
+            upload_jobs, renter_snapshot)
+        uploader = dataset_uploader.DatasetUploader(
+            queue, self.mock_sia_client, self.mock_condition_waiter,
+            self.mock_concurrency_controller, self.mock_upload_journal,
+            self.mock_latency_tracker, 1, self.exit_event)
+        value_errors = dataset_uploader.UPLOAD_ERRORS.value(error='ValueError')
 
         uploader.upload()
 
+        self.assertEqual(
+            value_errors + 1,
+            dataset_uploader.UPLOAD_ERRORS.value(error='ValueError'))
         self.mock_sia_api_impl.set_renter_upload.assert_has_calls([
             mock.call('a.txt', source='/dummy-path/a.txt'),
             mock.call('b.txt', source='/dummy-path/b.txt'),
@@ -144,3 +125,107 @@ class DatasetUploaderTest(unittest.TestCase):
         self.assertEqual(1, self.mock_condition_waiter.
                          wait_for_all_uploads_to_complete.call_count)
         self.assertTrue(self.exit_event.is_set())
+        self.assertEqual(
+            3, self.mock_concurrency_controller.record_upload_error.call_count)
+        self.mock_upload_journal.record_submitted.assert_called_once_with(
+            upload_jobs[1])
+        self.assertEqual(3, self.mock_upload_journal.record_failed.call_count)
+        self.assertEqual(
+            dataset_uploader.UploadStats(
+                uploads_started=1,
+                upload_failures=3,
+                scheduler_idle_seconds=0.0), uploader.stats())
+
+    def test_submits_each_job_once_with_multiple_workers(self):
+        upload_jobs = [
+            jobs.Job(
+                local_path='/dummy-path/%d.txt' % i, sia_path='%d.txt' % i)
+            for i in range(20)
+        ]
+        renter_snapshot = renter_poller.Snapshot(
+            uploads_in_progress=0,
+            uploaded_bytes=0,
+            sia_paths=frozenset(),
+            uploading_sia_paths=frozenset())
+        self.mock_sia_api_impl.set_renter_upload.return_value = True
+        queue = upload_queue.from_upload_jobs_and_snapshot(
+            upload_jobs, renter_snapshot)
+        uploader = dataset_uploader.DatasetUploader(
+            queue, self.mock_sia_client, self.mock_condition_waiter,
+            self.mock_concurrency_controller, self.mock_upload_journal,
+            self.mock_latency_tracker, 4, self.exit_event)
+
+        uploader.upload()
+
+        self.assertItemsEqual(
+            [mock.call(j.sia_path, source=j.local_path) for j in upload_jobs],
+            self.mock_sia_api_impl.set_renter_upload.call_args_list)
+        self.assertEqual(20, uploader.stats().uploads_started)
+        self.assertTrue(self.exit_event.is_set())
+
+    def test_raises_error_from_submission_worker(self):
+        upload_jobs = [
+            jobs.Job(local_path='/dummy-path/a.txt', sia_path='a.txt'),
+        ]
+        renter_snapshot = renter_poller.Snapshot(
+            uploads_in_progress=0,
+            uploaded_bytes=0,
+            sia_paths=frozenset(),
+            uploading_sia_paths=frozenset())
+        self.mock_condition_waiter.wait_for_available_upload_slot.side_effect = (
+            sia_conditions.WaitInterruptedError('dummy interruption'))
+        queue = upload_queue.from_upload_jobs_and_snapshot(
+            upload_jobs, renter_snapshot)
+        uploader = dataset_uploader.DatasetUploader(
+            queue, self.mock_sia_client, self.mock_condition_waiter,
+            self.mock_concurrency_controller, self.mock_upload_journal,
+            self.mock_latency_tracker, 2, self.exit_event)
+
+        with self.assertRaises(sia_conditions.WaitInterruptedError):
+            uploader.upload()
+        self.assertFalse(self.mock_sia_api_impl.set_renter_upload.called)
+
+    def test_stops_waiting_workers_when_a_worker_fails(self):
+        upload_jobs = [
+            jobs.Job(local_path='/dummy-path/a.txt', sia_path='a.txt'),
+            jobs.Job(local_path='/dummy-path/b.txt', sia_path='b.txt'),
+        ]
+        renter_snapshot = renter_poller.Snapshot(
+            uploads_in_progress=0,
+            uploaded_bytes=0,
+            sia_paths=frozenset(),
+            uploading_sia_paths=frozenset())
+        self.mock_sia_api_impl.set_renter_upload.return_value = True
+        slot_calls = []
+        waiting_for_slot = threading.Event()
+        timed_out_waits = []
+
+        def wait_for_available_upload_slot():
+            slot_calls.append(None)
+            if len(slot_calls) == 1:
+                return
+            # Sia never frees another slot, so only the exit event ends the
+            # wait.
+            waiting_for_slot.set()
+            if not self.exit_event.wait(5):
+                timed_out_waits.append(None)
+            raise sia_conditions.WaitInterruptedError('dummy interruption')
+
+        def fail_record_submitted(_):
+            waiting_for_slot.wait(5)
+            raise ValueError('dummy journal error')
+
+        self.mock_condition_waiter.wait_for_available_upload_slot.side_effect = (
+            wait_for_available_upload_slot)
+        self.mock_upload_journal.record_submitted.side_effect = (
+            fail_record_submitted)
+        queue = upload_queue.from_upload_jobs_and_snapshot(
+            upload_jobs, renter_snapshot)
+        uploader = dataset_uploader.DatasetUploader(
+            queue, self.mock_sia_client, self.mock_condition_waiter,
+            self.mock_concurrency_controller, self.mock_upload_journal,
+            self.mock_latency_tracker, 2, self.exit_event)
+
+        with self.assertRaises(ValueError):
+            uploader.upload()
+        self.assertEqual([], timed_out_waits)
@@ -0,0 +1,105 @@
+import unittest
+
+from sia_load_tester import event_loop
+
+
+class EventLoopTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.loop = event_loop.EventLoop(lambda: self.now, self.advance_time)
+
+    def advance_time(self, seconds):
+        self.now += seconds
+
+    def test_coroutine_result_comes_from_return(self):
+
+        def add(a, b):
+            yield self.loop.sleep(0)
+            raise event_loop.Return(a + b)
+
+        self.assertEqual(5,
+                         self.loop.run_until_complete(
+                             self.loop.spawn(add(2, 3))))
+
+    def test_coroutine_receives_results_of_nested_coroutines(self):
+
+        def double(value):
+            yield self.loop.sleep(1)
+            raise event_loop.Return(value * 2)
+
+        def quadruple(value):
+            doubled = yield self.loop.spawn(double(value))
+            quadrupled = yield self.loop.spawn(double(doubled))
+            raise event_loop.Return(quadrupled)
+
+        self.assertEqual(12,
+                         self.loop.run_until_complete(
+                             self.loop.spawn(quadruple(3))))
+        self.assertEqual(2.0, self.now)
+
+    def test_exceptions_propagate_into_waiting_coroutine(self):
+
+        def fail():
+            yield self.loop.sleep(0)
+            raise ValueError('dummy error')
+
+        def catch():
+            try:
+                yield self.loop.spawn(fail())
+            except ValueError as e:
+                raise event_loop.Return(e.message)
+
+        self.assertEqual('dummy error',
+                         self.loop.run_until_complete(self.loop.spawn(catch())))
+
+    def test_run_until_complete_raises_uncaught_coroutine_exception(self):
+
+        def fail():
+            yield self.loop.sleep(0)
+            raise ValueError('dummy error')
+
+        with self.assertRaises(ValueError):
+            self.loop.run_until_complete(self.loop.spawn(fail()))
+
+    def test_sleeping_coroutines_wake_in_deadline_order(self):
+        woken = []
+
+        def sleep_then_record(seconds):
+            yield self.loop.sleep(seconds)
+            woken.append(seconds)
+
+        tasks = [self.loop.spawn(sleep_then_record(s)) for s in (3, 1, 2)]
+        for task in tasks:
+            self.loop.run_until_complete(task)
+
+        self.assertEqual([1, 2, 3], woken)
+        self.assertEqual(3.0, self.now)
+
+    def test_with_timeout_is_true_when_future_completes_first(self):
+        future = event_loop.Future()
+        self.loop.call_later(1, future.set_result, None)
+
+        self.assertTrue(
+            self.loop.run_until_complete(self.loop.with_timeout(future, 5)))
+        self.assertEqual(1.0, self.now)
+
+    def test_with_timeout_is_false_when_timeout_elapses_first(self):
+        future = event_loop.Future()
+
+        self.assertFalse(
+            self.loop.run_until_complete(self.loop.with_timeout(future, 5)))
+        self.assertEqual(5.0, self.now)
+
+    def test_run_until_complete_raises_error_when_future_can_never_complete(
+            self):
+        with self.assertRaises(event_loop.Error):
+            self.loop.run_until_complete(event_loop.Future())
+
+    def test_coroutine_that_yields_non_future_fails(self):
+
+        def yield_value():
+            yield 5
+
+        with self.assertRaises(event_loop.Error):
+            self.loop.run_until_complete(self.loop.spawn(yield_value()))
@@ -0,0 +1,177 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from sia_load_tester import fake_siad
+from sia_load_tester import sia_client as sc
+
+
+def make_config(**overrides):
+    config = fake_siad.Config(
+        upload_bandwidth_mbps=8.0,  # 1 MB/s
+        redundancy=1.0,
+        contract_count=50,
+        contract_formation_seconds=0,
+        wallet_balance_hastings=1000L,
+        upload_error_rate=0.0,
+        connection_error_rate=0.0)
+    return config._replace(**overrides)
+
+
+class SimulatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.mock_time_fn = mock.Mock(return_value=0.0)
+        self.mock_random_fn = mock.Mock(return_value=0.5)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def make_file(self, filename, size):
+        path = os.path.join(self.test_dir, filename)
+        with open(path, 'wb') as f:
+            f.write('x' * size)
+        return path
+
+    def make_simulator(self, **config_overrides):
+        return fake_siad.Simulator(
+            make_config(**config_overrides), self.mock_time_fn,
+            self.mock_random_fn)
+
+    def upload_progress(self, simulator):
+        return [(f[u'siapath'], f[u'uploadedbytes'], f[u'uploadprogress'])
+                for f in simulator.renter_files()[u'files']]
+
+    def test_upload_progresses_with_bandwidth(self):
+        simulator = self.make_simulator()
+        simulator.upload('a.txt', self.make_file('a.txt', 2000000))
+
+        self.mock_time_fn.return_value = 0.5
+        self.assertEqual([('a.txt', 500000, 25.0)],
+                         self.upload_progress(simulator))
+        self.mock_time_fn.return_value = 10.0
+        self.assertEqual([('a.txt', 2000000, 100.0)],
+                         self.upload_progress(simulator))
+
+    def test_bandwidth_is_shared_between_uploads(self):
+        simulator = self.make_simulator()
+        simulator.upload('a.txt', self.make_file('a.txt', 250000))
+        simulator.upload('b.txt', self.make_file('b.txt', 1000000))
+
+        # a.txt finishes after 0.5s and b.txt gets its unused bandwidth.
+        self.mock_time_fn.return_value = 1.0
+        self.assertEqual([('a.txt', 250000, 100.0), ('b.txt', 750000, 75.0)],
+                         self.upload_progress(simulator))
+
+    def test_redundancy_counts_towards_uploaded_bytes(self):
+        simulator = self.make_simulator(redundancy=2.0)
+        simulator.upload('a.txt', self.make_file('a.txt', 1000000))
+
+        self.mock_time_fn.return_value = 1.0
+        self.assertEqual([('a.txt', 1000000, 50.0)],
+                         self.upload_progress(simulator))
+
+    def test_empty_file_upload_is_complete_immediately(self):
+        simulator = self.make_simulator()
+        simulator.upload('a.txt', self.make_file('a.txt', 0))
+
+        self.assertEqual([('a.txt', 0, 100.0)], self.upload_progress(simulator))
+
+    def test_upload_rejects_duplicate_sia_path(self):
+        simulator = self.make_simulator()
+        simulator.upload('a.txt', self.make_file('a.txt', 10))
+
+        with self.assertRaises(fake_siad.ApiError):
+            simulator.upload('a.txt', self.make_file('b.txt', 10))
+
+    def test_upload_rejects_missing_local_file(self):
+        simulator = self.make_simulator()
+
+        with self.assertRaises(fake_siad.ApiError):
+            simulator.upload('a.txt', os.path.join(self.test_dir, 'missing'))
+
+    def test_upload_injects_errors_at_configured_rate(self):
+        simulator = self.make_simulator(upload_error_rate=0.25)
+        self.mock_random_fn.return_value = 0.1
+
+        with self.assertRaises(fake_siad.ApiError):
+            simulator.upload('a.txt', self.make_file('a.txt', 10))
+        self.assertEqual([], self.upload_progress(simulator))
+
+    def test_contracts_form_gradually_after_allowance_is_set(self):
+        simulator = self.make_simulator(contract_formation_seconds=100)
+        self.assertEqual(0, len(simulator.renter_contracts()[u'contracts']))
+
+        simulator.set_allowance(1000L, 12960)
+        self.mock_time_fn.return_value = 50.0
+        self.assertEqual(25, len(simulator.renter_contracts()[u'contracts']))
+        self.mock_time_fn.return_value = 500.0
+        self.assertEqual(50, len(simulator.renter_contracts()[u'contracts']))
+
+    def test_set_allowance_rejects_funds_above_wallet_balance(self):
+        simulator = self.make_simulator(wallet_balance_hastings=1000L)
+
+        with self.assertRaises(fake_siad.ApiError):
+            simulator.set_allowance(1001L, 12960)
+
+
+class ServerTest(unittest.TestCase):
+    """Exercises the fake Sia API end-to-end through a real SiaClient."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.simulator = fake_siad.Simulator(
+            make_config(),
+            mock.Mock(return_value=0.0),
+            mock.Mock(return_value=0.5))
+        self.server = fake_siad.make_server(self.simulator, 0)
+        fake_siad.serve_async(self.server)
+        self.session = sc._make_session(1)
+        self.sia_client = sc.SiaClient(
+            sc.PooledSia(self.session, 'http://localhost',
+                         self.server.server_address[1]), mock.Mock())
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.test_dir)
+
+    def test_client_reads_node_state(self):
+        self.assertTrue(self.sia_client.is_blockchain_synced())
+        self.assertFalse(self.sia_client.is_wallet_locked())
+        self.assertEqual(1000L, self.sia_client.wallet_balance())
+        self.assertEqual(0L, self.sia_client.allowance_budget())
+        self.assertEqual(0, self.sia_client.contract_count())
+
+    def test_client_sets_allowance_and_forms_contracts(self):
+        self.assertTrue(self.sia_client.set_allowance_budget(1000L))
+
+        self.assertEqual(1000L, self.sia_client.allowance_budget())
+        self.assertEqual(50, self.sia_client.contract_count())
+
+    def test_client_uploads_file(self):
+        local_path = os.path.join(self.test_dir, 'a.txt')
+        open(local_path, 'w').close()
+
+        self.assertTrue(
+            self.sia_client.upload_file_async(local_path, 'foo/a.txt'))
+        self.assertFalse(
+            self.sia_client.upload_file_async(local_path, 'foo/a.txt'))
+        self.assertEqual(
+            [u'foo/a.txt'],
+            [f[u'siapath'] for f in self.sia_client.renter_files()])
+
+    def test_client_streams_renter_files(self):
+        local_path = os.path.join(self.test_dir, 'a.txt')
+        open(local_path, 'w').close()
+        for i in xrange(3):
+            self.sia_client.upload_file_async(local_path, '%d.txt' % i)
+
+        self.assertEqual(
+            [u'0.txt', u'1.txt', u'2.txt'],
+            [f[u'siapath'] for f in self.sia_client.iter_renter_files()])
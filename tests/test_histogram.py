@@ -0,0 +1,42 @@
+import unittest
+
+from sia_load_tester import histogram
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_empty_histogram_has_no_percentiles(self):
+        latency_histogram = histogram.Histogram()
+
+        self.assertEqual(0, len(latency_histogram))
+        self.assertIsNone(latency_histogram.percentile(50.0))
+        self.assertIsNone(latency_histogram.max())
+
+    def test_small_values_are_exact(self):
+        latency_histogram = histogram.Histogram()
+        for milliseconds in xrange(1, 11):
+            latency_histogram.record(milliseconds / 1000.0)
+
+        self.assertEqual(10, len(latency_histogram))
+        self.assertAlmostEqual(0.005, latency_histogram.percentile(50.0))
+        self.assertAlmostEqual(0.009, latency_histogram.percentile(90.0))
+        self.assertAlmostEqual(0.010, latency_histogram.percentile(99.9))
+        self.assertAlmostEqual(0.010, latency_histogram.max())
+
+    def test_large_values_are_within_relative_error(self):
+        latency_histogram = histogram.Histogram()
+        for seconds in xrange(1, 1001):
+            latency_histogram.record(seconds)
+
+        for percentile, expected in [(50.0, 500), (90.0, 900), (99.0, 990),
+                                     (99.9, 999)]:
+            actual = latency_histogram.percentile(percentile)
+            self.assertGreaterEqual(actual, expected)
+            self.assertLessEqual(actual, expected * (1 + 1.0 / 32))
+        self.assertEqual(1000.0, latency_histogram.max())
+
+    def test_records_negative_latencies_as_zero(self):
+        latency_histogram = histogram.Histogram()
+        latency_histogram.record(-5.0)
+
+        self.assertEqual(0.0, latency_histogram.percentile(50.0))
@@ -0,0 +1,183 @@
+import unittest
+
+import mock
+
+from sia_load_tester import job_ordering
+from sia_load_tester import upload_latency
+
+_MiB = 2**20
+
+
+def make_job(sia_path, file_size):
+    return mock.Mock(
+        sia_path=sia_path,
+        local_path='/dummy-root/' + sia_path,
+        file_size=file_size)
+
+
+def drain(ordering):
+    sia_paths = []
+    job = ordering.pop()
+    while job is not None:
+        sia_paths.append(job.sia_path)
+        job = ordering.pop()
+    return sia_paths
+
+
+class MakeOrderingTest(unittest.TestCase):
+
+    def test_rejects_unknown_ordering(self):
+        with self.assertRaises(job_ordering.InvalidOrderingError):
+            job_ordering.make_ordering('dummy-ordering')
+
+
+class ParseSizeMixTest(unittest.TestCase):
+
+    def test_parses_weights_by_size_class(self):
+        self.assertEqual({
+            upload_latency.SIZE_CLASS_SMALL: 1,
+            upload_latency.SIZE_CLASS_LARGE: 3,
+        }, job_ordering.parse_size_mix('small=1, large=3'))
+
+    def test_rejects_malformed_size_mixes(self):
+        for size_mix in ('tiny=1', 'small=one', 'small=-1', 'small=0'):
+            with self.assertRaises(job_ordering.InvalidSizeMixError):
+                job_ordering.parse_size_mix(size_mix)
+
+
+class OrderJobsTest(unittest.TestCase):
+
+    def test_orders_jobs_within_window(self):
+        upload_jobs = [
+            make_job('a.txt', 1),
+            make_job('b.txt', 5),
+            make_job('c.txt', 10),
+            make_job('d.txt', 20),
+        ]
+        mock_stat_cache = mock.Mock()
+        mock_stat_cache.size.side_effect = lambda job: job.file_size
+        ordering = job_ordering.SizeOrdering(
+            mock_stat_cache, largest_first=True)
+        ordering.window_jobs = 2
+
+        self.assertEqual(['b.txt', 'c.txt', 'd.txt', 'a.txt'], [
+            job.sia_path
+            for job in job_ordering.order_jobs(upload_jobs, ordering)
+        ])
+
+    def test_reads_jobs_lazily(self):
+        upload_jobs = iter([make_job('a.txt', 1), make_job('b.txt', 5)])
+
+        ordered_jobs = job_ordering.order_jobs(upload_jobs,
+                                               job_ordering.FifoOrdering())
+
+        self.assertEqual('a.txt', next(ordered_jobs).sia_path)
+        self.assertEqual(['b.txt'], [job.sia_path for job in upload_jobs])
+
+
+class StatCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_stat_fn = mock.Mock()
+        self.mock_stat_fn.return_value.st_size = 123
+        self.stat_cache = job_ordering.StatCache(self.mock_stat_fn)
+
+    def test_uses_size_from_job_when_known(self):
+        self.assertEqual(5, self.stat_cache.size(make_job('a.txt', 5)))
+        self.assertFalse(self.mock_stat_fn.called)
+
+    def test_stats_each_file_of_unknown_size_once(self):
+        self.assertEqual(123, self.stat_cache.size(make_job('a.txt', None)))
+        self.assertEqual(123, self.stat_cache.size(make_job('a.txt', None)))
+
+        self.mock_stat_fn.assert_called_once_with('/dummy-root/a.txt')
+
+    def test_unreadable_file_has_unknown_size(self):
+        self.mock_stat_fn.side_effect = OSError('dummy stat error')
+
+        self.assertIsNone(self.stat_cache.size(make_job('a.txt', None)))
+
+
+class FifoOrderingTest(unittest.TestCase):
+
+    def test_hands_out_jobs_in_order_added(self):
+        ordering = job_ordering.FifoOrdering()
+        for sia_path, size in (('a.txt', 5), ('b.txt', 1), ('c.txt', 10)):
+            ordering.push(make_job(sia_path, size))
+
+        self.assertEqual(['a.txt', 'b.txt', 'c.txt'], drain(ordering))
+
+
+class SizeOrderingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.jobs = [
+            make_job('a.txt', 5),
+            make_job('b.txt', None),
+            make_job('c.txt', 10),
+            make_job('d.txt', 1),
+            make_job('e.txt', 10),
+        ]
+        self.mock_stat_cache = mock.Mock()
+        self.mock_stat_cache.size.side_effect = lambda job: job.file_size
+
+    def test_largest_first(self):
+        ordering = job_ordering.SizeOrdering(
+            self.mock_stat_cache, largest_first=True)
+        for job in self.jobs:
+            ordering.push(job)
+
+        self.assertEqual(['c.txt', 'e.txt', 'a.txt', 'd.txt', 'b.txt'],
+                         drain(ordering))
+
+    def test_smallest_first(self):
+        ordering = job_ordering.SizeOrdering(
+            self.mock_stat_cache, largest_first=False)
+        for job in self.jobs:
+            ordering.push(job)
+
+        self.assertEqual(['d.txt', 'a.txt', 'c.txt', 'e.txt', 'b.txt'],
+                         drain(ordering))
+
+
+class MixOrderingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_stat_cache = mock.Mock()
+        self.mock_stat_cache.size.side_effect = lambda job: job.file_size
+
+    def push_jobs(self, ordering, prefix, count, size):
+        for i in xrange(count):
+            ordering.push(make_job('%s%d' % (prefix, i), size))
+
+    def test_round_robin_alternates_between_size_classes(self):
+        ordering = job_ordering.make_ordering(job_ordering.ORDERING_ROUND_ROBIN)
+        self.push_jobs(ordering, 'small', 3, 1)
+        self.push_jobs(ordering, 'large', 2, 100 * _MiB)
+        self.push_jobs(ordering, 'unknown', 1, None)
+
+        self.assertEqual(
+            ['small0', 'large0', 'unknown0', 'small1', 'large1', 'small2'],
+            drain(ordering))
+
+    def test_interleaves_size_classes_to_target_weights(self):
+        ordering = job_ordering.MixOrdering(self.mock_stat_cache, {
+            upload_latency.SIZE_CLASS_SMALL: 1,
+            upload_latency.SIZE_CLASS_LARGE: 2,
+        })
+        self.push_jobs(ordering, 'small', 3, 1)
+        self.push_jobs(ordering, 'large', 6, 100 * _MiB)
+
+        self.assertEqual([
+            'large0', 'small0', 'large1', 'large2', 'small1', 'large3',
+            'large4', 'small2', 'large5'
+        ], drain(ordering))
+
+    def test_serves_unweighted_size_classes_last(self):
+        ordering = job_ordering.MixOrdering(self.mock_stat_cache, {
+            upload_latency.SIZE_CLASS_LARGE: 1,
+        })
+        self.push_jobs(ordering, 'small', 1, 1)
+        self.push_jobs(ordering, 'large', 2, 100 * _MiB)
+
+        self.assertEqual(['large0', 'large1', 'small0'], drain(ordering))
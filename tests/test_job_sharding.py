@@ -0,0 +1,136 @@
+import threading
+import unittest
+
+import mock
+
+from sia_load_tester import job_sharding
+
+
+def make_job(sia_path):
+    return mock.Mock(sia_path=sia_path, local_path='/dummy-root/' + sia_path)
+
+
+class MakeSharderTest(unittest.TestCase):
+
+    def test_rejects_unknown_sharding(self):
+        with self.assertRaises(job_sharding.InvalidShardingError):
+            job_sharding.make_sharder('dummy-sharding', [], ['a:9980'])
+
+
+class HashRingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sia_paths = [u'file-%d.txt' % i for i in xrange(1000)]
+
+    def test_spreads_siapaths_across_nodes(self):
+        ring = job_sharding.HashRing(['a:9980', 'b:9980', 'c:9980'])
+
+        counts = [0, 0, 0]
+        for sia_path in self.sia_paths:
+            counts[ring.node_index(sia_path)] += 1
+
+        for count in counts:
+            self.assertGreater(count, 200)
+
+    def test_assigns_siapaths_by_node_name_not_position(self):
+        ring = job_sharding.HashRing(['a:9980', 'b:9980'])
+        reversed_ring = job_sharding.HashRing(['b:9980', 'a:9980'])
+
+        for sia_path in self.sia_paths:
+            self.assertEqual(1 - ring.node_index(sia_path),
+                             reversed_ring.node_index(sia_path))
+
+    def test_removing_node_moves_only_its_siapaths(self):
+        ring = job_sharding.HashRing(['a:9980', 'b:9980', 'c:9980'])
+        smaller_ring = job_sharding.HashRing(['a:9980', 'b:9980'])
+
+        for sia_path in self.sia_paths:
+            node_index = ring.node_index(sia_path)
+            if node_index != 2:
+                self.assertEqual(node_index, smaller_ring.node_index(sia_path))
+
+    def test_hashes_unicode_siapaths(self):
+        ring = job_sharding.HashRing(['a:9980', 'b:9980'])
+
+        self.assertEqual(
+            ring.node_index(u'\xe9.txt'), ring.node_index(u'\xe9.txt'))
+
+
+class HashSharderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_hash_ring = mock.Mock()
+        self.mock_hash_ring.node_index.side_effect = (
+            lambda sia_path: int(sia_path[0]))
+
+    def test_hands_each_node_the_jobs_it_owns(self):
+        jobs = [make_job(p) for p in ('0-a', '1-b', '1-c', '0-d', '1-e')]
+        sharder = job_sharding.HashSharder(jobs, self.mock_hash_ring)
+
+        self.assertEqual([jobs[0], jobs[3]], list(sharder.jobs_for(0)))
+        self.assertEqual([jobs[1], jobs[2], jobs[4]], list(sharder.jobs_for(1)))
+
+    def test_reads_jobs_lazily(self):
+        jobs = [make_job('0-a'), make_job('1-b'), make_job('0-c')]
+        mock_upload_jobs = iter(jobs)
+        sharder = job_sharding.HashSharder(mock_upload_jobs,
+                                           self.mock_hash_ring)
+
+        self.assertEqual(jobs[0], next(sharder.jobs_for(0)))
+        self.assertEqual([jobs[1], jobs[2]], list(mock_upload_jobs))
+
+    def test_waits_for_owner_with_too_many_pending_jobs_to_catch_up(self):
+        jobs = [make_job(p) for p in ('1-a', '1-b', '1-c', '0-d')]
+        sharder = job_sharding.HashSharder(
+            jobs, self.mock_hash_ring, max_pending_jobs=2)
+        node_0_jobs = []
+        reader = threading.Thread(
+            target=lambda: node_0_jobs.extend(sharder.jobs_for(0)))
+        reader.daemon = True
+        reader.start()
+        node_1_jobs = sharder.jobs_for(1)
+
+        reader.join(0.1)
+        self.assertTrue(reader.is_alive())
+        self.assertEqual(jobs[0], next(node_1_jobs))
+        reader.join(5)
+        self.assertFalse(reader.is_alive())
+        self.assertEqual([jobs[3]], node_0_jobs)
+        self.assertEqual([jobs[1], jobs[2]], list(node_1_jobs))
+
+    def test_stops_waiting_for_owner_whose_jobs_are_closed(self):
+        jobs = [make_job(p) for p in ('1-a', '1-b', '1-c', '0-d')]
+        sharder = job_sharding.HashSharder(
+            jobs, self.mock_hash_ring, max_pending_jobs=1)
+        node_1_jobs = sharder.jobs_for(1)
+        node_0_jobs = []
+        # Start node 1's iterator, as a node does when it begins uploading.
+        self.assertEqual(jobs[0], next(node_1_jobs))
+        reader = threading.Thread(
+            target=lambda: node_0_jobs.extend(sharder.jobs_for(0)))
+        reader.daemon = True
+        reader.start()
+
+        reader.join(0.1)
+        self.assertTrue(reader.is_alive())
+        node_1_jobs.close()
+        reader.join(5)
+        self.assertFalse(reader.is_alive())
+        # Node 1 will never read its jobs, so node 0 takes the job it was
+        # holding for it.
+        self.assertEqual([jobs[2], jobs[3]], node_0_jobs)
+
+
+class PullSharderTest(unittest.TestCase):
+
+    def test_hands_next_job_to_whichever_node_asks(self):
+        jobs = [make_job(p) for p in ('a', 'b', 'c', 'd')]
+        sharder = job_sharding.PullSharder(jobs)
+        node_a_jobs = sharder.jobs_for(0)
+        node_b_jobs = sharder.jobs_for(1)
+
+        self.assertEqual(jobs[0], next(node_a_jobs))
+        self.assertEqual(jobs[1], next(node_b_jobs))
+        self.assertEqual(jobs[2], next(node_b_jobs))
+        self.assertEqual([jobs[3]], list(node_a_jobs))
+        self.assertEqual([], list(node_b_jobs))
@@ -19,7 +19,10 @@ class GenerateUploadJobsTest(unittest.TestCase):
 
     def test_generates_empty_job_list_when_dataset_is_empty(self):
         input_dataset = dataset.Dataset('/dummy-path', [])
-        self.assertEqual([], jobs.from_dataset(input_dataset, dataset_copies=1))
+        self.assertEqual([],
+                         list(
+                             jobs.from_dataset(input_dataset,
+                                               dataset_copies=1)))
 
     def test_generates_correct_jobs_from_dataset(self):
         input_dataset = dataset.Dataset('/dummy-path', [
@@ -33,7 +36,7 @@ class GenerateUploadJobsTest(unittest.TestCase):
                 local_path='/dummy-path/fiz/baz/c.txt',
                 sia_path='fiz/baz/c.txt'),
             jobs.Job(local_path='/dummy-path/foo/b.txt', sia_path='foo/b.txt'),
-        ], jobs.from_dataset(input_dataset, dataset_copies=1))
+        ], list(jobs.from_dataset(input_dataset, dataset_copies=1)))
 
     def test_zero_dataset_copies_raises_exception(self):
         input_dataset = dataset.Dataset('/dummy-path', [
@@ -79,7 +82,7 @@ class GenerateUploadJobsTest(unittest.TestCase):
             jobs.Job(
                 local_path='/dummy-path/fiz/baz/c.txt',
                 sia_path='fiz/baz/c-00000002.txt'),
-        ], jobs.from_dataset(input_dataset, dataset_copies=3))
+        ], list(jobs.from_dataset(input_dataset, dataset_copies=3)))
 
     # Patch out relpath to simulate a Windows environment.
     @mock.patch.object(os.path, 'relpath')
@@ -99,7 +102,25 @@ class GenerateUploadJobsTest(unittest.TestCase):
                 sia_path='fiz/baz/c.txt'),
             jobs.Job(
                 local_path=r'C:\dummy-root\foo\b.txt', sia_path='foo/b.txt'),
-        ], jobs.from_dataset(input_dataset, dataset_copies=1))
+        ], list(jobs.from_dataset(input_dataset, dataset_copies=1)))
+
+    def test_generates_jobs_lazily(self):
+        input_dataset = dataset.Dataset('/dummy-path', [
+            '/dummy-path/a.txt',
+            '/dummy-path/b.txt',
+        ])
+        upload_jobs = jobs.from_dataset(
+            input_dataset, dataset_copies=jobs.MAX_DATASET_COPIES)
+
+        self.assertEqual(
+            jobs.Job(local_path='/dummy-path/a.txt', sia_path='a-00000000.txt'),
+            next(upload_jobs))
+        self.assertEqual(
+            jobs.Job(local_path='/dummy-path/b.txt', sia_path='b-00000000.txt'),
+            next(upload_jobs))
+        self.assertEqual(
+            jobs.Job(local_path='/dummy-path/a.txt', sia_path='a-00000001.txt'),
+            next(upload_jobs))
 
 
 class JobTest(unittest.TestCase):
@@ -120,3 +141,110 @@ class JobTest(unittest.TestCase):
         self.assertEqual(0, a.failure_count)
         a.increment_failure_count()
         self.assertEqual(1, a.failure_count)
+
+    def test_job_has_no_instance_dict(self):
+        a = jobs.Job(local_path='/foo/bar.txt', sia_path='bar.txt')
+        with self.assertRaises(AttributeError):
+            a.__dict__
+
+
+class JobStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.input_dataset = dataset.Dataset('/dummy-path', [
+            '/dummy-path/a.txt',
+            '/dummy-path/fiz/baz/c.txt',
+            '/dummy-path/fiz/baz/d.txt',
+        ])
+
+    def test_length_counts_every_copy_of_every_file(self):
+        self.assertEqual(6,
+                         len(
+                             jobs.JobStore(
+                                 self.input_dataset, dataset_copies=2)))
+
+    def test_indexes_jobs_by_copy_then_file(self):
+        store = jobs.JobStore(self.input_dataset, dataset_copies=2)
+
+        self.assertEqual(
+            jobs.Job(local_path='/dummy-path/a.txt', sia_path='a-00000000.txt'),
+            store[0])
+        self.assertEqual(
+            jobs.Job(
+                local_path='/dummy-path/fiz/baz/d.txt',
+                sia_path='fiz/baz/d-00000000.txt'), store[2])
+        self.assertEqual(
+            jobs.Job(
+                local_path='/dummy-path/fiz/baz/c.txt',
+                sia_path='fiz/baz/c-00000001.txt'), store[4])
+        self.assertEqual(
+            jobs.Job(
+                local_path='/dummy-path/fiz/baz/d.txt',
+                sia_path='fiz/baz/d-00000001.txt'), store[-1])
+        with self.assertRaises(IndexError):
+            store[6]
+
+    def test_stores_each_directory_once(self):
+        store = jobs.JobStore(self.input_dataset, dataset_copies=1)
+        list(store)
+
+        self.assertEqual(['/dummy-path/', '/dummy-path/fiz/baz/'],
+                         store._directories)
+
+    @mock.patch.object(os.path, 'relpath', wraps=os.path.relpath)
+    def test_computes_relative_path_once_per_directory(self, relpath_patch):
+        store = jobs.JobStore(self.input_dataset, dataset_copies=2)
+
+        self.assertEqual([
+            'a-00000000.txt', 'fiz/baz/c-00000000.txt',
+            'fiz/baz/d-00000000.txt', 'a-00000001.txt',
+            'fiz/baz/c-00000001.txt', 'fiz/baz/d-00000001.txt'
+        ], [job.sia_path for job in store])
+        self.assertEqual(2, relpath_patch.call_count)
+
+    def test_stored_jobs_track_failure_counts(self):
+        job = jobs.JobStore(self.input_dataset, dataset_copies=1)[0]
+
+        job.increment_failure_count()
+
+        self.assertEqual(1, job.failure_count)
+        self.assertNotEqual(
+            jobs.Job(local_path='/dummy-path/a.txt', sia_path='a.txt'), job)
+
+    def test_records_file_sizes(self):
+        store = jobs.JobStore(
+            dataset.Dataset('/dummy-path', [
+                '/dummy-path/a.txt',
+                '/dummy-path/b.txt',
+            ], {
+                '/dummy-path/a.txt': 5000000000,
+            }),
+            dataset_copies=1)
+        list(store)
+
+        self.assertEqual(5000000000, store.file_size(0))
+        self.assertIsNone(store.file_size(1))
+        self.assertEqual(5000000000, store[0].file_size)
+        self.assertIsNone(store[1].file_size)
+
+    def test_yields_first_copy_while_dataset_is_still_streaming(self):
+        scanned_files = []
+
+        def scan():
+            for path in ['/dummy-path/a.txt', '/dummy-path/b.txt']:
+                scanned_files.append(path)
+                yield dataset.DatasetFile(path=path, size=1)
+
+        store = jobs.JobStore(
+            dataset.StreamingDataset('/dummy-path', scan()), dataset_copies=2)
+        store_jobs = iter(store)
+
+        self.assertEqual(
+            jobs.Job(local_path='/dummy-path/a.txt', sia_path='a-00000000.txt'),
+            next(store_jobs))
+        self.assertEqual(['/dummy-path/a.txt'], scanned_files)
+        self.assertEqual([
+            jobs.Job(local_path='/dummy-path/b.txt', sia_path='b-00000000.txt'),
+            jobs.Job(local_path='/dummy-path/a.txt', sia_path='a-00000001.txt'),
+            jobs.Job(local_path='/dummy-path/b.txt', sia_path='b-00000001.txt'),
+        ], list(store_jobs))
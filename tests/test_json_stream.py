@@ -0,0 +1,127 @@
+import json
+import unittest
+
+from sia_load_tester import json_stream
+
+
+def split_into_chunks(document, chunk_size):
+    return [
+        document[i:i + chunk_size] for i in xrange(0, len(document), chunk_size)
+    ]
+
+
+class IterArrayItemsTest(unittest.TestCase):
+
+    def test_yields_items_of_array_under_key(self):
+        document = json.dumps({
+            'files': [{
+                'siapath': 'a.txt',
+                'uploadprogress': 100
+            }, {
+                'siapath': 'b.txt',
+                'uploadprogress': 12.5
+            }]
+        })
+
+        self.assertEqual([{
+            u'siapath': u'a.txt',
+            u'uploadprogress': 100
+        }, {
+            u'siapath': u'b.txt',
+            u'uploadprogress': 12.5
+        }], list(json_stream.iter_array_items([document], u'files')))
+
+    def test_yields_same_items_regardless_of_chunk_boundaries(self):
+        items = [
+            12345, -1.5e10, u'str\xe9\\"ing', None, True, [1, [2, 3]], {
+                u'key': {
+                    u'nested': [u'value']
+                }
+            }
+        ]
+        document = json.dumps(
+            {
+                'before': [1, 2, {
+                    'files': 'decoy'
+                }],
+                'files': items,
+                'after': 'ignored'
+            },
+            indent=2)
+
+        for chunk_size in xrange(1, len(document) + 1):
+            self.assertEqual(items,
+                             list(
+                                 json_stream.iter_array_items(
+                                     split_into_chunks(document, chunk_size),
+                                     u'files')))
+
+    def test_yields_nothing_for_empty_array(self):
+        self.assertEqual([],
+                         list(
+                             json_stream.iter_array_items(['{"files": []}'],
+                                                          u'files')))
+
+    def test_yields_nothing_for_null(self):
+        self.assertEqual([],
+                         list(
+                             json_stream.iter_array_items(['{"files": null}'],
+                                                          u'files')))
+
+    def test_yields_nothing_when_key_is_missing(self):
+        self.assertEqual([],
+                         list(
+                             json_stream.iter_array_items(['{"other": [1, 2]}'],
+                                                          u'files')))
+        self.assertEqual([], list(
+            json_stream.iter_array_items(['{}'], u'files')))
+
+    def test_does_not_read_past_end_of_array(self):
+
+        def chunks():
+            yield '{"files": [1, 2]'
+            raise AssertionError('Read past end of array')
+
+        self.assertEqual([1, 2],
+                         list(json_stream.iter_array_items(chunks(), u'files')))
+
+    def test_raises_error_on_truncated_document(self):
+        with self.assertRaises(json_stream.MalformedJsonError):
+            list(
+                json_stream.iter_array_items(['{"files": [{"a": 1}, {"b"'],
+                                             u'files'))
+
+    def test_raises_error_when_value_is_not_an_array(self):
+        with self.assertRaises(json_stream.MalformedJsonError):
+            list(json_stream.iter_array_items(['{"files": 5}'], u'files'))
+
+    def test_raises_error_when_document_is_not_an_object(self):
+        with self.assertRaises(json_stream.MalformedJsonError):
+            list(json_stream.iter_array_items(['[1, 2]'], u'files'))
+
+
+class ArrayItemDecoderTest(unittest.TestCase):
+
+    def test_returns_items_as_chunks_complete_them(self):
+        decoder = json_stream.ArrayItemDecoder(u'files')
+
+        self.assertEqual([{u'a': 1}], decoder.feed('{"files": [{"a": 1}, {"b"'))
+        self.assertEqual([{u'b': 2}, 3], decoder.feed(': 2}, 3, 4'))
+        self.assertFalse(decoder.is_done())
+        self.assertEqual([4], decoder.feed(']'))
+
+        self.assertTrue(decoder.is_done())
+        decoder.close()
+
+    def test_ignores_chunks_after_array(self):
+        decoder = json_stream.ArrayItemDecoder(u'files')
+        decoder.feed('{"files": [1]')
+
+        self.assertEqual([], decoder.feed(', "files": [2]}'))
+
+    def test_close_raises_error_on_truncated_document(self):
+        decoder = json_stream.ArrayItemDecoder(u'files')
+        decoder.feed('{"files": [1, 2')
+
+        with self.assertRaises(json_stream.MalformedJsonError):
+            decoder.close()
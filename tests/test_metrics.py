@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import urllib2
+
+from sia_load_tester import metrics
+
+
+class RegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_renders_metrics_in_registration_order(self):
+        counter = self.registry.register(
+            metrics.Counter('requests_total', 'Number of requests.',
+                            ['method']))
+        gauge = self.registry.register(
+            metrics.Gauge('uploaded_bytes', 'Bytes uploaded.', []))
+        summary = self.registry.register(
+            metrics.Summary('call_seconds', 'Call time.', ['method']))
+        counter.inc(method='b')
+        counter.inc(method='a')
+        counter.inc(2, method='a')
+        gauge.set(1024)
+        summary.observe(0.5, method='a')
+        summary.observe(1.5, method='a')
+
+        self.assertEqual(
+            ('# HELP sia_load_tester_requests_total Number of requests.\n'
+             '# TYPE sia_load_tester_requests_total counter\n'
+             'sia_load_tester_requests_total{method="a"} 3\n'
+             'sia_load_tester_requests_total{method="b"} 1\n'
+             '# HELP sia_load_tester_uploaded_bytes Bytes uploaded.\n'
+             '# TYPE sia_load_tester_uploaded_bytes gauge\n'
+             'sia_load_tester_uploaded_bytes 1024\n'
+             '# HELP sia_load_tester_call_seconds Call time.\n'
+             '# TYPE sia_load_tester_call_seconds summary\n'
+             'sia_load_tester_call_seconds_count{method="a"} 2\n'
+             'sia_load_tester_call_seconds_sum{method="a"} 2.0\n'),
+            self.registry.render())
+
+    def test_unlabeled_metrics_start_at_zero(self):
+        self.registry.register(metrics.Gauge('contracts', 'Contracts.', []))
+
+        self.assertIn('sia_load_tester_contracts 0\n', self.registry.render())
+
+    def test_escapes_label_values(self):
+        counter = self.registry.register(
+            metrics.Counter('errors_total', 'Errors.', ['error']))
+        counter.inc(error=u'bad "quote"\\\n')
+
+        self.assertIn(
+            'sia_load_tester_errors_total{error="bad \\"quote\\"\\\\\\n"} 1\n',
+            self.registry.render())
+
+    def test_rejects_wrong_labels(self):
+        counter = self.registry.register(
+            metrics.Counter('errors_total', 'Errors.', ['error']))
+
+        with self.assertRaises(metrics.InvalidLabelsError):
+            counter.inc(method='a')
+
+    def test_rejects_duplicate_metric_names(self):
+        self.registry.register(metrics.Gauge('contracts', 'Contracts.', []))
+
+        with self.assertRaises(metrics.DuplicateMetricError):
+            self.registry.register(metrics.Gauge('contracts', 'Contracts.', []))
+
+    def test_runs_collectors_before_rendering(self):
+        gauge = self.registry.register(
+            metrics.Gauge('contracts', 'Contracts.', []))
+        self.registry.register_collector(lambda: gauge.set(50))
+
+        self.assertIn('sia_load_tester_contracts 50\n', self.registry.render())
+
+    def test_renders_despite_collector_errors(self):
+        self.registry.register(metrics.Gauge('contracts', 'Contracts.', []))
+
+        def failing_collector():
+            raise ValueError('dummy collector error')
+
+        self.registry.register_collector(failing_collector)
+
+        self.assertIn('sia_load_tester_contracts 0\n', self.registry.render())
+
+
+class ExporterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.registry = metrics.Registry()
+        self.gauge = self.registry.register(
+            metrics.Gauge('contracts', 'Contracts.', []))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_textfile_exporter_replaces_file(self):
+        output_path = os.path.join(self.temp_dir, 'metrics.prom')
+        exporter = metrics.TextfileExporter(output_path, self.registry)
+
+        exporter.write()
+        self.gauge.set(7)
+        exporter.write()
+
+        with open(output_path) as output_file:
+            self.assertEqual(self.registry.render(), output_file.read())
+        self.assertEqual(['metrics.prom'], os.listdir(self.temp_dir))
+
+    def test_textfile_exporter_writes_final_metrics_on_exit(self):
+        output_path = os.path.join(self.temp_dir, 'metrics.prom')
+        exporter = metrics.TextfileExporter(output_path, self.registry)
+        exit_event = threading.Event()
+        exit_event.set()
+        self.gauge.set(7)
+
+        exporter.export_until_exit(60, exit_event)
+
+        with open(output_path) as output_file:
+            self.assertIn('sia_load_tester_contracts 7\n', output_file.read())
+
+    def test_http_server_serves_metrics(self):
+        self.gauge.set(7)
+        server = metrics.start_http_server_async(0, self.registry)
+        try:
+            response = urllib2.urlopen(
+                'http://localhost:%d/metrics' % server.server_address[1])
+            self.assertEqual(self.registry.render(), response.read())
+        finally:
+            server.shutdown()
+            server.server_close()
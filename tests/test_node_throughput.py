@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from sia_load_tester import dataset_uploader
+from sia_load_tester import node_throughput
+
+
+def make_throughput(node, bytes_uploaded, elapsed_seconds):
+    return node_throughput.NodeThroughput(
+        node=node,
+        uploads_started=2,
+        upload_failures=1,
+        bytes_uploaded=bytes_uploaded,
+        elapsed_seconds=elapsed_seconds,
+        upload_mbps=bytes_uploaded * 8 / 1000000.0 / elapsed_seconds)
+
+
+class RecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_time_fn = mock.Mock(return_value=100.0)
+        self.recorder = node_throughput.Recorder('a:9980', self.mock_time_fn)
+
+    def test_adds_up_bytes_uploaded_by_each_poll(self):
+        self.recorder.record_changes(mock.Mock(bytes_uploaded=3000000))
+        self.recorder.record_changes(mock.Mock(bytes_uploaded=2000000))
+        self.mock_time_fn.return_value = 120.0
+
+        self.assertEqual(
+            node_throughput.NodeThroughput(
+                node='a:9980',
+                uploads_started=5,
+                upload_failures=1,
+                bytes_uploaded=5000000,
+                elapsed_seconds=20.0,
+                upload_mbps=2.0),
+            self.recorder.throughput(
+                dataset_uploader.UploadStats(
+                    uploads_started=5,
+                    upload_failures=1,
+                    scheduler_idle_seconds=0.0)))
+
+    def test_exports_uploaded_bytes_by_node(self):
+        self.recorder.record_snapshot(mock.Mock(uploaded_bytes=500))
+
+        self.assertEqual(
+            500, node_throughput.NODE_UPLOADED_BYTES.value(node='a:9980'))
+
+    def test_sends_samples_to_sample_fn(self):
+        mock_sample_fn = mock.Mock()
+        recorder = node_throughput.Recorder('a:9980', self.mock_time_fn,
+                                            mock_sample_fn)
+
+        recorder.record_snapshot(mock.Mock(uploaded_bytes=500))
+
+        mock_sample_fn.assert_called_once_with(
+            node_throughput.ThroughputSample(node='a:9980', uploaded_bytes=500))
+
+
+class AggregateTest(unittest.TestCase):
+
+    def test_combines_nodes_uploading_in_parallel(self):
+        self.assertEqual(
+            node_throughput.NodeThroughput(
+                node=node_throughput.ALL_NODES,
+                uploads_started=4,
+                upload_failures=2,
+                bytes_uploaded=8000000,
+                elapsed_seconds=20.0,
+                upload_mbps=3.2),
+            node_throughput.aggregate([
+                make_throughput('a:9980', 3000000, 10.0),
+                make_throughput('b:9980', 5000000, 20.0)
+            ]))
+
+    def test_reports_zero_speed_without_nodes(self):
+        self.assertEqual(0.0, node_throughput.aggregate([]).upload_mbps)
+
+
+class WriteThroughputsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_writes_throughputs_as_csv(self):
+        output_path = os.path.join(self.temp_dir, 'node_throughput.csv')
+
+        node_throughput.write_throughputs(
+            output_path, [make_throughput('a:9980', 3000000, 10.0)])
+
+        with open(output_path) as output_file:
+            self.assertEqual(
+                ('node,uploads_started,upload_failures,bytes_uploaded,'
+                 'elapsed_seconds,upload_mbps\r\n'
+                 'a:9980,2,1,3000000,10.000,2.400\r\n'), output_file.read())
@@ -1,10 +1,10 @@
-import datetime
 import threading
 import unittest
 
 import mock
 
 from sia_load_tester import progress
+from sia_load_tester import renter_poller
 
 # Arbitrarily-chosen timeout to make sure we don't get stuck in a deadlock
 # waiting for a test to complete.
@@ -15,10 +15,13 @@ class MonitorTest(unittest.TestCase):
 
     def setUp(self):
         self.mock_tracker = mock.Mock()
+        self.mock_tracker.recent_upload_mbps.return_value = None
+        self.mock_concurrency_controller = mock.Mock()
         self.mock_sleep_fn = mock.Mock()
         self.exit_event = threading.Event()
-        self.monitor = progress.Monitor(self.mock_tracker, self.mock_sleep_fn,
-                                        self.exit_event)
+        self.monitor = progress.Monitor(self.mock_tracker,
+                                        self.mock_concurrency_controller,
+                                        self.mock_sleep_fn, self.exit_event)
         self.monitor_thread = None
 
     def start_monitor_async(self):
@@ -41,6 +44,17 @@ class MonitorTest(unittest.TestCase):
         # minimum.
         self.assertEqual(3, self.mock_sleep_fn.call_count)
 
+    def test_reports_recent_throughput_to_concurrency_controller(self):
+        self.mock_tracker.bytes_uploaded_in_window.side_effect = [
+            None, None, progress.MINIMUM_PROGRESS_THRESHOLD - 1
+        ]
+        self.mock_tracker.recent_upload_mbps.side_effect = [None, 2.5]
+
+        self.monitor.monitor()
+
+        self.mock_concurrency_controller.record_throughput.assert_called_once_with(
+            2.5)
+
     def test_exits_when_exit_event_is_set(self):
         self.mock_tracker.bytes_uploaded_in_window.return_value = progress.MINIMUM_PROGRESS_THRESHOLD + 100
 
@@ -55,11 +69,18 @@ class TrackerTest(unittest.TestCase):
 
     def setUp(self):
         self.mock_files = []
-        mock_sia_client = mock.Mock()
-        mock_sia_client.renter_files.side_effect = lambda: self.mock_files
-        self.mock_time = datetime.datetime(1970, 1, 1, 0, 0, 0)
+        mock_renter_poller = mock.Mock()
+        mock_renter_poller.latest.side_effect = self.make_snapshot
+        self.mock_time = 0.0
         mock_time_fn = lambda: self.mock_time
-        self.tracker = progress.Tracker(mock_sia_client, mock_time_fn)
+        self.tracker = progress.Tracker(mock_renter_poller, mock_time_fn)
+
+    def make_snapshot(self):
+        return renter_poller.Snapshot(
+            uploads_in_progress=0,
+            uploaded_bytes=sum([f[u'uploadedbytes'] for f in self.mock_files]),
+            sia_paths=frozenset(),
+            uploading_sia_paths=frozenset())
 
     def test_returns_None_when_elapsed_time_is_less_than_time_window(self):
         self.mock_files = [
@@ -70,13 +91,13 @@ class TrackerTest(unittest.TestCase):
                 u'uploadedbytes': 200,
             },
         ]
-        self.mock_time = datetime.datetime(2018, 2, 13, 0, 0, 0)
+        self.mock_time = 1518480000.0
         self.assertIsNone(self.tracker.bytes_uploaded_in_window())
 
         self.mock_files[0][u'uploadedbytes'] = 106
         self.mock_files[1][u'uploadedbytes'] = 211
 
-        self.mock_time += datetime.timedelta(minutes=59, seconds=59)
+        self.mock_time += 59 * 60 + 59
         self.assertIsNone(self.tracker.bytes_uploaded_in_window())
 
     def test_returns_byte_delta_when_elapsed_time_equals_time_window(self):
@@ -88,13 +109,13 @@ class TrackerTest(unittest.TestCase):
                 u'uploadedbytes': 200,
             },
         ]
-        self.mock_time = datetime.datetime(2018, 2, 13, 0, 0, 0)
+        self.mock_time = 1518480000.0
         self.assertIsNone(self.tracker.bytes_uploaded_in_window())
 
         self.mock_files[0][u'uploadedbytes'] = 106
         self.mock_files[1][u'uploadedbytes'] = 211
 
-        self.mock_time += datetime.timedelta(hours=1)
+        self.mock_time += 60 * 60
         self.assertEqual(17, self.tracker.bytes_uploaded_in_window())
 
     def test_returns_byte_delta_of_most_recent_time_window(self):
@@ -106,17 +127,108 @@ class TrackerTest(unittest.TestCase):
                 u'uploadedbytes': 200,
             },
         ]
-        self.mock_time = datetime.datetime(2018, 2, 13, 0, 0, 0)
+        self.mock_time = 1518480000.0
         self.tracker.bytes_uploaded_in_window()
 
         self.mock_files[0][u'uploadedbytes'] = 106
         self.mock_files[1][u'uploadedbytes'] = 211
 
-        self.mock_time += datetime.timedelta(hours=1)
+        self.mock_time += 60 * 60
         self.tracker.bytes_uploaded_in_window()
 
         self.mock_files[0][u'uploadedbytes'] = 606
         self.mock_files[1][u'uploadedbytes'] = 711
 
-        self.mock_time += datetime.timedelta(hours=1)
+        self.mock_time += 60 * 60
         self.assertEqual(1000, self.tracker.bytes_uploaded_in_window())
+
+    def test_recent_upload_mbps_is_None_before_second_check(self):
+        self.mock_files = [{u'uploadedbytes': 100}]
+        self.mock_time = 1518480000.0
+        self.assertIsNone(self.tracker.recent_upload_mbps())
+
+        self.tracker.bytes_uploaded_in_window()
+
+        self.assertIsNone(self.tracker.recent_upload_mbps())
+
+    def test_recent_upload_mbps_measures_speed_since_previous_check(self):
+        self.mock_files = [{u'uploadedbytes': 0}]
+        self.mock_time = 1518480000.0
+        self.tracker.bytes_uploaded_in_window()
+
+        self.mock_files[0][u'uploadedbytes'] = 15000000
+        self.mock_time += 60
+        self.tracker.bytes_uploaded_in_window()
+
+        self.mock_files[0][u'uploadedbytes'] = 45000000
+        self.mock_time += 60
+        self.tracker.bytes_uploaded_in_window()
+
+        self.assertAlmostEqual(4.0, self.tracker.recent_upload_mbps())
+
+    def test_returns_byte_delta_of_window_with_frequent_checks(self):
+        self.mock_files = [{u'uploadedbytes': 0}]
+        self.mock_time = 1518480000.0
+        for _ in range(2 * 60 * 60):
+            self.mock_files[0][u'uploadedbytes'] += 5
+            self.mock_time += 1
+            self.tracker.bytes_uploaded_in_window()
+
+        self.mock_files[0][u'uploadedbytes'] += 5
+        self.mock_time += 1
+        self.assertEqual(5 * 60 * 60, self.tracker.bytes_uploaded_in_window())
+
+
+class HistoryBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.history = progress.HistoryBuffer(3)
+
+    def test_empty_buffer_has_no_entries(self):
+        self.assertEqual(0, len(self.history))
+        with self.assertRaises(IndexError):
+            self.history[0]
+        with self.assertRaises(IndexError):
+            self.history.pop_oldest()
+
+    def test_indexes_entries_from_oldest_and_newest(self):
+        self.history.append(10.0, 100)
+        self.history.append(20.0, 250)
+
+        self.assertEqual(2, len(self.history))
+        self.assertEqual(
+            progress.HistoryEntry(timestamp=10.0, uploaded_bytes=100),
+            self.history[0])
+        self.assertEqual(
+            progress.HistoryEntry(timestamp=20.0, uploaded_bytes=250),
+            self.history[-1])
+        with self.assertRaises(IndexError):
+            self.history[2]
+
+    def test_pop_oldest_evicts_oldest_entry(self):
+        self.history.append(10.0, 100)
+        self.history.append(20.0, 250)
+
+        self.history.pop_oldest()
+
+        self.assertEqual(1, len(self.history))
+        self.assertEqual(
+            progress.HistoryEntry(timestamp=20.0, uploaded_bytes=250),
+            self.history[0])
+
+    def test_append_evicts_oldest_entry_when_full(self):
+        for i in range(5):
+            self.history.append(float(i), i * 100)
+
+        self.assertEqual(3, len(self.history))
+        self.assertEqual(
+            progress.HistoryEntry(timestamp=2.0, uploaded_bytes=200),
+            self.history[0])
+        self.assertEqual(
+            progress.HistoryEntry(timestamp=4.0, uploaded_bytes=400),
+            self.history[-1])
+
+    def test_stores_byte_counts_beyond_32_bits_exactly(self):
+        self.history.append(10.0, 12345678901234)
+
+        self.assertEqual(12345678901234, self.history[0].uploaded_bytes)
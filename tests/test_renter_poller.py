@@ -0,0 +1,438 @@
+import threading
+import unittest
+
+import mock
+
+from sia_load_tester import circuit_breaker
+from sia_load_tester import renter_poller
+
+# Arbitrarily-chosen timeout to make sure we don't get stuck in a deadlock
+# waiting for a test to complete.
+WAIT_SECONDS = 0.5
+
+
+class SnapshotFromRenterFilesTest(unittest.TestCase):
+
+    def test_empty_file_list_produces_empty_snapshot(self):
+        self.assertEqual(
+            renter_poller.Snapshot(
+                uploads_in_progress=0,
+                uploaded_bytes=0,
+                sia_paths=frozenset(),
+                uploading_sia_paths=frozenset()),
+            renter_poller.snapshot_from_renter_files([]))
+
+    def test_aggregates_all_renter_files(self):
+        self.assertEqual(
+            renter_poller.Snapshot(
+                uploads_in_progress=2,
+                uploaded_bytes=1600,
+                sia_paths=frozenset([u'a.txt', u'b.txt', u'c.txt']),
+                uploading_sia_paths=frozenset([u'b.txt', u'c.txt'])),
+            renter_poller.snapshot_from_renter_files([
+                {
+                    u'siapath': u'a.txt',
+                    u'uploadprogress': 100,
+                    u'uploadedbytes': 1000,
+                    u'redundancy': 3.0,
+                },
+                {
+                    u'siapath': u'b.txt',
+                    u'uploadprogress': 50,
+                    u'uploadedbytes': 500,
+                    u'redundancy': 1.5,
+                },
+                {
+                    u'siapath': u'c.txt',
+                    u'uploadprogress': 10,
+                    u'uploadedbytes': 100,
+                    u'redundancy': 0.3,
+                },
+            ]))
+
+
+def renter_file(sia_path, upload_progress, uploaded_bytes):
+    return {
+        u'siapath': sia_path,
+        u'uploadprogress': upload_progress,
+        u'uploadedbytes': uploaded_bytes,
+        u'redundancy': renter_poller.TARGET_REDUNDANCY * upload_progress / 100,
+    }
+
+
+class RenterStateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_time_fn = mock.Mock(return_value=10.0)
+        self.renter_state = renter_poller.RenterState(self.mock_time_fn)
+
+    def test_first_update_reports_all_files_as_new(self):
+        changes = self.renter_state.update([
+            renter_file(u'a.txt', 100, 1000),
+            renter_file(u'b.txt', 50, 500),
+        ])
+
+        self.assertEqual(
+            renter_poller.RenterChanges(
+                poll_time=10.0,
+                new_sia_paths=[u'a.txt', u'b.txt'],
+                started_uploads=[u'a.txt', u'b.txt'],
+                completed_uploads=[
+                    renter_poller.UploadCompletion(
+                        sia_path=u'a.txt',
+                        first_seen_time=10.0,
+                        completed_time=10.0)
+                ],
+                redundant_uploads=[u'a.txt'],
+                removed_sia_paths=[],
+                bytes_uploaded=1500), changes)
+        self.assertEqual(
+            renter_poller.Snapshot(
+                uploads_in_progress=1,
+                uploaded_bytes=1500,
+                sia_paths=frozenset([u'a.txt', u'b.txt']),
+                uploading_sia_paths=frozenset([u'b.txt'])),
+            self.renter_state.snapshot())
+
+    def test_update_reports_completed_uploads_with_timestamps(self):
+        self.renter_state.update([
+            renter_file(u'a.txt', 10, 100),
+            renter_file(u'b.txt', 10, 100),
+        ])
+        self.mock_time_fn.return_value = 25.0
+        self.renter_state.update([
+            renter_file(u'a.txt', 60, 600),
+            renter_file(u'b.txt', 100, 1000),
+            renter_file(u'c.txt', 0, 0),
+        ])
+        self.mock_time_fn.return_value = 40.0
+
+        changes = self.renter_state.update([
+            renter_file(u'a.txt', 100, 1000),
+            renter_file(u'b.txt', 100, 1000),
+            renter_file(u'c.txt', 20, 200),
+        ])
+
+        self.assertEqual(
+            renter_poller.RenterChanges(
+                poll_time=40.0,
+                new_sia_paths=[],
+                started_uploads=[u'c.txt'],
+                completed_uploads=[
+                    renter_poller.UploadCompletion(
+                        sia_path=u'a.txt',
+                        first_seen_time=10.0,
+                        completed_time=40.0)
+                ],
+                redundant_uploads=[u'a.txt'],
+                removed_sia_paths=[],
+                bytes_uploaded=600), changes)
+        self.assertEqual(
+            renter_poller.Snapshot(
+                uploads_in_progress=1,
+                uploaded_bytes=2200,
+                sia_paths=frozenset([u'a.txt', u'b.txt', u'c.txt']),
+                uploading_sia_paths=frozenset([u'c.txt'])),
+            self.renter_state.snapshot())
+
+    def test_update_reports_redundancy_separately_from_completion(self):
+        self.renter_state.update([renter_file(u'a.txt', 90, 900)])
+
+        uploaded = self.renter_state.update([{
+            u'siapath': u'a.txt',
+            u'uploadprogress': 100,
+            u'uploadedbytes': 1000,
+            u'redundancy': 2.5,
+        }])
+        redundant = self.renter_state.update([renter_file(u'a.txt', 100, 1000)])
+        unchanged = self.renter_state.update([renter_file(u'a.txt', 100, 1000)])
+
+        self.assertEqual([u'a.txt'],
+                         [c.sia_path for c in uploaded.completed_uploads])
+        self.assertEqual([], uploaded.redundant_uploads)
+        self.assertEqual([], redundant.completed_uploads)
+        self.assertEqual([u'a.txt'], redundant.redundant_uploads)
+        self.assertEqual([], unchanged.redundant_uploads)
+
+    def test_update_reports_started_uploads_once(self):
+        self.renter_state.update([renter_file(u'a.txt', 0, 0)])
+
+        started = self.renter_state.update([renter_file(u'a.txt', 10, 100)])
+        progressed = self.renter_state.update([renter_file(u'a.txt', 20, 200)])
+
+        self.assertEqual([u'a.txt'], started.started_uploads)
+        self.assertEqual([], progressed.started_uploads)
+
+    def test_update_forgets_removed_files(self):
+        self.renter_state.update([
+            renter_file(u'a.txt', 100, 1000),
+            renter_file(u'b.txt', 50, 500),
+        ])
+
+        changes = self.renter_state.update([renter_file(u'a.txt', 100, 1000)])
+
+        self.assertEqual([u'b.txt'], changes.removed_sia_paths)
+        self.assertEqual(-500, changes.bytes_uploaded)
+        self.assertEqual(
+            renter_poller.Snapshot(
+                uploads_in_progress=0,
+                uploaded_bytes=1000,
+                sia_paths=frozenset([u'a.txt']),
+                uploading_sia_paths=frozenset()), self.renter_state.snapshot())
+
+    def test_unchanged_update_reuses_snapshot_sets(self):
+        renter_files = [
+            renter_file(u'a.txt', 100, 1000),
+            renter_file(u'b.txt', 50, 500),
+        ]
+        self.renter_state.update(renter_files)
+        previous = self.renter_state.snapshot()
+
+        changes = self.renter_state.update(renter_files)
+
+        self.assertEqual(0, changes.bytes_uploaded)
+        self.assertIs(previous.sia_paths,
+                      self.renter_state.snapshot().sia_paths)
+        self.assertIs(previous.uploading_sia_paths,
+                      self.renter_state.snapshot().uploading_sia_paths)
+
+
+class PollerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_files = []
+        self.mock_sia_client = mock.Mock()
+        self.mock_sia_client.iter_renter_files.side_effect = (
+            lambda: iter(self.mock_files))
+        self.mock_sleep_fn = mock.Mock()
+        self.exit_event = threading.Event()
+        self.mock_time_fn = mock.Mock(return_value=100.0)
+        self.poller = renter_poller.Poller(
+            self.mock_sia_client, self.mock_sleep_fn, self.mock_time_fn,
+            self.exit_event, 15)
+
+    def test_latest_polls_when_no_snapshot_is_available(self):
+        self.mock_files = [{
+            u'siapath': u'a.txt',
+            u'uploadprogress': 50,
+            u'uploadedbytes': 500,
+            u'redundancy': 1.5,
+        }]
+
+        self.assertEqual(
+            renter_poller.Snapshot(
+                uploads_in_progress=1,
+                uploaded_bytes=500,
+                sia_paths=frozenset([u'a.txt']),
+                uploading_sia_paths=frozenset([u'a.txt'])),
+            self.poller.latest())
+
+    def test_latest_reuses_snapshot_between_polls(self):
+        self.poller.latest()
+        self.poller.latest()
+        self.poller.latest()
+
+        self.assertEqual(1, self.mock_sia_client.iter_renter_files.call_count)
+
+    def test_poll_publishes_snapshot_to_subscribers(self):
+        callback_a = mock.Mock()
+        callback_b = mock.Mock()
+        self.poller.subscribe(callback_a)
+        self.poller.subscribe(callback_b)
+
+        snapshot = self.poller.poll()
+
+        callback_a.assert_called_once_with(snapshot)
+        callback_b.assert_called_once_with(snapshot)
+
+    def test_poll_records_metrics_under_node_name(self):
+        other_sia_client = mock.Mock()
+        other_sia_client.iter_renter_files.return_value = iter([{
+            u'siapath':
+            u'b.txt',
+            u'uploadprogress':
+            100,
+            u'uploadedbytes':
+            700,
+            u'redundancy':
+            3.0,
+        }])
+        self.mock_files = [{
+            u'siapath': u'a.txt',
+            u'uploadprogress': 50,
+            u'uploadedbytes': 500,
+            u'redundancy': 1.5,
+        }]
+        poller_a = renter_poller.Poller(
+            self.mock_sia_client,
+            self.mock_sleep_fn,
+            self.mock_time_fn,
+            self.exit_event,
+            15,
+            node_name='dummy-a:9980')
+        poller_b = renter_poller.Poller(
+            other_sia_client,
+            self.mock_sleep_fn,
+            self.mock_time_fn,
+            self.exit_event,
+            15,
+            node_name='dummy-b:9980')
+
+        poller_a.poll()
+        poller_b.poll()
+
+        self.assertEqual(
+            500, renter_poller.UPLOADED_BYTES.value(node='dummy-a:9980'))
+        self.assertEqual(
+            700, renter_poller.UPLOADED_BYTES.value(node='dummy-b:9980'))
+        self.assertEqual(
+            1, renter_poller.UPLOADS_IN_PROGRESS.value(node='dummy-a:9980'))
+        self.assertEqual(
+            0, renter_poller.UPLOADS_IN_PROGRESS.value(node='dummy-b:9980'))
+
+    def test_poll_publishes_changes_to_change_subscribers(self):
+        mock_callback = mock.Mock()
+        self.poller.subscribe_to_changes(mock_callback)
+        self.mock_files = [{
+            u'siapath': u'a.txt',
+            u'uploadprogress': 50,
+            u'uploadedbytes': 500,
+            u'redundancy': 1.5,
+        }]
+        self.poller.poll()
+        self.mock_time_fn.return_value = 115.0
+        self.mock_files = [{
+            u'siapath': u'a.txt',
+            u'uploadprogress': 100,
+            u'uploadedbytes': 1000,
+            u'redundancy': 3.0,
+        }]
+
+        self.poller.poll()
+
+        mock_callback.assert_called_with(
+            renter_poller.RenterChanges(
+                poll_time=115.0,
+                new_sia_paths=[],
+                started_uploads=[],
+                completed_uploads=[
+                    renter_poller.UploadCompletion(
+                        sia_path=u'a.txt',
+                        first_seen_time=100.0,
+                        completed_time=115.0)
+                ],
+                redundant_uploads=[u'a.txt'],
+                removed_sia_paths=[],
+                bytes_uploaded=500))
+
+    def test_poll_until_exit_polls_once_per_interval_until_exit_event(self):
+        sleep_calls = []
+
+        def mock_sleep(seconds):
+            sleep_calls.append(seconds)
+            if len(sleep_calls) == 3:
+                self.exit_event.set()
+
+        self.mock_sleep_fn.side_effect = mock_sleep
+
+        self.poller.poll_until_exit()
+
+        self.assertEqual(3, self.mock_sia_client.iter_renter_files.call_count)
+
+    def test_poll_until_exit_continues_after_poll_errors(self):
+        self.mock_sia_client.iter_renter_files.side_effect = [
+            ValueError('dummy poll error'), [], []
+        ]
+
+        def mock_sleep(_):
+            if self.mock_sia_client.iter_renter_files.call_count == 3:
+                self.exit_event.set()
+
+        self.mock_sleep_fn.side_effect = mock_sleep
+
+        self.poller.poll_until_exit()
+
+        self.assertEqual(3, self.mock_sia_client.iter_renter_files.call_count)
+        self.assertEqual(
+            renter_poller.Snapshot(
+                uploads_in_progress=0,
+                uploaded_bytes=0,
+                sia_paths=frozenset(),
+                uploading_sia_paths=frozenset()), self.poller.latest())
+
+    def test_poll_until_exit_skips_polls_shed_by_circuit_breaker(self):
+        mock_circuit_breaker = mock.Mock()
+        mock_circuit_breaker.check_shed.side_effect = (
+            circuit_breaker.CallShedError('dummy shed error'))
+        poller = renter_poller.Poller(self.mock_sia_client, self.mock_sleep_fn,
+                                      self.mock_time_fn, self.exit_event, 15,
+                                      mock_circuit_breaker)
+        poller.latest()
+
+        def mock_sleep(_):
+            if self.mock_sleep_fn.call_count == 3:
+                self.exit_event.set()
+
+        self.mock_sleep_fn.side_effect = mock_sleep
+
+        poller.poll_until_exit()
+
+        self.assertEqual(1, self.mock_sia_client.iter_renter_files.call_count)
+        self.assertEqual(3, mock_circuit_breaker.check_shed.call_count)
+
+    def test_poll_until_exit_resumes_polls_when_open_period_ends(self):
+        breaker = circuit_breaker.CircuitBreaker(
+            self.mock_time_fn, failure_threshold=1, open_seconds=30.0)
+        poller = renter_poller.Poller(self.mock_sia_client, self.mock_sleep_fn,
+                                      self.mock_time_fn, self.exit_event, 15,
+                                      breaker)
+        poller.latest()
+        breaker.record_failure()
+
+        def mock_sleep(_):
+            # Let the open period end after the first shed poll.
+            self.mock_time_fn.return_value += 30.0
+            if self.mock_sleep_fn.call_count == 2:
+                self.exit_event.set()
+
+        self.mock_sleep_fn.side_effect = mock_sleep
+
+        poller.poll_until_exit()
+
+        self.assertEqual(2, self.mock_sia_client.iter_renter_files.call_count)
+
+    def test_wait_for_next_snapshot_returns_when_snapshot_is_published(self):
+        waiting_thread = threading.Thread(
+            target=self.poller.wait_for_next_snapshot,
+            args=(WAIT_SECONDS * 10,))
+        waiting_thread.start()
+
+        while waiting_thread.is_alive():
+            self.poller.poll()
+            waiting_thread.join(WAIT_SECONDS / 10)
+
+        self.assertFalse(waiting_thread.is_alive())
+
+    def test_wait_for_next_snapshot_returns_when_polling_stops(self):
+        self.mock_sleep_fn.side_effect = lambda _: self.exit_event.wait()
+        polling_thread = threading.Thread(target=self.poller.poll_until_exit)
+        polling_thread.start()
+        waiting_thread = threading.Thread(
+            target=self.poller.wait_for_next_snapshot,
+            args=(WAIT_SECONDS * 10,))
+        waiting_thread.start()
+
+        self.exit_event.set()
+
+        waiting_thread.join(WAIT_SECONDS)
+        polling_thread.join(WAIT_SECONDS)
+        self.assertFalse(waiting_thread.is_alive())
+        self.assertFalse(polling_thread.is_alive())
+
+    def test_wait_for_next_snapshot_returns_immediately_after_exit(self):
+        self.exit_event.set()
+
+        self.poller.wait_for_next_snapshot(WAIT_SECONDS * 10)
+
+    def test_wait_for_next_snapshot_returns_after_timeout(self):
+        self.poller.wait_for_next_snapshot(0.01)
@@ -0,0 +1,145 @@
+import threading
+import unittest
+
+import mock
+
+from sia_load_tester import circuit_breaker
+from sia_load_tester import response_cache
+
+# Arbitrarily-chosen timeout to make sure we don't get stuck in a deadlock
+# waiting for a test to complete.
+WAIT_SECONDS = 0.5
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_time_fn = mock.Mock(return_value=100.0)
+        self.cache = response_cache.ResponseCache(self.mock_time_fn)
+        self.mock_fetch_fn = mock.Mock(side_effect=['value-1', 'value-2'])
+
+    def test_serves_fresh_values_from_cache(self):
+        hits = response_cache.CACHE_HITS.value(method='wallet_balance')
+        misses = response_cache.CACHE_MISSES.value(method='wallet_balance')
+
+        self.assertEqual('value-1',
+                         self.cache.get('wallet_balance', 5,
+                                        self.mock_fetch_fn))
+        self.mock_time_fn.return_value = 104.9
+        self.assertEqual('value-1',
+                         self.cache.get('wallet_balance', 5,
+                                        self.mock_fetch_fn))
+
+        self.assertEqual(1, self.mock_fetch_fn.call_count)
+        self.assertEqual(
+            hits + 1, response_cache.CACHE_HITS.value(method='wallet_balance'))
+        self.assertEqual(
+            misses + 1,
+            response_cache.CACHE_MISSES.value(method='wallet_balance'))
+
+    def test_fetches_again_when_value_expires(self):
+        self.cache.get('wallet_balance', 5, self.mock_fetch_fn)
+        self.mock_time_fn.return_value = 105.0
+
+        self.assertEqual('value-2',
+                         self.cache.get('wallet_balance', 5,
+                                        self.mock_fetch_fn))
+
+    def test_caches_each_method_separately(self):
+        self.cache.get('wallet_balance', 5, self.mock_fetch_fn)
+
+        self.assertEqual('value-2',
+                         self.cache.get('contract_count', 5,
+                                        self.mock_fetch_fn))
+
+    def test_invalidate_discards_cached_value(self):
+        self.cache.get('wallet_balance', 5, self.mock_fetch_fn)
+        self.cache.invalidate(['wallet_balance'])
+
+        self.assertEqual('value-2',
+                         self.cache.get('wallet_balance', 5,
+                                        self.mock_fetch_fn))
+
+    def test_does_not_cache_errors(self):
+        self.mock_fetch_fn.side_effect = [ValueError('dummy error'), 'value-2']
+
+        with self.assertRaises(ValueError):
+            self.cache.get('wallet_balance', 5, self.mock_fetch_fn)
+        self.assertEqual('value-2',
+                         self.cache.get('wallet_balance', 5,
+                                        self.mock_fetch_fn))
+
+    def test_concurrent_callers_share_one_fetch(self):
+        fetch_started = threading.Event()
+        release_fetch = threading.Event()
+
+        def slow_fetch():
+            fetch_started.set()
+            release_fetch.wait(WAIT_SECONDS)
+            return self.mock_fetch_fn()
+
+        results = []
+        leader = threading.Thread(
+            target=lambda: results.append(
+                self.cache.get('renter_files', 5, slow_fetch)))
+        leader.start()
+        fetch_started.wait(WAIT_SECONDS)
+        follower = threading.Thread(
+            target=lambda: results.append(
+                self.cache.get('renter_files', 5, slow_fetch)))
+        follower.start()
+
+        release_fetch.set()
+        leader.join(WAIT_SECONDS)
+        follower.join(WAIT_SECONDS)
+
+        self.assertEqual(['value-1', 'value-1'], results)
+        self.assertEqual(1, self.mock_fetch_fn.call_count)
+
+    def test_caller_fetches_for_itself_when_shared_fetch_is_shed(self):
+        fetch_started = threading.Event()
+        release_fetch = threading.Event()
+
+        def shed_fetch():
+            fetch_started.set()
+            release_fetch.wait(WAIT_SECONDS)
+            raise circuit_breaker.CallShedError('dummy shed')
+
+        errors = []
+        results = []
+
+        def get_non_essential():
+            try:
+                self.cache.get('renter_files', 5, shed_fetch)
+            except circuit_breaker.CallShedError as ex:
+                errors.append(ex)
+
+        leader = threading.Thread(target=get_non_essential)
+        leader.start()
+        fetch_started.wait(WAIT_SECONDS)
+        follower = threading.Thread(
+            target=lambda: results.append(
+                self.cache.get('renter_files', 5, self.mock_fetch_fn)))
+        follower.start()
+        # Give the follower time to join the leader's fetch.
+        follower.join(0.1)
+
+        release_fetch.set()
+        leader.join(WAIT_SECONDS)
+        follower.join(WAIT_SECONDS)
+
+        self.assertEqual(1, len(errors))
+        self.assertEqual(['value-1'], results)
+
+    def test_does_not_cache_fetch_that_overlaps_invalidation(self):
+
+        def fetch_then_invalidate():
+            value = self.mock_fetch_fn()
+            self.cache.invalidate(['renter_files'])
+            return value
+
+        self.assertEqual('value-1',
+                         self.cache.get('renter_files', 5,
+                                        fetch_then_invalidate))
+        self.assertEqual('value-2',
+                         self.cache.get('renter_files', 5, self.mock_fetch_fn))
@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from sia_load_tester import jobs
+from sia_load_tester import retry_policy
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_dead_letter_file = mock.Mock()
+        self.mock_random_fn = mock.Mock(return_value=0.0)
+        self.policy = retry_policy.RetryPolicy(
+            10.0,
+            60.0,
+            self.mock_dead_letter_file,
+            mock.Mock(return_value=100.0),
+            self.mock_random_fn)
+        self.job = jobs.Job(local_path='/dummy-path/a.txt', sia_path=u'a.txt')
+
+    def fail_job(self, times):
+        for _ in xrange(times):
+            self.job.increment_failure_count()
+
+    def test_backoff_doubles_with_each_failure_up_to_max(self):
+        delays = []
+        for _ in xrange(5):
+            self.fail_job(1)
+            delays.append(self.policy.retry_delay(self.job))
+
+        self.assertEqual([5.0, 10.0, 20.0, 30.0, 30.0], delays)
+
+    def test_jitter_spreads_delay_up_to_full_backoff(self):
+        self.fail_job(2)
+        self.mock_random_fn.return_value = 0.5
+
+        self.assertEqual(15.0, self.policy.retry_delay(self.job))
+
+    def test_give_up_records_dead_letter(self):
+        self.fail_job(jobs.MAX_FAILURE_COUNT)
+
+        self.policy.give_up(self.job, 'ValueError')
+
+        self.mock_dead_letter_file.record.assert_called_once_with(
+            self.job, 'ValueError')
+
+
+class DeadLetterFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.output_path = os.path.join(self.temp_dir, 'dead_letter_jobs.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_appends_jobs_to_csv(self):
+        job_a = jobs.Job(local_path='/dummy-path/a.txt', sia_path=u'a.txt')
+        job_b = jobs.Job(
+            local_path='/dummy-path/\xc3\xa9.txt', sia_path=u'\xe9.txt')
+        dead_letter_file = retry_policy.DeadLetterFile(self.output_path)
+        dead_letter_file.record(job_a, 'rejected')
+        dead_letter_file.close()
+
+        dead_letter_file = retry_policy.DeadLetterFile(self.output_path)
+        dead_letter_file.record(job_b, 'ValueError')
+        dead_letter_file.close()
+
+        with open(self.output_path) as output_file:
+            self.assertEqual(
+                ('sia_path,local_path,failure_count,last_error\r\n'
+                 'a.txt,/dummy-path/a.txt,0,rejected\r\n'
+                 '\xc3\xa9.txt,/dummy-path/\xc3\xa9.txt,0,ValueError\r\n'),
+                output_file.read())
+
+    def test_creates_no_file_without_dead_letters(self):
+        retry_policy.DeadLetterFile(self.output_path).close()
+
+        self.assertFalse(os.path.exists(self.output_path))
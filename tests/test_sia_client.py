@@ -1,8 +1,13 @@
+import os
+import shutil
+import tempfile
 import unittest
 
 import mock
 import requests
 
+from sia_load_tester import circuit_breaker
+from sia_load_tester import response_cache
 from sia_load_tester import sia_client
 
 
@@ -601,6 +606,46 @@ class SiaClientTest(unittest.TestCase):
             mock.call(125),
         ])
 
+    def test_records_call_and_retry_metrics(self):
+        self.mock_sia_api_impl.get_renter_contracts.side_effect = [
+            requests.exceptions.ConnectionError,
+            requests.exceptions.ConnectionError,
+            {
+                u'contracts': [{}, {}, {}]
+            },
+        ]
+        calls = sia_client.API_CALLS.value(method='contract_count')
+        retries = sia_client.API_RETRIES.value(method='contract_count')
+
+        self.sia_client.contract_count()
+
+        self.assertEqual(
+            calls + 1, sia_client.API_CALLS.value(method='contract_count'))
+        self.assertEqual(
+            retries + 2, sia_client.API_RETRIES.value(method='contract_count'))
+        self.assertEqual(3, sia_client.CONTRACTS.value())
+
+    def test_records_per_method_api_call_stats(self):
+        self.mock_sia_api_impl.get_wallet.side_effect = [
+            requests.exceptions.ConnectionError,
+            {
+                u'unlocked': True
+            },
+        ]
+        before = {s.method: s
+                  for s in sia_client.api_call_stats()}.get(
+                      'is_wallet_locked',
+                      sia_client.ApiCallStats('is_wallet_locked', 0, 0.0, 0.0,
+                                              0.0, 0.0, 0, 0, 0))
+
+        self.sia_client.is_wallet_locked()
+
+        after = {s.method: s
+                 for s in sia_client.api_call_stats()}['is_wallet_locked']
+        self.assertEqual(before.calls + 1, after.calls)
+        self.assertEqual(before.retries + 1, after.retries)
+        self.assertEqual(before.backoff_seconds + 1, after.backoff_seconds)
+
     def test_upload_file_async_calls_api_impl(self):
         self.mock_sia_api_impl.set_renter_upload.return_value = True
 
@@ -620,3 +665,353 @@ class SiaClientTest(unittest.TestCase):
 
         self.mock_sia_api_impl.set_renter_upload.assert_called_with(
             'bar.txt', source='foo/bar.txt')
+
+
+class SiaClientResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_sia_api_impl = mock.Mock()
+        self.mock_time_fn = mock.Mock(return_value=100.0)
+        self.sia_client = sia_client.SiaClient(self.mock_sia_api_impl,
+                                               mock.Mock(),
+                                               response_cache.ResponseCache(
+                                                   self.mock_time_fn))
+
+    def test_repeated_reads_call_api_once(self):
+        self.mock_sia_api_impl.get_wallet.return_value = {
+            u'confirmedsiacoinbalance': u'1000'
+        }
+        calls = sia_client.API_CALLS.value(method='wallet_balance')
+
+        self.assertEqual(1000L, self.sia_client.wallet_balance())
+        self.assertEqual(1000L, self.sia_client.wallet_balance())
+
+        self.assertEqual(1, self.mock_sia_api_impl.get_wallet.call_count)
+        self.assertEqual(
+            calls + 1, sia_client.API_CALLS.value(method='wallet_balance'))
+
+    def test_setting_allowance_invalidates_allowance_budget(self):
+        self.mock_sia_api_impl.get_renter.side_effect = [
+            {
+                u'settings': {
+                    u'allowance': {
+                        u'funds': u'0'
+                    }
+                }
+            },
+            {
+                u'settings': {
+                    u'allowance': {
+                        u'funds': u'1000'
+                    }
+                }
+            },
+        ]
+        self.mock_sia_api_impl.set_renter.return_value = True
+
+        self.assertEqual(0L, self.sia_client.allowance_budget())
+        self.assertTrue(self.sia_client.set_allowance_budget(1000L))
+        self.assertEqual(1000L, self.sia_client.allowance_budget())
+
+    def test_upload_invalidates_renter_files(self):
+        self.mock_sia_api_impl.get_renter_files.side_effect = [
+            {
+                u'files': None
+            },
+            {
+                u'files': [{
+                    u'siapath': u'bar.txt'
+                }]
+            },
+        ]
+        self.mock_sia_api_impl.set_renter_upload.return_value = True
+
+        self.assertEqual([], self.sia_client.renter_files())
+        self.sia_client.upload_file_async('foo/bar.txt', 'bar.txt')
+        self.assertEqual([{
+            u'siapath': u'bar.txt'
+        }], self.sia_client.renter_files())
+
+
+class PooledSiaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_session = mock.Mock()
+        self.sia_api = sia_client.PooledSia(self.mock_session)
+
+    def test_get_requests_are_sent_through_session(self):
+        self.mock_session.get.return_value.json.return_value = {u'synced': True}
+
+        self.assertEqual({u'synced': True}, self.sia_api.get_consensus())
+
+        self.mock_session.get.assert_called_once_with(
+            'http://localhost:9980/consensus', params={})
+        self.assertFalse(self.mock_session.post.called)
+
+    def test_post_requests_are_sent_through_session(self):
+        self.mock_session.post.return_value.json.side_effect = ValueError(
+            'No JSON object could be decoded')
+        self.mock_session.post.return_value.ok = True
+
+        self.assertTrue(
+            self.sia_api.set_renter_upload('bar.txt', source='foo/bar.txt'))
+
+        self.mock_session.post.assert_called_once_with(
+            'http://localhost:9980/renter/upload/bar.txt',
+            data={
+                'source': 'foo/bar.txt'
+            })
+        self.assertFalse(self.mock_session.get.called)
+
+    def test_attributes_response_bytes_to_calling_client_method(self):
+        self.mock_session.get.return_value.content = '{"unlocked": true}'
+        self.mock_session.get.return_value.json.return_value = {
+            u'unlocked': True
+        }
+        received_bytes = sia_client.API_RECEIVED_BYTES.value(
+            method='is_wallet_locked')
+
+        sia_client.SiaClient(self.sia_api, mock.Mock()).is_wallet_locked()
+
+        self.assertEqual(
+            received_bytes + 18,
+            sia_client.API_RECEIVED_BYTES.value(method='is_wallet_locked'))
+
+    def test_counts_streamed_bytes_as_they_are_received(self):
+        self.mock_session.get.return_value.iter_content.return_value = iter(
+            ['{"files": [{"siapath": "a.txt"}', ', {"siapath": "b.txt"}]}'])
+        received_bytes = sia_client.API_RECEIVED_BYTES.value(
+            method='iter_renter_files')
+
+        files = sia_client.SiaClient(self.sia_api,
+                                     mock.Mock()).iter_renter_files()
+        self.assertEqual(
+            received_bytes,
+            sia_client.API_RECEIVED_BYTES.value(method='iter_renter_files'))
+
+        self.assertEqual([u'a.txt', u'b.txt'], [f[u'siapath'] for f in files])
+        self.assertEqual(
+            received_bytes + 55,
+            sia_client.API_RECEIVED_BYTES.value(method='iter_renter_files'))
+
+    def test_records_latency_of_streamed_call_when_stream_ends(self):
+        clock = [100.0]
+
+        def iter_slow_content(_):
+            yield '{"files": [{"siapath": "a.txt"}'
+            clock[0] += 20.0
+            yield ']}'
+
+        self.mock_session.get.return_value.iter_content.side_effect = (
+            iter_slow_content)
+
+        with mock.patch.object(sia_client.time, 'time', lambda: clock[0]):
+            files = sia_client.SiaClient(self.sia_api,
+                                         mock.Mock()).iter_renter_files()
+            self.assertEqual([u'a.txt'], [f[u'siapath'] for f in files])
+
+        stats = {s.method: s
+                 for s in sia_client.api_call_stats()}['iter_renter_files']
+        self.assertGreaterEqual(stats.max_seconds, 20.0)
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        sia_client.configure_connection_pool(pool_size=3)
+
+    def tearDown(self):
+        sia_client.configure_connection_pool(
+            sia_client.DEFAULT_CONNECTION_POOL_SIZE)
+
+    def test_clients_share_a_single_session(self):
+        self.assertIs(sia_client.make_sia_api()._session,
+                      sia_client.make_sia_api()._session)
+
+    def test_configure_api_port_sets_port_of_new_clients(self):
+        sia_client.configure_api_port(9981)
+        try:
+            self.assertEqual('http://localhost:9981',
+                             sia_client.make_sia_api()._url_base)
+        finally:
+            sia_client.configure_api_port(sia_client.DEFAULT_API_PORT)
+
+    def test_configure_connection_pool_sets_pool_size(self):
+        adapter = sia_client.make_sia_api()._session.get_adapter(
+            'http://localhost:9980')
+        self.assertEqual(3, adapter._pool_maxsize)
+
+    def test_connection_stats_is_zero_before_any_requests(self):
+        self.assertEqual(
+            sia_client.ConnectionStats(opened=0, reused=0),
+            sia_client.connection_stats())
+
+    def test_connection_stats_counts_opened_and_reused_connections(self):
+        adapter = sia_client.make_sia_api()._session.get_adapter(
+            'http://localhost:9980')
+        pool = adapter.poolmanager.connection_from_url('http://localhost:9980')
+        pool.num_connections = 2
+        pool.num_requests = 7
+
+        self.assertEqual(
+            sia_client.ConnectionStats(opened=2, reused=5),
+            sia_client.connection_stats())
+
+
+class WriteApiCallStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_writes_stats_as_csv(self):
+        output_path = os.path.join(self.temp_dir, 'api_call_stats.csv')
+
+        sia_client.write_api_call_stats(output_path, [
+            sia_client.ApiCallStats(
+                method='renter_files',
+                calls=4,
+                p50_seconds=0.5,
+                p90_seconds=1.25,
+                p99_seconds=2.0,
+                max_seconds=2.0,
+                bytes_received=1024,
+                retries=1,
+                backoff_seconds=1)
+        ])
+
+        with open(output_path) as output_file:
+            self.assertEqual(
+                ('method,calls,p50_seconds,p90_seconds,p99_seconds,'
+                 'max_seconds,bytes_received,retries,backoff_seconds\r\n'
+                 'renter_files,4,0.500,1.250,2.000,2.000,1024,1,1.000\r\n'),
+                output_file.read())
+
+
+class SiaClientCircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_sia_api_impl = mock.Mock()
+        self.mock_sleep_fn = mock.Mock()
+        self.mock_circuit_breaker = mock.Mock()
+        self.mock_circuit_breaker.admit.return_value = 0
+
+    def make_client(self, essential=True):
+        return sia_client.SiaClient(
+            self.mock_sia_api_impl,
+            self.mock_sleep_fn,
+            circuit_breaker=self.mock_circuit_breaker,
+            essential=essential)
+
+    def test_records_response_of_each_request(self):
+        self.mock_sia_api_impl.get_consensus.return_value = {u'synced': True}
+
+        self.assertTrue(self.make_client().is_blockchain_synced())
+
+        self.mock_circuit_breaker.admit.assert_called_once_with(
+            'is_blockchain_synced', True)
+        self.assertTrue(self.mock_circuit_breaker.record_response.called)
+        self.assertFalse(self.mock_circuit_breaker.record_failure.called)
+
+    def test_records_failure_of_each_request_that_fails_to_reach_sia(self):
+        self.mock_sia_api_impl.get_consensus.side_effect = [
+            requests.exceptions.ConnectionError, {
+                u'synced': True
+            }
+        ]
+
+        self.assertTrue(self.make_client().is_blockchain_synced())
+
+        self.assertEqual(1, self.mock_circuit_breaker.record_failure.call_count)
+        self.assertEqual(1,
+                         self.mock_circuit_breaker.record_response.call_count)
+
+    def make_streaming_client(self, *bodies):
+        mock_session = mock.Mock()
+        responses = []
+        for body in bodies:
+            response = mock.Mock()
+            response.iter_content.return_value = iter(body)
+            responses.append(response)
+        mock_session.get.side_effect = responses
+        return sia_client.SiaClient(
+            sia_client.PooledSia(mock_session),
+            self.mock_sleep_fn,
+            circuit_breaker=self.mock_circuit_breaker)
+
+    def test_retries_streamed_call_when_body_is_cut_off(self):
+        sia = self.make_streaming_client(['{"files": [{"siapath": "a.t'],
+                                         ['{"files": [{"siapath": "a.txt"}]}'])
+
+        self.assertEqual([u'a.txt'],
+                         [f[u'siapath'] for f in sia.iter_renter_files()])
+        self.assertEqual(1, self.mock_circuit_breaker.record_failure.call_count)
+        self.assertEqual(1, self.mock_sleep_fn.call_count)
+
+    def test_raises_when_streamed_body_is_cut_off_after_items_are_read(self):
+        sia = self.make_streaming_client(
+            ['{"files": [{"siapath": "a.txt"}, {"siapath": "b.t'])
+
+        files = sia.iter_renter_files()
+        self.assertEqual(u'a.txt', next(files)[u'siapath'])
+        with self.assertRaises(sia_client.SiaServerNotAvailable):
+            next(files)
+        self.assertEqual(1, self.mock_circuit_breaker.record_failure.call_count)
+
+    def test_waits_until_circuit_breaker_admits_request(self):
+        self.mock_circuit_breaker.admit.side_effect = [20.0, 1.0, 0]
+        self.mock_sia_api_impl.get_consensus.return_value = {u'synced': True}
+
+        self.assertTrue(self.make_client().is_blockchain_synced())
+
+        self.mock_sleep_fn.assert_has_calls([mock.call(20.0), mock.call(1.0)])
+        self.assertEqual(1, self.mock_sia_api_impl.get_consensus.call_count)
+
+    def test_non_essential_client_raises_when_call_is_shed(self):
+        self.mock_circuit_breaker.admit.side_effect = (
+            circuit_breaker.CallShedError('dummy shed error'))
+
+        with self.assertRaises(circuit_breaker.CallShedError):
+            self.make_client(essential=False).contract_count()
+
+        self.mock_circuit_breaker.admit.assert_called_once_with(
+            'contract_count', False)
+        self.assertFalse(self.mock_sia_api_impl.get_renter_contracts.called)
+
+
+class NodeTest(unittest.TestCase):
+
+    def test_parses_host_and_port(self):
+        self.assertEqual(
+            sia_client.Endpoint(host='sia-node-1', port=9981),
+            sia_client.parse_endpoint('sia-node-1:9981'))
+
+    def test_parses_port_on_localhost(self):
+        self.assertEqual(
+            sia_client.Endpoint(host='localhost', port=9981),
+            sia_client.parse_endpoint('9981'))
+
+    def test_rejects_endpoint_without_port(self):
+        with self.assertRaises(sia_client.InvalidEndpointError):
+            sia_client.parse_endpoint('sia-node-1')
+
+    def test_clients_of_node_send_requests_to_its_endpoint(self):
+        node = sia_client.make_node(
+            sia_client.Endpoint(host='sia-node-1', port=9981), 3, 5, 30.0, 30.0)
+
+        self.assertEqual('sia-node-1:9981', node.name)
+        self.assertEqual('http://sia-node-1:9981',
+                         node.make_sia_api()._url_base)
+
+    def test_nodes_do_not_share_connections_or_circuit_breakers(self):
+        endpoint = sia_client.Endpoint(host='localhost', port=9981)
+        node_a = sia_client.make_node(endpoint, 3, 5, 30.0, 30.0)
+        node_b = sia_client.make_node(endpoint, 3, 5, 30.0, 30.0)
+
+        self.assertIsNot(node_a.make_sia_api()._session,
+                         node_b.make_sia_api()._session)
+        self.assertIsNot(node_a.circuit_breaker, node_b.circuit_breaker)
+        self.assertIs(node_a.make_sia_api()._session,
+                      node_a.make_sia_api()._session)
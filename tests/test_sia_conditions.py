@@ -3,6 +3,8 @@ import unittest
 
 import mock
 
+from sia_load_tester import concurrency
+from sia_load_tester import renter_poller
 from sia_load_tester import sia_conditions
 
 
@@ -11,11 +13,23 @@ class WaiterTest(unittest.TestCase):
     def setUp(self):
         self.mock_sleep_fn = mock.Mock()
         self.mock_files = []
-        self.mock_sia_client = mock.Mock()
-        self.mock_sia_client.renter_files.side_effect = lambda: self.mock_files
+        self.mock_renter_poller = mock.Mock()
+        self.mock_renter_poller.latest.side_effect = self.make_snapshot
+        self.mock_time_fn = mock.Mock(return_value=0.0)
         self.exit_event = threading.Event()
-        self.waiter = sia_conditions.Waiter(self.mock_sia_client,
-                                            self.mock_sleep_fn, self.exit_event)
+        self.waiter = sia_conditions.Waiter(self.mock_renter_poller,
+                                            concurrency.FixedController(5),
+                                            self.mock_sleep_fn, 15,
+                                            self.mock_time_fn, self.exit_event)
+
+    def make_snapshot(self):
+        return renter_poller.Snapshot(
+            uploads_in_progress=len(
+                [f for f in self.mock_files if f[u'uploadprogress'] < 100]),
+            uploaded_bytes=0,
+            sia_paths=frozenset(
+                [f[u'siapath'] for f in self.mock_files if u'siapath' in f]),
+            uploading_sia_paths=frozenset())
 
     def increment_upload_progress_by_one(self):
         """Simulates all files making +1% upload progress."""
@@ -56,6 +70,78 @@ class WaiterTest(unittest.TestCase):
 
         self.assertEqual(100 - 94, self.mock_sleep_fn.call_count)
 
+    def test_wait_for_all_uploads_to_complete_logs_info_only_when_count_changes(
+            self):
+        self.mock_files = [{u'uploadprogress': 98}, {u'uploadprogress': 99}]
+        progress_steps = [0, 0, 1, 0, 1]
+
+        def advance_progress(_):
+            step = progress_steps.pop(0)
+            for f in self.mock_files:
+                f[u'uploadprogress'] = min(100, f[u'uploadprogress'] + step)
+
+        self.mock_sleep_fn.side_effect = advance_progress
+
+        with mock.patch.object(sia_conditions, 'logger') as mock_logger:
+            self.waiter.wait_for_all_uploads_to_complete()
+
+        # The count goes 2, 2, 2, 1, 1, then 0.
+        self.assertEqual(5, self.mock_sleep_fn.call_count)
+        self.assertEqual(2, mock_logger.info.call_count)
+        self.assertEqual(3, mock_logger.debug.call_count)
+
+    def test_wait_for_available_upload_slot_accumulates_idle_seconds(self):
+        self.mock_files = [{u'uploadprogress': 90}]
+        self.mock_time_fn.side_effect = [0.0, 0.5, 10.0, 12.5]
+
+        self.waiter.wait_for_available_upload_slot()
+        self.waiter.wait_for_available_upload_slot()
+
+        self.assertEqual(3.0, self.waiter.idle_seconds())
+
+    def test_wait_for_available_upload_slot_counts_reserved_slots(self):
+        self.mock_files = [{u'uploadprogress': 90}] * 3
+        self.waiter.wait_for_available_upload_slot()
+        self.waiter.wait_for_available_upload_slot()
+        self.mock_sleep_fn.side_effect = (
+            lambda _: self.waiter.release_upload_slot())
+
+        self.waiter.wait_for_available_upload_slot()
+
+        self.assertEqual(1, self.mock_sleep_fn.call_count)
+
+    def test_wait_for_available_upload_slot_counts_started_uploads_missing_from_snapshot(
+            self):
+        self.mock_files = [
+            {
+                u'siapath': u'a.txt',
+                u'uploadprogress': 90,
+            },
+            {
+                u'siapath': u'b.txt',
+                u'uploadprogress': 91,
+            },
+            {
+                u'siapath': u'c.txt',
+                u'uploadprogress': 92,
+            },
+        ]
+        self.waiter.record_upload_started(u'c.txt')
+        self.waiter.record_upload_started(u'd.txt')
+        self.waiter.record_upload_started(u'e.txt')
+
+        def add_started_files_to_snapshot(_):
+            self.mock_files.append({u'siapath': u'd.txt', u'uploadprogress': 0})
+            self.mock_files.append({u'siapath': u'e.txt', u'uploadprogress': 0})
+            self.mock_files[0][u'uploadprogress'] = 100
+            self.mock_files[1][u'uploadprogress'] = 100
+
+        self.mock_sleep_fn.side_effect = add_started_files_to_snapshot
+
+        self.waiter.wait_for_available_upload_slot()
+
+        self.assertEqual(1, self.mock_sleep_fn.call_count)
+
     def test_wait_for_available_upload_slot_raises_exception_when_exit_event_is_set_before_call(
             self):
         self.mock_files = []
@@ -172,3 +258,100 @@ class WaiterTest(unittest.TestCase):
             self.waiter.wait_for_all_uploads_to_complete()
 
         self.assertEqual(1, self.mock_sleep_fn.call_count)
+
+
+class MakeWaiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_files = [
+            {
+                u'uploadprogress': 10,
+            },
+            {
+                u'uploadprogress': 20,
+            },
+        ]
+        self.mock_renter_poller = mock.Mock()
+        self.mock_renter_poller.latest.side_effect = lambda: renter_poller.Snapshot(
+            uploads_in_progress=len(
+                [f for f in self.mock_files if f[u'uploadprogress'] < 100]),
+            uploaded_bytes=0,
+            sia_paths=frozenset(),
+            uploading_sia_paths=frozenset())
+        self.exit_event = threading.Event()
+
+    def test_event_mode_waits_for_new_renter_snapshots(self):
+
+        def complete_one_upload(_):
+            self.mock_files.pop()
+
+        self.mock_renter_poller.wait_for_next_snapshot.side_effect = complete_one_upload
+        waiter = sia_conditions.make_waiter(self.mock_renter_poller,
+                                            concurrency.FixedController(1),
+                                            self.exit_event,
+                                            sia_conditions.WAIT_MODE_EVENT)
+
+        waiter.wait_for_available_upload_slot()
+
+        self.assertEqual(
+            2, self.mock_renter_poller.wait_for_next_snapshot.call_count)
+        for call_args in (
+                self.mock_renter_poller.wait_for_next_snapshot.call_args_list):
+            timeout = call_args[0][0]
+            self.assertGreaterEqual(timeout, 0.5)
+            self.assertLessEqual(timeout, 1.5)
+
+    def test_event_mode_raises_exception_when_exit_event_is_set_during_wait(
+            self):
+        self.mock_renter_poller.wait_for_next_snapshot.side_effect = (
+            lambda _: self.exit_event.set())
+        waiter = sia_conditions.make_waiter(self.mock_renter_poller,
+                                            concurrency.FixedController(1),
+                                            self.exit_event,
+                                            sia_conditions.WAIT_MODE_EVENT)
+
+        with self.assertRaises(sia_conditions.WaitInterruptedError):
+            waiter.wait_for_all_uploads_to_complete()
+
+        self.assertEqual(
+            1, self.mock_renter_poller.wait_for_next_snapshot.call_count)
+
+
+class UploadSlotsTest(unittest.TestCase):
+
+    def test_counts_unconfirmed_uploads_without_visiting_every_renter_file(
+            self):
+        mock_sia_paths = mock.MagicMock()
+        mock_sia_paths.__contains__.side_effect = lambda p: p == u'a.txt'
+        mock_sia_paths.__iter__.side_effect = AssertionError(
+            'Visited every renter file')
+        mock_renter_poller = mock.Mock()
+        mock_renter_poller.latest.return_value = renter_poller.Snapshot(
+            uploads_in_progress=1,
+            uploaded_bytes=0,
+            sia_paths=mock_sia_paths,
+            uploading_sia_paths=frozenset())
+        upload_slots = sia_conditions.UploadSlots(
+            mock_renter_poller, concurrency.FixedController(5))
+        upload_slots.record_started(u'a.txt')
+        upload_slots.record_started(u'b.txt')
+
+        self.assertEqual(2, upload_slots.count_in_progress())
+
+    def test_checks_unconfirmed_uploads_once_per_snapshot(self):
+        mock_sia_paths = mock.MagicMock()
+        mock_sia_paths.__contains__.return_value = False
+        mock_renter_poller = mock.Mock()
+        mock_renter_poller.latest.return_value = renter_poller.Snapshot(
+            uploads_in_progress=0,
+            uploaded_bytes=0,
+            sia_paths=mock_sia_paths,
+            uploading_sia_paths=frozenset())
+        upload_slots = sia_conditions.UploadSlots(
+            mock_renter_poller, concurrency.FixedController(5))
+        upload_slots.record_started(u'a.txt')
+
+        for _ in xrange(3):
+            self.assertEqual(1, upload_slots.count_in_progress())
+
+        self.assertEqual(1, mock_sia_paths.__contains__.call_count)
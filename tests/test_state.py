@@ -6,6 +6,7 @@ import unittest
 
 import mock
 
+from sia_load_tester import circuit_breaker
 from sia_load_tester import state
 
 _DUMMY_TIMESTAMP = datetime.datetime(2018, 2, 12, 23, 12, 51)
@@ -212,3 +213,15 @@ class SnapshotterTest(unittest.TestCase):
     "unlocked": true
 }
 """.strip())
+
+    def test_skips_snapshot_when_shed_by_circuit_breaker(self):
+        mock_circuit_breaker = mock.Mock()
+        mock_circuit_breaker.check_shed.side_effect = (
+            circuit_breaker.CallShedError('dummy shed error'))
+        snapshotter = state.Snapshotter(self.test_dir, self.mock_sia_api,
+                                        self.mock_time_fn, mock_circuit_breaker)
+
+        snapshotter.snapshot()
+
+        self.assertFalse(self.mock_sia_api.get_renter.called)
+        self.assertEqual([], os.listdir(self.test_dir))
@@ -0,0 +1,167 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from sia_load_tester import jobs
+from sia_load_tester import renter_poller
+from sia_load_tester import upload_journal
+
+
+class UploadJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.journal_path = upload_journal.journal_path(self.test_dir)
+        self.mock_time_fn = mock.Mock(return_value=0.0)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def make_journal(self, submitted_sia_paths=()):
+        return upload_journal.Journal(
+            open(self.journal_path, 'ab'), self.mock_time_fn,
+            submitted_sia_paths)
+
+    def test_replay_returns_None_when_journal_does_not_exist(self):
+        self.assertIsNone(upload_journal.replay(self.journal_path))
+
+    def test_replay_returns_latest_state_of_each_job(self):
+        job_a = jobs.Job(local_path='/dummy-root/a.txt', sia_path='a.txt')
+        job_b = jobs.Job(local_path='/dummy-root/b.txt', sia_path='b.txt')
+        job_c = jobs.Job(local_path='/dummy-root/c.txt', sia_path='c.txt')
+        journal = self.make_journal()
+        journal.record_queued(job_a)
+        journal.record_queued(job_b)
+        journal.record_queued(job_c)
+        job_a.increment_failure_count()
+        journal.record_failed(job_a)
+        journal.record_submitted(job_a)
+        journal.record_submitted(job_b)
+        journal.record_completed_uploads(
+            renter_poller.Snapshot(
+                uploads_in_progress=1,
+                uploaded_bytes=0,
+                sia_paths=frozenset([u'a.txt', u'b.txt']),
+                uploading_sia_paths=frozenset([u'a.txt'])))
+        journal.close()
+
+        self.assertEqual({
+            u'a.txt':
+            upload_journal.JobRecord(
+                state=upload_journal.STATE_SUBMITTED, failure_count=1),
+            u'b.txt':
+            upload_journal.JobRecord(
+                state=upload_journal.STATE_COMPLETED, failure_count=0),
+            u'c.txt':
+            upload_journal.JobRecord(
+                state=upload_journal.STATE_QUEUED, failure_count=0),
+        }, upload_journal.replay(self.journal_path))
+
+    def test_replay_skips_partially_written_record(self):
+        journal = self.make_journal()
+        journal.record_queued(
+            jobs.Job(local_path='/dummy-root/a.txt', sia_path='a.txt'))
+        journal.close()
+        with open(self.journal_path, 'ab') as journal_file:
+            journal_file.write('{"event": "subm')
+
+        self.assertEqual({
+            u'a.txt':
+            upload_journal.JobRecord(
+                state=upload_journal.STATE_QUEUED, failure_count=0),
+        }, upload_journal.replay(self.journal_path))
+
+    def test_replay_all_returns_None_when_no_journal_exists(self):
+        self.assertIsNone(
+            upload_journal.replay_all([
+                os.path.join(self.test_dir, 'dummy-a.jsonl'),
+                os.path.join(self.test_dir, 'dummy-b.jsonl')
+            ]))
+
+    def test_replay_all_keeps_furthest_state_of_each_job(self):
+        job_a = jobs.Job(local_path='/dummy-root/a.txt', sia_path='a.txt')
+        job_b = jobs.Job(local_path='/dummy-root/b.txt', sia_path='b.txt')
+        other_journal_path = os.path.join(self.test_dir, 'other.jsonl')
+        journal = self.make_journal()
+        journal.record_queued(job_a)
+        journal.record_submitted(job_b)
+        journal.close()
+        other_journal = upload_journal.Journal(
+            open(other_journal_path, 'ab'), self.mock_time_fn, [])
+        other_journal.record_submitted(job_a)
+        other_journal.record_queued(job_b)
+        other_journal.close()
+
+        self.assertEqual({
+            u'a.txt':
+            upload_journal.JobRecord(
+                state=upload_journal.STATE_SUBMITTED, failure_count=0),
+            u'b.txt':
+            upload_journal.JobRecord(
+                state=upload_journal.STATE_SUBMITTED, failure_count=0),
+        }, upload_journal.replay_all([self.journal_path, other_journal_path]))
+
+    def test_records_completion_of_uploads_submitted_before_restart(self):
+        journal = self.make_journal(submitted_sia_paths=[u'a.txt'])
+        journal.record_completed_uploads(
+            renter_poller.Snapshot(
+                uploads_in_progress=0,
+                uploaded_bytes=0,
+                sia_paths=frozenset([u'a.txt']),
+                uploading_sia_paths=frozenset()))
+        journal.close()
+
+        self.assertEqual({
+            u'a.txt':
+            upload_journal.JobRecord(
+                state=upload_journal.STATE_COMPLETED, failure_count=0),
+        }, upload_journal.replay(self.journal_path))
+
+    def test_syncs_records_in_batches(self):
+        journal = self.make_journal()
+        job = jobs.Job(local_path='/dummy-root/a.txt', sia_path='a.txt')
+
+        with mock.patch.object(os, 'fsync') as mock_fsync:
+            journal.record_queued(job)
+            self.assertFalse(mock_fsync.called)
+
+            self.mock_time_fn.return_value = 60.0
+            journal.record_submitted(job)
+            self.assertEqual(1, mock_fsync.call_count)
+        journal.close()
+
+    def test_syncs_waiting_records_on_renter_poll_without_new_records(self):
+        journal = self.make_journal()
+        job = jobs.Job(local_path='/dummy-root/a.txt', sia_path='a.txt')
+        snapshot = renter_poller.Snapshot(
+            uploads_in_progress=0,
+            uploaded_bytes=0,
+            sia_paths=frozenset(),
+            uploading_sia_paths=frozenset())
+
+        with mock.patch.object(os, 'fsync') as mock_fsync:
+            journal.record_queued(job)
+            journal.record_completed_uploads(snapshot)
+            self.assertFalse(mock_fsync.called)
+
+            self.mock_time_fn.return_value = 60.0
+            journal.record_completed_uploads(snapshot)
+            self.assertEqual(1, mock_fsync.call_count)
+
+            # Nothing is left to sync on the next poll.
+            self.mock_time_fn.return_value = 120.0
+            journal.record_completed_uploads(snapshot)
+            self.assertEqual(1, mock_fsync.call_count)
+        journal.close()
+
+    def test_close_closes_journal_file_when_sync_fails(self):
+        journal_file = open(self.journal_path, 'ab')
+        journal = upload_journal.Journal(journal_file, self.mock_time_fn, [])
+
+        with mock.patch.object(os, 'fsync', side_effect=OSError('dummy')):
+            with self.assertRaises(OSError):
+                journal.close()
+        self.assertTrue(journal_file.closed)
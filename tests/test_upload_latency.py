@@ -0,0 +1,168 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from sia_load_tester import jobs
+from sia_load_tester import renter_poller
+from sia_load_tester import upload_latency
+
+
+def make_changes(poll_time,
+                 started_uploads=None,
+                 completed_uploads=None,
+                 redundant_uploads=None,
+                 removed_sia_paths=None):
+    return renter_poller.RenterChanges(
+        poll_time=poll_time,
+        new_sia_paths=[],
+        started_uploads=started_uploads or [],
+        completed_uploads=[
+            renter_poller.UploadCompletion(
+                sia_path=sia_path,
+                first_seen_time=poll_time,
+                completed_time=poll_time)
+            for sia_path in (completed_uploads or [])
+        ],
+        redundant_uploads=redundant_uploads or [],
+        removed_sia_paths=removed_sia_paths or [],
+        bytes_uploaded=0)
+
+
+class SizeClassTest(unittest.TestCase):
+
+    def test_classifies_file_sizes(self):
+        self.assertEqual(upload_latency.SIZE_CLASS_UNKNOWN,
+                         upload_latency.size_class(None))
+        self.assertEqual(upload_latency.SIZE_CLASS_SMALL,
+                         upload_latency.size_class(1))
+        self.assertEqual(upload_latency.SIZE_CLASS_MEDIUM,
+                         upload_latency.size_class(4 * 2**20))
+        self.assertEqual(upload_latency.SIZE_CLASS_MEDIUM,
+                         upload_latency.size_class(40 * 2**20))
+        self.assertEqual(upload_latency.SIZE_CLASS_LARGE,
+                         upload_latency.size_class(40 * 2**20 + 1))
+
+
+class TrackerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_time_fn = mock.Mock(return_value=100.0)
+        self.tracker = upload_latency.Tracker(self.mock_time_fn, 300)
+
+    def test_times_each_milestone_from_submission(self):
+        self.tracker.record_submitted(
+            jobs.Job(local_path='/dummy-path/a.txt', sia_path=u'a.txt'))
+        self.tracker.record_changes(
+            make_changes(115.0, started_uploads=[u'a.txt']))
+        self.tracker.record_changes(
+            make_changes(130.0, completed_uploads=[u'a.txt']))
+        self.tracker.record_changes(
+            make_changes(145.0, redundant_uploads=[u'a.txt']))
+
+        self.assertEqual([
+            upload_latency.LatencySummary(
+                stage=upload_latency.STAGE_FIRST_PROGRESS,
+                size_class=upload_latency.SIZE_CLASS_UNKNOWN,
+                count=1,
+                p50_seconds=15.0,
+                p90_seconds=15.0,
+                p99_seconds=15.0,
+                p999_seconds=15.0,
+                max_seconds=15.0),
+            upload_latency.LatencySummary(
+                stage=upload_latency.STAGE_UPLOADED,
+                size_class=upload_latency.SIZE_CLASS_UNKNOWN,
+                count=1,
+                p50_seconds=30.0,
+                p90_seconds=30.0,
+                p99_seconds=30.0,
+                p999_seconds=30.0,
+                max_seconds=30.0),
+            upload_latency.LatencySummary(
+                stage=upload_latency.STAGE_REDUNDANT,
+                size_class=upload_latency.SIZE_CLASS_UNKNOWN,
+                count=1,
+                p50_seconds=45.0,
+                p90_seconds=45.0,
+                p99_seconds=45.0,
+                p999_seconds=45.0,
+                max_seconds=45.0),
+        ], self.tracker.summaries())
+
+    def test_splits_latencies_by_size_class(self):
+        mock_small_job = mock.Mock(sia_path=u'a.txt', file_size=1)
+        mock_large_job = mock.Mock(sia_path=u'b.txt', file_size=2**30)
+        self.tracker.record_submitted(mock_small_job)
+        self.tracker.record_submitted(mock_large_job)
+
+        self.tracker.record_changes(
+            make_changes(110.0, completed_uploads=[u'a.txt']))
+        self.tracker.record_changes(
+            make_changes(200.0, completed_uploads=[u'b.txt']))
+
+        self.assertEqual(
+            [(upload_latency.SIZE_CLASS_SMALL, 10.0),
+             (upload_latency.SIZE_CLASS_LARGE, 100.0)],
+            [(s.size_class, s.max_seconds) for s in self.tracker.summaries()])
+
+    def test_ignores_files_not_submitted_during_test(self):
+        self.tracker.record_changes(
+            make_changes(
+                110.0,
+                started_uploads=[u'a.txt'],
+                completed_uploads=[u'a.txt'],
+                redundant_uploads=[u'a.txt']))
+
+        self.assertEqual([], self.tracker.summaries())
+
+    def test_records_each_milestone_once(self):
+        self.tracker.record_submitted(
+            jobs.Job(local_path='/dummy-path/a.txt', sia_path=u'a.txt'))
+        self.tracker.record_changes(
+            make_changes(110.0, started_uploads=[u'a.txt']))
+        self.tracker.record_changes(
+            make_changes(120.0, started_uploads=[u'a.txt']))
+
+        self.assertEqual([1], [s.count for s in self.tracker.summaries()])
+
+    def test_reports_when_interval_elapses(self):
+        with mock.patch.object(self.tracker, 'report') as mock_report:
+            self.tracker.record_changes(make_changes(399.0))
+            self.assertFalse(mock_report.called)
+
+            self.tracker.record_changes(make_changes(400.0))
+            self.assertTrue(mock_report.called)
+
+
+class WriteSummariesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_writes_summaries_as_csv(self):
+        output_path = os.path.join(self.temp_dir, 'upload_latency.csv')
+
+        upload_latency.write_summaries(output_path, [
+            upload_latency.LatencySummary(
+                stage=upload_latency.STAGE_UPLOADED,
+                size_class=upload_latency.SIZE_CLASS_SMALL,
+                count=3,
+                p50_seconds=1.5,
+                p90_seconds=2.0,
+                p99_seconds=2.25,
+                p999_seconds=2.25,
+                max_seconds=2.25)
+        ])
+
+        with open(output_path) as output_file:
+            self.assertEqual(
+                ('stage,size_class,count,p50_seconds,p90_seconds,p99_seconds,'
+                 'p999_seconds,max_seconds\r\n'
+                 'uploaded,small,3,1.500,2.000,2.250,2.250,2.250\r\n'),
+                output_file.read())
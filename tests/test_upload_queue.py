@@ -1,10 +1,16 @@
 import os
+import Queue
+import shutil
+import tempfile
 import unittest
 
 import mock
 
+from sia_load_tester import job_ordering
 from sia_load_tester import jobs
+from sia_load_tester import renter_poller
 from sia_load_tester import sia_client as sc
+from sia_load_tester import upload_journal
 from sia_load_tester import upload_queue
 
 
@@ -67,10 +73,12 @@ class GenerateUploadQueueTest(unittest.TestCase):
             ]
         }
 
-        queue = upload_queue.from_upload_jobs_and_sia_client(
-            upload_jobs, self.mock_sia_client)
+        queue = upload_queue.from_upload_jobs_and_snapshot(
+            upload_jobs,
+            renter_poller.snapshot_from_renter_files(
+                self.mock_sia_client.renter_files()))
 
-        self.assertEqual(0, queue.qsize())
+        self.assertTrue(queue.empty())
 
     def test_generates_upload_queue_when_no_files_are_on_sia(self):
         upload_jobs = [
@@ -82,8 +90,10 @@ class GenerateUploadQueueTest(unittest.TestCase):
         ]
         self.mock_sia_api_impl.get_renter_files.return_value = {u'files': []}
 
-        queue = upload_queue.from_upload_jobs_and_sia_client(
-            upload_jobs, self.mock_sia_client)
+        queue = upload_queue.from_upload_jobs_and_snapshot(
+            upload_jobs,
+            renter_poller.snapshot_from_renter_files(
+                self.mock_sia_client.renter_files()))
 
         self.assertEqual(
             jobs.Job(local_path='/dummy-root/a.txt', sia_path='a.txt'),
@@ -95,3 +105,214 @@ class GenerateUploadQueueTest(unittest.TestCase):
         self.assertEqual(
             jobs.Job(local_path='/dummy-root/foo/b.txt', sia_path='foo/b.txt'),
             queue.get())
+
+
+class ResumeUploadQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.upload_jobs = [
+            jobs.Job(local_path='/dummy-root/a.txt', sia_path='a.txt'),
+            jobs.Job(local_path='/dummy-root/b.txt', sia_path='b.txt'),
+            jobs.Job(local_path='/dummy-root/c.txt', sia_path='c.txt'),
+            jobs.Job(local_path='/dummy-root/d.txt', sia_path='d.txt'),
+            jobs.Job(local_path='/dummy-root/e.txt', sia_path='e.txt'),
+        ]
+        self.job_records = {
+            u'a.txt':
+            upload_journal.JobRecord(
+                state=upload_journal.STATE_COMPLETED, failure_count=0),
+            u'b.txt':
+            upload_journal.JobRecord(
+                state=upload_journal.STATE_SUBMITTED, failure_count=0),
+            u'c.txt':
+            upload_journal.JobRecord(
+                state=upload_journal.STATE_QUEUED, failure_count=2),
+            u'd.txt':
+            upload_journal.JobRecord(
+                state=upload_journal.STATE_QUEUED,
+                failure_count=jobs.MAX_FAILURE_COUNT),
+        }
+        self.mock_journal = mock.Mock()
+
+    def drain(self, queue):
+        queued_jobs = []
+        while not queue.empty():
+            queued_jobs.append(queue.get())
+        return queued_jobs
+
+    def test_skips_accepted_and_exhausted_jobs_and_restores_failure_counts(
+            self):
+        queue = upload_queue.from_upload_jobs_and_journal(
+            self.upload_jobs, self.job_records, self.mock_journal)
+
+        queued_jobs = self.drain(queue)
+
+        self.assertEqual(['c.txt', 'e.txt'], [j.sia_path for j in queued_jobs])
+        self.assertEqual([2, 0], [j.failure_count for j in queued_jobs])
+        # c.txt is already queued in the journal, so only e.txt is recorded.
+        self.mock_journal.record_queued.assert_called_once_with(queued_jobs[1])
+
+    def test_renter_snapshot_takes_precedence_over_journal(self):
+        renter_snapshot = renter_poller.Snapshot(
+            uploads_in_progress=0,
+            uploaded_bytes=0,
+            sia_paths=frozenset([u'a.txt', u'e.txt']),
+            uploading_sia_paths=frozenset())
+
+        queue = upload_queue.from_upload_jobs_and_journal(
+            self.upload_jobs, self.job_records, self.mock_journal,
+            renter_snapshot)
+
+        self.assertEqual(['b.txt', 'c.txt'],
+                         [j.sia_path for j in self.drain(queue)])
+
+
+class ResumeUploadQueueJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.journal_path = upload_journal.journal_path(self.test_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def run_upload(self):
+        """Queues every job that still needs uploading, as a run would."""
+        job_records = upload_journal.replay(self.journal_path)
+        journal = upload_journal.make_journal(self.test_dir, job_records)
+        upload_jobs = [
+            jobs.Job(local_path='/dummy-root/a.txt', sia_path='a.txt'),
+            jobs.Job(local_path='/dummy-root/b.txt', sia_path='b.txt'),
+        ]
+        if job_records is None:
+            queue = upload_queue.from_upload_jobs_and_snapshot(
+                upload_jobs,
+                renter_poller.Snapshot(
+                    uploads_in_progress=0,
+                    uploaded_bytes=0,
+                    sia_paths=frozenset(),
+                    uploading_sia_paths=frozenset()), journal)
+        else:
+            queue = upload_queue.from_upload_jobs_and_journal(
+                upload_jobs, job_records, journal)
+        while not queue.empty():
+            queue.get()
+        journal.close()
+
+    def test_resuming_does_not_grow_journal(self):
+        self.run_upload()
+        journal_size = os.path.getsize(self.journal_path)
+
+        self.run_upload()
+        self.run_upload()
+
+        self.assertEqual(journal_size, os.path.getsize(self.journal_path))
+
+
+class JobQueueTest(unittest.TestCase):
+
+    def test_empty_source_makes_empty_queue(self):
+        queue = upload_queue.JobQueue([])
+
+        self.assertTrue(queue.empty())
+        with self.assertRaises(Queue.Empty):
+            queue.get()
+
+    def test_serves_requeued_jobs_after_source_jobs(self):
+        job_a = jobs.Job(local_path='/dummy-root/a.txt', sia_path='a.txt')
+        job_b = jobs.Job(local_path='/dummy-root/b.txt', sia_path='b.txt')
+        job_c = jobs.Job(local_path='/dummy-root/c.txt', sia_path='c.txt')
+        queue = upload_queue.JobQueue([job_a, job_b])
+
+        self.assertEqual(job_a, queue.get())
+        queue.put(job_c)
+        queue.put(job_a)
+
+        self.assertEqual(job_b, queue.get())
+        self.assertEqual(job_c, queue.get())
+        self.assertEqual(job_a, queue.get())
+        self.assertTrue(queue.empty())
+
+    def test_draws_from_source_only_as_jobs_are_needed(self):
+        source_jobs = iter([
+            jobs.Job(local_path='/dummy-root/a.txt', sia_path='a.txt'),
+            jobs.Job(local_path='/dummy-root/b.txt', sia_path='b.txt'),
+            jobs.Job(local_path='/dummy-root/c.txt', sia_path='c.txt'),
+        ])
+        queue = upload_queue.JobQueue(source_jobs)
+
+        self.assertFalse(queue.empty())
+        queue.get()
+
+        self.assertEqual(
+            jobs.Job(local_path='/dummy-root/b.txt', sia_path='b.txt'),
+            next(source_jobs))
+
+    def test_hands_out_jobs_in_ordering_order(self):
+        ordering = job_ordering.make_ordering(
+            job_ordering.ORDERING_LARGEST_FIRST)
+        queue = upload_queue.JobQueue([
+            mock.Mock(sia_path='a.txt', file_size=1),
+            mock.Mock(sia_path='b.txt', file_size=100),
+            mock.Mock(sia_path='c.txt', file_size=10),
+        ], ordering)
+
+        self.assertEqual(['b.txt', 'c.txt', 'a.txt'],
+                         [queue.get().sia_path for _ in xrange(3)])
+        self.assertTrue(queue.empty())
+
+
+class JobQueueRetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        self.mock_retry_policy = mock.Mock()
+        self.mock_retry_policy.time.side_effect = lambda: self.now
+        self.mock_retry_policy.retry_delay.side_effect = (
+            lambda job: 10.0 * job.failure_count)
+        self.job_a = jobs.Job(local_path='/dummy-root/a.txt', sia_path='a.txt')
+        self.job_b = jobs.Job(local_path='/dummy-root/b.txt', sia_path='b.txt')
+
+    def fail(self, job):
+        job.increment_failure_count()
+        return job
+
+    def test_hands_out_failed_jobs_only_when_due(self):
+        queue = upload_queue.JobQueue(
+            [self.job_a], retry_policy=self.mock_retry_policy)
+        queue.retry(self.fail(queue.get()), 'ValueError')
+
+        self.assertFalse(queue.empty())
+        self.assertEqual(10.0, queue.seconds_until_ready())
+        with self.assertRaises(Queue.Empty):
+            queue.get()
+
+        self.now = 110.0
+        self.assertEqual(0, queue.seconds_until_ready())
+        self.assertEqual(self.job_a, queue.get())
+        self.assertIsNone(queue.seconds_until_ready())
+        self.assertTrue(queue.empty())
+
+    def test_hands_out_failed_jobs_in_order_they_are_due(self):
+        queue = upload_queue.JobQueue(
+            [self.job_a, self.job_b], retry_policy=self.mock_retry_policy)
+        job_a = self.fail(self.fail(queue.get()))
+        job_b = self.fail(queue.get())
+        queue.retry(job_a, 'ValueError')
+        queue.retry(job_b, 'ValueError')
+
+        self.now = 120.0
+
+        self.assertEqual([self.job_b, self.job_a], [queue.get(), queue.get()])
+
+    def test_gives_up_on_jobs_that_ran_out_of_retries(self):
+        queue = upload_queue.JobQueue(
+            [self.job_a], retry_policy=self.mock_retry_policy)
+        job = queue.get()
+        for _ in xrange(jobs.MAX_FAILURE_COUNT):
+            self.fail(job)
+
+        queue.retry(job, 'rejected')
+
+        self.mock_retry_policy.give_up.assert_called_once_with(job, 'rejected')
+        self.assertTrue(queue.empty())
@@ -0,0 +1,160 @@
+import Queue
+import threading
+import unittest
+
+import mock
+
+from sia_load_tester import job_sharding
+from sia_load_tester import jobs
+from sia_load_tester import node_throughput
+from sia_load_tester import worker_pool
+
+NODE_NAMES = ['a:9980', 'b:9980', 'c:9980']
+
+
+def make_job(sia_path):
+    return jobs.Job(
+        local_path='/dummy-root/' + sia_path, sia_path=sia_path, file_size=5)
+
+
+class FakeProcess(object):
+    """Runs a worker on a thread in place of a child process."""
+
+    def __init__(self, target, args):
+        self._thread = threading.Thread(target=target, args=args)
+        self.daemon = False
+        self.exitcode = None
+        self.terminate = mock.Mock()
+
+    def start(self):
+        self._thread.start()
+
+    def join(self):
+        self._thread.join()
+
+
+class FakeQueue(Queue.Queue):
+
+    def cancel_join_thread(self):
+        pass
+
+
+def read_node_jobs(worker_index, node_indexes, node_jobs, sample_fn):
+    return [(node_index, list(jobs_for_node))
+            for node_index, jobs_for_node in zip(node_indexes, node_jobs)]
+
+
+class GroupNodesTest(unittest.TestCase):
+
+    def test_deals_out_nodes_in_turn(self):
+        self.assertEqual([[0, 2, 4], [1, 3]], worker_pool.group_nodes(5, 2))
+
+    def test_uses_no_more_workers_than_nodes(self):
+        self.assertEqual([[0], [1]], worker_pool.group_nodes(2, 4))
+
+
+class CoordinatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.upload_jobs = [make_job('file-%d.txt' % i) for i in xrange(250)]
+        self.mock_sample_fn = mock.Mock()
+
+    def make_coordinator(self, worker_fn, sharding=job_sharding.SHARDING_HASH):
+        return worker_pool.Coordinator(
+            worker_fn,
+            worker_pool.group_nodes(len(NODE_NAMES), 2),
+            NODE_NAMES,
+            sharding,
+            self.mock_sample_fn,
+            process_factory=FakeProcess,
+            queue_factory=FakeQueue)
+
+    def run_coordinator(self, coordinator):
+        coordinator.start()
+        return coordinator.run(self.upload_jobs)
+
+    def test_sends_each_worker_the_jobs_of_its_nodes(self):
+        results = self.run_coordinator(self.make_coordinator(read_node_jobs))
+
+        hash_ring = job_sharding.HashRing(NODE_NAMES)
+        self.assertEqual([[0, 2], [1]],
+                         [[node_index
+                           for node_index, _ in worker_results]
+                          for worker_results in results])
+        for worker_results in results:
+            for node_index, node_jobs in worker_results:
+                self.assertEqual([
+                    job for job in self.upload_jobs
+                    if hash_ring.node_index(job.sia_path) == node_index
+                ], node_jobs)
+                for job in node_jobs:
+                    self.assertEqual(5, job.file_size)
+
+    def test_sends_each_job_to_one_worker_under_least_loaded_sharding(self):
+        results = self.run_coordinator(
+            self.make_coordinator(read_node_jobs,
+                                  job_sharding.SHARDING_LEAST_LOADED))
+
+        sent_sia_paths = [
+            job.sia_path for worker_results in results
+            for _, node_jobs in worker_results for job in node_jobs
+        ]
+        self.assertItemsEqual([job.sia_path for job in self.upload_jobs],
+                              sent_sia_paths)
+
+    def test_passes_samples_from_workers_to_sample_fn(self):
+
+        def send_sample(worker_index, node_indexes, node_jobs, sample_fn):
+            sample_fn(
+                node_throughput.ThroughputSample(
+                    node=NODE_NAMES[node_indexes[0]], uploaded_bytes=10))
+            return []
+
+        self.run_coordinator(self.make_coordinator(send_sample))
+
+        self.mock_sample_fn.assert_has_calls(
+            [
+                mock.call(
+                    node_throughput.ThroughputSample(
+                        node='a:9980', uploaded_bytes=10)),
+                mock.call(
+                    node_throughput.ThroughputSample(
+                        node='b:9980', uploaded_bytes=10))
+            ],
+            any_order=True)
+
+    def test_raises_and_stops_workers_when_a_worker_fails(self):
+
+        def fail_on_second_worker(worker_index, node_indexes, node_jobs,
+                                  sample_fn):
+            if worker_index == 1:
+                raise ValueError('dummy upload error')
+            return read_node_jobs(worker_index, node_indexes, node_jobs,
+                                  sample_fn)
+
+        coordinator = self.make_coordinator(fail_on_second_worker)
+        with self.assertRaises(worker_pool.WorkerFailedError):
+            self.run_coordinator(coordinator)
+        for process in coordinator._processes:
+            process.terminate.assert_called_once_with()
+
+    def test_raises_when_a_worker_dies(self):
+
+        class DeadProcess(FakeProcess):
+
+            def start(self):
+                self.exitcode = -9
+
+            def join(self):
+                pass
+
+        coordinator = worker_pool.Coordinator(
+            read_node_jobs, [[0]],
+            NODE_NAMES[:1],
+            job_sharding.SHARDING_HASH,
+            self.mock_sample_fn,
+            process_factory=DeadProcess,
+            queue_factory=FakeQueue)
+        with mock.patch.object(worker_pool, '_LIVENESS_CHECK_SECONDS', 0.01):
+            with self.assertRaises(worker_pool.WorkerFailedError):
+                self.run_coordinator(coordinator)